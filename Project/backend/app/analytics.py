@@ -0,0 +1,255 @@
+import os
+from datetime import date, datetime, timedelta
+import numpy as np
+from sqlalchemy import DateTime, delete, func, insert, select, type_coerce
+from sqlalchemy.orm import Session
+from . import database, lifecycle, models
+from .rollups import COUNTED_STATUSES, increment
+
+# Longest range, in days, the store analytics endpoints answer
+ANALYTICS_MAX_DAYS = int(os.getenv("ANALYTICS_MAX_DAYS", "731"))
+# Rows per INSERT when rebuilding the buckets
+ANALYTICS_REBUILD_BATCH = 5000
+
+# Events are added to their hour bucket only and product lines to their day
+# bucket, so the orders of one store share at most the current hour's row;
+# day and month totals are summed from those rows when read
+STAT_FIELDS = ("orders_placed", "orders_accepted", "accept_seconds", "orders_completed", "revenue",
+               "prep_count", "prep_seconds", "orders_cancelled")
+
+_STAT_KEYS = ("store_id", "granularity", "bucket")
+_PRODUCT_KEYS = ("store_id", "granularity", "bucket", "product_id")
+
+def truncate(at: datetime, granularity: str) -> datetime:
+    """Start of the hour, day or month containing at"""
+    if granularity == "hour":
+        return at.replace(minute=0, second=0, microsecond=0)
+    if granularity == "day":
+        return datetime(at.year, at.month, at.day)
+    return datetime(at.year, at.month, 1)
+
+def _seconds(start, end) -> int:
+    return max(0, int((end - start).total_seconds())) if start else 0
+
+def record(db: Session, store_id: int, at: datetime, **deltas: int):
+    """Add deltas (StoreStatsBucket field -> n) to the hour bucket of at, in the caller's transaction"""
+    fields = tuple(deltas)
+    increment(db, models.StoreStatsBucket, _STAT_KEYS, fields, {
+        (store_id, "hour", truncate(at, "hour")): [deltas[field] for field in fields]
+    })
+
+@lifecycle.subscribe
+def _count_event(db: Session, order_event: lifecycle.OrderEvent):
+    """Add an order transition to its store's buckets; each transition happens once, so is counted once"""
+    status = order_event.status
+    if status == "pending":
+        record(db, order_event.store_id, order_event.at, orders_placed=1)
+    elif status == "accepted":
+        record(db, order_event.store_id, order_event.at, orders_accepted=1,
+               accept_seconds=_seconds(order_event.ordered_at, order_event.at))
+    elif status == "delivered":
+        _count_sales(db, order_event)
+    elif status == "cancelled":
+        record(db, order_event.store_id, order_event.at, orders_cancelled=1)
+
+def _count_sales(db: Session, order_event: lifecycle.OrderEvent):
+    """Add a delivered order's sales and its product lines, at the time it was completed"""
+    at = order_event.completed_at
+    deltas = {"orders_completed": 1, "revenue": order_event.subtotal}
+    if order_event.accepted_at:
+        deltas.update(prep_count=1, prep_seconds=_seconds(order_event.accepted_at, at))
+    record(db, order_event.store_id, at, **deltas)
+
+    lines = db.execute(
+        select(models.OrderDetail.product_id, func.sum(models.OrderDetail.quantity), func.sum(models.OrderDetail.subtotal))
+        .where(models.OrderDetail.order_id == order_event.order_id).group_by(models.OrderDetail.product_id)
+    ).all()
+    increment(db, models.StoreProductBucket, _PRODUCT_KEYS, ("quantity", "revenue"), {
+        (order_event.store_id, "day", truncate(at, "day"), product_id): [quantity, revenue]
+        for product_id, quantity, revenue in lines
+    })
+
+def day_range(days: int) -> tuple[date, date]:
+    """[start, end) of the last days days, today (UTC) included"""
+    end = datetime.utcnow().date() + timedelta(days=1)
+    return end - timedelta(days=days), end
+
+def _midnight(day: date) -> datetime:
+    return datetime.combine(day, datetime.min.time())
+
+def _in_range(model, store_id: int, granularity: str, low: datetime, high: datetime):
+    return (model.store_id == store_id, model.granularity == granularity, model.bucket >= low, model.bucket < high)
+
+def summary(db: Session, store_id: int, start: date, end: date) -> dict[str, int]:
+    """STAT_FIELDS summed over [start, end)"""
+    bucket = models.StoreStatsBucket
+    row = db.execute(
+        select(*(func.coalesce(func.sum(getattr(bucket, field)), 0) for field in STAT_FIELDS))
+        .where(*_in_range(bucket, store_id, "hour", _midnight(start), _midnight(end)))
+    ).one()
+    return dict(zip(STAT_FIELDS, (int(value) for value in row)))
+
+def orders_by_hour(db: Session, store_id: int, start: date, end: date) -> list[int]:
+    """Orders placed in [start, end) per hour of the day (UTC), 0-23"""
+    bucket = models.StoreStatsBucket
+    rows = db.execute(
+        select(bucket.bucket, bucket.orders_placed)
+        .where(*_in_range(bucket, store_id, "hour", _midnight(start), _midnight(end)))
+    ).all()
+    counts = [0] * 24
+    for at, placed in rows:
+        counts[at.hour] += placed
+    return counts
+
+# SQLite has no date_trunc; strftime to the start of the day or month, read back as a datetime
+_SQLITE_TRUNCATE = {"day": "%Y-%m-%d 00:00:00", "month": "%Y-%m-01 00:00:00"}
+
+def _truncated(db: Session, column, granularity: str):
+    """column truncated to the start of its day or month, in SQL"""
+    if db.get_bind().dialect.name == "postgresql":
+        return func.date_trunc(granularity, column)
+    return type_coerce(func.strftime(_SQLITE_TRUNCATE[granularity], column), DateTime)
+
+def series(db: Session, store_id: int, granularity: str, start: date, end: date) -> list:
+    """The store's buckets of one granularity from the one containing start up to end
+
+    Rows with bucket and STAT_FIELDS; day and month buckets are summed from
+    the hour rows by the database, one GROUP BY over the range.
+    """
+    bucket = models.StoreStatsBucket
+    at = bucket.bucket if granularity == "hour" else _truncated(db, bucket.bucket, granularity)
+    return db.execute(
+        select(at.label("bucket"), *(func.sum(getattr(bucket, field)).label(field) for field in STAT_FIELDS))
+        .where(*_in_range(bucket, store_id, "hour", truncate(_midnight(start), granularity), _midnight(end)))
+        .group_by(at).order_by(at)
+    ).all()
+
+def top_products(db: Session, store_id: int, start: date, end: date, limit: int) -> list[dict]:
+    """The store's best selling products in [start, end) by revenue"""
+    bucket = models.StoreProductBucket
+    revenue = func.sum(bucket.revenue)
+    rows = db.execute(
+        select(bucket.product_id, models.Product.name, func.sum(bucket.quantity), revenue)
+        .join(models.Product, models.Product.id == bucket.product_id)
+        .where(*_in_range(bucket, store_id, "day", _midnight(start), _midnight(end)))
+        .group_by(bucket.product_id, models.Product.name)
+        .having(revenue > 0)
+        .order_by(revenue.desc(), bucket.product_id).limit(limit)
+    ).all()
+    return [
+        {"product_id": product_id, "name": name, "quantity": int(quantity), "revenue": int(total)}
+        for product_id, name, quantity, total in rows
+    ]
+
+def _datetimes(values) -> np.ndarray:
+    return np.array(values, dtype="datetime64[s]")
+
+def _group(keys: list[np.ndarray], values: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Sum the rows of values per distinct key tuple; returns (unique keys as rows, sums)"""
+    unique, inverse = np.unique(np.stack(keys, axis=1), axis=0, return_inverse=True)
+    inverse = inverse.ravel()
+    sums = np.stack([
+        np.bincount(inverse, weights=values[:, i], minlength=len(unique)) for i in range(values.shape[1])
+    ], axis=1)
+    return unique, np.rint(sums).astype(np.int64)
+
+def _bucket_rows(granularity: str, unit: str, keys: tuple[str, ...], unique: np.ndarray, sums: np.ndarray, fields):
+    """Rows to insert from _group output; keys names the key columns, "bucket" being bucket numbers in unit"""
+    columns = [
+        unique[:, i].astype(f"datetime64[{unit}]").astype("datetime64[us]").tolist() if key == "bucket"
+        else unique[:, i].tolist()
+        for i, key in enumerate(keys)
+    ]
+    sums = sums.tolist()
+    for i in range(len(unique)):
+        row = {key: column[i] for key, column in zip(keys, columns)}
+        row["granularity"] = granularity
+        row.update(zip(fields, sums[i]))
+        yield row
+
+def _insert_all(db: Session, model, rows):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == ANALYTICS_REBUILD_BATCH:
+            db.execute(insert(model), batch)
+            batch = []
+    if batch:
+        db.execute(insert(model), batch)
+
+def rebuild(db: Session) -> int:
+    """Recompute every bucket from the orders; commits and returns the number of orders read
+
+    Orders are read once into arrays and summed per store and hour with
+    numpy, and product sales per store, day and product. Changes committed
+    while it runs may be missed; run it when orders are quiet.
+    """
+    order = models.Order
+    rows = db.execute(select(
+        order.id, order.store_id, order.status, order.subtotal,
+        order.ordered_at, order.accepted_at, order.completed_at, order.cancelled_at
+    )).all()
+    db.execute(delete(models.StoreStatsBucket))
+    db.execute(delete(models.StoreProductBucket))
+    if rows:
+        ids, stores, statuses, subtotals, ordered, accepted, completed, cancelled = zip(*rows)
+        stores = np.array(stores, dtype=np.int64)
+        subtotals = np.array(subtotals, dtype=np.int64)
+        statuses = np.array(statuses)
+        ordered, accepted = _datetimes(ordered), _datetimes(accepted)
+        completed, cancelled = _datetimes(completed), _datetimes(cancelled)
+        delivered = np.isin(statuses, COUNTED_STATUSES) & ~np.isnat(completed)
+        was_accepted = ~np.isnat(accepted)
+        prepped = delivered & was_accepted
+
+        # One event per (order, kind), each a row of STAT_FIELDS at its time. A
+        # missing ordered_at makes a NaT delta, i.e. a huge negative: clamped to 0
+        events = []
+        def add(mask, at, **fields):
+            values = np.zeros((int(mask.sum()), len(STAT_FIELDS)), dtype=np.int64)
+            for field, value in fields.items():
+                values[:, STAT_FIELDS.index(field)] = value[mask] if isinstance(value, np.ndarray) else value
+            events.append((stores[mask], at[mask], values))
+        add(~np.isnat(ordered), ordered, orders_placed=1)
+        add(was_accepted, accepted, orders_accepted=1,
+            accept_seconds=np.maximum((accepted - ordered).astype(np.int64), 0))
+        add(delivered, completed, orders_completed=1, revenue=subtotals,
+            prep_count=prepped.astype(np.int64),
+            prep_seconds=np.where(prepped, np.maximum((completed - accepted).astype(np.int64), 0), 0))
+        add((statuses == "cancelled") & ~np.isnat(cancelled), cancelled, orders_cancelled=1)
+
+        event_stores = np.concatenate([e[0] for e in events])
+        hours = np.concatenate([e[1] for e in events]).astype("datetime64[h]").astype(np.int64)
+        values = np.concatenate([e[2] for e in events])
+        hourly, hour_sums = _group([event_stores, hours], values)
+        _insert_all(db, models.StoreStatsBucket,
+                    _bucket_rows("hour", "h", ("store_id", "bucket"), hourly, hour_sums, STAT_FIELDS))
+
+        # Product lines of delivered orders, at the day their order was completed
+        completed_day = dict(zip(
+            np.array(ids)[delivered].tolist(), completed[delivered].astype("datetime64[D]").astype(np.int64).tolist()
+        ))
+        lines = [
+            (store_id, product_id, completed_day[order_id], quantity, subtotal)
+            for order_id, store_id, product_id, quantity, subtotal in db.execute(
+                select(models.OrderDetail.order_id, order.store_id, models.OrderDetail.product_id,
+                       models.OrderDetail.quantity, models.OrderDetail.subtotal)
+                .join(order, order.id == models.OrderDetail.order_id)
+                .where(order.status.in_(COUNTED_STATUSES))
+            )
+            if order_id in completed_day
+        ]
+        if lines:
+            line_keys = np.array([line[:3] for line in lines], dtype=np.int64)
+            line_values = np.array([line[3:] for line in lines], dtype=np.int64)
+            daily, day_sums = _group([line_keys[:, 0], line_keys[:, 2], line_keys[:, 1]], line_values)
+            _insert_all(db, models.StoreProductBucket, _bucket_rows(
+                "day", "D", ("store_id", "bucket", "product_id"), daily, day_sums, ("quantity", "revenue")))
+    db.commit()
+    return len(rows)
+
+
+if __name__ == "__main__":
+    # Recompute the analytics buckets from the order history: python -m app.analytics
+    with database.SessionLocal() as db:
+        print(f"Rebuilt analytics buckets from {rebuild(db)} orders")
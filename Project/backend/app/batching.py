@@ -0,0 +1,151 @@
+import itertools
+import os
+from dataclasses import dataclass
+from datetime import timedelta
+from typing import Iterable, Optional
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from . import dispatch, models
+from .geo import bearing_deg, distance_matrix, haversine_km
+
+# Most drops stacked onto one courier; 1 turns batching off
+BATCH_MAX_DROPS = int(os.getenv("BATCH_MAX_DROPS", "3"))
+# Jobs of one store are batched only when they went ready within this long of
+# the batch's oldest job
+BATCH_READY_WINDOW_SECONDS = float(os.getenv("BATCH_READY_WINDOW_SECONDS", "300"))
+# ... and when their drop-offs lie within this many degrees of its bearing from the store
+BATCH_MAX_BEARING_DEG = float(os.getenv("BATCH_MAX_BEARING_DEG", "35"))
+# Most extra distance the batch's route may put before any one drop,
+# compared with driving there straight from the store
+BATCH_MAX_DETOUR_KM = float(os.getenv("BATCH_MAX_DETOUR_KM", "2"))
+
+
+@dataclass(frozen=True)
+class Batch:
+    """Open jobs of one store for a single courier, order_ids in drop order"""
+    store_id: int
+    order_ids: tuple[int, ...]
+    route_km: Optional[float]  # store to the last drop; None without coordinates
+
+
+def plan_route(store_lat: float, store_lng: float, drop_lats, drop_lngs) -> tuple[tuple[int, ...], np.ndarray]:
+    """The drop order with the shortest route from the store through every drop
+
+    Tries every order, which is cheap for the few drops of a batch. Returns
+    (drop indexes in route order, km travelled up to each of those drops);
+    the last distance is the route's length.
+    """
+    lats = np.concatenate(([store_lat], np.asarray(drop_lats, dtype=np.float64)))
+    lngs = np.concatenate(([store_lng], np.asarray(drop_lngs, dtype=np.float64)))
+    legs = distance_matrix(lats, lngs, lats, lngs)
+    best_order, best_arrival = None, None
+    for order in itertools.permutations(range(1, len(lats))):
+        arrival = np.cumsum(legs[(0,) + order[:-1], order])
+        if best_arrival is None or arrival[-1] < best_arrival[-1]:
+            best_order, best_arrival = order, arrival
+    return tuple(i - 1 for i in best_order), best_arrival
+
+def plan_batches(jobs: Iterable, max_drops: int = BATCH_MAX_DROPS) -> list[Batch]:
+    """Group open jobs into batches; every job ends up in exactly one, alone if nothing fits
+
+    jobs are rows with id, store_id, ready_at, store_latitude,
+    store_longitude, delivery_latitude and delivery_longitude. Per store, the
+    oldest job not batched yet starts a batch and takes on the jobs ready
+    within BATCH_READY_WINDOW_SECONDS of it whose drop-off bearing is
+    closest to its own, as long as the shortest route keeps every drop's
+    detour within BATCH_MAX_DETOUR_KM. Jobs lacking ready_at or coordinates
+    go alone.
+    """
+    by_store: dict[int, list] = {}
+    for job in jobs:
+        by_store.setdefault(job.store_id, []).append(job)
+    batches = []
+    for store_id, store_jobs in by_store.items():
+        batches.extend(_plan_store(store_id, store_jobs, max_drops))
+    return batches
+
+def _plan_store(store_id: int, jobs: list, max_drops: int) -> list[Batch]:
+    located, batches = [], []
+    for job in jobs:
+        if None in (job.ready_at, job.store_latitude, job.store_longitude,
+                    job.delivery_latitude, job.delivery_longitude):
+            batches.append(Batch(store_id, (job.id,), None))
+        else:
+            located.append(job)
+    if not located:
+        return batches
+
+    located.sort(key=lambda job: (job.ready_at, job.id))
+    store_lat, store_lng = float(located[0].store_latitude), float(located[0].store_longitude)
+    drop_lats = np.array([float(job.delivery_latitude) for job in located])
+    drop_lngs = np.array([float(job.delivery_longitude) for job in located])
+    bearings = bearing_deg(store_lat, store_lng, drop_lats, drop_lngs)
+    direct = haversine_km(store_lat, store_lng, drop_lats, drop_lngs)
+    window = timedelta(seconds=BATCH_READY_WINDOW_SECONDS)
+    free = set(range(len(located)))
+    for seed in range(len(located)):
+        if seed not in free:
+            continue
+        free.discard(seed)
+        members = [seed]
+        order, arrival = (0,), direct[[seed]]
+        # Angle between each drop-off's bearing and the seed's, in [0, 180]
+        spread = np.abs((bearings - bearings[seed] + 180) % 360 - 180)
+        candidates = sorted(
+            (i for i in free
+             if located[i].ready_at - located[seed].ready_at <= window and spread[i] <= BATCH_MAX_BEARING_DEG),
+            key=lambda i: (spread[i], i)
+        )
+        for i in candidates:
+            if len(members) == max_drops:
+                break
+            trial = members + [i]
+            trial_order, trial_arrival = plan_route(store_lat, store_lng, drop_lats[trial], drop_lngs[trial])
+            if np.all(trial_arrival - direct[trial][list(trial_order)] <= BATCH_MAX_DETOUR_KM):
+                members, order, arrival = trial, trial_order, trial_arrival
+                free.discard(i)
+        batches.append(Batch(store_id, tuple(located[members[i]].id for i in order), round(float(arrival[-1]), 2)))
+    return batches
+
+def open_store_jobs(db: Session, store_ids):
+    """Open jobs of the given stores, as plan_batches takes them"""
+    return db.execute(
+        select(
+            models.Order.id, models.Order.store_id, models.Order.ready_at,
+            models.Order.delivery_latitude, models.Order.delivery_longitude,
+            models.StoreProfile.latitude.label("store_latitude"),
+            models.StoreProfile.longitude.label("store_longitude"),
+        ).join(
+            models.StoreProfile, models.StoreProfile.id == models.Order.store_id
+        ).where(
+            *dispatch.open_job_filter(), models.Order.store_id.in_(store_ids)
+        ).order_by(models.Order.id)
+    ).all()
+
+def batches_for(db: Session, order_ids: list[int]) -> list[Batch]:
+    """The batches holding any of order_ids, planned over all open jobs of their stores"""
+    store_ids = db.execute(
+        select(models.Order.store_id).where(models.Order.id.in_(order_ids)).distinct()
+    ).scalars().all()
+    wanted = set(order_ids)
+    return [batch for batch in plan_batches(open_store_jobs(db, store_ids)) if wanted.intersection(batch.order_ids)]
+
+def claim_batch(db: Session, order_ids: list[int],
+                deliverer_id: int) -> Optional[list[tuple[models.Delivery, int]]]:
+    """Claim every job of a batch for one deliverer, in the caller's transaction
+
+    All or nothing: returns the claims (like claim_job) in the order of
+    order_ids, or None as soon as one job is not open any more or belongs
+    to another store than the rest; the caller must then roll back the
+    claims already made.
+    """
+    claims = {}
+    # Claim in id order, so two deliverers claiming overlapping batches lock
+    # the orders in the same order and cannot deadlock
+    for order_id in sorted(order_ids):
+        claim = dispatch.claim_job(db, order_id, deliverer_id)
+        if claim is None or any(store_id != claim[1] for _, store_id in claims.values()):
+            return None
+        claims[order_id] = claim
+    return [claims[order_id] for order_id in order_ids]
@@ -0,0 +1,236 @@
+import json
+import logging
+import os
+import threading
+from datetime import datetime, timedelta
+from sqlalchemy import func, insert, or_, select, update
+from sqlalchemy.orm import Session
+from . import database, models, notification_counts
+from .realtime import hub
+
+logger = logging.getLogger(__name__)
+
+# Recipients per transaction: one multi-row INSERT into notifications, one
+# counter UPDATE and one checkpoint, committed together
+BROADCAST_CHUNK_SIZE = int(os.getenv("BROADCAST_CHUNK_SIZE", "5000"))
+# Pause between chunks, leaving the pool and the CPU to foreground requests
+BROADCAST_CHUNK_PAUSE_MS = int(os.getenv("BROADCAST_CHUNK_PAUSE_MS", "20"))
+# How often the runner looks for pending or abandoned broadcasts; 0 disables
+# the in-process runner (run `python -m app.broadcasts` instead)
+BROADCAST_POLL_SECONDS = float(os.getenv("BROADCAST_POLL_SECONDS", "10"))
+# A running broadcast whose heartbeat is older than this is taken over by
+# another runner, e.g. after its worker process died
+BROADCAST_LEASE_SECONDS = float(os.getenv("BROADCAST_LEASE_SECONDS", "60"))
+# User topics per realtime event; keeps relayed payloads under the NOTIFY limit
+BROADCAST_PUSH_TOPICS = 500
+
+BROADCAST_TYPES = ("system", "promotion")
+AUDIENCE_ROLES = ("requester", "deliverer", "store", "admin")
+
+def audience_filter(broadcast: models.NotificationBroadcast):
+    """WHERE clause on users selecting a role or store_customers audience"""
+    if broadcast.audience == "role":
+        return (models.User.role == broadcast.audience_role) & (models.User.is_active == True)
+    customers = select(models.RequesterProfile.user_id).join(
+        models.Order, models.Order.requester_id == models.RequesterProfile.id
+    ).where(models.Order.store_id == broadcast.audience_store_id)
+    return models.User.id.in_(customers)
+
+def audience_size(db: Session, broadcast: models.NotificationBroadcast) -> int:
+    """Recipients of the broadcast; for an id list, the distinct ids given"""
+    if broadcast.audience == "users":
+        return len(set(json.loads(broadcast.audience_user_ids)))
+    return db.execute(select(func.count(models.User.id)).where(audience_filter(broadcast))).scalar()
+
+def next_recipients(db: Session, broadcast: models.NotificationBroadcast, after: int, limit: int) -> tuple[list[int], int]:
+    """Up to limit recipient ids after the checkpoint, and the checkpoint to store after them
+
+    An explicit id list is sliced in Python rather than sent as one huge IN
+    list; ids without a user are skipped, so the new checkpoint may be past
+    the last recipient returned. The checkpoint is unchanged when done.
+    """
+    if broadcast.audience == "users":
+        candidates = sorted(user_id for user_id in set(json.loads(broadcast.audience_user_ids)) if user_id > after)[:limit]
+        if not candidates:
+            return [], after
+        user_ids = db.execute(
+            select(models.User.id).where(models.User.id.in_(candidates)).order_by(models.User.id)
+        ).scalars().all()
+        return user_ids, candidates[-1]
+    user_ids = db.execute(
+        select(models.User.id).where(audience_filter(broadcast), models.User.id > after)
+        .order_by(models.User.id).limit(limit)
+    ).scalars().all()
+    return user_ids, user_ids[-1] if user_ids else after
+
+def _claimable(now: datetime):
+    stale = now - timedelta(seconds=BROADCAST_LEASE_SECONDS)
+    return or_(
+        models.NotificationBroadcast.status == "pending",
+        (models.NotificationBroadcast.status == "running") & (models.NotificationBroadcast.heartbeat_at < stale)
+    )
+
+
+class BroadcastRunner:
+    """Sends notification broadcasts in chunks, resumably
+
+    Recipients are walked in users.id order. Each chunk inserts its
+    notifications, bumps the unread counters and advances the broadcast's
+    last_user_id checkpoint in one transaction, so a crash loses at most the
+    uncommitted chunk and a resumed broadcast never notifies anyone twice.
+    Runners claim a broadcast with a conditional UPDATE and keep a heartbeat;
+    one whose heartbeat goes stale is picked up by any other runner.
+    """
+
+    def __init__(self, chunk_size: int = BROADCAST_CHUNK_SIZE, chunk_pause_ms: int = BROADCAST_CHUNK_PAUSE_MS,
+                 poll_seconds: float = BROADCAST_POLL_SECONDS, session_factory=None):
+        self.chunk_size = chunk_size
+        self.chunk_pause = chunk_pause_ms / 1000
+        self.poll_seconds = poll_seconds
+        self.session_factory = session_factory
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Start the background thread, which also resumes unfinished broadcasts"""
+        if self.poll_seconds <= 0 or self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run_forever, name="broadcast-runner", daemon=True)
+        self._thread.start()
+
+    def wake(self):
+        """Look for work now instead of at the next poll"""
+        self._wake.set()
+
+    def run_forever(self):
+        """Send broadcasts as they come in until stop() is called"""
+        while not self._stop.is_set():
+            try:
+                while not self._stop.is_set() and self.run_next():
+                    pass
+            except Exception:
+                logger.exception("Notification broadcast runner failed")
+            self._wake.wait(self.poll_seconds)
+            self._wake.clear()
+
+    def run_next(self) -> bool:
+        """Claim one pending or abandoned broadcast and send it; False when there is none"""
+        session_factory = self.session_factory or database.SessionLocal
+        with session_factory() as db:
+            now = datetime.utcnow()
+            broadcast_id = db.execute(
+                select(models.NotificationBroadcast.id).where(_claimable(now))
+                .order_by(models.NotificationBroadcast.id).limit(1)
+            ).scalar()
+            if broadcast_id is None:
+                return False
+            claimed = db.execute(
+                update(models.NotificationBroadcast).where(
+                    models.NotificationBroadcast.id == broadcast_id, _claimable(now)
+                ).values(
+                    status="running", heartbeat_at=now, error=None,
+                    started_at=func.coalesce(models.NotificationBroadcast.started_at, now)
+                )
+            ).rowcount
+            db.commit()
+            if claimed:
+                self.send(db, broadcast_id)
+            return True
+
+    def send(self, db: Session, broadcast_id: int):
+        """Send the remaining chunks of a broadcast this runner has claimed"""
+        broadcast = db.get(models.NotificationBroadcast, broadcast_id)
+        try:
+            while broadcast.status == "running":
+                if self._stop.is_set():
+                    # Hand the rest to whichever runner starts next
+                    self._set_status(db, broadcast, "pending")
+                    return
+                if not self._send_chunk(db, broadcast):
+                    return
+                if self.chunk_pause:
+                    self._stop.wait(self.chunk_pause)
+        except Exception as exc:
+            db.rollback()
+            logger.exception("Notification broadcast %d failed", broadcast_id)
+            self._set_status(db, broadcast, "failed", error=str(exc)[:1000])
+
+    def _send_chunk(self, db: Session, broadcast: models.NotificationBroadcast) -> bool:
+        """Send the next chunk; False when this runner should stop (done or lease lost)"""
+        checkpoint = broadcast.last_user_id
+        user_ids, next_checkpoint = next_recipients(db, broadcast, checkpoint, self.chunk_size)
+        now = datetime.utcnow()
+        if next_checkpoint == checkpoint:
+            self._set_status(db, broadcast, "completed", finished_at=now)
+            return False
+
+        if user_ids:
+            notification_counts.ensure_counters(db, user_ids)
+            db.execute(insert(models.Notification), [
+                {"user_id": user_id, "title": broadcast.title, "message": broadcast.message,
+                 "type": broadcast.type, "is_read": False}
+                for user_id in user_ids
+            ])
+            notification_counts.add_unread(db, {user_id: 1 for user_id in user_ids})
+        # Fenced on the checkpoint: if another runner took the broadcast over
+        # and got here first, this chunk is rolled back
+        advanced = db.execute(
+            update(models.NotificationBroadcast).where(
+                models.NotificationBroadcast.id == broadcast.id,
+                models.NotificationBroadcast.last_user_id == checkpoint,
+                models.NotificationBroadcast.status == "running"
+            ).values(
+                last_user_id=next_checkpoint, heartbeat_at=now,
+                sent_count=models.NotificationBroadcast.sent_count + len(user_ids)
+            )
+        ).rowcount
+        if not advanced:
+            db.rollback()
+            return False
+        db.commit()
+        db.refresh(broadcast)
+
+        topics = [f"user:{user_id}" for user_id in user_ids]
+        event = {"type": "broadcast", "broadcast_id": broadcast.id, "title": broadcast.title,
+                 "message": broadcast.message, "notification_type": broadcast.type}
+        for start in range(0, len(topics), BROADCAST_PUSH_TOPICS):
+            hub.publish(topics[start:start + BROADCAST_PUSH_TOPICS], event)
+        return True
+
+    def _set_status(self, db: Session, broadcast: models.NotificationBroadcast, status: str, **values):
+        db.execute(
+            update(models.NotificationBroadcast).where(
+                models.NotificationBroadcast.id == broadcast.id,
+                models.NotificationBroadcast.status == "running"
+            ).values(status=status, **values)
+        )
+        db.commit()
+        db.refresh(broadcast)
+
+    def stop(self):
+        """Stop after the current chunk; an interrupted broadcast goes back to pending"""
+        self._stop.set()
+        self._wake.set()
+
+    def shutdown(self):
+        self.stop()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+broadcast_runner = BroadcastRunner()
+
+
+if __name__ == "__main__":
+    # Standalone runner, for API workers started with BROADCAST_POLL_SECONDS=0:
+    # python -m app.broadcasts
+    import signal
+
+    logging.basicConfig(level=logging.INFO)
+    runner = BroadcastRunner(poll_seconds=BROADCAST_POLL_SECONDS or 10)
+    signal.signal(signal.SIGTERM, lambda *_: runner.stop())
+    signal.signal(signal.SIGINT, lambda *_: runner.stop())
+    runner.run_forever()
@@ -0,0 +1,192 @@
+import hashlib
+import logging
+import os
+import threading
+from dataclasses import dataclass
+from typing import Iterable, Optional
+from fastapi import Request, Response
+from pydantic import TypeAdapter
+from .principal import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# Serialized catalog responses kept per worker process
+CATALOG_CACHE_MAX_SIZE = int(os.getenv("CATALOG_CACHE_MAX_SIZE", "5000"))
+# Upper bound on staleness if an invalidation is ever missed
+CATALOG_CACHE_TTL_SECONDS = float(os.getenv("CATALOG_CACHE_TTL_SECONDS", "300"))
+# Shared version store so a write in one worker invalidates every worker at
+# once, e.g. redis://redis:6379/0; unset keeps versions in this process only
+CATALOG_CACHE_URL = os.getenv("CATALOG_CACHE_URL", "")
+
+# Tag of responses that list more than one store (store lists, product list)
+ALL_STORES = "all"
+# Bumped by every stock change, which only bumps its own store's tag
+# otherwise; snapshot of bodies whose stores are only known once loaded
+STOCK = "stock"
+UNKNOWN_STORES = (ALL_STORES, STOCK)
+
+def store_tag(store_id: int) -> str:
+    return f"store:{store_id}"
+
+def stores_tags(store_ids: Iterable[int]) -> list[str]:
+    """Tags of a response showing products of several stores"""
+    return [ALL_STORES, *(store_tag(store_id) for store_id in sorted(set(store_ids)))]
+
+
+class LocalVersions:
+    """Per-tag version numbers in this process; the default and test stand-in"""
+
+    def __init__(self):
+        self._versions: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def get(self, tags: tuple[str, ...]) -> tuple[int, ...]:
+        return tuple(self._versions.get(tag, 0) for tag in tags)
+
+    def bump(self, tags: Iterable[str]):
+        with self._lock:
+            for tag in tags:
+                self._versions[tag] = self._versions.get(tag, 0) + 1
+
+
+class RedisVersions:
+    """Per-tag version numbers shared by all workers through Redis"""
+
+    def __init__(self, url: str, prefix: str = "catalog:version:"):
+        import redis
+
+        self.client = redis.Redis.from_url(url, socket_timeout=0.5)
+        self.prefix = prefix
+
+    def get(self, tags: tuple[str, ...]) -> tuple[int, ...]:
+        values = self.client.mget([self.prefix + tag for tag in tags])
+        return tuple(int(value or 0) for value in values)
+
+    def bump(self, tags: Iterable[str]):
+        pipeline = self.client.pipeline()
+        for tag in tags:
+            pipeline.incr(self.prefix + tag)
+        pipeline.execute()
+
+
+@dataclass(frozen=True)
+class CachedResponse:
+    body: bytes
+    etag: str
+    headers: tuple[tuple[str, str], ...]
+    tags: tuple[str, ...]
+    versions: tuple[int, ...]
+
+
+class CatalogCache:
+    """Read-through cache of serialized public catalog responses
+
+    Entries are tagged with the store they show, or ALL_STORES (plus the
+    stores shown) for cross-store lists, and record the tags' versions when
+    they were built. A catalog write bumps the versions of its store and of
+    ALL_STORES, a stock change only its store's, so
+    every entry that could show the old data stops being served; nothing
+    has to be found and deleted. An entry built while a write to one of its
+    tags was in flight is served but not kept (see snapshot/put).
+    """
+
+    def __init__(self, max_size: int = CATALOG_CACHE_MAX_SIZE, ttl: float = CATALOG_CACHE_TTL_SECONDS,
+                 versions=None):
+        self._entries = TTLCache(max_size, ttl)
+        self.versions = versions if versions is not None else LocalVersions()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key) -> Optional[CachedResponse]:
+        """The entry for key while its tags are unchanged since it was built"""
+        entry = self._entries.get(key)
+        if entry is not None and self._versions(entry.tags) == entry.versions:
+            self.hits += 1
+            return entry
+        self.misses += 1
+        return None
+
+    def snapshot(self, tags: Iterable[str]) -> Optional[tuple[tuple[str, ...], tuple[int, ...]]]:
+        """Take before loading from the database, over the tags the body is known to depend on; pass to put()"""
+        tags = tuple(tags)
+        versions = self._versions(tags)
+        return None if versions is None else (tags, versions)
+
+    def put(self, key, tags: Iterable[str], body: bytes, snapshot: Optional[tuple[tuple[str, ...], tuple[int, ...]]],
+            headers: Optional[dict] = None) -> CachedResponse:
+        """Build the entry for a freshly loaded body and keep it unless a write raced the load"""
+        tags = tuple(tags)
+        versions = self._versions(tags)
+        entry = CachedResponse(
+            body=body,
+            etag='"' + hashlib.blake2b(body, digest_size=12).hexdigest() + '"',
+            headers=tuple((headers or {}).items()),
+            tags=tags,
+            versions=versions,
+        )
+        # Unchanged snapshot tags mean no write the body depends on committed
+        # while it was being loaded; writes to other stores do not matter
+        if snapshot is not None and versions is not None:
+            snapshot_tags, snapshot_versions = snapshot
+            current = versions if snapshot_tags == tags else self._versions(snapshot_tags)
+            if current == snapshot_versions:
+                self._entries.put(key, entry)
+        return entry
+
+    def invalidate_store(self, store_id: int):
+        """Call after committing a change to the store's profile, products or categories"""
+        try:
+            self.versions.bump((store_tag(store_id), ALL_STORES))
+        except Exception:
+            logger.exception("Catalog cache invalidation failed; store %d may be stale for up to %.0f s",
+                             store_id, CATALOG_CACHE_TTL_SECONDS)
+
+    def invalidate_stock(self, store_id: int):
+        """Call after committing a change to the stock of the store's products only (orders, cancellations)
+
+        Store lists do not show stock, so unlike invalidate_store this
+        leaves ALL_STORES and the entries tagged with it alone.
+        """
+        try:
+            self.versions.bump((store_tag(store_id), STOCK))
+        except Exception:
+            logger.exception("Catalog cache invalidation failed; store %d may be stale for up to %.0f s",
+                             store_id, CATALOG_CACHE_TTL_SECONDS)
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses,
+                "shared": not isinstance(self.versions, LocalVersions)}
+
+    def _versions(self, tags: tuple[str, ...]) -> Optional[tuple[int, ...]]:
+        try:
+            return self.versions.get(tags)
+        except Exception:
+            # Shared store unreachable: serve from the database, cache nothing
+            logger.warning("Catalog cache version lookup failed", exc_info=True)
+            return None
+
+
+_adapters: dict = {}
+
+def serialize(schema, value) -> bytes:
+    """JSON body of value as FastAPI would send it for response_model=schema"""
+    adapter = _adapters.get(schema)
+    if adapter is None:
+        adapter = _adapters[schema] = TypeAdapter(schema)
+    return adapter.dump_json(adapter.validate_python(value, from_attributes=True))
+
+def respond(request: Request, entry: CachedResponse) -> Response:
+    """200 with the cached body, or 304 when the client already has it"""
+    headers = {"ETag": entry.etag, "Cache-Control": "no-cache", **dict(entry.headers)}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        if entry.etag in tags or "*" in tags:
+            return Response(status_code=304, headers=headers)
+    return Response(content=entry.body, media_type="application/json", headers=headers)
+
+
+catalog_cache = CatalogCache(versions=RedisVersions(CATALOG_CACHE_URL) if CATALOG_CACHE_URL else None)
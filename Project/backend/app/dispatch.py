@@ -0,0 +1,498 @@
+import heapq
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Optional
+import numpy as np
+from sqlalchemy import case, insert, or_, select, update
+from sqlalchemy.orm import Session
+from . import database, lifecycle, models
+from .geo import distance_matrix
+from .realtime import hub
+
+logger = logging.getLogger(__name__)
+
+# Retries of claim_next_job when the picked job is taken before the UPDATE;
+# only happens without row locks (SQLite)
+CLAIM_ATTEMPTS = 5
+
+def open_job_filter():
+    """Orders on the job board: ready for pickup and not assigned yet"""
+    return (models.Order.status == "ready_for_pickup", models.Order.deliverer_id == None)
+
+def claim_job(db: Session, order_id: int, deliverer_id: int) -> Optional[tuple[models.Delivery, int]]:
+    """Assign an open job and create its delivery, in the caller's transaction
+
+    The claim is the order's conditional picked_up transition (which also
+    marks the deliverer busy), so when several deliverers claim the same job
+    at once exactly one gets it; the others' UPDATE matches no row. Returns
+    (delivery, store_id), or None if the job is not open (any more).
+    """
+    claimed = lifecycle.transition(
+        db, order_id, "picked_up", where=(models.Order.deliverer_id == None,), deliverer_id=deliverer_id
+    )
+    if claimed is None:
+        return None
+    delivery = models.Delivery(
+        order_id=order_id,
+        deliverer_id=deliverer_id,
+        status="assigned",
+        delivery_fee=claimed.delivery_fee
+    )
+    db.add(delivery)
+    return delivery, claimed.store_id
+
+def claim_next_job(db: Session, deliverer_id: int,
+                   candidates: Optional[list[int]] = None) -> Optional[tuple[models.Delivery, int]]:
+    """Claim the oldest open job, or the first still open of candidates (order ids, best first)
+
+    Jobs another claimer has locked are skipped instead of waited for
+    (FOR UPDATE SKIP LOCKED), so concurrent callers spread over the open
+    jobs. Returns like claim_job; None when there is no open job.
+    """
+    if candidates is not None and not candidates:
+        return None
+    stmt = select(models.Order.id).where(*open_job_filter())
+    if candidates is not None:
+        rank = case({order_id: i for i, order_id in enumerate(candidates)}, value=models.Order.id)
+        stmt = stmt.where(models.Order.id.in_(candidates)).order_by(rank)
+    else:
+        stmt = stmt.order_by(models.Order.id)
+    stmt = stmt.limit(1).with_for_update(skip_locked=True)
+    for _ in range(CLAIM_ATTEMPTS):
+        order_id = db.execute(stmt).scalar()
+        if order_id is None:
+            return None
+        claim = claim_job(db, order_id, deliverer_id)
+        if claim is not None:
+            return claim
+    return None
+
+
+# ==========================================
+# Automatic dispatch: offer open jobs to nearby online deliverers
+# ==========================================
+
+# How often the engine matches open jobs with online deliverers; 0 disables
+# the in-process engine (run `python -m app.dispatch` instead)
+DISPATCH_TICK_SECONDS = float(os.getenv("DISPATCH_TICK_SECONDS", "0"))
+# How long a deliverer has to accept an offer before it goes to someone else
+DISPATCH_OFFER_SECONDS = float(os.getenv("DISPATCH_OFFER_SECONDS", "30"))
+# Farthest a deliverer is sent to a store, and how many of the nearest stores
+# with open jobs within it the solver considers per deliverer
+DISPATCH_RADIUS_KM = float(os.getenv("DISPATCH_RADIUS_KM", "5"))
+DISPATCH_CANDIDATES = int(os.getenv("DISPATCH_CANDIDATES", "10"))
+# "hungarian" (least total distance) or "greedy" (closest pairs first)
+DISPATCH_SOLVER = os.getenv("DISPATCH_SOLVER", "hungarian")
+# Idle positions older than this are not matched
+DISPATCH_POSITION_MAX_AGE_SECONDS = float(os.getenv("DISPATCH_POSITION_MAX_AGE_SECONDS", "600"))
+# A job declined or let expire by a deliverer is not offered to them again for this long
+DISPATCH_REOFFER_SECONDS = float(os.getenv("DISPATCH_REOFFER_SECONDS", "300"))
+# Deliverer rows per block of the distance matrix; bounds its memory to
+# block x open jobs
+DISPATCH_MATRIX_BLOCK = 256
+# Solver passes per round; deliverers left without a job are matched again
+# against the jobs left (see match)
+DISPATCH_MATCH_PASSES = 4
+
+def nearest_candidates(deliverer_lats, deliverer_lngs, job_lats, job_lngs, radius_km: float = DISPATCH_RADIUS_KM,
+                       k: int = DISPATCH_CANDIDATES, excluded=()) -> tuple[np.ndarray, np.ndarray]:
+    """The k nearest jobs within radius_km of each deliverer, from a vectorized distance matrix
+
+    Returns (jobs, km), both deliverers x k: job indexes closest first, and
+    their distances, inf where a deliverer has fewer than k jobs in reach.
+    excluded holds (deliverer index, job index) pairs never to match.
+    """
+    n_deliverers, n_jobs = len(deliverer_lats), len(job_lats)
+    k = min(k, n_jobs)
+    jobs = np.zeros((n_deliverers, k), dtype=np.int64)
+    km = np.full((n_deliverers, k), np.inf)
+    if not k:
+        return jobs, km
+    excluded = np.array(sorted(excluded), dtype=np.int64).reshape(-1, 2)
+    for start in range(0, n_deliverers, DISPATCH_MATRIX_BLOCK):
+        stop = min(start + DISPATCH_MATRIX_BLOCK, n_deliverers)
+        block = distance_matrix(deliverer_lats[start:stop], deliverer_lngs[start:stop], job_lats, job_lngs)
+        block[block > radius_km] = np.inf
+        in_block = (excluded[:, 0] >= start) & (excluded[:, 0] < stop)
+        block[excluded[in_block, 0] - start, excluded[in_block, 1]] = np.inf
+        nearest = np.argpartition(block, k - 1, axis=1)[:, :k] if k < n_jobs else np.tile(np.arange(n_jobs), (stop - start, 1))
+        distances = np.take_along_axis(block, nearest, axis=1)
+        order = np.argsort(distances, axis=1, kind="stable")
+        jobs[start:stop] = np.take_along_axis(nearest, order, axis=1)
+        km[start:stop] = np.take_along_axis(distances, order, axis=1)
+    return jobs, km
+
+def assign_greedy(jobs: np.ndarray, km: np.ndarray, capacity=None) -> list[tuple[int, int]]:
+    """(deliverer, job) pairs taking the closest remaining pair first
+
+    capacity[job] is how many deliverers a job index takes (default one).
+    """
+    rows, slots = np.nonzero(np.isfinite(km))
+    ranked = np.argsort(km[rows, slots], kind="stable")
+    taken: dict[int, int] = {}
+    pairs = {}
+    for row, job in zip(rows[ranked].tolist(), jobs[rows[ranked], slots[ranked]].tolist()):
+        if row not in pairs and taken.get(job, 0) < (1 if capacity is None else capacity[job]):
+            pairs[row] = job
+            taken[job] = taken.get(job, 0) + 1
+    return sorted(pairs.items())
+
+def assign_hungarian(jobs: np.ndarray, km: np.ndarray, capacity=None) -> list[tuple[int, int]]:
+    """(deliverer, job) pairs matching as many deliverers as possible at the least total distance
+
+    The Hungarian method as successive shortest augmenting paths, run on
+    the candidate lists instead of the full matrix. Each deliverer also
+    has a private "no job" option costing more than any whole matching, so
+    every deliverer can be matched and the optimum uses that option only
+    where the real jobs run out. Deliverers are matched in turn by a
+    Dijkstra search over reduced costs, which may move already matched
+    deliverers to other jobs (or to none); node potentials keep the
+    reduced costs non-negative between searches. capacity[job] is how
+    many deliverers a job index takes (default one); a full one leads the
+    search on to all of its deliverers.
+    """
+    feasible = np.isfinite(km)
+    if not feasible.any():
+        return []
+    no_job_cost = float(km[feasible].sum()) + 1.0
+    # Jobs are indexes >= 0; deliverer row's "no job" option is -1 - row
+    edges = [
+        list(zip(jobs[row, feasible[row]].tolist(), km[row, feasible[row]].tolist())) + [(-1 - row, no_job_cost)]
+        for row in range(len(jobs))
+    ]
+    room = (lambda job: 1) if capacity is None else (lambda job: capacity[job] if job >= 0 else 1)
+    row_potential = [0.0] * len(jobs)
+    job_potential: dict[int, float] = {}
+    owners: dict[int, list[int]] = {}
+    job_of: dict[int, int] = {}
+    for start in np.flatnonzero(feasible.any(axis=1)).tolist():
+        job_dist: dict[int, float] = {}
+        settled_jobs: dict[int, float] = {}
+        settled_rows = {start: 0.0}
+        via: dict[int, int] = {}
+        heap: list[tuple[float, int]] = []
+        reached, dist = [start], 0.0
+        while True:
+            for row in reached:
+                for job, cost in edges[row]:
+                    if job in settled_jobs:
+                        continue
+                    reduced = dist + cost + row_potential[row] - job_potential.get(job, 0.0)
+                    if reduced < job_dist.get(job, np.inf):
+                        job_dist[job] = reduced
+                        via[job] = row
+                        heapq.heappush(heap, (reduced, job))
+            # The start's own "no job" option is always reachable
+            while True:
+                dist, job = heapq.heappop(heap)
+                if job not in settled_jobs:
+                    break
+            settled_jobs[job] = dist
+            if len(owners.get(job, ())) < room(job):
+                break
+            reached = owners[job]
+            for row in reached:
+                settled_rows[row] = dist
+        # Shift the potentials of everything settled so reduced costs stay
+        # non-negative and the path's edges become tight
+        for settled, settled_dist in settled_jobs.items():
+            job_potential[settled] = job_potential.get(settled, 0.0) + settled_dist - dist
+        for settled, settled_dist in settled_rows.items():
+            row_potential[settled] += settled_dist - dist
+        while True:
+            row = via[job]
+            previous = job_of.get(row)
+            owners.setdefault(job, []).append(row)
+            job_of[row] = job
+            if row == start:
+                break
+            owners[previous].remove(row)
+            job = previous
+    return sorted((row, job) for row, job in job_of.items() if job >= 0)
+
+SOLVERS = {"hungarian": assign_hungarian, "greedy": assign_greedy}
+
+def match(deliverer_lats, deliverer_lngs, job_lats, job_lngs, solver: str = DISPATCH_SOLVER,
+          excluded=()) -> list[tuple[int, int, float]]:
+    """(deliverer index, job index, km) matches from the candidate lists and the solver
+
+    Jobs at the same spot (one store's) are solved as a single node taking
+    as many deliverers as it has jobs, so a deliverer's candidates are the
+    nearest DISPATCH_CANDIDATES stores rather than that many jobs of the
+    nearest one; each store's oldest jobs go first. A deliverer whose
+    candidates all went to others is matched again against the jobs still
+    free, for up to DISPATCH_MATCH_PASSES passes.
+    """
+    spots, spot_of = np.unique(np.column_stack((job_lats, job_lngs)), axis=0, return_inverse=True)
+    spot_of = spot_of.reshape(-1).tolist()
+    free: list[list[int]] = [[] for _ in spots]
+    for job, spot in enumerate(spot_of):
+        free[spot].append(job)
+    refused: dict[int, set[int]] = {}
+    for row, job in excluded:
+        refused.setdefault(row, set()).add(job)
+    rows = np.arange(len(deliverer_lats))
+    matches = []
+    for _ in range(DISPATCH_MATCH_PASSES):
+        open_spots = np.array([spot for spot, spot_jobs in enumerate(free) if spot_jobs], dtype=np.int64)
+        if not len(rows) or not len(open_spots):
+            break
+        col_of = {spot: i for i, spot in enumerate(open_spots.tolist())}
+        # A deliverer is kept from a spot only once they refused every job left there
+        skip = {
+            (i, col_of[spot])
+            for i, row in enumerate(rows.tolist())
+            for spot in {spot_of[job] for job in refused.get(row, ())}
+            if spot in col_of and refused[row].issuperset(free[spot])
+        }
+        candidate_spots, km = nearest_candidates(
+            deliverer_lats[rows], deliverer_lngs[rows], spots[open_spots, 0], spots[open_spots, 1], excluded=skip
+        )
+        pairs = SOLVERS[solver](candidate_spots, km, [len(free[spot]) for spot in open_spots.tolist()])
+        matched = []
+        for i, col in pairs:
+            row, spot = int(rows[i]), int(open_spots[col])
+            job = next((job for job in free[spot] if job not in refused.get(row, ())), None)
+            if job is None:
+                # The jobs this deliverer had not refused went to others
+                continue
+            free[spot].remove(job)
+            slot = int(np.flatnonzero(candidate_spots[i] == col)[0])
+            matches.append((row, job, float(km[i, slot])))
+            matched.append(i)
+        if not matched:
+            break
+        rows = np.delete(rows, matched)
+    return matches
+
+def _live_offers():
+    return models.JobOffer.status == "offered"
+
+def _open_jobs(db: Session):
+    return db.execute(
+        select(models.Order.id, models.StoreProfile.latitude, models.StoreProfile.longitude)
+        .join(models.StoreProfile, models.StoreProfile.id == models.Order.store_id)
+        .where(
+            *open_job_filter(), models.StoreProfile.latitude != None, models.StoreProfile.longitude != None,
+            models.Order.id.not_in(select(models.JobOffer.order_id).where(_live_offers()))
+        ).order_by(models.Order.id)
+    ).all()
+
+def _idle_deliverers(db: Session, now: datetime):
+    profile = models.DelivererProfile
+    return db.execute(
+        select(profile.id, profile.latitude, profile.longitude).where(
+            profile.work_status == "online", profile.latitude != None, profile.longitude != None,
+            profile.location_updated_at >= now - timedelta(seconds=DISPATCH_POSITION_MAX_AGE_SECONDS),
+            profile.id.not_in(select(models.JobOffer.deliverer_id).where(_live_offers()))
+        ).order_by(profile.id)
+    ).all()
+
+def close_offers(db: Session, now: datetime) -> int:
+    """Expire offers past their deadline and withdraw those whose job or deliverer is gone; returns how many"""
+    offer = models.JobOffer
+    expired = db.execute(
+        update(offer).where(_live_offers(), offer.expires_at <= now)
+        .values(status="expired").execution_options(synchronize_session=False)
+    ).rowcount
+    withdrawn = db.execute(
+        update(offer).where(_live_offers(), or_(
+            offer.order_id.not_in(select(models.Order.id).where(*open_job_filter())),
+            offer.deliverer_id.not_in(
+                select(models.DelivererProfile.id).where(models.DelivererProfile.work_status == "online")
+            ),
+        )).values(status="withdrawn", responded_at=now).execution_options(synchronize_session=False)
+    ).rowcount
+    return expired + withdrawn
+
+def offer_jobs(db: Session, solver: str = DISPATCH_SOLVER) -> dict:
+    """One dispatch round: match open jobs with idle online deliverers and offer each match
+
+    Jobs and deliverers with an offer outstanding sit the round out, as do
+    pairs declined or let expire recently. Commits, then notifies each
+    deliverer on their realtime topic. Returns counts and timings.
+    """
+    now = datetime.utcnow()
+    closed = close_offers(db, now)
+    jobs = _open_jobs(db)
+    deliverers = _idle_deliverers(db, now)
+    stats = {"closed": closed, "jobs": len(jobs), "deliverers": len(deliverers), "offered": 0, "km": 0.0}
+    if not jobs or not deliverers:
+        db.commit()
+        return stats
+
+    t0 = time.perf_counter()
+    job_row = {order_id: i for i, (order_id, _, _) in enumerate(jobs)}
+    deliverer_row = {deliverer_id: i for i, (deliverer_id, _, _) in enumerate(deliverers)}
+    refused = db.execute(
+        select(models.JobOffer.deliverer_id, models.JobOffer.order_id).where(
+            models.JobOffer.status.in_(("declined", "expired")),
+            models.JobOffer.offered_at >= now - timedelta(seconds=DISPATCH_REOFFER_SECONDS)
+        )
+    ).all()
+    excluded = {
+        (deliverer_row[deliverer_id], job_row[order_id])
+        for deliverer_id, order_id in refused
+        if deliverer_id in deliverer_row and order_id in job_row
+    }
+    columns = lambda rows, i: np.array([float(row[i]) for row in rows])  # noqa: E731
+    matches = match(
+        columns(deliverers, 1), columns(deliverers, 2), columns(jobs, 1), columns(jobs, 2), solver, excluded
+    )
+    stats["solve_ms"] = (time.perf_counter() - t0) * 1000
+    if not matches:
+        db.commit()
+        return stats
+
+    expires_at = now + timedelta(seconds=DISPATCH_OFFER_SECONDS)
+    offers = db.execute(
+        insert(models.JobOffer).returning(
+            models.JobOffer.id, models.JobOffer.order_id, models.JobOffer.deliverer_id, models.JobOffer.distance_km
+        ),
+        [
+            {"order_id": jobs[job].id, "deliverer_id": deliverers[row].id, "status": "offered",
+             "distance_km": round(km, 2), "offered_at": now, "expires_at": expires_at}
+            for row, job, km in matches
+        ]
+    ).all()
+    db.commit()
+    for offer_id, order_id, deliverer_id, distance_km in offers:
+        hub.publish([f"deliverer:{deliverer_id}"], {
+            "type": "job_offer", "offer_id": offer_id, "order_id": order_id,
+            "distance_km": float(distance_km), "expires_at": expires_at,
+        })
+    stats["offered"] = len(offers)
+    stats["km"] = sum(km for _, _, km in matches)
+    return stats
+
+def accept_offer(db: Session, offer_id: int, deliverer_id: int) -> Optional[tuple[models.Delivery, int]]:
+    """Accept a live offer made to deliverer_id and claim its job, in the caller's transaction
+
+    Returns like claim_job, or None when the offer is not the deliverer's,
+    not live or expired. When the job has meanwhile been taken from the
+    board, the offer is marked withdrawn and None returned as well.
+    """
+    now = datetime.utcnow()
+    order_id = db.execute(
+        update(models.JobOffer).where(
+            models.JobOffer.id == offer_id, models.JobOffer.deliverer_id == deliverer_id,
+            _live_offers(), models.JobOffer.expires_at > now
+        ).values(status="accepted", responded_at=now).returning(models.JobOffer.order_id)
+        .execution_options(synchronize_session=False)
+    ).scalar()
+    if order_id is None:
+        return None
+    claim = claim_job(db, order_id, deliverer_id)
+    if claim is None:
+        db.execute(
+            update(models.JobOffer).where(models.JobOffer.id == offer_id)
+            .values(status="withdrawn").execution_options(synchronize_session=False)
+        )
+    return claim
+
+def decline_offer(db: Session, offer_id: int, deliverer_id: int) -> bool:
+    """Decline a live offer made to deliverer_id, in the caller's transaction; False if there is none"""
+    return db.execute(
+        update(models.JobOffer).where(
+            models.JobOffer.id == offer_id, models.JobOffer.deliverer_id == deliverer_id, _live_offers()
+        ).values(status="declined", responded_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    ).rowcount > 0
+
+def set_position(db: Session, deliverer_id: int, latitude: float, longitude: float, at: datetime):
+    """Record an idle deliverer's position for matching, in the caller's transaction"""
+    db.execute(
+        update(models.DelivererProfile).where(models.DelivererProfile.id == deliverer_id)
+        .values(latitude=latitude, longitude=longitude, location_updated_at=at)
+        .execution_options(synchronize_session=False)
+    )
+
+@lifecycle.subscribe
+def _position_after_delivery(db: Session, order_event: lifecycle.OrderEvent):
+    """A deliverer who just delivered waits at the drop-off point"""
+    if order_event.status != "delivered" or order_event.deliverer_id is None:
+        return
+    drop_off = db.execute(
+        select(models.Order.delivery_latitude, models.Order.delivery_longitude)
+        .where(models.Order.id == order_event.order_id)
+    ).first()
+    if drop_off is not None and drop_off.delivery_latitude is not None and drop_off.delivery_longitude is not None:
+        set_position(db, order_event.deliverer_id, drop_off.delivery_latitude, drop_off.delivery_longitude,
+                     order_event.at)
+
+
+class DispatchEngine:
+    """Runs a dispatch round (offer_jobs) every tick on a background thread
+
+    Batching a tick's worth of jobs and deliverers lets the solver pick the
+    pairs with the least total travel instead of serving whoever asks
+    first. Offers are advisory: jobs stay on the board and claims still go
+    through claim_job, so a job taken there just withdraws its offer. Run
+    one engine per database; two would offer the same jobs twice.
+    """
+
+    def __init__(self, tick_seconds: float = DISPATCH_TICK_SECONDS, solver: str = DISPATCH_SOLVER,
+                 session_factory=None):
+        self.tick_seconds = tick_seconds
+        self.solver = solver
+        self.session_factory = session_factory
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self.tick_seconds <= 0 or self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run_forever, name="dispatch-engine", daemon=True)
+        self._thread.start()
+
+    def wake(self):
+        """Run the next round now instead of at the next tick"""
+        self._wake.set()
+
+    def run_forever(self):
+        while not self._stop.is_set():
+            try:
+                self.tick()
+            except Exception:
+                logger.exception("Dispatch round failed")
+            self._wake.wait(self.tick_seconds)
+            self._wake.clear()
+
+    def tick(self) -> dict:
+        session_factory = self.session_factory or database.SessionLocal
+        with session_factory() as db:
+            stats = offer_jobs(db, self.solver)
+        if stats["offered"]:
+            logger.info("Offered %d jobs (%d open, %d deliverers idle)",
+                        stats["offered"], stats["jobs"], stats["deliverers"])
+        return stats
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def shutdown(self):
+        self.stop()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+dispatch_engine = DispatchEngine()
+
+
+if __name__ == "__main__":
+    # Standalone engine, for API workers started with DISPATCH_TICK_SECONDS=0:
+    # python -m app.dispatch
+    import signal
+
+    logging.basicConfig(level=logging.INFO)
+    engine = DispatchEngine(tick_seconds=DISPATCH_TICK_SECONDS or 5)
+    signal.signal(signal.SIGTERM, lambda *_: engine.stop())
+    signal.signal(signal.SIGINT, lambda *_: engine.stop())
+    engine.run_forever()
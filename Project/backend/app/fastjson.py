@@ -0,0 +1,35 @@
+import os
+from typing import Iterable
+import orjson
+from fastapi.responses import Response
+
+# Build hot list responses from Core rows with orjson instead of validating
+# ORM objects through the pydantic response model; the bytes are the same
+FAST_JSON_RESPONSES = os.getenv("FAST_JSON_RESPONSES", "true").lower() in ("1", "true", "yes", "on")
+
+def fields(schema, exclude: Iterable[str] = ()) -> tuple[str, ...]:
+    """Field names of a response schema, in the order pydantic writes them"""
+    return tuple(name for name in schema.model_fields if name not in exclude)
+
+def columns(model, field_names: Iterable[str]) -> list:
+    """The model's attributes named like the schema fields, for select()"""
+    return [getattr(model, name).label(name) for name in field_names]
+
+def rows_to_dicts(rows, field_names: tuple[str, ...]) -> list[dict]:
+    return [dict(zip(field_names, row)) for row in rows]
+
+def dumps(content) -> bytes:
+    # Aware datetimes end in "Z", as pydantic writes them
+    return orjson.dumps(content, option=orjson.OPT_UTC_Z)
+
+
+class FastJSONResponse(Response):
+    """JSON response rendered with orjson; content may also be pre-serialized bytes
+
+    Returning it from a route skips the response_model validation, so the
+    content must already have the schema's fields in the schema's order.
+    """
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        return content if isinstance(content, bytes) else dumps(content)
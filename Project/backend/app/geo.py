@@ -0,0 +1,158 @@
+import math
+import os
+import threading
+import time
+import numpy as np
+from sqlalchemy.orm import Session
+from . import models
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE_LAT = 111.32
+
+# Grid cell edge in degrees (about 1.1 km north-south)
+GRID_CELL_DEG = float(os.getenv("JOB_INDEX_CELL_DEG", "0.01"))
+# Rebuild the index from the database at least this often, so jobs published
+# by other worker processes show up as well
+RESYNC_SECONDS = float(os.getenv("JOB_INDEX_RESYNC_SECONDS", "30"))
+
+def haversine_km(lat, lng, lats, lngs):
+    """Great-circle distance in km from one point to arrays of points"""
+    lat1 = np.radians(lat)
+    lat2 = np.radians(np.asarray(lats, dtype=np.float64))
+    dlat = lat2 - lat1
+    dlng = np.radians(np.asarray(lngs, dtype=np.float64)) - np.radians(lng)
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlng / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+def distance_matrix(lats1, lngs1, lats2, lngs2):
+    """Great-circle distances in km between every point of one set (rows) and every point of another"""
+    lat1 = np.radians(np.asarray(lats1, dtype=np.float64))[:, None]
+    lat2 = np.radians(np.asarray(lats2, dtype=np.float64))[None, :]
+    dlng = np.radians(np.asarray(lngs2, dtype=np.float64))[None, :] - np.radians(np.asarray(lngs1, dtype=np.float64))[:, None]
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlng / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+def bearing_deg(lat, lng, lats, lngs):
+    """Initial compass bearing in degrees [0, 360) from one point to arrays of points"""
+    lat1 = np.radians(lat)
+    lat2 = np.radians(np.asarray(lats, dtype=np.float64))
+    dlng = np.radians(np.asarray(lngs, dtype=np.float64)) - np.radians(lng)
+    x = np.sin(dlng) * np.cos(lat2)
+    y = np.cos(lat1) * np.sin(lat2) - np.sin(lat1) * np.cos(lat2) * np.cos(dlng)
+    return np.degrees(np.arctan2(x, y)) % 360
+
+
+class JobIndex:
+    """In-process grid index over the store coordinates of open delivery jobs
+
+    Points are bucketed into GRID_CELL_DEG square cells; a radius query only
+    visits the cells overlapping the search box and computes the haversine
+    distance for all candidates in one vectorized call.
+    """
+
+    def __init__(self, cell_deg: float = GRID_CELL_DEG):
+        self.cell_deg = cell_deg
+        self._cells: dict[tuple[int, int], dict[int, tuple[float, float]]] = {}
+        self._cell_of: dict[int, tuple[int, int]] = {}
+        self._lock = threading.Lock()
+        self._synced_at = None
+
+    def _cell(self, lat: float, lng: float) -> tuple[int, int]:
+        return (math.floor(lat / self.cell_deg), math.floor(lng / self.cell_deg))
+
+    def __len__(self):
+        return len(self._cell_of)
+
+    def add(self, order_id: int, lat, lng):
+        """Insert or move a job; jobs without coordinates are not indexed"""
+        if lat is None or lng is None:
+            self.discard(order_id)
+            return
+        lat, lng = float(lat), float(lng)
+        cell = self._cell(lat, lng)
+        with self._lock:
+            self._discard_locked(order_id)
+            self._cells.setdefault(cell, {})[order_id] = (lat, lng)
+            self._cell_of[order_id] = cell
+
+    def discard(self, order_id: int):
+        with self._lock:
+            self._discard_locked(order_id)
+
+    def _discard_locked(self, order_id: int):
+        cell = self._cell_of.pop(order_id, None)
+        if cell is not None:
+            bucket = self._cells[cell]
+            bucket.pop(order_id, None)
+            if not bucket:
+                del self._cells[cell]
+
+    def rebuild(self, points):
+        """Replace the index contents with (order_id, lat, lng) tuples"""
+        cells: dict[tuple[int, int], dict[int, tuple[float, float]]] = {}
+        cell_of: dict[int, tuple[int, int]] = {}
+        for order_id, lat, lng in points:
+            if lat is None or lng is None:
+                continue
+            lat, lng = float(lat), float(lng)
+            cell = self._cell(lat, lng)
+            cells.setdefault(cell, {})[order_id] = (lat, lng)
+            cell_of[order_id] = cell
+        with self._lock:
+            self._cells, self._cell_of = cells, cell_of
+            self._synced_at = time.monotonic()
+
+    def sync(self, db: Session, force: bool = False):
+        """Reload open jobs from the database when the index is stale"""
+        if not force and self._synced_at is not None and time.monotonic() - self._synced_at < RESYNC_SECONDS:
+            return
+        rows = db.query(
+            models.Order.id, models.StoreProfile.latitude, models.StoreProfile.longitude
+        ).join(
+            models.StoreProfile, models.StoreProfile.id == models.Order.store_id
+        ).filter(
+            models.Order.status == "ready_for_pickup",
+            models.Order.deliverer_id == None
+        ).all()
+        self.rebuild(rows)
+
+    def nearest(self, lat: float, lng: float, radius_km: float, k: int) -> list[tuple[int, float]]:
+        """Return up to k (order_id, distance_km) pairs within radius_km, closest first"""
+        dlat = radius_km / KM_PER_DEGREE_LAT
+        dlng = radius_km / (KM_PER_DEGREE_LAT * max(math.cos(math.radians(lat)), 1e-6))
+        lat_lo, lng_lo = self._cell(lat - dlat, lng - dlng)
+        lat_hi, lng_hi = self._cell(lat + dlat, lng + dlng)
+
+        ids, lats, lngs = [], [], []
+        with self._lock:
+            n_cells = (lat_hi - lat_lo + 1) * (lng_hi - lng_lo + 1)
+            if n_cells > len(self._cells):
+                # Search box covers more cells than are occupied: walk occupied cells
+                buckets = [
+                    bucket for (clat, clng), bucket in self._cells.items()
+                    if lat_lo <= clat <= lat_hi and lng_lo <= clng <= lng_hi
+                ]
+            else:
+                buckets = [
+                    self._cells[(clat, clng)]
+                    for clat in range(lat_lo, lat_hi + 1)
+                    for clng in range(lng_lo, lng_hi + 1)
+                    if (clat, clng) in self._cells
+                ]
+            for bucket in buckets:
+                for order_id, (plat, plng) in bucket.items():
+                    ids.append(order_id)
+                    lats.append(plat)
+                    lngs.append(plng)
+
+        if not ids:
+            return []
+        distances = haversine_km(lat, lng, lats, lngs)
+        within = np.flatnonzero(distances <= radius_km)
+        if len(within) > k:
+            within = within[np.argpartition(distances[within], k - 1)[:k]]
+        within = within[np.argsort(distances[within], kind="stable")]
+        return [(ids[i], float(distances[i])) for i in within]
+
+
+job_index = JobIndex()
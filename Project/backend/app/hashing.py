@@ -0,0 +1,83 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from fastapi import HTTPException
+from passlib.context import CryptContext
+
+# bcrypt work factor; each +1 doubles the CPU cost of a hash/verify
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+# Worker processes for password hashing; 0 hashes inline in the request thread
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", "2"))
+# Hash jobs allowed in flight (running + queued) before new ones get a 429
+HASH_MAX_PENDING = int(os.getenv("HASH_MAX_PENDING", str(max(HASH_WORKERS, 1) * 4)))
+HASH_RETRY_AFTER_SECONDS = 1
+# Scheduling niceness of the worker processes, so request handling wins the CPU
+HASH_WORKER_NICE = int(os.getenv("HASH_WORKER_NICE", "10"))
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+
+def _verify(plain_password: str, hashed_password: str) -> bool:
+    return pwd_context.verify(plain_password, hashed_password)
+
+def _hash(password: str) -> str:
+    return pwd_context.hash(password)
+
+def _init_worker():
+    if HASH_WORKER_NICE and hasattr(os, "nice"):
+        os.nice(HASH_WORKER_NICE)
+
+
+class HashingPool:
+    """Runs bcrypt in a fixed set of worker processes with bounded admission
+
+    Callers block on the result, but at most `max_pending` of them at a time;
+    the rest are rejected with 429 so a login storm cannot occupy every
+    threadpool thread and CPU core the order endpoints need.
+    """
+
+    def __init__(self, workers: int = HASH_WORKERS, max_pending: int = HASH_MAX_PENDING):
+        self.workers = workers
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+    def _get_executor(self):
+        with self._executor_lock:
+            if self._executor is None:
+                # spawn: forking a process that already runs threads is unsafe
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                )
+            return self._executor
+
+    def run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            raise HTTPException(
+                status_code=429,
+                detail="Too many authentication requests, please retry",
+                headers={"Retry-After": str(HASH_RETRY_AFTER_SECONDS)},
+            )
+        try:
+            if self.workers <= 0:
+                return fn(*args)
+            return self._get_executor().submit(fn, *args).result()
+        finally:
+            self._slots.release()
+
+    def shutdown(self):
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown(cancel_futures=True)
+                self._executor = None
+
+
+hashing_pool = HashingPool()
+
+def verify_password(plain_password: str, hashed_password: str) -> bool:
+    return hashing_pool.run(_verify, plain_password, hashed_password)
+
+def hash_password(password: str) -> str:
+    return hashing_pool.run(_hash, password)
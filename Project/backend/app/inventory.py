@@ -0,0 +1,179 @@
+import random
+from fastapi import HTTPException
+from sqlalchemy import case, delete, func, insert, select, update
+from sqlalchemy.orm import Session
+from . import lifecycle, models
+from .catalog_cache import catalog_cache
+
+STOCK_SHARDS_MAX = 64
+
+def reserve(db: Session, products: dict[int, models.Product], quantities: dict[int, int]):
+    """Take quantities (product_id -> n) out of stock in the caller's transaction
+
+    Products with a single stock row are decremented together by one
+    conditional UPDATE, so stock can never go below zero and nothing is read
+    first. Raises 409 naming the products that are short; the caller rolls
+    back, which also returns whatever was already taken.
+    """
+    plain = {product_id: n for product_id, n in quantities.items() if not products[product_id].stock_shards}
+    short = []
+    if plain:
+        need = case(plain, value=models.Product.id)
+        taken = set(db.execute(
+            update(models.Product)
+            .where(models.Product.id.in_(plain), models.Product.stock_quantity >= need)
+            .values(stock_quantity=models.Product.stock_quantity - need)
+            .returning(models.Product.id)
+            .execution_options(synchronize_session=False)
+        ).scalars())
+        short = [product_id for product_id in plain if product_id not in taken]
+    if not short:
+        # After the single-row products, in id order, so buyers lock in one order
+        for product_id in sorted(set(quantities) - set(plain)):
+            if not _take_from_shards(db, product_id, quantities[product_id]):
+                short.append(product_id)
+                break
+    if short:
+        names = ", ".join(products[product_id].name for product_id in short)
+        raise HTTPException(status_code=409, detail=f"Out of stock: {names}")
+
+def _take_from_shards(db: Session, product_id: int, n: int) -> bool:
+    shard = models.ProductStockShard
+    # Any one shard that is not locked by another buyer and holds enough
+    picked = db.execute(
+        select(shard.shard).where(shard.product_id == product_id, shard.quantity >= n)
+        .order_by(func.random()).limit(1).with_for_update(skip_locked=True)
+    ).scalar()
+    if picked is not None:
+        db.execute(
+            update(shard).where(shard.product_id == product_id, shard.shard == picked)
+            .values(quantity=shard.quantity - n)
+        )
+    else:
+        # Every shard is busy or too small on its own: wait for all of them, in shard order
+        rows = db.execute(
+            select(shard.shard, shard.quantity).where(shard.product_id == product_id)
+            .order_by(shard.shard).with_for_update()
+        ).all()
+        if sum(quantity for _, quantity in rows) < n:
+            return False
+        remaining = n
+        for number, quantity in rows:
+            take = min(quantity, remaining)
+            if take:
+                db.execute(
+                    update(shard).where(shard.product_id == product_id, shard.shard == number)
+                    .values(quantity=shard.quantity - take)
+                )
+                remaining -= take
+            if not remaining:
+                break
+    _refresh_total(db, product_id)
+    return True
+
+def _refresh_total(db: Session, product_id: int):
+    """Copy a sharded product's stock into products.stock_quantity, for display
+
+    Skipped while another buyer holds the product row, so the row is never
+    waited on; that buyer's refresh includes this change once it commits.
+    """
+    shard = models.ProductStockShard
+    unlocked = select(models.Product.id).where(models.Product.id == product_id).with_for_update(skip_locked=True)
+    total = select(func.coalesce(func.sum(shard.quantity), 0)).where(shard.product_id == product_id)
+    db.execute(
+        update(models.Product).where(models.Product.id == unlocked.scalar_subquery())
+        .values(stock_quantity=total.scalar_subquery())
+        .execution_options(synchronize_session=False)
+    )
+
+def release(db: Session, quantities: dict[int, int]):
+    """Put quantities (product_id -> n) back into stock in the caller's transaction"""
+    shards = dict(db.execute(
+        select(models.Product.id, models.Product.stock_shards).where(models.Product.id.in_(quantities))
+    ).all())
+    plain = {product_id: n for product_id, n in quantities.items() if product_id in shards and not shards[product_id]}
+    if plain:
+        db.execute(
+            update(models.Product).where(models.Product.id.in_(plain))
+            .values(stock_quantity=models.Product.stock_quantity + case(plain, value=models.Product.id))
+            .execution_options(synchronize_session=False)
+        )
+    for product_id in sorted(set(shards) - set(plain)):
+        shard = models.ProductStockShard
+        db.execute(
+            update(shard).where(shard.product_id == product_id, shard.shard == random.randrange(shards[product_id]))
+            .values(quantity=shard.quantity + quantities[product_id])
+        )
+        _refresh_total(db, product_id)
+
+def order_quantities(details) -> dict[int, int]:
+    """product_id -> total quantity over an order's lines"""
+    quantities: dict[int, int] = {}
+    for item in details:
+        quantities[item.product_id] = quantities.get(item.product_id, 0) + item.quantity
+    return quantities
+
+@lifecycle.subscribe
+def _restock_cancelled(db: Session, order_event: lifecycle.OrderEvent):
+    """Put a cancelled order's items back; the transition happens once, so they are returned once"""
+    if order_event.status != "cancelled":
+        return
+    details = db.execute(
+        select(models.OrderDetail.product_id, models.OrderDetail.quantity)
+        .where(models.OrderDetail.order_id == order_event.order_id, models.OrderDetail.product_id.is_not(None))
+    ).all()
+    release(db, order_quantities(details))
+    # The menu shows stock_quantity
+    lifecycle.after_commit(db, lambda: catalog_cache.invalidate_stock(order_event.store_id))
+
+def set_shards(db: Session, product_id: int, shards: int) -> int:
+    """Spread a product's stock over shards rows (0 or 1: back to the product row)
+
+    Commits. Worth it for items many buyers order at once, e.g. a flash sale.
+    Returns the product's stock.
+    """
+    if not 0 <= shards <= STOCK_SHARDS_MAX:
+        raise ValueError(f"shards must be between 0 and {STOCK_SHARDS_MAX}")
+    product = db.execute(
+        select(models.Product).where(models.Product.id == product_id).with_for_update()
+    ).scalar_one()
+    stock = product.stock_quantity or 0
+    if product.stock_shards:
+        stock = _clear_shards(db, product_id)
+    if shards > 1:
+        _fill_shards(db, product_id, shards, stock)
+    product.stock_shards = shards if shards > 1 else 0
+    product.stock_quantity = stock
+    db.commit()
+    return stock
+
+def set_stock(db: Session, product: models.Product, stock: int):
+    """Replace a sharded product's stock in the caller's transaction"""
+    _clear_shards(db, product.id)
+    _fill_shards(db, product.id, product.stock_shards, stock)
+    product.stock_quantity = stock
+
+def _clear_shards(db: Session, product_id: int) -> int:
+    shard = models.ProductStockShard
+    stock = sum(db.execute(
+        select(shard.quantity).where(shard.product_id == product_id).order_by(shard.shard).with_for_update()
+    ).scalars())
+    db.execute(delete(shard).where(shard.product_id == product_id))
+    return stock
+
+def _fill_shards(db: Session, product_id: int, shards: int, stock: int):
+    db.execute(insert(models.ProductStockShard), [
+        {"product_id": product_id, "shard": number, "quantity": stock // shards + (number < stock % shards)}
+        for number in range(shards)
+    ])
+
+
+if __name__ == "__main__":
+    # Shard a hot product's stock: python -m app.inventory <product_id> <shards>
+    import sys
+    from .database import SessionLocal
+
+    product_id, shards = int(sys.argv[1]), int(sys.argv[2])
+    with SessionLocal() as db:
+        stock = set_shards(db, product_id, shards)
+        print(f"Product {product_id}: {stock} in stock over {max(shards, 1)} row(s)")
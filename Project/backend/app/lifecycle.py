@@ -0,0 +1,203 @@
+import logging
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable, Optional
+from fastapi import HTTPException
+from sqlalchemy import event, exists, func, select, update
+from sqlalchemy.orm import Session
+from . import models
+from .geo import job_index
+from .realtime import hub, order_topics
+
+logger = logging.getLogger(__name__)
+
+ORDER_STATUSES = ("pending", "accepted", "preparing", "ready_for_pickup", "picked_up", "delivering",
+                  "delivered", "completed", "cancelled")
+# status -> statuses an order may move to it from. Nothing leads back to
+# pending, and delivered (then completed) and cancelled are the two ends.
+ORDER_TRANSITIONS = {
+    "accepted": ("pending",),
+    "preparing": ("accepted",),
+    "ready_for_pickup": ("accepted", "preparing"),
+    "picked_up": ("ready_for_pickup",),  # a deliverer claiming the job (dispatch.claim_job)
+    "delivering": ("picked_up",),
+    "delivered": ("picked_up", "delivering"),
+    "completed": ("delivered",),
+    "cancelled": ("pending", "accepted", "preparing", "ready_for_pickup", "picked_up", "delivering"),
+}
+# The same for deliveries: assigned on claim, then moved along by the deliverer
+DELIVERY_TRANSITIONS = {
+    "picked_up": ("assigned",),
+    "delivering": ("assigned", "picked_up"),
+    "completed": ("assigned", "picked_up", "delivering"),
+    "cancelled": ("assigned", "picked_up", "delivering"),
+}
+# Delivery statuses a deliverer sets, and the order status each moves the order to
+DELIVERY_STEPS = {"picked_up": None, "delivering": "delivering", "completed": "delivered"}
+
+# Order status -> status its delivery follows it to, and its deliverer's work_status
+_DELIVERY_CASCADE = {"delivering": "delivering", "delivered": "completed", "cancelled": "cancelled"}
+_WORK_STATUS_CASCADE = {"picked_up": "busy", "delivered": "online", "cancelled": "online"}
+# Order statuses in which the order's deliverer is carrying it
+_CARRYING = ("picked_up", "delivering")
+
+@dataclass(frozen=True)
+class OrderEvent:
+    """An order entering status; the other fields are the order's after the change"""
+    order_id: int
+    status: str
+    store_id: int
+    deliverer_id: Optional[int]
+    subtotal: int
+    delivery_fee: int
+    ordered_at: Optional[datetime]
+    accepted_at: Optional[datetime]
+    completed_at: Optional[datetime]
+    at: datetime
+
+_EVENT_COLUMNS = (models.Order.store_id, models.Order.deliverer_id, models.Order.subtotal, models.Order.delivery_fee,
+                  models.Order.ordered_at, models.Order.accepted_at, models.Order.completed_at)
+
+_subscribers: list[Callable[[Session, OrderEvent], None]] = []
+
+def subscribe(handler: Callable[[Session, OrderEvent], None]):
+    """Register handler(db, event) for every order event; usable as a decorator
+
+    Handlers run in the transaction that made the change, so what they write
+    commits or rolls back with it. Work that must wait for the commit
+    (notifying clients, caches) goes through after_commit.
+    """
+    _subscribers.append(handler)
+    return handler
+
+def emit(db: Session, order_event: OrderEvent):
+    for handler in _subscribers:
+        handler(db, order_event)
+
+def after_commit(db: Session, callback: Callable[[], None]):
+    """Run callback() once db's current transaction has committed; dropped if it rolls back"""
+    db.info.setdefault("after_commit", []).append(callback)
+
+@event.listens_for(Session, "after_commit")
+def _run_after_commit(session: Session):
+    for callback in session.info.pop("after_commit", ()):
+        try:
+            callback()
+        except Exception:
+            logger.exception("after_commit callback failed")
+
+@event.listens_for(Session, "after_rollback")
+def _drop_after_commit(session: Session):
+    session.info.pop("after_commit", None)
+
+def order_placed(db: Session, order: models.Order):
+    """Emit the pending event of an order just inserted (flushed) in db's transaction"""
+    emit(db, OrderEvent(
+        order_id=order.id, status="pending", store_id=order.store_id, deliverer_id=None,
+        subtotal=order.subtotal, delivery_fee=order.delivery_fee, ordered_at=None, accepted_at=None,
+        completed_at=None, at=datetime.utcnow()
+    ))
+
+def transition(db: Session, order_id: int, status: str, where=(), cascade_delivery: bool = True,
+               **values) -> Optional[OrderEvent]:
+    """Move an order to status in the caller's transaction; None if it is not in a status allowed to
+
+    The move is one conditional UPDATE ... RETURNING, so of two requests
+    moving the same order at once only one can succeed, and nothing is read
+    first. It stamps accepted_at/completed_at (the first time) or
+    cancelled_at, carries the order's delivery and deliverer along, and
+    emits the event to the subscribers. where adds conditions, values
+    further columns to set.
+    """
+    sources = ORDER_TRANSITIONS.get(status)
+    if not sources:
+        return None
+    now = datetime.utcnow()
+    values["status"] = status
+    if status == "accepted":
+        values["accepted_at"] = func.coalesce(models.Order.accepted_at, now)
+    elif status == "ready_for_pickup":
+        values["ready_at"] = now
+    elif status in ("delivered", "completed"):
+        values["completed_at"] = func.coalesce(models.Order.completed_at, now)
+    elif status == "cancelled":
+        values["cancelled_at"] = now
+    row = db.execute(
+        update(models.Order).where(models.Order.id == order_id, models.Order.status.in_(sources), *where)
+        .values(**values).returning(*_EVENT_COLUMNS)
+        .execution_options(synchronize_session=False)
+    ).first()
+    if row is None:
+        return None
+
+    if cascade_delivery and status in _DELIVERY_CASCADE:
+        _move_delivery(db, models.Delivery.order_id == order_id, _DELIVERY_CASCADE[status], now)
+    if row.deliverer_id is not None and status in _WORK_STATUS_CASCADE:
+        where = ()
+        if _WORK_STATUS_CASCADE[status] == "online":
+            # A deliverer carrying a batch stays busy until the last drop
+            where = (~exists().where(
+                models.Order.deliverer_id == row.deliverer_id, models.Order.id != order_id,
+                models.Order.status.in_(_CARRYING)
+            ),)
+        db.execute(
+            update(models.DelivererProfile).where(models.DelivererProfile.id == row.deliverer_id, *where)
+            .values(work_status=_WORK_STATUS_CASCADE[status])
+            .execution_options(synchronize_session=False)
+        )
+    order_event = OrderEvent(order_id=order_id, status=status, at=now, **row._mapping)
+    emit(db, order_event)
+    return order_event
+
+def _move_delivery(db: Session, condition, status: str, now: datetime) -> Optional[int]:
+    """Conditionally move the matching delivery to status; returns its order id, None if none moved"""
+    values = {"status": status}
+    if status == "picked_up":
+        values["pickup_time"] = func.coalesce(models.Delivery.pickup_time, now)
+    elif status == "completed":
+        values["delivery_time"] = func.coalesce(models.Delivery.delivery_time, now)
+    return db.execute(
+        update(models.Delivery).where(condition, models.Delivery.status.in_(DELIVERY_TRANSITIONS[status]))
+        .values(**values).returning(models.Delivery.order_id)
+        .execution_options(synchronize_session=False)
+    ).scalar()
+
+def advance_delivery(db: Session, delivery_id: int, deliverer_id: int, status: str) -> Optional[int]:
+    """Move a deliverer's own delivery to one of DELIVERY_STEPS, and its order along, in the caller's transaction
+
+    Returns the order id, or None if the delivery is not the deliverer's or
+    not in a status allowed to. Raises 409 when the order cannot follow,
+    e.g. because the store cancelled it meanwhile; the caller rolls back.
+    """
+    order_id = _move_delivery(
+        db, (models.Delivery.id == delivery_id) & (models.Delivery.deliverer_id == deliverer_id),
+        status, datetime.utcnow()
+    )
+    if order_id is None:
+        return None
+    order_status = DELIVERY_STEPS[status]
+    if order_status and transition(db, order_id, order_status, cascade_delivery=False) is None:
+        current = db.execute(select(models.Order.status).where(models.Order.id == order_id)).scalar()
+        raise HTTPException(status_code=409, detail=f"Order is {current}")
+    return order_id
+
+@subscribe
+def _announce(db: Session, order_event: OrderEvent):
+    """After commit: keep the nearest-job index in step with the board and notify the order's subscribers"""
+    if order_event.status == "pending":
+        return
+    topics = order_topics(order_event.order_id, order_event.store_id, order_event.deliverer_id)
+    on_board = order_event.status == "ready_for_pickup" and order_event.deliverer_id is None
+    if on_board:
+        store = db.execute(
+            select(models.StoreProfile.latitude, models.StoreProfile.longitude)
+            .where(models.StoreProfile.id == order_event.store_id)
+        ).first()
+        after_commit(db, lambda: job_index.add(order_event.order_id, store.latitude, store.longitude))
+    if on_board or "ready_for_pickup" in ORDER_TRANSITIONS[order_event.status]:
+        # On the board now, or may just have left it
+        topics.append("jobs")
+        if not on_board:
+            after_commit(db, lambda: job_index.discard(order_event.order_id))
+    message = {"type": "order_status", "order_id": order_event.order_id, "status": order_event.status}
+    after_commit(db, lambda: hub.publish(topics, message))
@@ -1,12 +1,38 @@
+from contextlib import ExitStack, asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from .database import engine, Base
-from .routers import auth, products, orders, delivery, stores, notifications, profile
+from . import broadcasts, dispatch, hashing, realtime, tracking
+# Subscribe to order lifecycle events on import
+from . import analytics, inventory, rollups  # noqa: F401
+from .database import engine, Base, DB_MODE, SQLALCHEMY_DATABASE_URL
+from .pagination import NEXT_CURSOR_HEADER
+from .routers import auth, products, orders, delivery, stores, notifications, profile, internal
+from .routers import realtime as realtime_router
 
 # Create tables
 Base.metadata.create_all(bind=engine)
 
-app = FastAPI(title="Stellar Delivery API")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Run the background workers while the app serves
+
+    The realtime hub starts first and stops last, since the others publish
+    through it. On shutdown the workers stop in reverse order, then the
+    buffered location fixes are flushed; every step runs even if an
+    earlier one fails.
+    """
+    with ExitStack() as stack:
+        realtime.hub.start(SQLALCHEMY_DATABASE_URL)
+        stack.callback(realtime.hub.shutdown)
+        stack.callback(hashing.hashing_pool.shutdown)
+        stack.callback(tracking.location_buffer.shutdown)
+        broadcasts.broadcast_runner.start()
+        stack.callback(broadcasts.broadcast_runner.shutdown)
+        dispatch.dispatch_engine.start()
+        stack.callback(dispatch.dispatch_engine.shutdown)
+        yield
+
+app = FastAPI(title="Stellar Delivery API", lifespan=lifespan)
 
 # CORS configuration
 origins = [
@@ -22,8 +48,27 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER],
 )
 
+if DB_MODE == "async":
+    from .routers.aio import orders as aio_orders, delivery as aio_delivery
+    from .routers.aio import products as aio_products, notifications as aio_notifications
+
+    # Each async router replaces the sync routes it re-implements
+    for sync_router, async_router in [
+        (products.router, aio_products.router),
+        (orders.router, aio_orders.router),
+        (delivery.router, aio_delivery.router),
+        (notifications.router, aio_notifications.router),
+    ]:
+        shadowed = {(route.path, frozenset(route.methods)) for route in async_router.routes}
+        sync_router.routes[:] = [
+            route for route in sync_router.routes
+            if (route.path, frozenset(route.methods)) not in shadowed
+        ]
+        app.include_router(async_router)
+
 app.include_router(auth.router)
 app.include_router(products.router)
 app.include_router(orders.router)
@@ -31,6 +76,8 @@ app.include_router(delivery.router)
 app.include_router(stores.router)
 app.include_router(notifications.router)
 app.include_router(profile.router)
+app.include_router(internal.router)
+app.include_router(realtime_router.router)
 
 @app.get("/")
 def read_root():
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, Float, DateTime, Text, Numeric, Date
+from sqlalchemy import Column, Integer, BigInteger, String, Boolean, ForeignKey, Float, DateTime, Text, Numeric, Date, Index, LargeBinary, DDL, event
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from .database import Base
@@ -69,6 +69,10 @@ class DelivererProfile(Base):
     phone_number = Column(String(20))
     resume = Column(Text)
     work_status = Column(String(20), default="offline")  # online, offline, busy
+    # Last known position while not on a delivery, matched against open jobs (see dispatch.py)
+    latitude = Column(Numeric(10, 8))
+    longitude = Column(Numeric(11, 8))
+    location_updated_at = Column(DateTime)
     bank_name = Column(String(100))
     bank_branch = Column(String(100))
     bank_account_type = Column(String(20))
@@ -106,6 +110,8 @@ class StoreProfile(Base):
     bank_account_holder = Column(String(100))
     store_image_url = Column(String(500))
     is_open = Column(Boolean, default=True)
+    # Platform commission on the store's item sales, in percent (see rollups.py)
+    commission_rate = Column(Numeric(5, 2), nullable=False, default=10.00)
     created_at = Column(DateTime, server_default=func.now())
     updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
 
@@ -145,6 +151,8 @@ class Product(Base):
     image_url = Column(String(500))
     is_available = Column(Boolean, default=True)
     stock_quantity = Column(Integer, default=0)
+    # > 0: the stock lives in that many product_stock_shards rows (see inventory.py)
+    stock_shards = Column(Integer, default=0)
     display_order = Column(Integer, default=0)
     created_at = Column(DateTime, server_default=func.now())
     updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
@@ -153,6 +161,26 @@ class Product(Base):
     category = relationship("ProductCategory", back_populates="products")
     order_details = relationship("OrderDetail", back_populates="product")
 
+    # Trigram indexes answer the ILIKE '%term%' of /products/search on Postgres
+    __table_args__ = (
+        Index("idx_products_name_trgm", "name", postgresql_using="gin",
+              postgresql_ops={"name": "gin_trgm_ops"}).ddl_if(dialect="postgresql"),
+        Index("idx_products_description_trgm", "description", postgresql_using="gin",
+              postgresql_ops={"description": "gin_trgm_ops"}).ddl_if(dialect="postgresql"),
+    )
+
+event.listen(Product.__table__, "before_create",
+             DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(dialect="postgresql"))
+
+
+class ProductStockShard(Base):
+    """One slice of a hot product's stock, so concurrent buyers lock different rows (see inventory.py)"""
+    __tablename__ = "product_stock_shards"
+
+    product_id = Column(Integer, ForeignKey("products.id", ondelete="CASCADE"), primary_key=True)
+    shard = Column(Integer, primary_key=True)
+    quantity = Column(Integer, nullable=False, default=0)
+
 
 # ==========================================
 # 注文管理モデル
@@ -177,16 +205,29 @@ class Order(Base):
     estimated_delivery_time = Column(DateTime)
     ordered_at = Column(DateTime, server_default=func.now())
     accepted_at = Column(DateTime)
+    # Last time the order went ready_for_pickup; pickups ready together are batched (see batching.py)
+    ready_at = Column(DateTime)
     completed_at = Column(DateTime)
     cancelled_at = Column(DateTime)
     cancel_reason = Column(Text)
+    # Day whose sales rollups include this order; NULL while not counted (see rollups.py)
+    rollup_day = Column(Date)
+    # The store's commission_rate when the order was first counted; kept when it is counted again
+    commission_rate = Column(Numeric(5, 2))
 
     requester = relationship("RequesterProfile", back_populates="orders")
     store = relationship("StoreProfile", back_populates="orders")
-    order_details = relationship("OrderDetail", back_populates="order")
+    order_details = relationship("OrderDetail", back_populates="order", order_by="OrderDetail.id")
     delivery = relationship("Delivery", back_populates="order", uselist=False)
     payment = relationship("Payment", back_populates="order", uselist=False)
 
+    # Serve the newest-first keyset pages of /orders/my per role
+    __table_args__ = (
+        Index("idx_orders_requester_ordered", "requester_id", "ordered_at", "id"),
+        Index("idx_orders_store_ordered", "store_id", "ordered_at", "id"),
+        Index("idx_orders_deliverer_ordered", "deliverer_id", "ordered_at", "id"),
+    )
+
 
 class OrderDetail(Base):
     __tablename__ = "order_details"
@@ -230,6 +271,26 @@ class Delivery(Base):
     location_history = relationship("DeliveryLocationHistory", back_populates="delivery")
 
 
+class JobOffer(Base):
+    """A job offered to one deliverer by the dispatch engine, open until expires_at (see dispatch.py)"""
+    __tablename__ = "job_offers"
+
+    id = Column(Integer, primary_key=True, index=True)
+    order_id = Column(Integer, ForeignKey("orders.id", ondelete="CASCADE"), nullable=False)
+    deliverer_id = Column(Integer, ForeignKey("deliverer_profiles.id", ondelete="CASCADE"), nullable=False)
+    status = Column(String(20), nullable=False, default="offered")  # offered, accepted, declined, expired, withdrawn
+    distance_km = Column(Numeric(6, 2))  # deliverer to store when offered
+    offered_at = Column(DateTime, nullable=False)
+    expires_at = Column(DateTime, nullable=False)
+    responded_at = Column(DateTime)
+
+    __table_args__ = (
+        Index("idx_job_offers_order", "order_id"),
+        Index("idx_job_offers_status_expires", "status", "expires_at"),
+        Index("idx_job_offers_deliverer_status", "deliverer_id", "status"),
+    )
+
+
 class DeliveryLocationHistory(Base):
     __tablename__ = "delivery_location_history"
 
@@ -241,6 +302,23 @@ class DeliveryLocationHistory(Base):
 
     delivery = relationship("Delivery", back_populates="location_history")
 
+    __table_args__ = (
+        Index("idx_location_history_delivery", "delivery_id", "recorded_at"),
+    )
+
+
+class DeliveryTrack(Base):
+    """Compacted location history of a finished delivery (see tracks.py)"""
+    __tablename__ = "delivery_tracks"
+
+    id = Column(Integer, primary_key=True, index=True)
+    delivery_id = Column(Integer, ForeignKey("deliveries.id", ondelete="CASCADE"), unique=True, nullable=False)
+    point_count = Column(Integer, nullable=False)
+    started_at = Column(DateTime, nullable=False)
+    packed = Column(LargeBinary, nullable=False)  # delta-encoded int32 lat/lng/time arrays
+    polyline = Column(Text, nullable=False)  # simplified route, encoded polyline format
+    created_at = Column(DateTime, server_default=func.now())
+
 
 # ==========================================
 # 通知モデル
@@ -260,6 +338,43 @@ class Notification(Base):
 
     user = relationship("User", back_populates="notifications")
 
+    __table_args__ = (
+        Index("idx_notifications_user_created", "user_id", "created_at", "id"),
+    )
+
+
+class NotificationCounter(Base):
+    """Denormalized unread notification count per user (see notification_counts.py)"""
+    __tablename__ = "notification_counters"
+
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    unread_count = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
+
+
+class NotificationBroadcast(Base):
+    """One notification sent to a whole audience, in chunks (see broadcasts.py)"""
+    __tablename__ = "notification_broadcasts"
+
+    id = Column(Integer, primary_key=True, index=True)
+    created_by = Column(Integer, ForeignKey("users.id", ondelete="SET NULL"))
+    title = Column(String(200), nullable=False)
+    message = Column(Text, nullable=False)
+    type = Column(String(50), nullable=False)  # system, promotion
+    audience = Column(String(20), nullable=False)  # role, store_customers, users
+    audience_role = Column(String(20))
+    audience_store_id = Column(Integer, ForeignKey("store_profiles.id", ondelete="CASCADE"))
+    audience_user_ids = Column(Text)  # JSON list of user ids for the "users" audience
+    status = Column(String(20), default="pending")  # pending, running, completed, failed
+    total_count = Column(Integer, nullable=False, default=0)
+    sent_count = Column(Integer, nullable=False, default=0)
+    last_user_id = Column(Integer, nullable=False, default=0)  # checkpoint: recipients up to this id are done
+    heartbeat_at = Column(DateTime)
+    error = Column(Text)
+    created_at = Column(DateTime, server_default=func.now())
+    started_at = Column(DateTime)
+    finished_at = Column(DateTime)
+
 
 # ==========================================
 # 支払い・売上モデル
@@ -297,6 +412,10 @@ class DelivererPayout(Base):
 
     deliverer = relationship("DelivererProfile", back_populates="payouts")
 
+    __table_args__ = (
+        Index("idx_deliverer_payouts_period", "deliverer_id", "period_start", "period_end", unique=True),
+    )
+
 
 class StoreSales(Base):
     __tablename__ = "store_sales"
@@ -315,3 +434,58 @@ class StoreSales(Base):
     created_at = Column(DateTime, server_default=func.now())
 
     store = relationship("StoreProfile", back_populates="sales")
+
+    __table_args__ = (
+        Index("idx_store_sales_period", "store_id", "period_start", "period_end", unique=True),
+    )
+
+
+class StoreSalesDaily(Base):
+    """Delivered orders of a store per day, kept up to date as orders change (see rollups.py)"""
+    __tablename__ = "store_sales_daily"
+
+    store_id = Column(Integer, ForeignKey("store_profiles.id", ondelete="CASCADE"), primary_key=True)
+    day = Column(Date, primary_key=True)
+    order_count = Column(Integer, nullable=False, default=0)
+    gross_amount = Column(Integer, nullable=False, default=0)
+    commission_amount = Column(Integer, nullable=False, default=0)
+    net_amount = Column(Integer, nullable=False, default=0)
+
+
+class DelivererEarningsDaily(Base):
+    """Completed deliveries of a deliverer per day, kept up to date as orders change (see rollups.py)"""
+    __tablename__ = "deliverer_earnings_daily"
+
+    deliverer_id = Column(Integer, ForeignKey("deliverer_profiles.id", ondelete="CASCADE"), primary_key=True)
+    day = Column(Date, primary_key=True)
+    delivery_count = Column(Integer, nullable=False, default=0)
+    total_amount = Column(Integer, nullable=False, default=0)
+
+
+class StoreStatsBucket(Base):
+    """Order lifecycle counts of a store per hour (see analytics.py)"""
+    __tablename__ = "store_stats_buckets"
+
+    store_id = Column(Integer, ForeignKey("store_profiles.id", ondelete="CASCADE"), primary_key=True)
+    granularity = Column(String(5), primary_key=True)  # hour; day and month are summed from hours when read
+    bucket = Column(DateTime, primary_key=True)  # start of the hour
+    orders_placed = Column(Integer, nullable=False, default=0)
+    orders_accepted = Column(Integer, nullable=False, default=0)
+    accept_seconds = Column(BigInteger, nullable=False, default=0)  # ordered_at -> accepted_at, summed
+    orders_completed = Column(Integer, nullable=False, default=0)
+    revenue = Column(BigInteger, nullable=False, default=0)
+    prep_count = Column(Integer, nullable=False, default=0)  # completed orders that had been accepted
+    prep_seconds = Column(BigInteger, nullable=False, default=0)  # accepted_at -> completed_at, summed
+    orders_cancelled = Column(Integer, nullable=False, default=0)
+
+
+class StoreProductBucket(Base):
+    """Units and revenue of a store's delivered products per day (see analytics.py)"""
+    __tablename__ = "store_product_buckets"
+
+    store_id = Column(Integer, ForeignKey("store_profiles.id", ondelete="CASCADE"), primary_key=True)
+    granularity = Column(String(5), primary_key=True)  # day
+    bucket = Column(DateTime, primary_key=True)
+    product_id = Column(Integer, ForeignKey("products.id", ondelete="CASCADE"), primary_key=True)
+    quantity = Column(Integer, nullable=False, default=0)
+    revenue = Column(BigInteger, nullable=False, default=0)
@@ -0,0 +1,120 @@
+from sqlalchemy import func, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+from . import models
+
+_DIALECT_INSERTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+def ensure_counters(db: Session, user_ids):
+    """Create the missing counter rows of user_ids, initialized from COUNT(*)
+
+    Call it in the transaction before changing the users' notifications, then
+    apply the change with add_unread. Existing rows are not touched.
+    """
+    user_ids = sorted(set(user_ids))
+    if not user_ids:
+        return
+    counter = models.NotificationCounter.__table__
+    unread = select(func.count(models.Notification.id)).where(
+        models.Notification.user_id == models.User.id,
+        models.Notification.is_read == False
+    ).scalar_subquery()
+    missing = select(models.User.id, unread).where(
+        models.User.id.in_(user_ids),
+        ~select(counter.c.user_id).where(counter.c.user_id == models.User.id).exists()
+    )
+    insert = _DIALECT_INSERTS[db.get_bind().dialect.name]
+    db.execute(insert(counter).from_select(["user_id", "unread_count"], missing).on_conflict_do_nothing())
+
+def add_unread(db: Session, deltas: dict[int, int]):
+    """Adjust unread counters by user_id -> delta in the caller's transaction
+
+    Run it in the same transaction as the notifications change it mirrors, so
+    both commit or roll back together; the rows must exist (ensure_counters).
+    """
+    deltas = {user_id: delta for user_id, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    counter = models.NotificationCounter.__table__
+    user_ids = sorted(deltas)
+    if len(user_ids) > 1:
+        # Lock in user_id order first, so concurrent fan-outs cannot deadlock
+        db.execute(
+            select(counter.c.user_id).where(counter.c.user_id.in_(user_ids))
+            .order_by(counter.c.user_id).with_for_update()
+        )
+    by_delta: dict[int, list[int]] = {}
+    for user_id in user_ids:
+        by_delta.setdefault(deltas[user_id], []).append(user_id)
+    # One UPDATE per distinct delta; a broadcast chunk is a single statement
+    for delta, delta_user_ids in by_delta.items():
+        db.execute(
+            update(counter).where(counter.c.user_id.in_(delta_user_ids)).values(
+                unread_count=counter.c.unread_count + delta, updated_at=func.now()
+            )
+        )
+
+def unread_count(db: Session, user_id: int) -> int:
+    """Unread count from the counter row; a primary-key lookup"""
+    count = db.execute(
+        select(models.NotificationCounter.unread_count).where(models.NotificationCounter.user_id == user_id)
+    ).scalar()
+    # No row yet: the user has had no notification since counters were introduced
+    # and reconcile() has not reached them
+    return count if count is not None else count_unread(db, user_id)
+
+def count_unread(db: Session, user_id: int) -> int:
+    """Authoritative unread count; what the counters are reconciled against"""
+    return db.execute(
+        select(func.count(models.Notification.id)).where(
+            models.Notification.user_id == user_id,
+            models.Notification.is_read == False
+        )
+    ).scalar()
+
+def reconcile(db: Session, batch_size: int = 1000) -> int:
+    """Rewrite every counter that differs from COUNT(*) of unread notifications
+
+    Returns the number of counters fixed. Each batch of users is recounted
+    and corrected in its own transaction, with the counter rows locked, so a
+    concurrent create or mark-read cannot interleave with the recount.
+    """
+    fixed = 0
+    last_user_id = 0
+    while True:
+        user_ids = db.execute(
+            select(models.User.id).where(models.User.id > last_user_id).order_by(models.User.id).limit(batch_size)
+        ).scalars().all()
+        if not user_ids:
+            return fixed
+        last_user_id = user_ids[-1]
+
+        # Make sure every user has a counter row to lock
+        ensure_counters(db, user_ids)
+        stored = dict(db.execute(
+            select(models.NotificationCounter.user_id, models.NotificationCounter.unread_count).where(
+                models.NotificationCounter.user_id.in_(user_ids)
+            ).order_by(models.NotificationCounter.user_id).with_for_update()
+        ).all())
+        actual = dict(db.execute(
+            select(models.Notification.user_id, func.count(models.Notification.id)).where(
+                models.Notification.user_id.in_(user_ids),
+                models.Notification.is_read == False
+            ).group_by(models.Notification.user_id)
+        ).all())
+        drifted = [
+            {"user_id": user_id, "unread_count": actual.get(user_id, 0)}
+            for user_id in user_ids if stored.get(user_id) != actual.get(user_id, 0)
+        ]
+        if drifted:
+            db.execute(update(models.NotificationCounter), drifted)
+        db.commit()
+        fixed += len(drifted)
+
+
+if __name__ == "__main__":
+    # Reconciliation job: python -m app.notification_counts
+    from .database import SessionLocal
+
+    with SessionLocal() as db:
+        print(f"Fixed {reconcile(db)} unread counters")
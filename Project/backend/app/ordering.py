@@ -0,0 +1,78 @@
+from fastapi import HTTPException
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+from . import inventory, lifecycle, models, schemas
+from .catalog_cache import catalog_cache
+
+DEFAULT_DELIVERY_FEE = 300
+
+def load_order_products(db: Session, store_id: int, details: list[schemas.OrderDetailCreate]):
+    """Load every product of an order in one IN query and validate it against the store"""
+    if not details:
+        raise HTTPException(status_code=400, detail="Order must contain at least one item")
+
+    product_ids = {item.product_id for item in details}
+    products = {
+        product.id: product
+        for product in db.query(models.Product).filter(models.Product.id.in_(product_ids))
+    }
+
+    for item in details:
+        product = products.get(item.product_id)
+        if not product:
+            raise HTTPException(status_code=404, detail=f"Product {item.product_id} not found")
+        if product.store_id != store_id:
+            raise HTTPException(status_code=400, detail=f"Product {product.name} does not belong to this store")
+        if not product.is_available:
+            raise HTTPException(status_code=400, detail=f"Product {product.name} is not available")
+        if item.quantity <= 0:
+            raise HTTPException(status_code=400, detail="Quantity must be greater than 0")
+
+    return products
+
+def place_order(db: Session, requester_id: int, order: schemas.OrderCreate) -> models.Order:
+    """Reserve stock, price an order and insert it with its details in a single transaction"""
+    products = load_order_products(db, order.store_id, order.details)
+
+    subtotal = sum(products[item.product_id].price * item.quantity for item in order.details)
+    delivery_fee = DEFAULT_DELIVERY_FEE
+
+    db_order = models.Order(
+        requester_id=requester_id,
+        store_id=order.store_id,
+        status="pending",
+        subtotal=subtotal,
+        delivery_fee=delivery_fee,
+        total_price=subtotal + delivery_fee,
+        delivery_address=order.delivery_address,
+        delivery_latitude=order.delivery_latitude,
+        delivery_longitude=order.delivery_longitude,
+        notes=order.notes
+    )
+    try:
+        inventory.reserve(db, products, inventory.order_quantities(order.details))
+        db.add(db_order)
+        db.flush()  # assigns db_order.id without committing
+
+        db.execute(insert(models.OrderDetail), [
+            {
+                "order_id": db_order.id,
+                "product_id": item.product_id,
+                "product_name": products[item.product_id].name,
+                "quantity": item.quantity,
+                "unit_price": products[item.product_id].price,
+                "subtotal": products[item.product_id].price * item.quantity,
+                "notes": item.notes,
+            }
+            for item in order.details
+        ])
+        lifecycle.order_placed(db, db_order)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+    # The menu shows stock_quantity
+    catalog_cache.invalidate_stock(order.store_id)
+    db.refresh(db_order)
+    return db_order
@@ -0,0 +1,59 @@
+import base64
+import json
+from datetime import datetime
+from typing import Optional
+from fastapi import HTTPException
+from sqlalchemy import tuple_
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+def encode_cursor(*values) -> str:
+    """Pack the sort key of the last returned row into an opaque cursor string"""
+    payload = [v.isoformat() if isinstance(v, datetime) else v for v in values]
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str, size: int) -> list:
+    """Unpack a cursor produced by encode_cursor; raises 400 when it is malformed"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if not isinstance(values, list) or len(values) != size:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return values
+
+def keyset_page(stmt, sort_column, id_column, cursor: Optional[str], limit: Optional[int],
+                descending: bool = True):
+    """Order stmt by (sort_column, id_column) and resume after the cursor row
+
+    Fetches limit + 1 rows so next_page can tell whether another page exists,
+    or every remaining row when limit is None. Pass sort_column=None to page
+    by id_column alone.
+    """
+    columns = [c for c in (sort_column, id_column) if c is not None]
+    if cursor:
+        values = decode_cursor(cursor, len(columns))
+        if sort_column is not None:
+            try:
+                values[0] = datetime.fromisoformat(values[0])
+            except (TypeError, ValueError):
+                raise HTTPException(status_code=400, detail="Invalid cursor")
+        if not isinstance(values[-1], int):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        key, after = tuple_(*columns), tuple_(*values)
+        stmt = stmt.where(key < after if descending else key > after)
+    order = [c.desc() if descending else c.asc() for c in columns]
+    stmt = stmt.order_by(*order)
+    return stmt if limit is None else stmt.limit(limit + 1)
+
+def next_page(rows: list, limit: Optional[int], sort_attr: Optional[str], id_attr: str = "id"):
+    """Trim the extra row fetched by keyset_page; returns (rows, next_cursor)"""
+    if limit is None or len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]
+    values = [getattr(last, sort_attr)] if sort_attr else []
+    values.append(getattr(last, id_attr))
+    return rows, encode_cursor(*values)
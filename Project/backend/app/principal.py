@@ -0,0 +1,124 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional
+from sqlalchemy import event, inspect
+from . import models
+
+# Trust the signed role/user_id claims and serve users from the cache below
+AUTH_FAST_PATH = os.getenv("AUTH_FAST_PATH", "true").lower() in ("1", "true", "yes", "on")
+# Upper bound on how long a deactivation or role change made by another
+# worker process can go unnoticed by this one
+USER_CACHE_TTL_SECONDS = float(os.getenv("USER_CACHE_TTL_SECONDS", "60"))
+USER_CACHE_MAX_SIZE = int(os.getenv("USER_CACHE_MAX_SIZE", "10000"))
+PROFILE_CACHE_TTL_SECONDS = float(os.getenv("PROFILE_CACHE_TTL_SECONDS", "300"))
+PROFILE_CACHE_MAX_SIZE = int(os.getenv("PROFILE_CACHE_MAX_SIZE", "10000"))
+
+
+@dataclass(frozen=True)
+class Principal:
+    """Detached snapshot of a users row; what get_current_user hands to routes"""
+    id: int
+    email: str
+    role: str
+    is_active: bool
+    created_at: Optional[datetime]
+
+    @classmethod
+    def from_user(cls, user: models.User) -> "Principal":
+        return cls(
+            id=user.id,
+            email=user.email,
+            role=user.role,
+            is_active=bool(user.is_active) if user.is_active is not None else True,
+            created_at=user.created_at,
+        )
+
+
+class TTLCache:
+    """Thread-safe bounded LRU with a per-entry TTL"""
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+# Principal by user id
+user_cache = TTLCache(USER_CACHE_MAX_SIZE, USER_CACHE_TTL_SECONDS)
+# Role profile id (requester/deliverer/store profile) by user id
+profile_id_cache = TTLCache(PROFILE_CACHE_MAX_SIZE, PROFILE_CACHE_TTL_SECONDS)
+
+PROFILE_MODELS = {
+    "requester": models.RequesterProfile,
+    "deliverer": models.DelivererProfile,
+    "store": models.StoreProfile,
+}
+
+
+def invalidate_user(user_id: int):
+    """Drop a cached user, e.g. after deactivation or a role change"""
+    user_cache.invalidate(user_id)
+    profile_id_cache.invalidate(user_id)
+
+
+def invalidate_profile(user_id: int):
+    """Drop a cached role profile id after the profile is created or deleted"""
+    profile_id_cache.invalidate(user_id)
+
+
+def claims_match(principal: Principal, claims: dict) -> bool:
+    """A token is only honoured while the user is active and its role claim is current"""
+    return principal.is_active and principal.role == claims.get("role")
+
+
+@event.listens_for(models.User, "after_update")
+def _invalidate_on_update(mapper, connection, target):
+    state = inspect(target)
+    if state.attrs.is_active.history.has_changes() or state.attrs.role.history.has_changes():
+        invalidate_user(target.id)
+
+
+@event.listens_for(models.User, "after_delete")
+def _invalidate_on_delete(mapper, connection, target):
+    invalidate_user(target.id)
+
+
+def _invalidate_profile_owner(mapper, connection, target):
+    invalidate_profile(target.user_id)
+
+
+for _profile_model in PROFILE_MODELS.values():
+    event.listen(_profile_model, "after_insert", _invalidate_profile_owner)
+    event.listen(_profile_model, "after_delete", _invalidate_profile_owner)
@@ -0,0 +1,216 @@
+import asyncio
+import json
+import logging
+import os
+import queue
+import select
+import threading
+import uuid
+from typing import Iterable, Optional
+from sqlalchemy.engine import make_url
+
+logger = logging.getLogger(__name__)
+
+# Messages buffered per connection; a client that falls this far behind gets
+# its backlog replaced by a single resync message
+REALTIME_QUEUE_SIZE = int(os.getenv("REALTIME_QUEUE_SIZE", "100"))
+REALTIME_MAX_TOPICS = int(os.getenv("REALTIME_MAX_TOPICS", "20"))
+# "local": events reach subscribers of this process only
+# "postgres": events are also relayed to the other workers via LISTEN/NOTIFY
+REALTIME_BROKER = os.getenv("REALTIME_BROKER", "local")
+REALTIME_CHANNEL = "stellar_events"
+# Postgres rejects NOTIFY payloads of 8000 bytes or more
+NOTIFY_MAX_PAYLOAD = 7900
+
+# Tells the client it missed events and must refetch what it displays
+RESYNC_MESSAGE = json.dumps({"type": "resync"})
+
+def order_topics(order_id: int, store_id: Optional[int] = None, deliverer_id: Optional[int] = None) -> list[str]:
+    topics = [f"order:{order_id}"]
+    if store_id is not None:
+        topics.append(f"store:{store_id}")
+    if deliverer_id is not None:
+        topics.append(f"deliverer:{deliverer_id}")
+    return topics
+
+
+class Subscription:
+    """One connection's bounded queue of serialized messages"""
+
+    def __init__(self, topics: Iterable[str], queue_size: int = REALTIME_QUEUE_SIZE):
+        self.topics = frozenset(topics)
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.dropped = 0
+
+    def offer(self, message: str):
+        """Enqueue without waiting; never lets a slow client hold up the publisher"""
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            while not self.queue.empty():
+                self.queue.get_nowait()
+                self.dropped += 1
+            self.queue.put_nowait(RESYNC_MESSAGE)
+
+    async def get(self) -> str:
+        return await self.queue.get()
+
+
+class Hub:
+    """In-process topic pub/sub for the realtime endpoints
+
+    Subscriptions live on the event loop. publish() may be called from any
+    thread (the sync routes run on the threadpool); it serializes the event
+    once and hands it to the loop, which offers it to every matching queue.
+    """
+
+    def __init__(self, queue_size: int = REALTIME_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._topics: dict[str, set[Subscription]] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._bridge: Optional["PostgresBridge"] = None
+        self.published = 0
+        self.delivered = 0
+
+    def subscribe(self, topics: Iterable[str]) -> Subscription:
+        """Register a subscription; must run on the event loop"""
+        self._loop = asyncio.get_running_loop()
+        subscription = Subscription(topics, self.queue_size)
+        for topic in subscription.topics:
+            self._topics.setdefault(topic, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        for topic in subscription.topics:
+            subscribers = self._topics.get(topic)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._topics[topic]
+
+    def publish(self, topics: Iterable[str], event: dict):
+        """Send event to the subscribers of any of topics, in every worker"""
+        topics = list(topics)
+        message = json.dumps(event, default=str)
+        self.published += 1
+        if self._bridge is not None:
+            self._bridge.send(topics, message)
+        self.deliver_threadsafe(topics, message)
+
+    def deliver_threadsafe(self, topics: list[str], message: str):
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            return  # nobody has subscribed in this process
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            self.deliver(topics, message)
+        else:
+            loop.call_soon_threadsafe(self.deliver, topics, message)
+
+    def deliver(self, topics: list[str], message: str) -> int:
+        """Offer message to each subscription matching any topic once; runs on the loop"""
+        targets = set()
+        for topic in topics:
+            targets.update(self._topics.get(topic, ()))
+        for subscription in targets:
+            subscription.offer(message)
+        self.delivered += len(targets)
+        return len(targets)
+
+    def stats(self) -> dict:
+        subscriptions = set()
+        for subscribers in self._topics.values():
+            subscriptions.update(subscribers)
+        return {
+            "subscriptions": len(subscriptions),
+            "topics": len(self._topics),
+            "published": self.published,
+            "delivered": self.delivered,
+            "dropped": sum(s.dropped for s in subscriptions),
+            "broker": "postgres" if self._bridge is not None else "local",
+        }
+
+    def start(self, database_url: str):
+        if REALTIME_BROKER == "postgres" and self._bridge is None:
+            self._bridge = PostgresBridge(self, database_url)
+            self._bridge.start()
+
+    def shutdown(self):
+        if self._bridge is not None:
+            self._bridge.stop()
+            self._bridge = None
+
+
+class PostgresBridge:
+    """Relays hub events between worker processes over LISTEN/NOTIFY
+
+    A daemon thread owns one autocommit psycopg2 connection: it LISTENs on
+    REALTIME_CHANNEL, sends queued NOTIFYs and hands notifications from other
+    processes to the local hub. It reconnects after errors; events published
+    while it is disconnected reach local subscribers only.
+    """
+
+    def __init__(self, hub: Hub, database_url: str, channel: str = REALTIME_CHANNEL):
+        self.hub = hub
+        self.dsn = make_url(database_url).set(drivername="postgresql").render_as_string(hide_password=False)
+        self.channel = channel
+        self.origin = uuid.uuid4().hex
+        self._outbox: queue.SimpleQueue = queue.SimpleQueue()
+        self._wake_r, self._wake_w = os.pipe()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="realtime-bridge", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        os.write(self._wake_w, b"x")
+        self._thread.join(timeout=5)
+
+    def send(self, topics: list[str], message: str):
+        payload = json.dumps({"origin": self.origin, "topics": topics, "message": message})
+        if len(payload.encode()) > NOTIFY_MAX_PAYLOAD:
+            logger.warning("Realtime event too large to relay (%d bytes)", len(payload))
+            return
+        self._outbox.put(payload)
+        os.write(self._wake_w, b"x")
+
+    def _run(self):
+        import psycopg2
+        import psycopg2.extensions
+
+        while not self._stop.is_set():
+            conn = None
+            try:
+                conn = psycopg2.connect(self.dsn)
+                conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+                cursor = conn.cursor()
+                cursor.execute(f"LISTEN {self.channel}")
+                while not self._stop.is_set():
+                    readable, _, _ = select.select([conn, self._wake_r], [], [], 5)
+                    if self._wake_r in readable:
+                        os.read(self._wake_r, 4096)
+                    while True:
+                        try:
+                            payload = self._outbox.get_nowait()
+                        except queue.Empty:
+                            break
+                        cursor.execute("SELECT pg_notify(%s, %s)", (self.channel, payload))
+                    conn.poll()
+                    while conn.notifies:
+                        data = json.loads(conn.notifies.pop(0).payload)
+                        if data["origin"] != self.origin:
+                            self.hub.deliver_threadsafe(data["topics"], data["message"])
+            except Exception:
+                logger.exception("Realtime bridge connection failed; reconnecting")
+                self._stop.wait(1)
+            finally:
+                if conn is not None:
+                    conn.close()
+
+
+hub = Hub()
@@ -0,0 +1,226 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from decimal import Decimal, ROUND_HALF_UP
+from sqlalchemy import Date, case, delete, func, literal, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+from . import database, lifecycle, models
+
+# Orders per backfill transaction
+ROLLUP_BACKFILL_CHUNK = int(os.getenv("ROLLUP_BACKFILL_CHUNK", "2000"))
+ROLLUP_BACKFILL_WORKERS = int(os.getenv("ROLLUP_BACKFILL_WORKERS", "4"))
+
+# Orders in these states count as sales of their rollup_day
+COUNTED_STATUSES = ("delivered", "completed")
+
+_DIALECT_INSERTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+_ORDER_AMOUNTS = (models.Order.store_id, models.Order.deliverer_id, models.Order.subtotal, models.Order.delivery_fee,
+                  models.Order.commission_rate)
+# Set with rollup_day: an order keeps the rate it was first counted at, so
+# changing a store's rate does not re-price its history on a backfill
+_COMMISSION_RATE_SNAPSHOT = func.coalesce(
+    models.Order.commission_rate,
+    select(models.StoreProfile.commission_rate).where(models.StoreProfile.id == models.Order.store_id)
+    .scalar_subquery()
+)
+
+def commission(gross: int, rate: Decimal) -> int:
+    """Commission on gross yen at rate percent, rounded half up to the yen"""
+    return int((gross * Decimal(rate) / 100).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+def _apply(db: Session, orders, sign: int):
+    """Add (sign=1) or remove (sign=-1) orders, as (day, amounts row) pairs, to the day rows"""
+    stores: dict[tuple, list[int]] = {}
+    deliverers: dict[tuple, list[int]] = {}
+    for day, order in orders:
+        fee = commission(order.subtotal, order.commission_rate)
+        totals = stores.setdefault((order.store_id, day), [0, 0, 0, 0])
+        totals[0] += sign
+        totals[1] += sign * order.subtotal
+        totals[2] += sign * fee
+        totals[3] += sign * (order.subtotal - fee)
+        if order.deliverer_id is not None:
+            totals = deliverers.setdefault((order.deliverer_id, day), [0, 0])
+            totals[0] += sign
+            totals[1] += sign * (order.delivery_fee or 0)
+    increment(db, models.StoreSalesDaily, ("store_id", "day"),
+              ("order_count", "gross_amount", "commission_amount", "net_amount"), stores)
+    increment(db, models.DelivererEarningsDaily, ("deliverer_id", "day"),
+              ("delivery_count", "total_amount"), deliverers)
+
+def increment(db: Session, model, keys: tuple[str, ...], fields: tuple[str, ...], deltas: dict[tuple, list[int]]):
+    """Add deltas (key values -> field values) to counter rows, creating missing rows, with one upsert"""
+    if not deltas:
+        return
+    table = model.__table__
+    insert = _DIALECT_INSERTS[db.get_bind().dialect.name]
+    stmt = insert(table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=list(keys),
+        set_={field: table.c[field] + stmt.excluded[field] for field in fields}
+    )
+    # In key order, so concurrent rollups lock the day rows in the same order
+    db.execute(stmt, [dict(zip(keys + fields, key + tuple(values))) for key, values in sorted(deltas.items())])
+
+def sync_order(db: Session, order_id: int) -> int:
+    """Bring an order's contribution to the day rows in line with its status
+
+    Call in the transaction that changed the status, after the change. A
+    delivered order is added to the day it was completed; one that is
+    cancelled (or otherwise leaves the delivered states) afterwards is taken
+    out of that day again. Setting and clearing orders.rollup_day is a
+    compare-and-set, so an order is counted once however many requests race.
+    Returns 1 if this call counted the order, -1 if it took it out, else 0.
+    """
+    db.flush()
+    order = db.execute(
+        select(models.Order.status, models.Order.rollup_day, models.Order.completed_at)
+        .where(models.Order.id == order_id)
+    ).first()
+    if order is None:
+        return 0
+    counted = order.status in COUNTED_STATUSES
+    if counted and order.rollup_day is None:
+        day = (order.completed_at or datetime.utcnow()).date()
+        amounts = db.execute(
+            update(models.Order).where(models.Order.id == order_id, models.Order.rollup_day == None)
+            .values(rollup_day=day, commission_rate=_COMMISSION_RATE_SNAPSHOT).returning(*_ORDER_AMOUNTS)
+            .execution_options(synchronize_session=False)
+        ).first()
+        if amounts is not None:
+            _apply(db, [(day, amounts)], 1)
+            return 1
+    elif not counted and order.rollup_day is not None:
+        amounts = db.execute(
+            update(models.Order).where(models.Order.id == order_id, models.Order.rollup_day == order.rollup_day)
+            .values(rollup_day=None).returning(*_ORDER_AMOUNTS)
+            .execution_options(synchronize_session=False)
+        ).first()
+        if amounts is not None:
+            _apply(db, [(order.rollup_day, amounts)], -1)
+            return -1
+    return 0
+
+@lifecycle.subscribe
+def _sync_counted(db: Session, order_event: lifecycle.OrderEvent):
+    if order_event.status in COUNTED_STATUSES or order_event.status == "cancelled":
+        sync_order(db, order_event.order_id)
+
+def close_period(db: Session, period_start: date, period_end: date) -> tuple[int, int]:
+    """Write store_sales and deliverer_payouts rows for a period from the day rows
+
+    Reads one row per store (deliverer) and day, however many orders there
+    were; those with nothing left in the period get no row. The commission
+    amounts are those of the orders' own rates; commission_rate records the
+    store's current one. Re-closing a period rewrites its pending rows; rows
+    already being paid out are left alone. Commits; returns the (stores,
+    deliverers) written.
+    """
+    insert = _DIALECT_INSERTS[db.get_bind().dialect.name]
+    start, end = literal(period_start, Date), literal(period_end, Date)
+
+    daily = models.StoreSalesDaily
+    sales = models.StoreSales.__table__
+    stmt = insert(sales).from_select(
+        ["store_id", "period_start", "period_end", "total_orders", "total_amount",
+         "commission_rate", "commission_amount", "net_amount", "status"],
+        select(daily.store_id, start, end, func.sum(daily.order_count), func.sum(daily.gross_amount),
+               models.StoreProfile.commission_rate, func.sum(daily.commission_amount),
+               func.sum(daily.net_amount), literal("pending"))
+        .join(models.StoreProfile, models.StoreProfile.id == daily.store_id)
+        .where(daily.day >= period_start, daily.day <= period_end)
+        .group_by(daily.store_id, models.StoreProfile.commission_rate).having(func.sum(daily.order_count) > 0)
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["store_id", "period_start", "period_end"],
+        set_={column: stmt.excluded[column] for column in
+              ("total_orders", "total_amount", "commission_rate", "commission_amount", "net_amount")},
+        where=sales.c.status == "pending"
+    )
+    stores = db.execute(stmt).rowcount
+
+    earnings = models.DelivererEarningsDaily
+    payouts = models.DelivererPayout.__table__
+    stmt = insert(payouts).from_select(
+        ["deliverer_id", "period_start", "period_end", "total_deliveries", "total_amount", "status"],
+        select(earnings.deliverer_id, start, end, func.sum(earnings.delivery_count),
+               func.sum(earnings.total_amount), literal("pending"))
+        .where(earnings.day >= period_start, earnings.day <= period_end)
+        .group_by(earnings.deliverer_id).having(func.sum(earnings.delivery_count) > 0)
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["deliverer_id", "period_start", "period_end"],
+        set_={column: stmt.excluded[column] for column in ("total_deliveries", "total_amount")},
+        where=payouts.c.status == "pending"
+    )
+    deliverers = db.execute(stmt).rowcount
+    db.commit()
+    return stores, deliverers
+
+def backfill_chunk(db: Session, first_id: int, end_id: int) -> int:
+    """Count the not yet counted delivered orders with first_id <= id < end_id; returns how many"""
+    pending = db.execute(
+        select(models.Order.id, models.Order.completed_at, models.Order.ordered_at).where(
+            models.Order.id >= first_id, models.Order.id < end_id,
+            models.Order.status.in_(COUNTED_STATUSES), models.Order.rollup_day == None
+        )
+    ).all()
+    if not pending:
+        return 0
+    days = {order.id: (order.completed_at or order.ordered_at).date() for order in pending}
+    counted = db.execute(
+        update(models.Order).where(models.Order.id.in_(days), models.Order.rollup_day == None)
+        .values(rollup_day=case(days, value=models.Order.id), commission_rate=_COMMISSION_RATE_SNAPSHOT)
+        .returning(models.Order.rollup_day, *_ORDER_AMOUNTS)
+        .execution_options(synchronize_session=False)
+    ).all()
+    _apply(db, [(order.rollup_day, order) for order in counted], 1)
+    return len(counted)
+
+def backfill(session_factory=None, workers: int = ROLLUP_BACKFILL_WORKERS,
+             chunk_size: int = ROLLUP_BACKFILL_CHUNK) -> int:
+    """Rebuild the day rows from the order history; returns the number of orders counted
+
+    Clears the day rows and every rollup_day, then counts delivered orders
+    in chunks of order ids on a pool of workers, each chunk in its own
+    transaction. Chunks only add to the day rows, so they commute with each
+    other and with sync_order: an order is counted by whichever sets its
+    rollup_day first.
+    """
+    session_factory = session_factory or database.SessionLocal
+    with session_factory() as db:
+        db.execute(update(models.Order).where(models.Order.rollup_day != None).values(rollup_day=None))
+        db.execute(delete(models.StoreSalesDaily))
+        db.execute(delete(models.DelivererEarningsDaily))
+        db.commit()
+        first_id, last_id = db.execute(select(func.min(models.Order.id), func.max(models.Order.id))).one()
+    if first_id is None:
+        return 0
+
+    def run(start: int) -> int:
+        with session_factory() as db:
+            counted = backfill_chunk(db, start, start + chunk_size)
+            db.commit()
+            return counted
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return sum(pool.map(run, range(first_id, last_id + 1, chunk_size)))
+
+
+if __name__ == "__main__":
+    # python -m app.rollups backfill [workers]
+    # python -m app.rollups close <period_start> <period_end>   (YYYY-MM-DD, inclusive)
+    import sys
+
+    command = sys.argv[1] if len(sys.argv) > 1 else ""
+    if command == "backfill":
+        workers = int(sys.argv[2]) if len(sys.argv) > 2 else ROLLUP_BACKFILL_WORKERS
+        print(f"Counted {backfill(workers=workers)} delivered orders")
+    elif command == "close" and len(sys.argv) == 4:
+        period_start, period_end = date.fromisoformat(sys.argv[2]), date.fromisoformat(sys.argv[3])
+        with database.SessionLocal() as db:
+            stores, deliverers = close_period(db, period_start, period_end)
+        print(f"Closed {period_start}..{period_end}: {stores} stores, {deliverers} deliverers")
+    else:
+        sys.exit("usage: python -m app.rollups backfill [workers] | close <period_start> <period_end>")
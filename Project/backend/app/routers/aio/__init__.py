@@ -0,0 +1,5 @@
+"""Async (AsyncSession) variants of the hot endpoints, mounted when DB_MODE=async.
+
+Routes here shadow the sync route with the same method and path; every other
+route keeps being served by the sync routers.
+"""
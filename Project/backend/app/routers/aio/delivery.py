@@ -0,0 +1,56 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
+from ... import models, schemas, database, fastjson
+from ...pagination import NEXT_CURSOR_HEADER
+from ...tracking import location_buffer
+from ..auth import get_current_profile_id_async, get_current_user_async
+from ..delivery import list_delivery_jobs, location_fixes, publish_location, tracked_order_id
+
+router = APIRouter(
+    prefix="/delivery",
+    tags=["delivery"],
+)
+
+@router.get("/jobs", response_model=List[schemas.DeliveryJob])
+async def get_delivery_jobs(
+    response: Response,
+    lat: Optional[float] = Query(None, ge=-90, le=90),
+    lng: Optional[float] = Query(None, ge=-180, le=180),
+    radius_km: float = Query(5.0, gt=0, le=100),
+    limit: int = Query(100, ge=1, le=500),
+    cursor: Optional[str] = None,
+    batched: bool = False,
+    current_user: models.User = Depends(get_current_user_async),
+    db: AsyncSession = Depends(database.get_async_db)
+):
+    """Get available delivery jobs (deliverer only)"""
+    if current_user.role != "deliverer":
+        raise HTTPException(status_code=403, detail="Only deliverers can access this endpoint")
+
+    jobs, next_cursor = await db.run_sync(list_delivery_jobs, lat, lng, radius_km, limit, cursor, batched)
+    if fastjson.FAST_JSON_RESPONSES:
+        headers = {NEXT_CURSOR_HEADER: next_cursor} if next_cursor else None
+        return fastjson.FastJSONResponse(jobs, headers=headers)
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return jobs
+
+@router.put("/{delivery_id}/location")
+async def update_delivery_location(
+    delivery_id: int,
+    location: schemas.DeliveryLocationUpdate,
+    current_user: models.User = Depends(get_current_user_async),
+    deliverer_id: Optional[int] = Depends(get_current_profile_id_async),
+    db: AsyncSession = Depends(database.get_async_db)
+):
+    """Update deliverer's current location"""
+    if current_user.role != "deliverer":
+        raise HTTPException(status_code=403, detail="Only deliverers can update location")
+
+    points = location_fixes([location])
+    order_id = tracked_order_id(await db.run_sync(location_buffer.delivery_owner, delivery_id), deliverer_id)
+
+    location_buffer.append(delivery_id, points)
+    publish_location(order_id, delivery_id)
+    return {"message": "Location updated"}
@@ -0,0 +1,36 @@
+from fastapi import APIRouter, Depends, Query, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
+from ... import models, schemas, database, notification_counts
+from ...pagination import NEXT_CURSOR_HEADER, next_page
+from ..auth import get_current_user_async
+from ..notifications import my_notifications_select
+
+router = APIRouter(
+    prefix="/notifications",
+    tags=["notifications"],
+)
+
+@router.get("/", response_model=List[schemas.Notification])
+async def get_my_notifications(
+    response: Response,
+    skip: int = 0,
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None,
+    current_user: models.User = Depends(get_current_user_async),
+    db: AsyncSession = Depends(database.get_async_db)
+):
+    """Get current user's notifications"""
+    result = await db.execute(my_notifications_select(current_user.id, skip, limit, cursor))
+    notifications, next_cursor = next_page(result.scalars().all(), limit, "created_at")
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return notifications
+
+@router.get("/unread/count")
+async def get_unread_count(
+    current_user: models.User = Depends(get_current_user_async),
+    db: AsyncSession = Depends(database.get_async_db)
+):
+    """Get count of unread notifications"""
+    return {"unread_count": await db.run_sync(notification_counts.unread_count, current_user.id)}
@@ -0,0 +1,99 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
+from ... import models, schemas, database, fastjson, ordering
+from ...pagination import NEXT_CURSOR_HEADER, next_page
+from ..auth import get_current_user_async, get_current_profile_id_async
+from ..orders import (ORDER_DETAILS_LOADER, ORDER_OWNER_COLUMNS, MY_ORDERS_PAGE_SIZE, my_orders_select,
+                      order_details_select, order_dicts)
+
+router = APIRouter(
+    prefix="/orders",
+    tags=["orders"],
+)
+
+@router.post("/", response_model=schemas.Order)
+async def create_order(
+    order: schemas.OrderCreate,
+    current_user: models.User = Depends(get_current_user_async),
+    requester_id: Optional[int] = Depends(get_current_profile_id_async),
+    db: AsyncSession = Depends(database.get_async_db)
+):
+    """Create a new order (requester only)"""
+    if current_user.role != "requester":
+        raise HTTPException(status_code=403, detail="Only requesters can create orders")
+
+    if requester_id is None:
+        raise HTTPException(status_code=404, detail="Requester profile not found")
+
+    db_order = await db.run_sync(ordering.place_order, requester_id, order)
+    await db.refresh(db_order, attribute_names=["order_details"])
+    return db_order
+
+@router.get("/my", response_model=List[schemas.Order])
+async def get_my_orders(
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=200),
+    cursor: Optional[str] = None,
+    current_user: models.User = Depends(get_current_user_async),
+    profile_id: Optional[int] = Depends(get_current_profile_id_async),
+    db: AsyncSession = Depends(database.get_async_db)
+):
+    """Get current user's orders, newest first; paged as in the sync route"""
+    owner_column = ORDER_OWNER_COLUMNS.get(current_user.role)
+    if owner_column is None or profile_id is None:
+        return []
+    if cursor and limit is None:
+        limit = MY_ORDERS_PAGE_SIZE
+
+    if fastjson.FAST_JSON_RESPONSES:
+        result = await db.execute(my_orders_select(owner_column, profile_id, cursor, limit, fast=True))
+        rows, next_cursor = next_page(result.all(), limit, "ordered_at")
+        details = (await db.execute(order_details_select([row.id for row in rows]))).all() if rows else []
+        headers = {NEXT_CURSOR_HEADER: next_cursor} if next_cursor else None
+        return fastjson.FastJSONResponse(order_dicts(rows, details), headers=headers)
+
+    result = await db.execute(my_orders_select(owner_column, profile_id, cursor, limit))
+    orders, next_cursor = next_page(result.scalars().all(), limit, "ordered_at")
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return orders
+
+@router.get("/{order_id}", response_model=schemas.Order)
+async def get_order(
+    order_id: int,
+    current_user: models.User = Depends(get_current_user_async),
+    db: AsyncSession = Depends(database.get_async_db)
+):
+    """Get a specific order"""
+    result = await db.execute(
+        select(models.Order).options(ORDER_DETAILS_LOADER).where(
+            models.Order.id == order_id
+        )
+    )
+    order = result.scalars().first()
+    if not order:
+        raise HTTPException(status_code=404, detail="Order not found")
+    return order
+
+@router.get("/store/pending", response_model=List[schemas.Order])
+async def get_store_pending_orders(
+    current_user: models.User = Depends(get_current_user_async),
+    store_id: Optional[int] = Depends(get_current_profile_id_async),
+    db: AsyncSession = Depends(database.get_async_db)
+):
+    """Get pending orders for store"""
+    if current_user.role != "store":
+        raise HTTPException(status_code=403, detail="Only stores can access this endpoint")
+
+    if store_id is None:
+        raise HTTPException(status_code=404, detail="Store profile not found")
+
+    result = await db.execute(
+        select(models.Order).options(ORDER_DETAILS_LOADER).where(
+            models.Order.store_id == store_id,
+            models.Order.status.in_(["pending", "accepted", "preparing", "ready_for_pickup"])
+        ).order_by(models.Order.ordered_at.desc())
+    )
+    return result.scalars().all()
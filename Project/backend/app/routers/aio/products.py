@@ -0,0 +1,101 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
+from ... import models, schemas, database, fastjson
+from ...catalog_cache import UNKNOWN_STORES, catalog_cache, respond, serialize, store_tag, stores_tags
+from ...pagination import NEXT_CURSOR_HEADER, next_page
+from ..products import available_products_select, search_products, store_products_body, store_products_select
+
+router = APIRouter(
+    prefix="/products",
+    tags=["products"],
+)
+
+@router.get("/", response_model=List[schemas.Product])
+async def get_products(
+    request: Request,
+    skip: int = 0,
+    limit: int = Query(100, ge=1, le=500),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(database.get_async_db)
+):
+    """Get all available products"""
+    key = ("products", skip, limit, cursor)
+    entry = catalog_cache.get(key)
+    if entry is None:
+        snapshot = catalog_cache.snapshot(UNKNOWN_STORES)
+        result = await db.execute(available_products_select(skip, limit, cursor))
+        products, next_cursor = next_page(result.scalars().all(), limit, None)
+        headers = {NEXT_CURSOR_HEADER: next_cursor} if next_cursor else None
+        tags = stores_tags(product.store_id for product in products)
+        entry = catalog_cache.put(key, tags, serialize(List[schemas.Product], products), snapshot, headers)
+    return respond(request, entry)
+
+@router.get("/search", response_model=List[schemas.Product])
+async def get_search_products(
+    request: Request,
+    q: str = Query(..., min_length=1, max_length=200),
+    store_id: Optional[int] = None,
+    category_id: Optional[int] = None,
+    max_price: Optional[int] = Query(None, ge=0),
+    limit: int = Query(20, ge=1, le=100),
+    db: AsyncSession = Depends(database.get_async_db)
+):
+    """Search available products by name and description"""
+    key = ("search", q, store_id, category_id, max_price, limit)
+    entry = catalog_cache.get(key)
+    if entry is None:
+        snapshot = catalog_cache.snapshot([store_tag(store_id)] if store_id is not None else UNKNOWN_STORES)
+        body, store_ids = await db.run_sync(search_products, q, store_id, category_id, max_price, limit)
+        tags = [store_tag(store_id)] if store_id is not None else stores_tags(store_ids)
+        entry = catalog_cache.put(key, tags, body, snapshot)
+    return respond(request, entry)
+
+@router.get("/{product_id}", response_model=schemas.Product)
+async def get_product(request: Request, product_id: int, db: AsyncSession = Depends(database.get_async_db)):
+    """Get a specific product by ID"""
+    key = ("product", product_id)
+    entry = catalog_cache.get(key)
+    if entry is None:
+        # The product's store is only known once it is loaded
+        snapshot = catalog_cache.snapshot(UNKNOWN_STORES)
+        product = await db.get(models.Product, product_id)
+        if not product:
+            raise HTTPException(status_code=404, detail="Product not found")
+        entry = catalog_cache.put(key, [store_tag(product.store_id)], serialize(schemas.Product, product), snapshot)
+    return respond(request, entry)
+
+@router.get("/store/{store_id}", response_model=List[schemas.Product])
+async def get_store_products(request: Request, store_id: int, db: AsyncSession = Depends(database.get_async_db)):
+    """Get all products for a specific store"""
+    key = ("store_products", store_id)
+    entry = catalog_cache.get(key)
+    if entry is None:
+        tags = [store_tag(store_id)]
+        snapshot = catalog_cache.snapshot(tags)
+        if fastjson.FAST_JSON_RESPONSES:
+            result = await db.execute(store_products_select(store_id, fast=True))
+            body = store_products_body(result.all())
+        else:
+            result = await db.execute(store_products_select(store_id))
+            body = serialize(List[schemas.Product], result.scalars().all())
+        entry = catalog_cache.put(key, tags, body, snapshot)
+    return respond(request, entry)
+
+@router.get("/store/{store_id}/categories", response_model=List[schemas.ProductCategory])
+async def get_store_categories(request: Request, store_id: int, db: AsyncSession = Depends(database.get_async_db)):
+    """Get all product categories for a store"""
+    key = ("store_categories", store_id)
+    entry = catalog_cache.get(key)
+    if entry is None:
+        tags = [store_tag(store_id)]
+        snapshot = catalog_cache.snapshot(tags)
+        result = await db.execute(
+            select(models.ProductCategory).where(
+                models.ProductCategory.store_id == store_id
+            ).order_by(models.ProductCategory.display_order)
+        )
+        categories = result.scalars().all()
+        entry = catalog_cache.put(key, tags, serialize(List[schemas.ProductCategory], categories), snapshot)
+    return respond(request, entry)
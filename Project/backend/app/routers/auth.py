@@ -1,9 +1,13 @@
 from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from fastapi.security import OAuth2PasswordRequestForm, OAuth2PasswordBearer
 from datetime import timedelta, datetime
-from .. import models, schemas, database
-from passlib.context import CryptContext
+from typing import Optional
+from .. import models, schemas, database, hashing
+from ..catalog_cache import catalog_cache
+from ..principal import AUTH_FAST_PATH, PROFILE_MODELS, Principal, claims_match, profile_id_cache, user_cache
 from jose import JWTError, jwt
 import os
 
@@ -16,15 +20,13 @@ SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login")
 
 def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+    return hashing.verify_password(plain_password, hashed_password)
 
 def get_password_hash(password):
-    return pwd_context.hash(password)
+    return hashing.hash_password(password)
 
 def create_access_token(data: dict, expires_delta: timedelta | None = None):
     to_encode = data.copy()
@@ -36,25 +38,101 @@ def create_access_token(data: dict, expires_delta: timedelta | None = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(database.get_db)):
-    credentials_exception = HTTPException(
+def _credentials_exception():
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+
+def _decode_token(token: str) -> dict:
+    credentials_exception = _credentials_exception()
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         email: str = payload.get("sub")
         if email is None:
             raise credentials_exception
-        token_data = schemas.TokenData(email=email)
     except JWTError:
         raise credentials_exception
-    user = db.query(models.User).filter(models.User.email == token_data.email).first()
+    return payload
+
+def _cache_user(user) -> Principal:
     if user is None:
-        raise credentials_exception
+        raise _credentials_exception()
+    principal = Principal.from_user(user)
+    user_cache.put(principal.id, principal)
+    return principal
+
+def _check_principal(principal: Principal, claims: dict) -> Principal:
+    if principal.email != claims["sub"] or not claims_match(principal, claims):
+        raise _credentials_exception()
+    return principal
+
+# Plain def so a blocking users lookup runs on the threadpool, not the event loop
+def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(database.get_db)):
+    claims = _decode_token(token)
+    if AUTH_FAST_PATH and claims.get("user_id") is not None:
+        # Fast path: trust the signed claims and serve the user from the cache
+        principal = user_cache.get(claims["user_id"])
+        if principal is None:
+            principal = _cache_user(db.get(models.User, claims["user_id"]))
+        return _check_principal(principal, claims)
+
+    user = db.query(models.User).filter(models.User.email == claims["sub"]).first()
+    if user is None or user.is_active is False:
+        raise _credentials_exception()
     return user
 
+async def get_current_user_async(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(database.get_async_db)):
+    claims = _decode_token(token)
+    if AUTH_FAST_PATH and claims.get("user_id") is not None:
+        principal = user_cache.get(claims["user_id"])
+        if principal is None:
+            principal = _cache_user(await db.get(models.User, claims["user_id"]))
+        return _check_principal(principal, claims)
+
+    result = await db.execute(select(models.User).where(models.User.email == claims["sub"]))
+    user = result.scalars().first()
+    if user is None or user.is_active is False:
+        raise _credentials_exception()
+    return user
+
+def get_current_admin(current_user: models.User = Depends(get_current_user)):
+    """The caller, who must be an admin; 403 otherwise"""
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Only admins can access this endpoint")
+    return current_user
+
+def get_current_profile_id(
+    current_user: models.User = Depends(get_current_user),
+    db: Session = Depends(database.get_db)
+) -> Optional[int]:
+    """Id of the caller's requester/deliverer/store profile, or None (cached per user)"""
+    profile_model = PROFILE_MODELS.get(current_user.role)
+    if profile_model is None:
+        return None
+    profile_id = profile_id_cache.get(current_user.id)
+    if profile_id is None:
+        profile_id = db.query(profile_model.id).filter(profile_model.user_id == current_user.id).scalar()
+        if profile_id is not None:
+            profile_id_cache.put(current_user.id, profile_id)
+    return profile_id
+
+async def get_current_profile_id_async(
+    current_user: models.User = Depends(get_current_user_async),
+    db: AsyncSession = Depends(database.get_async_db)
+) -> Optional[int]:
+    profile_model = PROFILE_MODELS.get(current_user.role)
+    if profile_model is None:
+        return None
+    profile_id = profile_id_cache.get(current_user.id)
+    if profile_id is None:
+        result = await db.execute(select(profile_model.id).where(profile_model.user_id == current_user.id))
+        profile_id = result.scalar()
+        if profile_id is not None:
+            profile_id_cache.put(current_user.id, profile_id)
+    return profile_id
+
 @router.post("/register", response_model=schemas.User)
 def register(user: schemas.UserCreate, db: Session = Depends(database.get_db)):
     db_user = db.query(models.User).filter(models.User.email == user.email).first()
@@ -79,6 +157,8 @@ def register(user: schemas.UserCreate, db: Session = Depends(database.get_db)):
         db.add(profile)
     
     db.commit()
+    if user.role == "store":
+        catalog_cache.invalidate_store(profile.id)
     return new_user
 
 @router.post("/login", response_model=schemas.Token)
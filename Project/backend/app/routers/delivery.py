@@ -1,221 +1,640 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy import func, select
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 from datetime import datetime
-from .. import models, schemas, database
-from .auth import get_current_user
+from .. import models, schemas, database, batching, dispatch, fastjson, lifecycle, tracks
+from ..geo import job_index
+from ..pagination import NEXT_CURSOR_HEADER, keyset_page, next_page
+from ..realtime import hub, order_topics
+from ..tracking import LOCATION_BATCH_MAX, fix_time, location_buffer
+from .auth import get_current_user, get_current_profile_id
 
 router = APIRouter(
     prefix="/delivery",
     tags=["delivery"],
 )
 
+# Nearest open jobs tried by POST /jobs/next before giving up
+NEXT_JOB_CANDIDATES = 20
+
+# Role -> column holding the profile id of that party to a delivery
+DELIVERY_PARTY_COLUMNS = {
+    "requester": models.Order.requester_id,
+    "store": models.Order.store_id,
+    "deliverer": models.Delivery.deliverer_id,
+}
+
+def authorize_delivery(db: Session, delivery_id: int, current_user: models.User, profile_id: Optional[int]):
+    """404 unless the delivery exists, 403 unless the caller is its requester, store or deliverer"""
+    party_column = DELIVERY_PARTY_COLUMNS.get(current_user.role)
+    if party_column is None or profile_id is None:
+        raise HTTPException(status_code=403, detail="Not a party to this delivery")
+    party = db.execute(
+        select(party_column.label("profile_id"))
+        .select_from(models.Delivery)
+        .join(models.Order, models.Order.id == models.Delivery.order_id)
+        .where(models.Delivery.id == delivery_id)
+    ).first()
+    if party is None:
+        raise HTTPException(status_code=404, detail="Delivery not found")
+    if party.profile_id != profile_id:
+        raise HTTPException(status_code=403, detail="Not a party to this delivery")
+
+def job_board_select():
+    """Open jobs joined with their store and item count in a single grouped query"""
+    return select(
+        models.Order.id,
+        models.Order.delivery_address,
+        models.Order.delivery_fee,
+        models.StoreProfile.store_name,
+        models.StoreProfile.address.label("store_address"),
+        func.count(models.OrderDetail.id).label("items_count"),
+    ).outerjoin(
+        models.StoreProfile, models.StoreProfile.id == models.Order.store_id
+    ).outerjoin(
+        models.OrderDetail, models.OrderDetail.order_id == models.Order.id
+    ).where(
+        *dispatch.open_job_filter()
+    ).group_by(models.Order.id, models.StoreProfile.id)
+
+def job_row_to_dict(row, distance: Optional[float] = None):
+    return {
+        "id": row.id,
+        "order_id": row.id,
+        "store_name": row.store_name or "Unknown",
+        "store_address": row.store_address or "Unknown",
+        "delivery_address": row.delivery_address,
+        "reward": row.delivery_fee or 300,
+        "distance": round(distance, 2) if distance is not None else None,
+        "items_count": row.items_count,
+        "order_ids": None,
+        "route_km": None
+    }
+
+def list_delivery_jobs(db: Session, lat: Optional[float], lng: Optional[float],
+                       radius_km: float, limit: int, cursor: Optional[str], batched: bool = False):
+    """Return (jobs, next_cursor) for the job board; shared by the sync and async routes"""
+    if batched:
+        return list_batched_jobs(db, lat, lng, radius_km, limit, cursor)
+    if lat is not None and lng is not None:
+        job_index.sync(db)
+        nearest = job_index.nearest(lat, lng, radius_km, limit)
+        if not nearest:
+            return [], None
+        # Re-check against the database so jobs claimed elsewhere drop out
+        rows = db.execute(job_board_select().where(
+            models.Order.id.in_([order_id for order_id, _ in nearest])
+        )).all()
+        rows_by_id = {row.id: row for row in rows}
+        return [
+            job_row_to_dict(rows_by_id[order_id], distance)
+            for order_id, distance in nearest
+            if order_id in rows_by_id
+        ], None
+
+    stmt = keyset_page(job_board_select(), None, models.Order.id, cursor, limit, descending=False)
+    rows, next_cursor = next_page(db.execute(stmt).all(), limit, None)
+
+    return [job_row_to_dict(row) for row in rows], next_cursor
+
+def batch_to_dict(batch: batching.Batch, rows_by_id: dict, distance: Optional[float] = None):
+    jobs = [job_row_to_dict(rows_by_id[order_id], distance) for order_id in batch.order_ids]
+    job = jobs[0]
+    job.update(
+        reward=sum(item["reward"] for item in jobs),
+        items_count=sum(item["items_count"] for item in jobs),
+        order_ids=list(batch.order_ids),
+        route_km=batch.route_km,
+    )
+    return job
+
+def list_batched_jobs(db: Session, lat: Optional[float], lng: Optional[float],
+                      radius_km: float, limit: int, cursor: Optional[str]):
+    """Like list_delivery_jobs, with each store's open jobs grouped into multi-drop batches
+
+    With lat/lng, the batches of the `limit` nearest jobs, closest first.
+    Otherwise the jobs are paged by id as on the plain board and each batch
+    is listed on the page holding its lowest order id.
+    """
+    distance = None
+    if lat is not None and lng is not None:
+        job_index.sync(db)
+        distance = dict(job_index.nearest(lat, lng, radius_km, limit))
+        seeds, next_cursor = list(distance), None
+    else:
+        stmt = keyset_page(
+            select(models.Order.id).where(*dispatch.open_job_filter()), None, models.Order.id, cursor, limit,
+            descending=False
+        )
+        rows, next_cursor = next_page(db.execute(stmt).all(), limit, None)
+        seeds = [row.id for row in rows]
+    if not seeds:
+        return [], None
+
+    batches = batching.batches_for(db, seeds)
+    rows = db.execute(job_board_select().where(
+        models.Order.id.in_([order_id for batch in batches for order_id in batch.order_ids])
+    )).all()
+    rows_by_id = {row.id: row for row in rows}
+    # Skip batches a job of which was claimed since they were planned
+    batches = [batch for batch in batches if all(order_id in rows_by_id for order_id in batch.order_ids)]
+    if distance is None:
+        page = set(seeds)
+        batches = sorted(
+            (batch for batch in batches if min(batch.order_ids) in page), key=lambda batch: min(batch.order_ids)
+        )
+        return [batch_to_dict(batch, rows_by_id) for batch in batches], next_cursor
+
+    # A batch is one store's, so any of its jobs gives the distance
+    jobs = [
+        batch_to_dict(batch, rows_by_id, next(distance[o] for o in batch.order_ids if o in distance))
+        for batch in batches
+    ]
+    jobs.sort(key=lambda job: job["distance"])
+    return jobs, None
+
+def _set_work_status(db: Session, deliverer_id: int, work_status: str):
+    db.query(models.DelivererProfile).filter(
+        models.DelivererProfile.id == deliverer_id
+    ).update({"work_status": work_status}, synchronize_session=False)
+
 @router.get("/jobs", response_model=List[schemas.DeliveryJob])
 def get_delivery_jobs(
+    response: Response,
+    lat: Optional[float] = Query(None, ge=-90, le=90),
+    lng: Optional[float] = Query(None, ge=-180, le=180),
+    radius_km: float = Query(5.0, gt=0, le=100),
+    limit: int = Query(100, ge=1, le=500),
+    cursor: Optional[str] = None,
+    batched: bool = False,
     current_user: models.User = Depends(get_current_user),
     db: Session = Depends(database.get_db)
 ):
-    """Get available delivery jobs (deliverer only)"""
+    """Get available delivery jobs (deliverer only)
+
+    With lat/lng, returns the `limit` nearest jobs whose store lies within
+    radius_km, closest first, with `distance` in km from the given position.
+
+    Otherwise jobs are returned oldest first. When more jobs remain, the
+    X-Next-Cursor response header holds a cursor; passing it back returns only
+    the jobs after it, so polling clients do not download the whole board again.
+
+    With batched=true, jobs of one store that went ready around the same
+    time and head the same way come as one multi-drop job listing its
+    order_ids in drop order; accept it with POST /delivery/batches/accept.
+    """
     if current_user.role != "deliverer":
         raise HTTPException(status_code=403, detail="Only deliverers can access this endpoint")
+
+    jobs, next_cursor = list_delivery_jobs(db, lat, lng, radius_km, limit, cursor, batched)
+    if fastjson.FAST_JSON_RESPONSES:
+        # job_row_to_dict already builds schemas.DeliveryJob-shaped dicts
+        headers = {NEXT_CURSOR_HEADER: next_cursor} if next_cursor else None
+        return fastjson.FastJSONResponse(jobs, headers=headers)
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return jobs
+
+def _claimed(db: Session, claim):
+    """Commit a successful claim; the lifecycle takes the job off the board and notifies"""
+    delivery, _ = claim
+    db.commit()
+    return {"message": "Job accepted", "order_id": delivery.order_id, "delivery_id": delivery.id}
+
+@router.post("/jobs/next")
+def accept_next_job(
+    lat: Optional[float] = Query(None, ge=-90, le=90),
+    lng: Optional[float] = Query(None, ge=-180, le=180),
+    radius_km: float = Query(5.0, gt=0, le=100),
+    current_user: models.User = Depends(get_current_user),
+    deliverer_id: Optional[int] = Depends(get_current_profile_id),
+    db: Session = Depends(database.get_db)
+):
+    """Accept the nearest open job within radius_km, or the oldest without lat/lng (deliverer only)
+
+    Jobs being claimed by someone else are skipped, not waited for.
+    """
+    if current_user.role != "deliverer":
+        raise HTTPException(status_code=403, detail="Only deliverers can accept jobs")
     
-    # Get orders that are ready for pickup and not yet assigned
-    orders = db.query(models.Order).filter(
-        models.Order.status == "ready_for_pickup",
-        models.Order.deliverer_id == None
-    ).all()
-    
-    jobs = []
-    for order in orders:
-        store = db.query(models.StoreProfile).filter(
-            models.StoreProfile.id == order.store_id
-        ).first()
-        
-        # Count items in order
-        items_count = db.query(models.OrderDetail).filter(
-            models.OrderDetail.order_id == order.id
-        ).count()
-        
-        jobs.append({
-            "id": order.id,
-            "order_id": order.id,
-            "store_name": store.store_name if store else "Unknown",
-            "store_address": store.address if store else "Unknown",
-            "delivery_address": order.delivery_address,
-            "reward": order.delivery_fee or 300,
-            "distance": 2.5,  # TODO: Calculate actual distance
-            "items_count": items_count
-        })
+    if deliverer_id is None:
+        raise HTTPException(status_code=404, detail="Deliverer profile not found")
     
-    return jobs
+    candidates = None
+    if lat is not None and lng is not None:
+        job_index.sync(db)
+        candidates = [order_id for order_id, _ in job_index.nearest(lat, lng, radius_km, NEXT_JOB_CANDIDATES)]
+    claim = dispatch.claim_next_job(db, deliverer_id, candidates)
+    if claim is None:
+        raise HTTPException(status_code=404, detail="No jobs available")
+    return _claimed(db, claim)
 
 @router.post("/jobs/{order_id}/accept")
 def accept_job(
     order_id: int,
     current_user: models.User = Depends(get_current_user),
+    deliverer_id: Optional[int] = Depends(get_current_profile_id),
     db: Session = Depends(database.get_db)
 ):
-    """Accept a delivery job (deliverer only)"""
+    """Accept a delivery job (deliverer only)
+
+    Of several deliverers accepting the same job at once, one gets it and
+    the others get 409.
+    """
     if current_user.role != "deliverer":
         raise HTTPException(status_code=403, detail="Only deliverers can accept jobs")
     
-    deliverer = db.query(models.DelivererProfile).filter(
-        models.DelivererProfile.user_id == current_user.id
-    ).first()
-    if not deliverer:
+    if deliverer_id is None:
         raise HTTPException(status_code=404, detail="Deliverer profile not found")
     
-    order = db.query(models.Order).filter(models.Order.id == order_id).first()
-    if not order:
-        raise HTTPException(status_code=404, detail="Order not found")
-    
-    if order.status != "ready_for_pickup":
-        raise HTTPException(status_code=400, detail="Order not ready for pickup")
+    claim = dispatch.claim_job(db, order_id, deliverer_id)
+    if claim is None:
+        order = db.execute(
+            select(models.Order.status, models.Order.deliverer_id).where(models.Order.id == order_id)
+        ).first()
+        if not order:
+            raise HTTPException(status_code=404, detail="Order not found")
+        if order.deliverer_id is None:
+            raise HTTPException(status_code=400, detail="Order not ready for pickup")
+        raise HTTPException(status_code=409, detail="Order already assigned to a deliverer")
     
-    if order.deliverer_id is not None:
-        raise HTTPException(status_code=400, detail="Order already assigned to a deliverer")
+    return _claimed(db, claim)
+
+@router.post("/batches/accept")
+def accept_job_batch(
+    batch: schemas.JobBatchAccept,
+    current_user: models.User = Depends(get_current_user),
+    deliverer_id: Optional[int] = Depends(get_current_profile_id),
+    db: Session = Depends(database.get_db)
+):
+    """Accept a multi-drop job from the batched job board (deliverer only)
 
-    # Assign deliverer to order
-    order.deliverer_id = deliverer.id
-    order.status = "picked_up"
+    order_ids must be exactly the orders of one batch the board plans now,
+    in any order; otherwise, e.g. after the board changed, the response is
+    409. Its orders are claimed and their deliveries created in one
+    transaction: if any of them was taken meanwhile, none is and the
+    response is 409 too.
+    """
+    if current_user.role != "deliverer":
+        raise HTTPException(status_code=403, detail="Only deliverers can accept jobs")
     
-    # Create delivery record
-    delivery = models.Delivery(
-        order_id=order_id,
-        deliverer_id=deliverer.id,
-        status="assigned",
-        delivery_fee=order.delivery_fee
-    )
-    db.add(delivery)
+    if deliverer_id is None:
+        raise HTTPException(status_code=404, detail="Deliverer profile not found")
+    
+    order_ids = batch.order_ids
+    if not order_ids or len(order_ids) > batching.BATCH_MAX_DROPS or len(set(order_ids)) != len(order_ids):
+        raise HTTPException(
+            status_code=400, detail=f"order_ids must be 1 to {batching.BATCH_MAX_DROPS} distinct orders"
+        )
     
-    # Update deliverer status
-    deliverer.work_status = "busy"
+    wanted = set(order_ids)
+    planned = next((plan for plan in batching.batches_for(db, order_ids) if set(plan.order_ids) == wanted), None)
+    if planned is None:
+        raise HTTPException(status_code=409, detail="Not a batch on the current job board")
+    
+    claims = batching.claim_batch(db, list(planned.order_ids), deliverer_id)
+    if claims is None:
+        db.rollback()
+        raise HTTPException(status_code=409, detail="Batch is no longer available")
     
     db.commit()
+    return {
+        "message": "Batch accepted",
+        "order_ids": list(planned.order_ids),
+        "delivery_ids": [delivery.id for delivery, _ in claims],
+    }
+
+@router.get("/offers", response_model=List[schemas.JobOffer])
+def get_my_job_offers(
+    current_user: models.User = Depends(get_current_user),
+    deliverer_id: Optional[int] = Depends(get_current_profile_id),
+    db: Session = Depends(database.get_db)
+):
+    """Get the jobs the dispatch engine currently offers the deliverer
+
+    Offers are also pushed as job_offer events on the deliverer's realtime
+    topic. Each must be accepted before its expires_at.
+    """
+    if current_user.role != "deliverer":
+        raise HTTPException(status_code=403, detail="Only deliverers can access this endpoint")
     
-    return {"message": "Job accepted", "order_id": order_id}
+    if deliverer_id is None:
+        return []
+    
+    return db.execute(
+        select(models.JobOffer).where(
+            models.JobOffer.deliverer_id == deliverer_id,
+            models.JobOffer.status == "offered",
+            models.JobOffer.expires_at > datetime.utcnow()
+        ).order_by(models.JobOffer.id)
+    ).scalars().all()
+
+def _offer_status(db: Session, offer_id: int, deliverer_id: Optional[int]) -> str:
+    """Status of the deliverer's offer for the error of a failed accept/decline; 404 if not theirs"""
+    offer = db.execute(
+        select(models.JobOffer.status, models.JobOffer.deliverer_id).where(models.JobOffer.id == offer_id)
+    ).first()
+    if not offer or offer.deliverer_id != deliverer_id:
+        raise HTTPException(status_code=404, detail="Offer not found")
+    return "expired" if offer.status == "offered" else offer.status
+
+@router.post("/offers/{offer_id}/accept")
+def accept_job_offer(
+    offer_id: int,
+    current_user: models.User = Depends(get_current_user),
+    deliverer_id: Optional[int] = Depends(get_current_profile_id),
+    db: Session = Depends(database.get_db)
+):
+    """Accept a job offered by the dispatch engine (deliverer only)
+
+    409 once the offer has expired or been answered, or when its job was
+    taken from the board meanwhile.
+    """
+    if current_user.role != "deliverer":
+        raise HTTPException(status_code=403, detail="Only deliverers can accept jobs")
+    
+    claim = dispatch.accept_offer(db, offer_id, deliverer_id)
+    if claim is None:
+        db.commit()  # keeps the offer withdrawn if its job is gone
+        raise HTTPException(status_code=409, detail=f"Offer is {_offer_status(db, offer_id, deliverer_id)}")
+    
+    return _claimed(db, claim)
+
+@router.post("/offers/{offer_id}/decline")
+def decline_job_offer(
+    offer_id: int,
+    current_user: models.User = Depends(get_current_user),
+    deliverer_id: Optional[int] = Depends(get_current_profile_id),
+    db: Session = Depends(database.get_db)
+):
+    """Decline a job offered by the dispatch engine; the job goes to someone else next round"""
+    if current_user.role != "deliverer":
+        raise HTTPException(status_code=403, detail="Only deliverers can decline jobs")
+    
+    if not dispatch.decline_offer(db, offer_id, deliverer_id):
+        raise HTTPException(status_code=409, detail=f"Offer is {_offer_status(db, offer_id, deliverer_id)}")
+    
+    db.commit()
+    dispatch.dispatch_engine.wake()
+    return {"message": "Offer declined", "offer_id": offer_id}
 
 @router.get("/my", response_model=List[schemas.Delivery])
 def get_my_deliveries(
     current_user: models.User = Depends(get_current_user),
+    deliverer_id: Optional[int] = Depends(get_current_profile_id),
     db: Session = Depends(database.get_db)
 ):
     """Get current deliverer's deliveries"""
     if current_user.role != "deliverer":
         raise HTTPException(status_code=403, detail="Only deliverers can access this endpoint")
     
-    deliverer = db.query(models.DelivererProfile).filter(
-        models.DelivererProfile.user_id == current_user.id
-    ).first()
-    if not deliverer:
+    if deliverer_id is None:
         return []
     
     deliveries = db.query(models.Delivery).filter(
-        models.Delivery.deliverer_id == deliverer.id
+        models.Delivery.deliverer_id == deliverer_id
     ).order_by(models.Delivery.created_at.desc()).all()
     
     return deliveries
 
+def finish_track(delivery_id: int):
+    """Write out a finished delivery's buffered fixes, then pack its route"""
+    location_buffer.flush([delivery_id])
+    with database.SessionLocal() as db:
+        tracks.compact_delivery(db, delivery_id)
+
 @router.put("/{delivery_id}/status")
 def update_delivery_status(
     delivery_id: int,
     status_update: schemas.DeliveryStatusUpdate,
+    background_tasks: BackgroundTasks,
     current_user: models.User = Depends(get_current_user),
+    deliverer_id: Optional[int] = Depends(get_current_profile_id),
     db: Session = Depends(database.get_db)
 ):
-    """Update delivery status"""
+    """Update delivery status (picked_up, delivering, completed)
+
+    Moves the order along with it (delivering, delivered) and puts the
+    deliverer back online on completion, all in one transaction. The
+    finished route is packed after the response (see finish_track).
+    """
     if current_user.role != "deliverer":
         raise HTTPException(status_code=403, detail="Only deliverers can update delivery status")
     
-    delivery = db.query(models.Delivery).filter(models.Delivery.id == delivery_id).first()
-    if not delivery:
-        raise HTTPException(status_code=404, detail="Delivery not found")
+    if status_update.status not in lifecycle.DELIVERY_STEPS:
+        raise HTTPException(status_code=400, detail=f"Unknown delivery status: {status_update.status}")
     
-    delivery.status = status_update.status
-    
-    # Update timestamps
-    if status_update.status == "picked_up":
-        delivery.pickup_time = datetime.utcnow()
-    elif status_update.status == "completed":
-        delivery.delivery_time = datetime.utcnow()
-        # Update order status
-        order = db.query(models.Order).filter(models.Order.id == delivery.order_id).first()
-        if order:
-            order.status = "delivered"
-            order.completed_at = datetime.utcnow()
-        # Update deliverer status
-        deliverer = db.query(models.DelivererProfile).filter(
-            models.DelivererProfile.id == delivery.deliverer_id
+    order_id = lifecycle.advance_delivery(db, delivery_id, deliverer_id, status_update.status)
+    if order_id is None:
+        current = db.execute(
+            select(models.Delivery.status, models.Delivery.deliverer_id).where(models.Delivery.id == delivery_id)
         ).first()
-        if deliverer:
-            deliverer.work_status = "online"
+        if not current or current.deliverer_id != deliverer_id:
+            raise HTTPException(status_code=404, detail="Delivery not found")
+        if current.status != status_update.status:
+            raise HTTPException(
+                status_code=409,
+                detail=f"Cannot change delivery status from {current.status} to {status_update.status}"
+            )
+        return {"message": "Delivery status updated", "status": current.status}
     
     db.commit()
-    return {"message": "Delivery status updated", "status": delivery.status}
+    hub.publish(order_topics(order_id, deliverer_id=deliverer_id), {
+        "type": "delivery_status", "delivery_id": delivery_id, "order_id": order_id,
+        "status": status_update.status,
+    })
+    
+    if status_update.status == "completed":
+        background_tasks.add_task(finish_track, delivery_id)
+    return {"message": "Delivery status updated", "status": status_update.status}
+
+def location_fixes(fixes: List[schemas.DeliveryLocationUpdate]):
+    """(latitude, longitude, recorded_at) tuples for the location buffer; 400 on a bad timestamp"""
+    now = datetime.utcnow()
+    result = []
+    for fix in fixes:
+        recorded_at = fix_time(fix.recorded_at, now)
+        if recorded_at is None:
+            raise HTTPException(status_code=400, detail="recorded_at is out of range")
+        result.append((fix.latitude, fix.longitude, recorded_at))
+    return result
+
+def publish_location(order_id: int, delivery_id: int):
+    latitude, longitude, recorded_at = location_buffer.latest(delivery_id)
+    hub.publish(order_topics(order_id), {
+        "type": "delivery_location", "delivery_id": delivery_id, "order_id": order_id,
+        "latitude": latitude, "longitude": longitude, "recorded_at": recorded_at,
+    })
+
+def tracked_order_id(owner: Optional[tuple[int, int, bool]], deliverer_id: Optional[int]) -> int:
+    """Order id of a delivery (tracking.LocationBuffer.delivery_owner) the caller may send fixes for
+
+    404 unless it exists, 403 unless it is the caller's, 409 once it has ended.
+    """
+    if owner is None:
+        raise HTTPException(status_code=404, detail="Delivery not found")
+    order_id, owner_id, in_progress = owner
+    if owner_id != deliverer_id:
+        raise HTTPException(status_code=403, detail="Not your delivery")
+    if not in_progress:
+        raise HTTPException(status_code=409, detail="Delivery has ended")
+    return order_id
+
+def _queue_fixes(db: Session, delivery_id: int, deliverer_id: Optional[int],
+                 fixes: List[schemas.DeliveryLocationUpdate]):
+    points = location_fixes(fixes)
+    order_id = tracked_order_id(location_buffer.delivery_owner(db, delivery_id), deliverer_id)
+    location_buffer.append(delivery_id, points)
+    publish_location(order_id, delivery_id)
 
 @router.put("/{delivery_id}/location")
 def update_delivery_location(
     delivery_id: int,
     location: schemas.DeliveryLocationUpdate,
     current_user: models.User = Depends(get_current_user),
+    deliverer_id: Optional[int] = Depends(get_current_profile_id),
+    db: Session = Depends(database.get_db)
+):
+    """Update deliverer's current location
+
+    The fix is buffered in memory and written to the location history with
+    other fixes in the next batch (see tracking.LocationBuffer).
+    """
+    if current_user.role != "deliverer":
+        raise HTTPException(status_code=403, detail="Only deliverers can update location")
+    
+    _queue_fixes(db, delivery_id, deliverer_id, [location])
+    return {"message": "Location updated"}
+
+@router.post("/{delivery_id}/locations")
+def upload_delivery_locations(
+    delivery_id: int,
+    batch: schemas.DeliveryLocationBatch,
+    current_user: models.User = Depends(get_current_user),
+    deliverer_id: Optional[int] = Depends(get_current_profile_id),
     db: Session = Depends(database.get_db)
 ):
-    """Update deliverer's current location"""
+    """Upload several fixes at once, e.g. points recorded while offline"""
     if current_user.role != "deliverer":
         raise HTTPException(status_code=403, detail="Only deliverers can update location")
     
-    delivery = db.query(models.Delivery).filter(models.Delivery.id == delivery_id).first()
+    if not batch.fixes:
+        raise HTTPException(status_code=400, detail="No locations given")
+    if len(batch.fixes) > LOCATION_BATCH_MAX:
+        raise HTTPException(status_code=400, detail=f"At most {LOCATION_BATCH_MAX} locations per request")
+    
+    _queue_fixes(db, delivery_id, deliverer_id, batch.fixes)
+    return {"message": "Locations updated", "count": len(batch.fixes)}
+
+@router.get("/{delivery_id}/location", response_model=schemas.DeliveryPosition)
+def get_delivery_location(
+    delivery_id: int,
+    current_user: models.User = Depends(get_current_user),
+    profile_id: Optional[int] = Depends(get_current_profile_id),
+    db: Session = Depends(database.get_db)
+):
+    """Get the latest known position of a delivery (its requester, store or deliverer only)"""
+    authorize_delivery(db, delivery_id, current_user, profile_id)
+    latest = location_buffer.latest(delivery_id)
+    if latest is not None:
+        latitude, longitude, recorded_at = latest
+        return {"delivery_id": delivery_id, "latitude": latitude, "longitude": longitude, "recorded_at": recorded_at}
+    
+    # Not tracked by this process: use the position written by the last flush
+    delivery = db.execute(
+        select(models.Delivery.current_latitude, models.Delivery.current_longitude, models.Delivery.updated_at)
+        .where(models.Delivery.id == delivery_id)
+    ).first()
     if not delivery:
         raise HTTPException(status_code=404, detail="Delivery not found")
+    return {
+        "delivery_id": delivery_id,
+        "latitude": delivery.current_latitude,
+        "longitude": delivery.current_longitude,
+        "recorded_at": delivery.updated_at,
+    }
+
+@router.get("/{delivery_id}/track")
+def get_delivery_track(
+    delivery_id: int,
+    simplified: bool = False,
+    current_user: models.User = Depends(get_current_user),
+    profile_id: Optional[int] = Depends(get_current_profile_id),
+    db: Session = Depends(database.get_db)
+):
+    """Get the recorded route of a delivery (its requester, store or deliverer only)
+
+    Streams every fix as {"latitude", "longitude", "recorded_at"}; with
+    simplified=true returns {"polyline"} in encoded polyline format instead.
+    """
+    authorize_delivery(db, delivery_id, current_user, profile_id)
     
-    delivery.current_latitude = location.latitude
-    delivery.current_longitude = location.longitude
+    if simplified:
+        return {"delivery_id": delivery_id, "polyline": tracks.track_polyline(db, delivery_id)}
     
-    # Save location history
-    location_history = models.DeliveryLocationHistory(
-        delivery_id=delivery_id,
-        latitude=location.latitude,
-        longitude=location.longitude
+    return StreamingResponse(
+        tracks.stream_track_json(database.SessionLocal, delivery_id), media_type="application/json"
     )
-    db.add(location_history)
+
+@router.put("/position")
+def update_deliverer_position(
+    position: schemas.DeliveryLocationUpdate,
+    current_user: models.User = Depends(get_current_user),
+    deliverer_id: Optional[int] = Depends(get_current_profile_id),
+    db: Session = Depends(database.get_db)
+):
+    """Report where an idle deliverer is waiting
+
+    The dispatch engine only offers jobs to online deliverers with a recent
+    position; during a delivery, use the delivery's location routes instead.
+    """
+    if current_user.role != "deliverer":
+        raise HTTPException(status_code=403, detail="Only deliverers can use this endpoint")
+    
+    if deliverer_id is None:
+        raise HTTPException(status_code=404, detail="Deliverer profile not found")
     
+    (latitude, longitude, recorded_at), = location_fixes([position])
+    dispatch.set_position(db, deliverer_id, latitude, longitude, recorded_at)
     db.commit()
-    return {"message": "Location updated"}
+    return {"message": "Position updated"}
 
 @router.put("/status/online")
 def set_deliverer_online(
+    lat: Optional[float] = Query(None, ge=-90, le=90),
+    lng: Optional[float] = Query(None, ge=-180, le=180),
     current_user: models.User = Depends(get_current_user),
+    deliverer_id: Optional[int] = Depends(get_current_profile_id),
     db: Session = Depends(database.get_db)
 ):
-    """Set deliverer status to online"""
+    """Set deliverer status to online, optionally at lat/lng (see PUT /delivery/position)"""
     if current_user.role != "deliverer":
         raise HTTPException(status_code=403, detail="Only deliverers can use this endpoint")
     
-    deliverer = db.query(models.DelivererProfile).filter(
-        models.DelivererProfile.user_id == current_user.id
-    ).first()
-    if not deliverer:
+    if deliverer_id is None:
         raise HTTPException(status_code=404, detail="Deliverer profile not found")
     
-    deliverer.work_status = "online"
+    _set_work_status(db, deliverer_id, "online")
+    if lat is not None and lng is not None:
+        dispatch.set_position(db, deliverer_id, lat, lng, datetime.utcnow())
     db.commit()
     return {"message": "Status set to online", "work_status": "online"}
 
 @router.put("/status/offline")
 def set_deliverer_offline(
     current_user: models.User = Depends(get_current_user),
+    deliverer_id: Optional[int] = Depends(get_current_profile_id),
     db: Session = Depends(database.get_db)
 ):
     """Set deliverer status to offline"""
     if current_user.role != "deliverer":
         raise HTTPException(status_code=403, detail="Only deliverers can use this endpoint")
     
-    deliverer = db.query(models.DelivererProfile).filter(
-        models.DelivererProfile.user_id == current_user.id
-    ).first()
-    if not deliverer:
+    if deliverer_id is None:
         raise HTTPException(status_code=404, detail="Deliverer profile not found")
     
-    deliverer.work_status = "offline"
+    _set_work_status(db, deliverer_id, "offline")
     db.commit()
     return {"message": "Status set to offline", "work_status": "offline"}
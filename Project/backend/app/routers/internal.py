@@ -0,0 +1,35 @@
+from fastapi import APIRouter, Depends
+from .. import database
+from ..catalog_cache import catalog_cache
+from ..pool_metrics import InstrumentedAsyncQueuePool, InstrumentedQueuePool, pool_status
+from ..realtime import hub
+from ..tracking import location_buffer
+from .auth import get_current_admin
+
+router = APIRouter(
+    prefix="/internal",
+    tags=["internal"],
+)
+
+@router.get("/pool", dependencies=[Depends(get_current_admin)])
+def get_pool_stats():
+    """Connection pool state and checkout-wait histogram (admin only)"""
+    stats = {"sync": pool_status(database.engine, InstrumentedQueuePool.metrics)}
+    if database.async_engine is not None:
+        stats["async"] = pool_status(database.async_engine.sync_engine, InstrumentedAsyncQueuePool.metrics)
+    return stats
+
+@router.get("/tracking", dependencies=[Depends(get_current_admin)])
+def get_tracking_stats():
+    """Location buffer state of this worker process (admin only)"""
+    return location_buffer.stats()
+
+@router.get("/realtime", dependencies=[Depends(get_current_admin)])
+def get_realtime_stats():
+    """Realtime hub subscriptions and delivery counters of this worker (admin only)"""
+    return hub.stats()
+
+@router.get("/catalog-cache", dependencies=[Depends(get_current_admin)])
+def get_catalog_cache_stats():
+    """Catalog cache hit/miss counters of this worker (admin only)"""
+    return catalog_cache.stats()
@@ -1,25 +1,44 @@
-from fastapi import APIRouter, Depends, HTTPException
+import json
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from sqlalchemy import select, update
 from sqlalchemy.orm import Session
-from typing import List
-from .. import models, schemas, database
-from .auth import get_current_user
+from typing import List, Optional
+from .. import models, schemas, database, broadcasts, notification_counts
+from ..pagination import NEXT_CURSOR_HEADER, keyset_page, next_page
+from ..realtime import hub
+from .auth import get_current_user, get_current_profile_id
 
 router = APIRouter(
     prefix="/notifications",
     tags=["notifications"],
 )
 
+def my_notifications_select(user_id: int, skip: int, limit: int, cursor: Optional[str]):
+    """Newest-first notifications; keyset-paginated on (created_at, id) when a cursor is given"""
+    stmt = select(models.Notification).where(models.Notification.user_id == user_id)
+    stmt = keyset_page(stmt, models.Notification.created_at, models.Notification.id, cursor, limit)
+    if skip and not cursor:
+        stmt = stmt.offset(skip)
+    return stmt
+
 @router.get("/", response_model=List[schemas.Notification])
 def get_my_notifications(
+    response: Response,
     skip: int = 0,
-    limit: int = 50,
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None,
     current_user: models.User = Depends(get_current_user),
     db: Session = Depends(database.get_db)
 ):
-    """Get current user's notifications"""
-    notifications = db.query(models.Notification).filter(
-        models.Notification.user_id == current_user.id
-    ).order_by(models.Notification.created_at.desc()).offset(skip).limit(limit).all()
+    """Get current user's notifications
+
+    Prefer the cursor from the X-Next-Cursor response header over skip:
+    its cost does not grow with the page depth.
+    """
+    notifications = db.execute(my_notifications_select(current_user.id, skip, limit, cursor)).scalars().all()
+    notifications, next_cursor = next_page(notifications, limit, "created_at")
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
     return notifications
 
 @router.get("/unread/count")
@@ -28,11 +47,7 @@ def get_unread_count(
     db: Session = Depends(database.get_db)
 ):
     """Get count of unread notifications"""
-    count = db.query(models.Notification).filter(
-        models.Notification.user_id == current_user.id,
-        models.Notification.is_read == False
-    ).count()
-    return {"unread_count": count}
+    return {"unread_count": notification_counts.unread_count(db, current_user.id)}
 
 @router.put("/{notification_id}/read")
 def mark_notification_read(
@@ -41,14 +56,24 @@ def mark_notification_read(
     db: Session = Depends(database.get_db)
 ):
     """Mark a notification as read"""
-    notification = db.query(models.Notification).filter(
-        models.Notification.id == notification_id,
-        models.Notification.user_id == current_user.id
-    ).first()
-    if not notification:
-        raise HTTPException(status_code=404, detail="Notification not found")
+    notification_counts.ensure_counters(db, [current_user.id])
+    # Conditional update, so only the request that flips is_read decrements the counter
+    result = db.execute(
+        update(models.Notification).where(
+            models.Notification.id == notification_id,
+            models.Notification.user_id == current_user.id,
+            models.Notification.is_read == False
+        ).values(is_read=True)
+    )
+    if result.rowcount == 0:
+        exists = db.execute(select(models.Notification.id).where(
+            models.Notification.id == notification_id,
+            models.Notification.user_id == current_user.id
+        )).first()
+        if not exists:
+            raise HTTPException(status_code=404, detail="Notification not found")
     
-    notification.is_read = True
+    notification_counts.add_unread(db, {current_user.id: -result.rowcount})
     db.commit()
     return {"message": "Notification marked as read"}
 
@@ -58,10 +83,12 @@ def mark_all_notifications_read(
     db: Session = Depends(database.get_db)
 ):
     """Mark all notifications as read"""
-    db.query(models.Notification).filter(
+    notification_counts.ensure_counters(db, [current_user.id])
+    marked = db.query(models.Notification).filter(
         models.Notification.user_id == current_user.id,
         models.Notification.is_read == False
     ).update({"is_read": True})
+    notification_counts.add_unread(db, {current_user.id: -marked})
     db.commit()
     return {"message": "All notifications marked as read"}
 
@@ -71,6 +98,7 @@ def create_notification(
     db: Session = Depends(database.get_db)
 ):
     """Create a new notification (internal use)"""
+    notification_counts.ensure_counters(db, [notification.user_id])
     db_notification = models.Notification(
         user_id=notification.user_id,
         title=notification.title,
@@ -79,6 +107,92 @@ def create_notification(
         related_order_id=notification.related_order_id
     )
     db.add(db_notification)
+    notification_counts.add_unread(db, {notification.user_id: 1})
     db.commit()
     db.refresh(db_notification)
+    hub.publish([f"user:{db_notification.user_id}"], {
+        "type": "notification",
+        "notification": schemas.Notification.model_validate(db_notification).model_dump(mode="json"),
+    })
     return db_notification
+
+def _get_own_broadcast(broadcast_id: int, current_user: models.User, db: Session) -> models.NotificationBroadcast:
+    broadcast = db.get(models.NotificationBroadcast, broadcast_id)
+    if not broadcast or (current_user.role != "admin" and broadcast.created_by != current_user.id):
+        raise HTTPException(status_code=404, detail="Broadcast not found")
+    return broadcast
+
+@router.post("/broadcasts", response_model=schemas.NotificationBroadcast, status_code=202)
+def create_broadcast(
+    broadcast: schemas.NotificationBroadcastCreate,
+    current_user: models.User = Depends(get_current_user),
+    profile_id: Optional[int] = Depends(get_current_profile_id),
+    db: Session = Depends(database.get_db)
+):
+    """Queue a notification to a whole audience
+
+    Admins may target a role, a store's past customers or a list of user
+    ids; store owners may target their own customers. Sent in the
+    background; poll GET /notifications/broadcasts/{id} for progress.
+    """
+    if broadcast.type not in broadcasts.BROADCAST_TYPES:
+        raise HTTPException(status_code=400, detail=f"Broadcast type must be one of {', '.join(broadcasts.BROADCAST_TYPES)}")
+    if current_user.role == "store":
+        if broadcast.audience != "store_customers" or broadcast.store_id not in (None, profile_id):
+            raise HTTPException(status_code=403, detail="Store owners can only notify their own customers")
+        broadcast.store_id = profile_id
+    elif current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Only admins and store owners can send broadcasts")
+    
+    db_broadcast = models.NotificationBroadcast(
+        created_by=current_user.id,
+        title=broadcast.title,
+        message=broadcast.message,
+        type=broadcast.type,
+        audience=broadcast.audience
+    )
+    if broadcast.audience == "role" and broadcast.role in broadcasts.AUDIENCE_ROLES:
+        db_broadcast.audience_role = broadcast.role
+    elif broadcast.audience == "store_customers" and broadcast.store_id is not None:
+        db_broadcast.audience_store_id = broadcast.store_id
+    elif broadcast.audience == "users" and broadcast.user_ids:
+        db_broadcast.audience_user_ids = json.dumps(broadcast.user_ids)
+    else:
+        raise HTTPException(status_code=400, detail="Give role, store_id or user_ids matching the audience")
+    
+    db_broadcast.total_count = broadcasts.audience_size(db, db_broadcast)
+    db.add(db_broadcast)
+    db.commit()
+    db.refresh(db_broadcast)
+    broadcasts.broadcast_runner.wake()
+    return db_broadcast
+
+@router.get("/broadcasts/{broadcast_id}", response_model=schemas.NotificationBroadcast)
+def get_broadcast(
+    broadcast_id: int,
+    current_user: models.User = Depends(get_current_user),
+    db: Session = Depends(database.get_db)
+):
+    """Get a broadcast's status and progress"""
+    return _get_own_broadcast(broadcast_id, current_user, db)
+
+@router.post("/broadcasts/{broadcast_id}/resume", response_model=schemas.NotificationBroadcast, status_code=202)
+def resume_broadcast(
+    broadcast_id: int,
+    current_user: models.User = Depends(get_current_user),
+    db: Session = Depends(database.get_db)
+):
+    """Retry a failed broadcast from its last committed chunk"""
+    broadcast = _get_own_broadcast(broadcast_id, current_user, db)
+    resumed = db.execute(
+        update(models.NotificationBroadcast).where(
+            models.NotificationBroadcast.id == broadcast_id,
+            models.NotificationBroadcast.status == "failed"
+        ).values(status="pending")
+    ).rowcount
+    if not resumed:
+        raise HTTPException(status_code=409, detail=f"Broadcast is {broadcast.status}, not failed")
+    db.commit()
+    db.refresh(broadcast)
+    broadcasts.broadcast_runner.wake()
+    return broadcast
@@ -1,9 +1,10 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from typing import List
-from datetime import datetime
-from .. import models, schemas, database
-from .auth import get_current_user
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from sqlalchemy import select
+from sqlalchemy.orm import Session, selectinload
+from typing import List, Optional
+from .. import models, schemas, database, fastjson, lifecycle, ordering
+from ..pagination import NEXT_CURSOR_HEADER, keyset_page, next_page
+from .auth import get_current_user, get_current_profile_id
 
 router = APIRouter(
     prefix="/orders",
@@ -14,100 +15,97 @@ router = APIRouter(
 def create_order(
     order: schemas.OrderCreate,
     current_user: models.User = Depends(get_current_user),
+    requester_id: Optional[int] = Depends(get_current_profile_id),
     db: Session = Depends(database.get_db)
 ):
     """Create a new order (requester only)"""
     if current_user.role != "requester":
         raise HTTPException(status_code=403, detail="Only requesters can create orders")
     
-    # Get requester profile
-    requester = db.query(models.RequesterProfile).filter(
-        models.RequesterProfile.user_id == current_user.id
-    ).first()
-    if not requester:
+    if requester_id is None:
         raise HTTPException(status_code=404, detail="Requester profile not found")
     
-    # Calculate total amount
-    subtotal = 0
-    for item in order.details:
-        product = db.query(models.Product).filter(models.Product.id == item.product_id).first()
-        if not product:
-            raise HTTPException(status_code=404, detail=f"Product {item.product_id} not found")
-        if not product.is_available:
-            raise HTTPException(status_code=400, detail=f"Product {product.name} is not available")
-        subtotal += product.price * item.quantity
-    
-    delivery_fee = 300  # Default delivery fee
-    total_price = subtotal + delivery_fee
-
-    db_order = models.Order(
-        requester_id=requester.id,
-        store_id=order.store_id,
-        status="pending",
-        subtotal=subtotal,
-        delivery_fee=delivery_fee,
-        total_price=total_price,
-        delivery_address=order.delivery_address,
-        delivery_latitude=order.delivery_latitude,
-        delivery_longitude=order.delivery_longitude,
-        notes=order.notes
-    )
-    db.add(db_order)
-    db.commit()
-    db.refresh(db_order)
-
-    for item in order.details:
-        product = db.query(models.Product).filter(models.Product.id == item.product_id).first()
-        db_detail = models.OrderDetail(
-            order_id=db_order.id,
-            product_id=item.product_id,
-            product_name=product.name,
-            quantity=item.quantity,
-            unit_price=product.price,
-            subtotal=product.price * item.quantity,
-            notes=item.notes
-        )
-        db.add(db_detail)
-    
-    db.commit()
-    db.refresh(db_order)
-    return db_order
+    return ordering.place_order(db, requester_id, order)
+
+# schemas.Order serializes order_details; load them for a whole page in one
+# extra IN query instead of one lazy load per order
+ORDER_DETAILS_LOADER = selectinload(models.Order.order_details)
+
+ORDER_OWNER_COLUMNS = {
+    "requester": models.Order.requester_id,
+    "store": models.Order.store_id,
+    "deliverer": models.Order.deliverer_id,
+}
+
+# Page size of /orders/my when a cursor is given without a limit
+MY_ORDERS_PAGE_SIZE = 50
+
+ORDER_FIELDS = fastjson.fields(schemas.Order, exclude=["order_details"])
+ORDER_DETAIL_FIELDS = fastjson.fields(schemas.OrderDetail)
+
+def my_orders_select(owner_column, profile_id: int, cursor: Optional[str], limit: Optional[int],
+                     fast: bool = False):
+    """Newest-first page of the caller's orders, keyset-paginated on (ordered_at, id)
+
+    With fast=True, selects schemas.Order's columns as plain rows (details
+    not included; see order_details_select) instead of ORM objects.
+    """
+    if fast:
+        stmt = select(*fastjson.columns(models.Order, ORDER_FIELDS))
+    else:
+        stmt = select(models.Order).options(ORDER_DETAILS_LOADER)
+    stmt = stmt.where(owner_column == profile_id)
+    return keyset_page(stmt, models.Order.ordered_at, models.Order.id, cursor, limit)
+
+def order_details_select(order_ids: List[int]):
+    """schemas.OrderDetail rows of the given orders, in the relationship's order"""
+    return select(*fastjson.columns(models.OrderDetail, ORDER_DETAIL_FIELDS)).where(
+        models.OrderDetail.order_id.in_(order_ids)
+    ).order_by(models.OrderDetail.id)
+
+def order_dicts(order_rows, detail_rows) -> List[dict]:
+    """schemas.Order-shaped dicts from my_orders_select(fast=True) and order_details_select rows"""
+    details = {}
+    for detail in fastjson.rows_to_dicts(detail_rows, ORDER_DETAIL_FIELDS):
+        details.setdefault(detail["order_id"], []).append(detail)
+    orders = fastjson.rows_to_dicts(order_rows, ORDER_FIELDS)
+    for order in orders:
+        order["order_details"] = details.get(order["id"], [])
+    return orders
 
 @router.get("/my", response_model=List[schemas.Order])
 def get_my_orders(
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=200),
+    cursor: Optional[str] = None,
     current_user: models.User = Depends(get_current_user),
+    profile_id: Optional[int] = Depends(get_current_profile_id),
     db: Session = Depends(database.get_db)
 ):
-    """Get current user's orders"""
-    if current_user.role == "requester":
-        requester = db.query(models.RequesterProfile).filter(
-            models.RequesterProfile.user_id == current_user.id
-        ).first()
-        if not requester:
-            return []
-        orders = db.query(models.Order).filter(
-            models.Order.requester_id == requester.id
-        ).order_by(models.Order.ordered_at.desc()).all()
-    elif current_user.role == "store":
-        store = db.query(models.StoreProfile).filter(
-            models.StoreProfile.user_id == current_user.id
-        ).first()
-        if not store:
-            return []
-        orders = db.query(models.Order).filter(
-            models.Order.store_id == store.id
-        ).order_by(models.Order.ordered_at.desc()).all()
-    elif current_user.role == "deliverer":
-        deliverer = db.query(models.DelivererProfile).filter(
-            models.DelivererProfile.user_id == current_user.id
-        ).first()
-        if not deliverer:
-            return []
-        orders = db.query(models.Order).filter(
-            models.Order.deliverer_id == deliverer.id
-        ).order_by(models.Order.ordered_at.desc()).all()
-    else:
-        orders = []
+    """Get current user's orders, newest first
+
+    With a limit or cursor, returns at most `limit` (default
+    MY_ORDERS_PAGE_SIZE) orders and the X-Next-Cursor response header holds
+    the cursor for the next page when there is one. Without either, returns
+    every order, as clients that do not page expect.
+    """
+    owner_column = ORDER_OWNER_COLUMNS.get(current_user.role)
+    if owner_column is None or profile_id is None:
+        return []
+    if cursor and limit is None:
+        limit = MY_ORDERS_PAGE_SIZE
+    
+    if fastjson.FAST_JSON_RESPONSES:
+        rows = db.execute(my_orders_select(owner_column, profile_id, cursor, limit, fast=True)).all()
+        rows, next_cursor = next_page(rows, limit, "ordered_at")
+        details = db.execute(order_details_select([row.id for row in rows])).all() if rows else []
+        headers = {NEXT_CURSOR_HEADER: next_cursor} if next_cursor else None
+        return fastjson.FastJSONResponse(order_dicts(rows, details), headers=headers)
+    
+    orders = db.execute(my_orders_select(owner_column, profile_id, cursor, limit)).scalars().all()
+    orders, next_cursor = next_page(orders, limit, "ordered_at")
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
     
     return orders
 
@@ -123,49 +121,77 @@ def get_order(
         raise HTTPException(status_code=404, detail="Order not found")
     return order
 
+# Order status -> role of the party that may set it, on their own orders only
+ORDER_STATUS_SETTERS = {
+    "accepted": "store",
+    "preparing": "store",
+    "ready_for_pickup": "store",
+    "delivering": "deliverer",
+    "delivered": "deliverer",
+    "completed": "deliverer",
+    "cancelled": "requester",
+}
+
 @router.put("/{order_id}/status")
 def update_order_status(
     order_id: int,
     status_update: schemas.OrderUpdate,
     current_user: models.User = Depends(get_current_user),
+    profile_id: Optional[int] = Depends(get_current_profile_id),
     db: Session = Depends(database.get_db)
 ):
-    """Update order status"""
-    order = db.query(models.Order).filter(models.Order.id == order_id).first()
-    if not order:
-        raise HTTPException(status_code=404, detail="Order not found")
+    """Update order status
+
+    The store moves its orders up to ready_for_pickup, the order's
+    deliverer on from there, and the requester cancels; anyone else gets
+    403. Only moves allowed by lifecycle.ORDER_TRANSITIONS succeed; the
+    others, including losing a race with another update, get 409. Setting
+    the status the order already has is a no-op.
+    """
+    status = status_update.status
+    if status is not None and status not in lifecycle.ORDER_STATUSES:
+        raise HTTPException(status_code=400, detail=f"Unknown order status: {status}")
+    if status == "picked_up":
+        raise HTTPException(status_code=400, detail="Orders are picked up by accepting their delivery job")
+    
+    owner_column = ORDER_OWNER_COLUMNS.get(current_user.role)
+    setter = ORDER_STATUS_SETTERS.get(status)
+    if setter is not None and setter != current_user.role:
+        raise HTTPException(status_code=403, detail=f"Only the order's {setter} can set it to {status}")
+    if owner_column is None or profile_id is None:
+        raise HTTPException(status_code=403, detail="Not a party to this order")
     
-    if status_update.status:
-        order.status = status_update.status
-        
-        # Update timestamps based on status
-        if status_update.status == "accepted":
-            order.accepted_at = datetime.utcnow()
-        elif status_update.status in ["delivered", "completed"]:
-            order.completed_at = datetime.utcnow()
-        elif status_update.status == "cancelled":
-            order.cancelled_at = datetime.utcnow()
+    if status is None or lifecycle.transition(db, order_id, status, where=(owner_column == profile_id,)) is None:
+        order = db.execute(
+            select(models.Order.status, owner_column.label("owner_id")).where(models.Order.id == order_id)
+        ).first()
+        if order is None:
+            raise HTTPException(status_code=404, detail="Order not found")
+        if order.owner_id != profile_id:
+            raise HTTPException(status_code=403, detail="Not a party to this order")
+        current = order.status
+        if status not in (None, current):
+            raise HTTPException(status_code=409, detail=f"Cannot change order status from {current} to {status}")
+        return {"message": "Status updated", "status": current}
     
     db.commit()
-    return {"message": "Status updated", "status": order.status}
+    return {"message": "Status updated", "status": status}
 
 @router.get("/store/pending", response_model=List[schemas.Order])
 def get_store_pending_orders(
     current_user: models.User = Depends(get_current_user),
+    store_id: Optional[int] = Depends(get_current_profile_id),
     db: Session = Depends(database.get_db)
 ):
     """Get pending orders for store"""
     if current_user.role != "store":
         raise HTTPException(status_code=403, detail="Only stores can access this endpoint")
     
-    store = db.query(models.StoreProfile).filter(
-        models.StoreProfile.user_id == current_user.id
-    ).first()
-    if not store:
+    if store_id is None:
         raise HTTPException(status_code=404, detail="Store profile not found")
     
-    orders = db.query(models.Order).filter(
-        models.Order.store_id == store.id,
+    orders = db.query(models.Order).options(ORDER_DETAILS_LOADER).filter(
+        models.Order.store_id == store_id,
         models.Order.status.in_(["pending", "accepted", "preparing", "ready_for_pickup"])
     ).order_by(models.Order.ordered_at.desc()).all()
     
@@ -1,64 +1,162 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from sqlalchemy import select
 from sqlalchemy.orm import Session
-from typing import List
-from .. import models, schemas, database
-from .auth import get_current_user
+from typing import List, Optional
+from .. import models, schemas, database, fastjson, inventory
+from ..catalog_cache import UNKNOWN_STORES, catalog_cache, respond, serialize, store_tag, stores_tags
+from ..pagination import NEXT_CURSOR_HEADER, keyset_page, next_page
+from ..search import product_search, search_product_ids
+from .auth import get_current_user, get_current_profile_id
 
 router = APIRouter(
     prefix="/products",
     tags=["products"],
 )
 
+def available_products_select(skip: int, limit: int, cursor: Optional[str]):
+    """Available products in id order; keyset-paginated on id when a cursor is given"""
+    stmt = select(models.Product).where(models.Product.is_available == True)
+    stmt = keyset_page(stmt, None, models.Product.id, cursor, limit, descending=False)
+    if skip and not cursor:
+        stmt = stmt.offset(skip)
+    return stmt
+
+PRODUCT_FIELDS = fastjson.fields(schemas.Product)
+
+def store_products_select(store_id: int, fast: bool = False):
+    """A store's menu in display order; plain schemas.Product rows with fast=True"""
+    entities = fastjson.columns(models.Product, PRODUCT_FIELDS) if fast else [models.Product]
+    return select(*entities).where(models.Product.store_id == store_id).order_by(models.Product.display_order)
+
+def store_products_body(rows) -> bytes:
+    """JSON body of store_products_select(fast=True) rows"""
+    return fastjson.dumps(fastjson.rows_to_dicts(rows, PRODUCT_FIELDS))
+
 @router.get("/", response_model=List[schemas.Product])
-def get_products(skip: int = 0, limit: int = 100, db: Session = Depends(database.get_db)):
-    """Get all available products"""
-    products = db.query(models.Product).filter(
-        models.Product.is_available == True
-    ).offset(skip).limit(limit).all()
-    return products
+def get_products(
+    request: Request,
+    skip: int = 0,
+    limit: int = Query(100, ge=1, le=500),
+    cursor: Optional[str] = None,
+    db: Session = Depends(database.get_db)
+):
+    """Get all available products
+
+    Prefer the cursor from the X-Next-Cursor response header over skip:
+    its cost does not grow with the page depth.
+    """
+    key = ("products", skip, limit, cursor)
+    entry = catalog_cache.get(key)
+    if entry is None:
+        snapshot = catalog_cache.snapshot(UNKNOWN_STORES)
+        products = db.execute(available_products_select(skip, limit, cursor)).scalars().all()
+        products, next_cursor = next_page(products, limit, None)
+        headers = {NEXT_CURSOR_HEADER: next_cursor} if next_cursor else None
+        tags = stores_tags(product.store_id for product in products)
+        entry = catalog_cache.put(key, tags, serialize(List[schemas.Product], products), snapshot, headers)
+    return respond(request, entry)
+
+def search_products_body(db: Session, product_ids: List[int]) -> tuple[bytes, set]:
+    """JSON body of the products with the given ids, in that order, and the ids of their stores"""
+    rows = db.execute(
+        select(*fastjson.columns(models.Product, PRODUCT_FIELDS)).where(models.Product.id.in_(product_ids))
+    ).all() if product_ids else []
+    position = {product_id: i for i, product_id in enumerate(product_ids)}
+    products = sorted(fastjson.rows_to_dicts(rows, PRODUCT_FIELDS), key=lambda product: position[product["id"]])
+    store_ids = {product["store_id"] for product in products}
+    if fastjson.FAST_JSON_RESPONSES:
+        return fastjson.dumps(products), store_ids
+    return serialize(List[schemas.Product], products), store_ids
+
+def search_products(db: Session, q: str, store_id: Optional[int], category_id: Optional[int],
+                    max_price: Optional[int], limit: int) -> tuple[bytes, set]:
+    product_ids = search_product_ids(db, q, store_id, category_id, max_price, limit)
+    return search_products_body(db, product_ids)
+
+@router.get("/search", response_model=List[schemas.Product])
+def get_search_products(
+    request: Request,
+    q: str = Query(..., min_length=1, max_length=200),
+    store_id: Optional[int] = None,
+    category_id: Optional[int] = None,
+    max_price: Optional[int] = Query(None, ge=0),
+    limit: int = Query(20, ge=1, le=100),
+    db: Session = Depends(database.get_db)
+):
+    """Search available products by name and description
+
+    Every whitespace-separated term of q must appear in the name or the
+    description; name prefix matches come first, then name matches.
+    """
+    key = ("search", q, store_id, category_id, max_price, limit)
+    entry = catalog_cache.get(key)
+    if entry is None:
+        snapshot = catalog_cache.snapshot([store_tag(store_id)] if store_id is not None else UNKNOWN_STORES)
+        body, store_ids = search_products(db, q, store_id, category_id, max_price, limit)
+        tags = [store_tag(store_id)] if store_id is not None else stores_tags(store_ids)
+        entry = catalog_cache.put(key, tags, body, snapshot)
+    return respond(request, entry)
 
 @router.get("/{product_id}", response_model=schemas.Product)
-def get_product(product_id: int, db: Session = Depends(database.get_db)):
+def get_product(request: Request, product_id: int, db: Session = Depends(database.get_db)):
     """Get a specific product by ID"""
-    product = db.query(models.Product).filter(models.Product.id == product_id).first()
-    if not product:
-        raise HTTPException(status_code=404, detail="Product not found")
-    return product
+    key = ("product", product_id)
+    entry = catalog_cache.get(key)
+    if entry is None:
+        # The product's store is only known once it is loaded
+        snapshot = catalog_cache.snapshot(UNKNOWN_STORES)
+        product = db.query(models.Product).filter(models.Product.id == product_id).first()
+        if not product:
+            raise HTTPException(status_code=404, detail="Product not found")
+        entry = catalog_cache.put(key, [store_tag(product.store_id)], serialize(schemas.Product, product), snapshot)
+    return respond(request, entry)
 
 @router.get("/store/{store_id}", response_model=List[schemas.Product])
-def get_store_products(store_id: int, db: Session = Depends(database.get_db)):
+def get_store_products(request: Request, store_id: int, db: Session = Depends(database.get_db)):
     """Get all products for a specific store"""
-    products = db.query(models.Product).filter(
-        models.Product.store_id == store_id
-    ).order_by(models.Product.display_order).all()
-    return products
+    key = ("store_products", store_id)
+    entry = catalog_cache.get(key)
+    if entry is None:
+        tags = [store_tag(store_id)]
+        snapshot = catalog_cache.snapshot(tags)
+        if fastjson.FAST_JSON_RESPONSES:
+            body = store_products_body(db.execute(store_products_select(store_id, fast=True)).all())
+        else:
+            products = db.execute(store_products_select(store_id)).scalars().all()
+            body = serialize(List[schemas.Product], products)
+        entry = catalog_cache.put(key, tags, body, snapshot)
+    return respond(request, entry)
 
 @router.get("/store/{store_id}/categories", response_model=List[schemas.ProductCategory])
-def get_store_categories(store_id: int, db: Session = Depends(database.get_db)):
+def get_store_categories(request: Request, store_id: int, db: Session = Depends(database.get_db)):
     """Get all product categories for a store"""
-    categories = db.query(models.ProductCategory).filter(
-        models.ProductCategory.store_id == store_id
-    ).order_by(models.ProductCategory.display_order).all()
-    return categories
+    key = ("store_categories", store_id)
+    entry = catalog_cache.get(key)
+    if entry is None:
+        tags = [store_tag(store_id)]
+        snapshot = catalog_cache.snapshot(tags)
+        categories = db.query(models.ProductCategory).filter(
+            models.ProductCategory.store_id == store_id
+        ).order_by(models.ProductCategory.display_order).all()
+        entry = catalog_cache.put(key, tags, serialize(List[schemas.ProductCategory], categories), snapshot)
+    return respond(request, entry)
 
 @router.post("/", response_model=schemas.Product)
 def create_product(
     product: schemas.ProductCreate,
     current_user: models.User = Depends(get_current_user),
+    store_id: Optional[int] = Depends(get_current_profile_id),
     db: Session = Depends(database.get_db)
 ):
     """Create a new product (store owner only)"""
     if current_user.role != "store":
         raise HTTPException(status_code=403, detail="Only store owners can create products")
     
-    store = db.query(models.StoreProfile).filter(
-        models.StoreProfile.user_id == current_user.id
-    ).first()
-    if not store:
+    if store_id is None:
         raise HTTPException(status_code=404, detail="Store profile not found")
     
     db_product = models.Product(
-        store_id=store.id,
+        store_id=store_id,
         name=product.name,
         description=product.description,
         price=product.price,
@@ -70,6 +168,8 @@ def create_product(
     db.add(db_product)
     db.commit()
     db.refresh(db_product)
+    product_search.add(db_product)
+    catalog_cache.invalidate_store(store_id)
     return db_product
 
 @router.put("/{product_id}", response_model=schemas.Product)
@@ -77,19 +177,19 @@ def update_product(
     product_id: int,
     product_update: schemas.ProductUpdate,
     current_user: models.User = Depends(get_current_user),
+    store_id: Optional[int] = Depends(get_current_profile_id),
     db: Session = Depends(database.get_db)
 ):
     """Update a product (store owner only)"""
     if current_user.role != "store":
         raise HTTPException(status_code=403, detail="Only store owners can update products")
     
-    store = db.query(models.StoreProfile).filter(
-        models.StoreProfile.user_id == current_user.id
-    ).first()
+    if store_id is None:
+        raise HTTPException(status_code=404, detail="Store profile not found")
     
     product = db.query(models.Product).filter(
         models.Product.id == product_id,
-        models.Product.store_id == store.id
+        models.Product.store_id == store_id
     ).first()
     
     if not product:
@@ -98,28 +198,32 @@ def update_product(
     update_data = product_update.model_dump(exclude_unset=True)
     for field, value in update_data.items():
         setattr(product, field, value)
+    if update_data.get("stock_quantity") is not None and product.stock_shards:
+        inventory.set_stock(db, product, update_data["stock_quantity"])
     
     db.commit()
     db.refresh(product)
+    product_search.add(product)
+    catalog_cache.invalidate_store(store_id)
     return product
 
 @router.delete("/{product_id}")
 def delete_product(
     product_id: int,
     current_user: models.User = Depends(get_current_user),
+    store_id: Optional[int] = Depends(get_current_profile_id),
     db: Session = Depends(database.get_db)
 ):
     """Delete a product (store owner only)"""
     if current_user.role != "store":
         raise HTTPException(status_code=403, detail="Only store owners can delete products")
     
-    store = db.query(models.StoreProfile).filter(
-        models.StoreProfile.user_id == current_user.id
-    ).first()
+    if store_id is None:
+        raise HTTPException(status_code=404, detail="Store profile not found")
     
     product = db.query(models.Product).filter(
         models.Product.id == product_id,
-        models.Product.store_id == store.id
+        models.Product.store_id == store_id
     ).first()
     
     if not product:
@@ -127,30 +231,31 @@ def delete_product(
     
     db.delete(product)
     db.commit()
+    product_search.discard(product_id)
+    catalog_cache.invalidate_store(store_id)
     return {"message": "Product deleted"}
 
 @router.post("/categories", response_model=schemas.ProductCategory)
 def create_category(
     category: schemas.ProductCategoryCreate,
     current_user: models.User = Depends(get_current_user),
+    store_id: Optional[int] = Depends(get_current_profile_id),
     db: Session = Depends(database.get_db)
 ):
     """Create a new product category (store owner only)"""
     if current_user.role != "store":
         raise HTTPException(status_code=403, detail="Only store owners can create categories")
     
-    store = db.query(models.StoreProfile).filter(
-        models.StoreProfile.user_id == current_user.id
-    ).first()
-    if not store:
+    if store_id is None:
         raise HTTPException(status_code=404, detail="Store profile not found")
     
     db_category = models.ProductCategory(
-        store_id=store.id,
+        store_id=store_id,
         name=category.name,
         display_order=category.display_order
     )
     db.add(db_category)
     db.commit()
+    catalog_cache.invalidate_store(store_id)
     db.refresh(db_category)
     return db_category
@@ -1,8 +1,9 @@
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 from .. import models, schemas, database
-from .auth import get_current_user
+from ..catalog_cache import catalog_cache
+from .auth import get_current_user, get_current_profile_id
 
 router = APIRouter(
     prefix="/profile",
@@ -60,20 +61,18 @@ def update_requester_profile(
 @router.get("/requester/addresses", response_model=List[schemas.RequesterAddress])
 def get_requester_addresses(
     current_user: models.User = Depends(get_current_user),
+    requester_id: Optional[int] = Depends(get_current_profile_id),
     db: Session = Depends(database.get_db)
 ):
     """Get current requester's addresses"""
     if current_user.role != "requester":
         raise HTTPException(status_code=403, detail="Only requesters can access this endpoint")
     
-    profile = db.query(models.RequesterProfile).filter(
-        models.RequesterProfile.user_id == current_user.id
-    ).first()
-    if not profile:
+    if requester_id is None:
         raise HTTPException(status_code=404, detail="Profile not found")
     
     addresses = db.query(models.RequesterAddress).filter(
-        models.RequesterAddress.requester_id == profile.id
+        models.RequesterAddress.requester_id == requester_id
     ).all()
     return addresses
 
@@ -81,26 +80,24 @@ def get_requester_addresses(
 def add_requester_address(
     address: schemas.RequesterAddressCreate,
     current_user: models.User = Depends(get_current_user),
+    requester_id: Optional[int] = Depends(get_current_profile_id),
     db: Session = Depends(database.get_db)
 ):
     """Add a new address for current requester"""
     if current_user.role != "requester":
         raise HTTPException(status_code=403, detail="Only requesters can add addresses")
     
-    profile = db.query(models.RequesterProfile).filter(
-        models.RequesterProfile.user_id == current_user.id
-    ).first()
-    if not profile:
+    if requester_id is None:
         raise HTTPException(status_code=404, detail="Profile not found")
     
     # If this is the first address or marked as default, set it as default
     if address.is_default:
         db.query(models.RequesterAddress).filter(
-            models.RequesterAddress.requester_id == profile.id
+            models.RequesterAddress.requester_id == requester_id
         ).update({"is_default": False})
     
     db_address = models.RequesterAddress(
-        requester_id=profile.id,
+        requester_id=requester_id,
         label=address.label,
         postal_code=address.postal_code,
         prefecture=address.prefecture,
@@ -117,7 +114,9 @@ def add_requester_address(
     
     # Update default address in profile
     if address.is_default:
-        profile.default_address_id = db_address.id
+        db.query(models.RequesterProfile).filter(
+            models.RequesterProfile.id == requester_id
+        ).update({"default_address_id": db_address.id}, synchronize_session=False)
         db.commit()
     
     return db_address
@@ -126,21 +125,19 @@ def add_requester_address(
 def delete_requester_address(
     address_id: int,
     current_user: models.User = Depends(get_current_user),
+    requester_id: Optional[int] = Depends(get_current_profile_id),
     db: Session = Depends(database.get_db)
 ):
     """Delete an address"""
     if current_user.role != "requester":
         raise HTTPException(status_code=403, detail="Only requesters can delete addresses")
     
-    profile = db.query(models.RequesterProfile).filter(
-        models.RequesterProfile.user_id == current_user.id
-    ).first()
-    if not profile:
+    if requester_id is None:
         raise HTTPException(status_code=404, detail="Profile not found")
     
     address = db.query(models.RequesterAddress).filter(
         models.RequesterAddress.id == address_id,
-        models.RequesterAddress.requester_id == profile.id
+        models.RequesterAddress.requester_id == requester_id
     ).first()
     if not address:
         raise HTTPException(status_code=404, detail="Address not found")
@@ -263,5 +260,6 @@ def update_store_profile(
         setattr(profile, field, value)
     
     db.commit()
+    catalog_cache.invalidate_store(profile.id)
     db.refresh(profile)
     return profile
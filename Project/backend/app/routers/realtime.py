@@ -0,0 +1,125 @@
+import asyncio
+from fastapi import APIRouter, HTTPException, Request, WebSocket, WebSocketDisconnect
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from typing import List, Optional
+from .. import models, database
+from ..realtime import REALTIME_MAX_TOPICS, hub
+from .auth import get_current_user, get_current_profile_id
+from .orders import ORDER_OWNER_COLUMNS
+
+router = APIRouter(
+    prefix="/realtime",
+    tags=["realtime"],
+)
+
+# Comment line sent on idle SSE streams so proxies keep them open
+SSE_KEEPALIVE_SECONDS = 15
+TOPIC_KINDS = ("order", "store", "deliverer", "user")
+
+def parse_topics(raw: str) -> List[str]:
+    """Split "order:12,user:3,jobs" into validated topic names"""
+    topics = []
+    for topic in (t.strip() for t in raw.split(",")):
+        kind, _, key = topic.partition(":")
+        if topic == "jobs" or (kind in TOPIC_KINDS and key.isdigit()):
+            topics.append(topic)
+        else:
+            raise HTTPException(status_code=400, detail=f"Invalid topic {topic!r}")
+    if not topics or len(topics) > REALTIME_MAX_TOPICS:
+        raise HTTPException(status_code=400, detail=f"Subscribe to 1-{REALTIME_MAX_TOPICS} topics")
+    return topics
+
+def authorize_topics(db: Session, current_user: models.User, topics: List[str]):
+    """Raise 403 unless the caller may follow every topic"""
+    profile_id = get_current_profile_id(current_user, db)
+    for topic in topics:
+        kind, _, key = topic.partition(":")
+        if kind == "jobs":
+            allowed = current_user.role == "deliverer"
+        elif kind == "user":
+            allowed = int(key) == current_user.id
+        elif kind in ("store", "deliverer"):
+            allowed = current_user.role == kind and profile_id == int(key)
+        else:
+            owner_column = ORDER_OWNER_COLUMNS.get(current_user.role)
+            allowed = owner_column is not None and profile_id is not None and db.execute(
+                select(models.Order.id).where(models.Order.id == int(key), owner_column == profile_id)
+            ).first() is not None
+        if not allowed:
+            raise HTTPException(status_code=403, detail=f"Not allowed to follow {topic}")
+
+def _authenticate(token: Optional[str], topics: List[str]):
+    if not token:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    with database.SessionLocal() as db:
+        authorize_topics(db, get_current_user(token, db), topics)
+
+@router.websocket("/ws")
+async def realtime_websocket(websocket: WebSocket, topics: str, token: Optional[str] = None):
+    """Push events for the given topics over a WebSocket
+
+    topics is a comma-separated list of order:{id}, store:{id},
+    deliverer:{id}, user:{id} and jobs; token is the access token, since
+    browsers cannot set headers on WebSocket requests.
+    """
+    try:
+        topic_list = parse_topics(topics)
+        await run_in_threadpool(_authenticate, token, topic_list)
+    except HTTPException as exc:
+        await websocket.close(code=1008, reason=str(exc.detail))
+        return
+
+    await websocket.accept()
+    subscription = hub.subscribe(topic_list)
+
+    async def send_events():
+        while True:
+            await websocket.send_text(await subscription.get())
+
+    async def wait_for_disconnect():
+        try:
+            while True:
+                await websocket.receive_text()
+        except WebSocketDisconnect:
+            pass
+
+    tasks = [asyncio.create_task(send_events()), asyncio.create_task(wait_for_disconnect())]
+    try:
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in tasks:
+            task.cancel()
+        hub.unsubscribe(subscription)
+
+@router.get("/sse")
+async def realtime_events(request: Request, topics: str, token: Optional[str] = None):
+    """Push events for the given topics as Server-Sent Events
+
+    Same topics as /realtime/ws; the token may be passed as a query parameter
+    (EventSource cannot set headers) or as a Bearer Authorization header.
+    """
+    authorization = request.headers.get("authorization", "")
+    if token is None and authorization.lower().startswith("bearer "):
+        token = authorization[7:]
+    topic_list = parse_topics(topics)
+    await run_in_threadpool(_authenticate, token, topic_list)
+    subscription = hub.subscribe(topic_list)
+
+    async def event_stream():
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                try:
+                    message = await asyncio.wait_for(subscription.get(), SSE_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"data: {message}\n\n"
+        finally:
+            hub.unsubscribe(subscription)
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
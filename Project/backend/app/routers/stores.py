@@ -1,8 +1,11 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
 from sqlalchemy.orm import Session
-from typing import List
-from .. import models, schemas, database
-from .auth import get_current_user
+from typing import List, Optional
+from datetime import timedelta
+from .. import models, schemas, database, analytics
+from ..analytics import ANALYTICS_MAX_DAYS
+from ..catalog_cache import ALL_STORES, catalog_cache, respond, serialize, store_tag
+from .auth import get_current_user, get_current_profile_id
 
 router = APIRouter(
     prefix="/stores",
@@ -11,25 +14,38 @@ router = APIRouter(
 
 @router.get("/", response_model=List[schemas.StoreProfile])
 def get_stores(
+    request: Request,
     skip: int = 0,
     limit: int = 100,
     db: Session = Depends(database.get_db)
 ):
     """Get all open stores"""
-    stores = db.query(models.StoreProfile).filter(
-        models.StoreProfile.is_open == True
-    ).offset(skip).limit(limit).all()
-    return stores
+    key = ("stores", skip, limit)
+    entry = catalog_cache.get(key)
+    if entry is None:
+        tags = [ALL_STORES]
+        snapshot = catalog_cache.snapshot(tags)
+        stores = db.query(models.StoreProfile).filter(
+            models.StoreProfile.is_open == True
+        ).offset(skip).limit(limit).all()
+        entry = catalog_cache.put(key, tags, serialize(List[schemas.StoreProfile], stores), snapshot)
+    return respond(request, entry)
 
 @router.get("/{store_id}", response_model=schemas.StoreProfile)
-def get_store(store_id: int, db: Session = Depends(database.get_db)):
+def get_store(request: Request, store_id: int, db: Session = Depends(database.get_db)):
     """Get a specific store by ID"""
-    store = db.query(models.StoreProfile).filter(
-        models.StoreProfile.id == store_id
-    ).first()
-    if not store:
-        raise HTTPException(status_code=404, detail="Store not found")
-    return store
+    key = ("store", store_id)
+    entry = catalog_cache.get(key)
+    if entry is None:
+        tags = [store_tag(store_id)]
+        snapshot = catalog_cache.snapshot(tags)
+        store = db.query(models.StoreProfile).filter(
+            models.StoreProfile.id == store_id
+        ).first()
+        if not store:
+            raise HTTPException(status_code=404, detail="Store not found")
+        entry = catalog_cache.put(key, tags, serialize(schemas.StoreProfile, store), snapshot)
+    return respond(request, entry)
 
 @router.get("/my/profile", response_model=schemas.StoreProfile)
 def get_my_store_profile(
@@ -68,6 +84,7 @@ def update_my_store_profile(
         setattr(store, field, value)
     
     db.commit()
+    catalog_cache.invalidate_store(store.id)
     db.refresh(store)
     return store
 
@@ -88,4 +105,62 @@ def toggle_store_open(
     
     store.is_open = not store.is_open
     db.commit()
+    catalog_cache.invalidate_store(store.id)
     return {"message": "Store status updated", "is_open": store.is_open}
+
+def analytics_store_id(
+    current_user: models.User = Depends(get_current_user),
+    store_id: Optional[int] = Depends(get_current_profile_id)
+) -> int:
+    if current_user.role != "store":
+        raise HTTPException(status_code=403, detail="Only store owners can access this endpoint")
+    if store_id is None:
+        raise HTTPException(status_code=404, detail="Store profile not found")
+    return store_id
+
+@router.get("/my/analytics", response_model=schemas.StoreAnalytics)
+def get_my_store_analytics(
+    days: int = Query(90, ge=1, le=ANALYTICS_MAX_DAYS),
+    top: int = Query(10, ge=1, le=100),
+    store_id: int = Depends(analytics_store_id),
+    db: Session = Depends(database.get_db)
+):
+    """Dashboard for the last `days` days: totals, average times, orders by hour and top products"""
+    start, end = analytics.day_range(days)
+    totals = analytics.summary(db, store_id, start, end)
+    
+    def average_minutes(seconds, count):
+        return round(seconds / count / 60, 1) if count else None
+    
+    return {
+        "start": start,
+        "end": end - timedelta(days=1),
+        **{field: totals[field] for field in
+           ("orders_placed", "orders_accepted", "orders_completed", "orders_cancelled", "revenue")},
+        "avg_accept_minutes": average_minutes(totals["accept_seconds"], totals["orders_accepted"]),
+        "avg_prep_minutes": average_minutes(totals["prep_seconds"], totals["prep_count"]),
+        "orders_by_hour": analytics.orders_by_hour(db, store_id, start, end),
+        "top_products": analytics.top_products(db, store_id, start, end, top),
+    }
+
+@router.get("/my/analytics/volume", response_model=List[schemas.AnalyticsBucket])
+def get_my_store_order_volume(
+    granularity: str = Query("day", pattern="^(hour|day|month)$"),
+    days: int = Query(90, ge=1, le=ANALYTICS_MAX_DAYS),
+    store_id: int = Depends(analytics_store_id),
+    db: Session = Depends(database.get_db)
+):
+    """Orders and revenue per hour, day or month over the last `days` days (empty buckets left out)"""
+    start, end = analytics.day_range(days)
+    return analytics.series(db, store_id, granularity, start, end)
+
+@router.get("/my/analytics/top-products", response_model=List[schemas.ProductRevenue])
+def get_my_store_top_products(
+    days: int = Query(90, ge=1, le=ANALYTICS_MAX_DAYS),
+    limit: int = Query(10, ge=1, le=100),
+    store_id: int = Depends(analytics_store_id),
+    db: Session = Depends(database.get_db)
+):
+    """Best selling products of the last `days` days by revenue"""
+    start, end = analytics.day_range(days)
+    return analytics.top_products(db, store_id, start, end, limit)
@@ -139,6 +139,8 @@ class StoreProfileUpdate(BaseModel):
     description: Optional[str] = None
     address: Optional[str] = None
     postal_code: Optional[str] = None
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
     phone_number: Optional[str] = None
     business_hours: Optional[str] = None
     is_open: Optional[bool] = None
@@ -269,6 +271,16 @@ class Order(BaseModel):
 class DeliveryLocationUpdate(BaseModel):
     latitude: float
     longitude: float
+    recorded_at: Optional[datetime] = None  # device time of the fix; defaults to arrival time
+
+class DeliveryLocationBatch(BaseModel):
+    fixes: List[DeliveryLocationUpdate]
+
+class DeliveryPosition(BaseModel):
+    delivery_id: int
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
+    recorded_at: Optional[datetime] = None
 
 class DeliveryStatusUpdate(BaseModel):
     status: str
@@ -282,6 +294,24 @@ class DeliveryJob(BaseModel):
     reward: int
     distance: Optional[float] = None
     items_count: int = 0
+    # Batched board only: the orders of a multi-drop job in drop order, and
+    # the route length in km from the store through them
+    order_ids: Optional[List[int]] = None
+    route_km: Optional[float] = None
+
+    class Config:
+        from_attributes = True
+
+class JobBatchAccept(BaseModel):
+    order_ids: List[int]  # as listed on the batched job board
+
+class JobOffer(BaseModel):
+    id: int
+    order_id: int
+    status: str
+    distance_km: Optional[float] = None
+    offered_at: datetime
+    expires_at: datetime
 
     class Config:
         from_attributes = True
@@ -324,6 +354,32 @@ class Notification(NotificationBase):
     class Config:
         from_attributes = True
 
+class NotificationBroadcastCreate(BaseModel):
+    title: str
+    message: str
+    type: str = "system"  # system, promotion
+    audience: str  # role, store_customers, users
+    role: Optional[str] = None  # for audience "role"
+    store_id: Optional[int] = None  # for audience "store_customers"; defaults to the caller's store
+    user_ids: Optional[List[int]] = None  # for audience "users"
+
+class NotificationBroadcast(BaseModel):
+    id: int
+    title: str
+    message: str
+    type: str
+    audience: str
+    status: str
+    total_count: int
+    sent_count: int
+    error: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
 
 # ==========================================
 # Payment Schemas
@@ -379,3 +435,38 @@ class StoreSales(BaseModel):
 
     class Config:
         from_attributes = True
+
+
+# ==========================================
+# Store Analytics Schemas
+# ==========================================
+
+class AnalyticsBucket(BaseModel):
+    bucket: datetime
+    orders_placed: int
+    orders_accepted: int
+    orders_completed: int
+    orders_cancelled: int
+    revenue: int
+
+    class Config:
+        from_attributes = True
+
+class ProductRevenue(BaseModel):
+    product_id: int
+    name: str
+    quantity: int
+    revenue: int
+
+class StoreAnalytics(BaseModel):
+    start: date
+    end: date  # inclusive
+    orders_placed: int
+    orders_accepted: int
+    orders_completed: int
+    orders_cancelled: int
+    revenue: int
+    avg_accept_minutes: Optional[float] = None  # ordered_at -> accepted_at
+    avg_prep_minutes: Optional[float] = None  # accepted_at -> completed_at
+    orders_by_hour: List[int]  # orders placed per hour of the day (UTC)
+    top_products: List[ProductRevenue]
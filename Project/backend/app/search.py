@@ -0,0 +1,252 @@
+import bisect
+import os
+import threading
+import time
+import unicodedata
+from typing import Optional
+from fastapi import HTTPException
+from sqlalchemy import and_, case, func, select
+from sqlalchemy.orm import Session
+from . import models
+
+# "postgres": pg_trgm GIN indexes on products.name/description (init.sql)
+# "memory": in-process inverted index (SQLite, tests); "auto" picks by dialect
+SEARCH_BACKEND = os.getenv("SEARCH_BACKEND", "auto")
+# Rebuild the in-memory index from the database at least this often, so
+# products written by other worker processes show up as well
+SEARCH_INDEX_RESYNC_SECONDS = float(os.getenv("SEARCH_INDEX_RESYNC_SECONDS", "300"))
+SEARCH_MAX_TERMS = 8
+
+def normalize(text: Optional[str]) -> str:
+    """Fold width variants and case, so ＡＢＣ, abc and ABC match each other"""
+    return unicodedata.normalize("NFKC", text or "").casefold()
+
+def parse_terms(q: str) -> list[str]:
+    """Whitespace-separated search terms; every term must match"""
+    terms = list(dict.fromkeys(normalize(q).split()))
+    if not terms or len(terms) > SEARCH_MAX_TERMS:
+        raise HTTPException(status_code=400, detail=f"Give 1-{SEARCH_MAX_TERMS} search terms")
+    return terms
+
+def _grams(text: str) -> set[str]:
+    """Characters and character bigrams; bigrams suit Japanese text without spaces"""
+    return set(text) | {text[i:i + 2] for i in range(len(text) - 1)}
+
+def _term_grams(term: str) -> set[str]:
+    return {term[i:i + 2] for i in range(len(term) - 1)} or {term}
+
+def _escape_like(term: str) -> str:
+    return term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+class ProductSearchIndex:
+    """In-process inverted index over the names and descriptions of available products
+
+    Every character and character bigram of a product's normalized name, and
+    of its name plus description, has a posting list; so do its name's first
+    one and two characters, its store and its category. Matching is the
+    same as the Postgres ILIKE '%term%': candidates come from the postings of
+    a term's bigrams (its character's for one-letter terms) and are confirmed
+    by substring match. Results rank name prefix matches first, then name
+    matches, then description-only matches, shorter names first, then by id.
+
+    Posting lists hold (len(name) << 32 | id) codes kept sorted, i.e. in
+    result order, so each rank is answered by walking its shortest posting
+    list and stopping after limit matches instead of collecting every match.
+    """
+
+    def __init__(self):
+        self._postings: dict[tuple, list[int]] = {}
+        self._docs: dict[int, tuple] = {}
+        self._lock = threading.Lock()
+        # Held while reloading from the database, so only one request reloads at a time
+        self._reload_lock = threading.Lock()
+        self._synced_at = None
+        self.reloads = 0
+
+    def __len__(self):
+        return len(self._docs)
+
+    @staticmethod
+    def _doc(product) -> tuple:
+        name = normalize(product.name)
+        return (name, name + "\n" + normalize(product.description),
+                product.store_id, product.category_id, product.price)
+
+    @staticmethod
+    def _keys(doc: tuple) -> set[tuple]:
+        name, text, store_id, category_id, _ = doc
+        keys = {("name", gram) for gram in _grams(name)}
+        keys.update(("text", gram) for gram in _grams(text))
+        keys.update(("prefix", name[:n]) for n in (1, 2) if len(name) >= n)
+        keys.add(("store", store_id))
+        keys.add(("category", category_id))
+        return keys
+
+    @staticmethod
+    def _code(product_id: int, doc: tuple) -> int:
+        return len(doc[0]) << 32 | product_id
+
+    def add(self, product):
+        """Index or re-index a product; unavailable products are removed"""
+        if self._synced_at is None:
+            return  # not built; the first search loads everything
+        if not product.is_available:
+            self.discard(product.id)
+            return
+        doc = self._doc(product)
+        code = self._code(product.id, doc)
+        with self._lock:
+            self._discard_locked(product.id)
+            self._docs[product.id] = doc
+            for key in self._keys(doc):
+                bisect.insort(self._postings.setdefault(key, []), code)
+
+    def discard(self, product_id: int):
+        with self._lock:
+            self._discard_locked(product_id)
+
+    def _discard_locked(self, product_id: int):
+        doc = self._docs.pop(product_id, None)
+        if doc is None:
+            return
+        code = self._code(product_id, doc)
+        for key in self._keys(doc):
+            postings = self._postings[key]
+            del postings[bisect.bisect_left(postings, code)]
+            if not postings:
+                del self._postings[key]
+
+    def rebuild(self, products):
+        """Replace the index contents with rows carrying the Product attributes used"""
+        postings: dict[tuple, list[int]] = {}
+        docs = {}
+        for product in products:
+            doc = docs[product.id] = self._doc(product)
+            code = self._code(product.id, doc)
+            for key in self._keys(doc):
+                postings.setdefault(key, []).append(code)
+        for codes in postings.values():
+            codes.sort()
+        with self._lock:
+            self._postings, self._docs = postings, docs
+            self._synced_at = time.monotonic()
+
+    def _stale(self) -> bool:
+        return self._synced_at is None or time.monotonic() - self._synced_at >= SEARCH_INDEX_RESYNC_SECONDS
+
+    def sync(self, db: Session, force: bool = False):
+        """Reload available products from the database when the index is stale
+
+        One caller reloads at a time. While it does, the others keep
+        searching the current index; only before the first load do they wait
+        for it instead.
+        """
+        if not force and not self._stale():
+            return
+        built = self._synced_at is not None
+        if not self._reload_lock.acquire(blocking=not built):
+            return
+        try:
+            # Someone else may have reloaded while this caller waited
+            if not force and not self._stale():
+                return
+            rows = db.execute(
+                select(models.Product.id, models.Product.name, models.Product.description,
+                       models.Product.store_id, models.Product.category_id, models.Product.price)
+                .where(models.Product.is_available == True)
+            ).all()
+            self.rebuild(rows)
+            self.reloads += 1
+        finally:
+            self._reload_lock.release()
+
+    def search(self, terms: list[str], store_id: Optional[int] = None, category_id: Optional[int] = None,
+               max_price: Optional[int] = None, limit: int = 20) -> list[int]:
+        """Ids of up to limit products containing every term, best match first"""
+        filters = []
+        if store_id is not None:
+            filters.append(("store", store_id))
+        if category_id is not None:
+            filters.append(("category", category_id))
+
+        def prefix_rank(name, text):
+            return name.startswith(terms[0]) and all(term in text for term in terms)
+
+        def name_rank(name, text):
+            return not name.startswith(terms[0]) and all(term in name for term in terms)
+
+        def text_rank(name, text):
+            return (not name.startswith(terms[0]) and not all(term in name for term in terms)
+                    and all(term in text for term in terms))
+
+        ranks = [
+            ([("prefix", terms[0][:2])], prefix_rank),
+            ([("name", gram) for term in terms for gram in _term_grams(term)], name_rank),
+            ([("text", gram) for term in terms for gram in _term_grams(term)], text_rank),
+        ]
+        found = []
+        with self._lock:
+            for keys, matches in ranks:
+                lists = [self._postings.get(key) for key in keys + filters]
+                if not all(lists):
+                    continue
+                for code in min(lists, key=len):
+                    product_id = code & 0xFFFFFFFF
+                    name, text, doc_store_id, doc_category_id, price = self._docs[product_id]
+                    if store_id is not None and doc_store_id != store_id:
+                        continue
+                    if category_id is not None and doc_category_id != category_id:
+                        continue
+                    if max_price is not None and price > max_price:
+                        continue
+                    if matches(name, text):
+                        found.append(product_id)
+                        if len(found) == limit:
+                            return found
+        return found
+
+
+product_search = ProductSearchIndex()
+
+
+def uses_postgres(db: Session) -> bool:
+    if SEARCH_BACKEND == "auto":
+        return db.get_bind().dialect.name == "postgresql"
+    return SEARCH_BACKEND == "postgres"
+
+def search_select(terms: list[str], store_id: Optional[int], category_id: Optional[int],
+                  max_price: Optional[int], limit: int):
+    """Ranked product ids on Postgres; ILIKE '%term%' is answered by the pg_trgm GIN indexes
+
+    Ranked exactly like the in-memory index, so both backends return the
+    same page for the same query.
+    """
+    name, description = models.Product.name, models.Product.description
+    patterns = [f"%{_escape_like(term)}%" for term in terms]
+    stmt = select(models.Product.id).where(
+        models.Product.is_available == True,
+        *[name.ilike(pattern, escape="\\") | description.ilike(pattern, escape="\\") for pattern in patterns]
+    )
+    if store_id is not None:
+        stmt = stmt.where(models.Product.store_id == store_id)
+    if category_id is not None:
+        stmt = stmt.where(models.Product.category_id == category_id)
+    if max_price is not None:
+        stmt = stmt.where(models.Product.price <= max_price)
+    rank = case(
+        (name.ilike(f"{_escape_like(terms[0])}%", escape="\\"), 0),
+        (and_(*[name.ilike(pattern, escape="\\") for pattern in patterns]), 1),
+        else_=2
+    )
+    # Same order as ProductSearchIndex: rank, shorter names first, then id
+    return stmt.order_by(rank, func.length(name), models.Product.id).limit(limit)
+
+def search_product_ids(db: Session, q: str, store_id: Optional[int] = None, category_id: Optional[int] = None,
+                       max_price: Optional[int] = None, limit: int = 20) -> list[int]:
+    """Ids of available products matching every term of q, best match first"""
+    terms = parse_terms(q)
+    if uses_postgres(db):
+        return db.execute(search_select(terms, store_id, category_id, max_price, limit)).scalars().all()
+    product_search.sync(db)
+    return product_search.search(terms, store_id, category_id, max_price, limit)
@@ -0,0 +1,235 @@
+import logging
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+from sqlalchemy import insert, select, update
+from sqlalchemy.orm import Session
+from . import database, lifecycle, models
+from .principal import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# Unflushed fixes kept per delivery; the oldest are dropped when a delivery
+# produces more than this between two flushes (e.g. while the database is down)
+LOCATION_BUFFER_SIZE = int(os.getenv("LOCATION_BUFFER_SIZE", "256"))
+# How often the background flusher writes buffered fixes to the database;
+# 0 disables the flusher and leaves flushing to the caller
+LOCATION_FLUSH_MS = int(os.getenv("LOCATION_FLUSH_MS", "1000"))
+# Rows per multi-row INSERT into delivery_location_history
+LOCATION_FLUSH_BATCH = int(os.getenv("LOCATION_FLUSH_BATCH", "1000"))
+# Fixes accepted by one batch upload
+LOCATION_BATCH_MAX = int(os.getenv("LOCATION_BATCH_MAX", "1000"))
+# Oldest device timestamp accepted for a fix, and how far ahead of the
+# server clock one may be
+LOCATION_MAX_AGE_HOURS = float(os.getenv("LOCATION_MAX_AGE_HOURS", "24"))
+LOCATION_MAX_SKEW_SECONDS = float(os.getenv("LOCATION_MAX_SKEW_SECONDS", "300"))
+# Latest positions not updated for this long are dropped from memory; reads
+# then fall back to deliveries.current_latitude/current_longitude
+LOCATION_LATEST_TTL_SECONDS = float(os.getenv("LOCATION_LATEST_TTL_SECONDS", "600"))
+# How long the owner of a delivery in progress is cached; a delivery ended by
+# another worker process keeps accepting fixes here for at most this long
+LOCATION_OWNER_TTL_SECONDS = float(os.getenv("LOCATION_OWNER_TTL_SECONDS", "60"))
+# Delivery statuses after which no more fixes are accepted
+ENDED_DELIVERY_STATUSES = ("completed", "cancelled")
+
+
+def utc_naive(value: datetime) -> datetime:
+    """value as a naive UTC datetime, the form stored and compared throughout"""
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+def fix_time(recorded_at: Optional[datetime], now: datetime) -> Optional[datetime]:
+    """Naive UTC device time of a fix, or None when it is outside the accepted window"""
+    if recorded_at is None:
+        return now
+    recorded_at = utc_naive(recorded_at)
+    if not now - timedelta(hours=LOCATION_MAX_AGE_HOURS) <= recorded_at <= now + timedelta(seconds=LOCATION_MAX_SKEW_SECONDS):
+        return None
+    return recorded_at
+
+
+class LocationBuffer:
+    """Buffers GPS fixes in memory and writes them to the database in batches
+
+    Each delivery gets a bounded ring of unflushed fixes. A daemon thread,
+    started by the first fix, drains all rings every `flush_ms` into one
+    multi-row INSERT per LOCATION_FLUSH_BATCH rows plus one bulk UPDATE of
+    deliveries.current_latitude/current_longitude, in a single transaction.
+    The latest fix per delivery is kept in memory and served from there.
+    """
+
+    def __init__(self, buffer_size: int = LOCATION_BUFFER_SIZE, flush_ms: int = LOCATION_FLUSH_MS,
+                 session_factory=None):
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_ms / 1000
+        self.session_factory = session_factory
+        self._rings: dict[int, deque] = {}
+        self._latest: dict[int, tuple[float, float, datetime, float]] = {}
+        self._dirty: set[int] = set()
+        self._owners = TTLCache(max_size=10000, ttl=LOCATION_OWNER_TTL_SECONDS)
+        self._lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        # Serializes flushes so an older position never overwrites a newer one
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.flushed = 0
+        self.dropped = 0
+
+    def delivery_owner(self, db: Session, delivery_id: int) -> Optional[tuple[int, int, bool]]:
+        """(order_id, deliverer_id, in_progress) of the delivery, or None when it does not exist
+
+        Deliveries in progress are cached until they end (see forget).
+        """
+        owner = self._owners.get(delivery_id)
+        if owner is None:
+            row = db.execute(
+                select(models.Delivery.order_id, models.Delivery.deliverer_id, models.Delivery.status)
+                .where(models.Delivery.id == delivery_id)
+            ).first()
+            if row is None:
+                return None
+            owner = (row.order_id, row.deliverer_id, row.status not in ENDED_DELIVERY_STATUSES)
+            if owner[2]:
+                self._owners.put(delivery_id, owner)
+        return owner
+
+    def forget(self, delivery_id: int):
+        """Drop the cached owner of a delivery that has ended"""
+        self._owners.invalidate(delivery_id)
+
+    def append(self, delivery_id: int, fixes):
+        """Queue (latitude, longitude, recorded_at) fixes; recorded_at may be None or timezone-aware"""
+        now = datetime.utcnow()
+        touched = time.monotonic()
+        with self._lock:
+            ring = self._rings.get(delivery_id)
+            if ring is None:
+                ring = self._rings[delivery_id] = deque(maxlen=self.buffer_size)
+            for latitude, longitude, recorded_at in fixes:
+                recorded_at = utc_naive(recorded_at) if recorded_at is not None else now
+                if len(ring) == ring.maxlen:
+                    self.dropped += 1
+                ring.append((latitude, longitude, recorded_at))
+                # Offline uploads may arrive after newer live fixes
+                latest = self._latest.get(delivery_id)
+                if latest is None or recorded_at >= latest[2]:
+                    self._latest[delivery_id] = (latitude, longitude, recorded_at, touched)
+                    self._dirty.add(delivery_id)
+        self._ensure_flusher()
+
+    def latest(self, delivery_id: int) -> Optional[tuple[float, float, datetime]]:
+        entry = self._latest.get(delivery_id)
+        return entry[:3] if entry is not None else None
+
+    def _ensure_flusher(self):
+        if self.flush_interval <= 0:
+            return
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name="location-flusher", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Flushing buffered locations failed")
+
+    def flush(self, delivery_ids: Optional[list[int]] = None) -> int:
+        """Write buffered fixes now, of every delivery or only of delivery_ids; returns the rows written"""
+        with self._flush_lock:
+            return self._flush_locked(delivery_ids)
+
+    def _flush_locked(self, delivery_ids: Optional[list[int]] = None) -> int:
+        with self._lock:
+            if delivery_ids is None:
+                pending = {delivery_id: list(ring) for delivery_id, ring in self._rings.items() if ring}
+                self._rings = {}
+                dirty, self._dirty = self._dirty, set()
+                expired_before = time.monotonic() - LOCATION_LATEST_TTL_SECONDS
+                for delivery_id in [d for d, entry in self._latest.items() if entry[3] < expired_before]:
+                    del self._latest[delivery_id]
+            else:
+                pending = {
+                    delivery_id: list(self._rings.pop(delivery_id))
+                    for delivery_id in delivery_ids if self._rings.get(delivery_id)
+                }
+                dirty = self._dirty.intersection(delivery_ids)
+                self._dirty -= dirty
+            positions = {
+                delivery_id: self._latest[delivery_id][:2] for delivery_id in dirty if delivery_id in self._latest
+            }
+        if not pending and not positions:
+            return 0
+
+        rows = [
+            {"delivery_id": delivery_id, "latitude": lat, "longitude": lng, "recorded_at": recorded_at}
+            for delivery_id, fixes in pending.items()
+            for lat, lng, recorded_at in fixes
+        ]
+        session_factory = self.session_factory or database.SessionLocal
+        try:
+            with session_factory() as db:
+                for start in range(0, len(rows), LOCATION_FLUSH_BATCH):
+                    db.execute(insert(models.DeliveryLocationHistory), rows[start:start + LOCATION_FLUSH_BATCH])
+                if positions:
+                    db.execute(update(models.Delivery), [
+                        {"id": delivery_id, "current_latitude": lat, "current_longitude": lng}
+                        for delivery_id, (lat, lng) in positions.items()
+                    ])
+                db.commit()
+        except Exception:
+            self._requeue(pending, positions)
+            raise
+        self.flushed += len(rows)
+        return len(rows)
+
+    def _requeue(self, pending: dict, positions: dict):
+        """Put fixes from a failed flush back in front of anything newer"""
+        with self._lock:
+            for delivery_id, fixes in pending.items():
+                ring = deque(fixes, maxlen=self.buffer_size)
+                newer = self._rings.get(delivery_id, ())
+                self.dropped += max(0, len(fixes) + len(newer) - self.buffer_size)
+                ring.extend(newer)
+                self._rings[delivery_id] = ring
+            self._dirty.update(positions)
+
+    def stats(self) -> dict:
+        with self._lock:
+            buffered = sum(len(ring) for ring in self._rings.values())
+            tracked = len(self._latest)
+        return {"buffered": buffered, "tracked_deliveries": tracked,
+                "flushed": self.flushed, "dropped": self.dropped}
+
+    def shutdown(self):
+        """Stop the flusher and write whatever is still buffered"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+
+location_buffer = LocationBuffer()
+
+
+@lifecycle.subscribe
+def _forget_ended(db: Session, order_event: lifecycle.OrderEvent):
+    """After commit: stop accepting fixes for the delivery of an order delivered or cancelled"""
+    if order_event.status not in ("delivered", "cancelled"):
+        return
+    delivery_id = db.execute(
+        select(models.Delivery.id).where(models.Delivery.order_id == order_event.order_id)
+    ).scalar()
+    if delivery_id is not None:
+        lifecycle.after_commit(db, lambda: location_buffer.forget(delivery_id))
@@ -0,0 +1,266 @@
+import heapq
+import json
+import math
+import os
+import struct
+import zlib
+from datetime import datetime, timedelta
+from typing import Optional
+import numpy as np
+from sqlalchemy import delete, func, select
+from sqlalchemy.orm import Session
+from . import models
+from .geo import EARTH_RADIUS_KM
+
+# Coordinates are stored as int32 multiples of 1e-7 degree (about 1 cm)
+COORD_SCALE = 10_000_000
+# Longitudes wrap around: a step across the antimeridian is stored as the
+# short way round, and decoded longitudes are brought back into [-180, 180)
+_HALF_TURN = 180 * COORD_SCALE
+TRACK_FORMAT_VERSION = 1
+# version, point count; followed by the zlib-compressed delta columns
+_HEADER = struct.Struct("<BI")
+_INT32 = np.iinfo(np.int32)
+
+# Douglas-Peucker tolerance for the display polyline
+TRACK_SIMPLIFY_TOLERANCE_M = float(os.getenv("TRACK_SIMPLIFY_TOLERANCE_M", "5"))
+POLYLINE_PRECISION = 5
+# Points per chunk when streaming a track
+TRACK_STREAM_CHUNK = 1000
+
+def pack_track(lats, lngs, times: list[datetime]) -> tuple[datetime, bytes]:
+    """Delta-encode a time-ordered track; returns (started_at, packed bytes)
+
+    Latitude, longitude and milliseconds since started_at are each stored as
+    an int32 column holding the first value followed by successive
+    differences, which keeps the numbers small for zlib. Longitude steps
+    are taken modulo 360 degrees, so a track may cross the antimeridian;
+    a longitude of exactly 180 comes back as -180.
+    """
+    started_at = times[0]
+    offsets_ms = np.array([(t - started_at) / timedelta(milliseconds=1) for t in times])
+    columns = [
+        np.round(np.asarray(lats, dtype=np.float64) * COORD_SCALE).astype(np.int64),
+        np.round(np.asarray(lngs, dtype=np.float64) * COORD_SCALE).astype(np.int64),
+        np.round(offsets_ms).astype(np.int64),
+    ]
+    deltas = [np.diff(column, prepend=0) for column in columns]
+    deltas[1] = (deltas[1] + _HALF_TURN) % (2 * _HALF_TURN) - _HALF_TURN
+    for delta in deltas:
+        if len(delta) and (delta.min() < _INT32.min or delta.max() > _INT32.max):
+            raise ValueError("Track step does not fit the packed format")
+    body = b"".join(delta.astype("<i4").tobytes() for delta in deltas)
+    return started_at, _HEADER.pack(TRACK_FORMAT_VERSION, len(times)) + zlib.compress(body)
+
+def _unpack_columns(packed: bytes):
+    """(latitudes, longitudes, ms offsets) of a packed track as int64 arrays, coordinates in 1e-7 degree"""
+    version, count = _HEADER.unpack_from(packed)
+    if version != TRACK_FORMAT_VERSION:
+        raise ValueError(f"Unknown track format version {version}")
+    columns = np.frombuffer(zlib.decompress(packed[_HEADER.size:]), dtype="<i4").reshape(3, count)
+    lat_i, lng_i, offsets_ms = np.cumsum(columns.astype(np.int64), axis=1)
+    return lat_i, (lng_i + _HALF_TURN) % (2 * _HALF_TURN) - _HALF_TURN, offsets_ms
+
+def unpack_track(started_at: datetime, packed: bytes):
+    """Inverse of pack_track; returns (lats, lngs, times)"""
+    lat_i, lng_i, offsets_ms = _unpack_columns(packed)
+    times = [started_at + timedelta(milliseconds=int(ms)) for ms in offsets_ms]
+    return lat_i / COORD_SCALE, lng_i / COORD_SCALE, times
+
+def douglas_peucker(lats, lngs, tolerance_m: float = TRACK_SIMPLIFY_TOLERANCE_M) -> np.ndarray:
+    """Indices of the points kept by Douglas-Peucker simplification"""
+    count = len(lats)
+    if count <= 2:
+        return np.arange(count)
+    # Local equirectangular projection in meters; plenty for a city-sized route
+    meters_per_degree = math.pi / 180 * EARTH_RADIUS_KM * 1000
+    lats = np.asarray(lats, dtype=np.float64)
+    y = lats * meters_per_degree
+    x = np.asarray(lngs, dtype=np.float64) * meters_per_degree * math.cos(math.radians(lats.mean()))
+
+    keep = np.zeros(count, dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, count - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        dx, dy = x[last] - x[first], y[last] - y[first]
+        px, py = x[first + 1:last] - x[first], y[first + 1:last] - y[first]
+        length = math.hypot(dx, dy)
+        if length == 0:
+            distances = np.hypot(px, py)
+        else:
+            distances = np.abs(dx * py - dy * px) / length
+        farthest = int(np.argmax(distances))
+        if distances[farthest] > tolerance_m:
+            index = first + 1 + farthest
+            keep[index] = True
+            stack.append((first, index))
+            stack.append((index, last))
+    return np.flatnonzero(keep)
+
+def encode_polyline(lats, lngs, precision: int = POLYLINE_PRECISION) -> str:
+    """Encode points in the encoded polyline algorithm format used by map SDKs"""
+    factor = 10 ** precision
+    chunks = []
+    prev_lat = prev_lng = 0
+    for lat, lng in zip(lats, lngs):
+        lat_e, lng_e = int(round(lat * factor)), int(round(lng * factor))
+        for value in (lat_e - prev_lat, lng_e - prev_lng):
+            value = ~(value << 1) if value < 0 else value << 1
+            while value >= 0x20:
+                chunks.append(chr((0x20 | (value & 0x1f)) + 63))
+                value >>= 5
+            chunks.append(chr(value + 63))
+        prev_lat, prev_lng = lat_e, lng_e
+    return "".join(chunks)
+
+def simplified_polyline(lats, lngs) -> str:
+    keep = douglas_peucker(lats, lngs)
+    return encode_polyline(np.asarray(lats)[keep], np.asarray(lngs)[keep])
+
+def _history_select(delivery_id: int):
+    return select(
+        models.DeliveryLocationHistory.id,
+        models.DeliveryLocationHistory.latitude,
+        models.DeliveryLocationHistory.longitude,
+        models.DeliveryLocationHistory.recorded_at,
+    ).where(
+        models.DeliveryLocationHistory.delivery_id == delivery_id
+    ).order_by(models.DeliveryLocationHistory.recorded_at, models.DeliveryLocationHistory.id)
+
+def _history_rows(db: Session, delivery_id: int):
+    return db.execute(_history_select(delivery_id)).all()
+
+def _stored_track(db: Session, delivery_id: int):
+    return db.execute(
+        select(models.DeliveryTrack).where(models.DeliveryTrack.delivery_id == delivery_id)
+    ).scalar_one_or_none()
+
+def _merge(track: Optional[models.DeliveryTrack], rows):
+    """Points of a stored track plus raw history rows, ordered by time"""
+    lats, lngs, times = [], [], []
+    if track is not None:
+        packed_lats, packed_lngs, times = unpack_track(track.started_at, track.packed)
+        lats, lngs = packed_lats.tolist(), packed_lngs.tolist()
+    if rows:
+        lats = lats + [float(row.latitude) for row in rows]
+        lngs = lngs + [float(row.longitude) for row in rows]
+        times = times + [row.recorded_at for row in rows]
+        if track is not None:
+            order = sorted(range(len(times)), key=times.__getitem__)
+            lats, lngs, times = [lats[i] for i in order], [lngs[i] for i in order], [times[i] for i in order]
+    return lats, lngs, times
+
+def load_track(db: Session, delivery_id: int):
+    """(lats, lngs, times) of a delivery from its packed track and any raw history"""
+    return _merge(_stored_track(db, delivery_id), _history_rows(db, delivery_id))
+
+def track_polyline(db: Session, delivery_id: int) -> str:
+    """Simplified route for display; the stored one unless raw history is left"""
+    track = _stored_track(db, delivery_id)
+    rows = _history_rows(db, delivery_id)
+    if track is not None and not rows:
+        return track.polyline
+    lats, lngs, _ = _merge(track, rows)
+    return simplified_polyline(lats, lngs) if lats else ""
+
+def compact_delivery(db: Session, delivery_id: int) -> int:
+    """Fold a delivery's raw history rows into its packed track; returns the rows folded
+
+    Rows inserted after the history was read (e.g. by a late flush from another
+    worker) are left in place and picked up by the next compaction.
+    """
+    rows = _history_rows(db, delivery_id)
+    if not rows:
+        return 0
+    track = _stored_track(db, delivery_id)
+    lats, lngs, times = _merge(track, rows)
+    started_at, packed = pack_track(lats, lngs, times)
+
+    if track is None:
+        track = models.DeliveryTrack(delivery_id=delivery_id)
+        db.add(track)
+    track.point_count = len(times)
+    track.started_at = started_at
+    track.packed = packed
+    track.polyline = simplified_polyline(lats, lngs)
+
+    db.execute(delete(models.DeliveryLocationHistory).where(
+        models.DeliveryLocationHistory.id.in_([row.id for row in rows])
+    ))
+    db.commit()
+    return len(rows)
+
+def compact_completed(db: Session, limit: int = 100) -> int:
+    """Compact up to `limit` completed deliveries that still have raw history"""
+    delivery_ids = db.execute(
+        select(models.Delivery.id).join(
+            models.DeliveryLocationHistory, models.DeliveryLocationHistory.delivery_id == models.Delivery.id
+        ).where(
+            models.Delivery.status == "completed"
+        ).group_by(models.Delivery.id).order_by(models.Delivery.id).limit(limit)
+    ).scalars().all()
+    for delivery_id in delivery_ids:
+        compact_delivery(db, delivery_id)
+    return len(delivery_ids)
+
+def _packed_points(track: models.DeliveryTrack):
+    """(lat, lng, recorded_at) of a packed track, decoding timestamps as they are consumed"""
+    lat_i, lng_i, offsets_ms = _unpack_columns(track.packed)
+    for lat, lng, ms in zip((lat_i / COORD_SCALE).tolist(), (lng_i / COORD_SCALE).tolist(), offsets_ms.tolist()):
+        yield lat, lng, track.started_at + timedelta(milliseconds=ms)
+
+def stream_track_json(session_factory, delivery_id: int):
+    """Yield a delivery's track as a JSON document in chunks of TRACK_STREAM_CHUNK points
+
+    Opens its own session, since it runs while the response is sent. Raw
+    history rows are fetched TRACK_STREAM_CHUNK at a time and merged by time
+    with the packed track, so the full track is never held in memory; rows
+    flushed after the point count was taken are left out.
+    """
+    with session_factory() as db:
+        track = _stored_track(db, delivery_id)
+        raw_count, last_id = db.execute(
+            select(func.count(models.DeliveryLocationHistory.id), func.max(models.DeliveryLocationHistory.id))
+            .where(models.DeliveryLocationHistory.delivery_id == delivery_id)
+        ).one()
+        count = raw_count + (track.point_count if track is not None else 0)
+        yield '{"delivery_id":%d,"point_count":%d,"points":[' % (delivery_id, count)
+
+        points = iter(())
+        if last_id is not None:
+            rows = db.execute(
+                _history_select(delivery_id).where(models.DeliveryLocationHistory.id <= last_id)
+                .execution_options(yield_per=TRACK_STREAM_CHUNK)
+            )
+            points = ((float(row.latitude), float(row.longitude), row.recorded_at) for row in rows)
+        if track is not None:
+            # Stable: on equal times the packed point comes first, as in load_track
+            points = heapq.merge(_packed_points(track), points, key=lambda point: point[2])
+
+        chunk = []
+        separator = ""
+        for lat, lng, recorded_at in points:
+            chunk.append(json.dumps({"latitude": lat, "longitude": lng, "recorded_at": recorded_at.isoformat()}))
+            if len(chunk) == TRACK_STREAM_CHUNK:
+                yield separator + ",".join(chunk)
+                chunk, separator = [], ","
+        if chunk:
+            yield separator + ",".join(chunk)
+    yield "]}"
+
+
+if __name__ == "__main__":
+    # Backfill: python -m app.tracks
+    from .database import SessionLocal
+
+    total = 0
+    with SessionLocal() as db:
+        while True:
+            compacted = compact_completed(db)
+            total += compacted
+            if not compacted:
+                break
+    print(f"Compacted {total} deliveries")
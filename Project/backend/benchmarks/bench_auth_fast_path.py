@@ -0,0 +1,37 @@
+"""Authenticated-request resolution rate with and without the JWT fast path.
+
+    python -m benchmarks.bench_auth_fast_path [repeat]
+
+Each iteration opens a session and resolves the caller the way every
+authenticated route does (auth.get_current_user), so the numbers are the
+per-request auth ceiling in requests/sec.
+"""
+import sys
+
+from .common import make_session_factory, seed_requester, timed, percentile
+from app import models
+from app.principal import user_cache
+from app.routers import auth
+
+
+def main(repeat=5000):
+    SessionLocal = make_session_factory()
+    with SessionLocal() as db:
+        requester = seed_requester(db)
+        user = db.get(models.User, requester.user_id)
+        token = auth.create_access_token({"sub": user.email, "role": user.role, "user_id": user.id})
+
+    def resolve():
+        with SessionLocal() as db:
+            auth.get_current_user(token, db)
+
+    print(f"{'mode':>12} {'req/s':>10} {'p50 us':>8} {'p99 us':>8}")
+    for label, fast_path in [("db lookup", False), ("fast path", True)]:
+        auth.AUTH_FAST_PATH = fast_path
+        user_cache.clear()
+        ops, latencies = timed(resolve, repeat)
+        print(f"{label:>12} {ops:>10.0f} {percentile(latencies, 50) * 1000:>8.0f} {percentile(latencies, 99) * 1000:>8.0f}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5000)
@@ -0,0 +1,174 @@
+"""Automatic dispatch against first-come claiming: jobs matched and distance travelled to the stores.
+
+    python -m benchmarks.bench_auto_dispatch [orders] [deliverers] [stores]
+
+Seeds `orders` ready_for_pickup orders over `stores` stores and `deliverers`
+idle online deliverers scattered around the same city, three times over
+with the same random positions:
+
+- first-come: deliverers arrive in random order and each calls
+  POST /delivery/jobs/next with their position (the current scheme).
+- greedy / hungarian: one dispatch round (dispatch.offer_jobs) with that
+  solver, then every deliverer accepts their offer.
+
+Reports how many jobs got a deliverer, the deliverer-to-store distance
+(total, mean, p95) and the assignment latency: the whole round for the
+engine, all the claims for first-come. No job or deliverer may be offered
+twice, no offer may exceed the dispatch radius and every offer must be
+claimable.
+"""
+import random
+import sys
+import time
+from datetime import datetime
+
+from fastapi import HTTPException
+from sqlalchemy import func, insert, select
+
+from .common import make_session_factory, percentile, seed_requester
+from app import dispatch, models
+from app.geo import haversine_km, job_index
+from app.routers import delivery
+
+CITY = (33.56, 133.53)
+STORE_SPREAD_DEG = 0.04
+DELIVERER_SPREAD_DEG = 0.05
+
+
+def seed(n_orders, n_deliverers, n_stores):
+    rng = random.Random(24)
+    SessionLocal = make_session_factory()
+    now = datetime.utcnow()
+    with SessionLocal() as db:
+        requester = seed_requester(db)
+        db.execute(insert(models.User), [
+            {"email": f"bench-store-{i}@test.com", "hashed_password": "x", "role": "store"} for i in range(n_stores)
+        ] + [
+            {"email": f"bench-deliverer-{i}@test.com", "hashed_password": "x", "role": "deliverer"}
+            for i in range(n_deliverers)
+        ])
+        users = db.execute(select(models.User.id, models.User.role).order_by(models.User.id)).all()
+        db.execute(insert(models.StoreProfile), [
+            {"user_id": user_id, "store_name": f"Store {user_id}", "address": "Bench",
+             "latitude": rng.gauss(CITY[0], STORE_SPREAD_DEG), "longitude": rng.gauss(CITY[1], STORE_SPREAD_DEG)}
+            for user_id, role in users if role == "store"
+        ])
+        db.execute(insert(models.DelivererProfile), [
+            {"user_id": user_id, "name": f"Deliverer {user_id}", "work_status": "online", "location_updated_at": now,
+             "latitude": rng.gauss(CITY[0], DELIVERER_SPREAD_DEG), "longitude": rng.gauss(CITY[1], DELIVERER_SPREAD_DEG)}
+            for user_id, role in users if role == "deliverer"
+        ])
+        store_ids = db.execute(select(models.StoreProfile.id)).scalars().all()
+        db.execute(insert(models.Order), [
+            {"requester_id": requester.id, "store_id": rng.choice(store_ids), "status": "ready_for_pickup",
+             "subtotal": 1000, "delivery_fee": 300, "total_price": 1300, "delivery_address": f"Bench {i}"}
+            for i in range(n_orders)
+        ])
+        db.commit()
+    return SessionLocal
+
+
+def pickup_km(db, pairs):
+    """Deliverer-to-store distance of each (deliverer_id, order_id) pair"""
+    positions = dict(
+        (row.id, (float(row.latitude), float(row.longitude)))
+        for row in db.execute(select(models.DelivererProfile.id, models.DelivererProfile.latitude,
+                                     models.DelivererProfile.longitude))
+    )
+    stores = dict(
+        (row.id, (float(row.latitude), float(row.longitude)))
+        for row in db.execute(
+            select(models.Order.id, models.StoreProfile.latitude, models.StoreProfile.longitude)
+            .join(models.StoreProfile, models.StoreProfile.id == models.Order.store_id)
+        )
+    )
+    return [
+        float(haversine_km(*positions[deliverer_id], [stores[order_id][0]], [stores[order_id][1]])[0])
+        for deliverer_id, order_id in pairs
+    ]
+
+
+def first_come(SessionLocal):
+    """Every deliverer, in random order, claims the nearest open job through POST /delivery/jobs/next"""
+    with SessionLocal() as db:
+        deliverers = db.execute(
+            select(models.DelivererProfile.id, models.DelivererProfile.user_id,
+                   models.DelivererProfile.latitude, models.DelivererProfile.longitude)
+        ).all()
+        job_index.sync(db, force=True)
+    random.Random(7).shuffle(deliverers)
+    pairs = []
+    start = time.perf_counter()
+    for deliverer_id, user_id, lat, lng in deliverers:
+        with SessionLocal() as db:
+            user = db.get(models.User, user_id)
+            try:
+                claimed = delivery.accept_next_job(float(lat), float(lng), dispatch.DISPATCH_RADIUS_KM, user,
+                                                   deliverer_id, db)
+            except HTTPException as e:
+                assert e.status_code == 404, e.detail
+                continue
+            pairs.append((deliverer_id, claimed["order_id"]))
+    elapsed = time.perf_counter() - start
+    with SessionLocal() as db:
+        return pairs, pickup_km(db, pairs), elapsed
+
+
+def engine_round(SessionLocal, solver):
+    """One dispatch round with solver, then every offer accepted"""
+    with SessionLocal() as db:
+        start = time.perf_counter()
+        stats = dispatch.offer_jobs(db, solver)
+        elapsed = time.perf_counter() - start
+        offers = db.execute(
+            select(models.JobOffer.id, models.JobOffer.deliverer_id, models.JobOffer.order_id,
+                   models.JobOffer.distance_km)
+        ).all()
+    assert len(offers) == stats["offered"]
+    assert len({offer.order_id for offer in offers}) == len(offers), "a job was offered twice"
+    assert len({offer.deliverer_id for offer in offers}) == len(offers), "a deliverer got two offers"
+    assert all(float(offer.distance_km) <= dispatch.DISPATCH_RADIUS_KM + 0.01 for offer in offers)
+
+    with SessionLocal() as db:
+        for offer in offers:
+            assert dispatch.accept_offer(db, offer.id, offer.deliverer_id) is not None, f"offer {offer.id} failed"
+        db.commit()
+        claimed = db.execute(select(func.count()).where(models.Order.deliverer_id != None)).scalar()
+        assert claimed == len(offers), f"{claimed} orders claimed for {len(offers)} accepted offers"
+        pairs = [(offer.deliverer_id, offer.order_id) for offer in offers]
+        return pairs, pickup_km(db, pairs), elapsed, stats
+
+
+def main(n_orders=5000, n_deliverers=2000, n_stores=400):
+    print(f"{n_orders:,} open jobs at {n_stores} stores, {n_deliverers:,} idle deliverers, "
+          f"radius {dispatch.DISPATCH_RADIUS_KM:g} km, {dispatch.DISPATCH_CANDIDATES} candidate stores per deliverer")
+    print(f"{'scheme':>12} {'matched':>8} {'total km':>9} {'mean km':>8} {'p95 km':>7} {'latency':>22}")
+
+    def report(scheme, km, latency):
+        km = sorted(km)
+        print(f"{scheme:>12} {len(km):>8,} {sum(km):>9,.0f} {sum(km) / len(km):>8.2f} "
+              f"{percentile(km, 95):>7.2f} {latency:>22}")
+        return sum(km) / len(km)
+
+    pairs, km, elapsed = first_come(seed(n_orders, n_deliverers, n_stores))
+    baseline = report("first-come", km, f"{elapsed:.1f}s for {len(pairs):,} claims")
+    baseline_matched = len(pairs)
+
+    results = {}
+    for solver in ("greedy", "hungarian"):
+        pairs, km, elapsed, stats = engine_round(seed(n_orders, n_deliverers, n_stores), solver)
+        results[solver] = report(
+            solver, km, f"round {elapsed * 1000:.0f} ms (solve {stats['solve_ms']:.0f})"
+        ), len(pairs)
+
+    mean_km, matched = results["hungarian"]
+    assert matched >= baseline_matched, f"hungarian matched {matched}, first-come {baseline_matched}"
+    print(f"hungarian vs first-come: {matched - baseline_matched:+,} jobs matched, "
+          f"{(1 - mean_km / baseline) * 100:.0f}% less distance to the store per job")
+    if mean_km >= baseline:
+        sys.exit("the dispatch engine did not shorten the trips to the stores")
+
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:4]]
+    main(*args)
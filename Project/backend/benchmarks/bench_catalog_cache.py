@@ -0,0 +1,64 @@
+"""Store menu endpoint with and without the catalog cache.
+
+    python -m benchmarks.bench_catalog_cache [n_products] [repeat]
+
+Calls products.get_store_products the way a browsing client does: cold
+(cache cleared before every call, so each one queries and serializes), warm
+(served from the cache) and revalidated (If-None-Match with the current
+ETag, answered 304 without a body). Then a product update shows the next
+read is fresh.
+"""
+import sys
+
+from starlette.requests import Request
+
+from .common import make_session_factory, percentile, seed_store, timed
+from app import models
+from app.catalog_cache import catalog_cache
+from app.routers import products
+
+
+def request(headers=None):
+    raw = [(name.lower().encode(), value.encode()) for name, value in (headers or {}).items()]
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": raw, "query_string": b""})
+
+
+def main(n_products=50, repeat=3000):
+    SessionLocal = make_session_factory()
+    with SessionLocal() as db:
+        store, store_products = seed_store(db, n_products=n_products)
+        store_id, product_id = store.id, store_products[0].id
+
+    def call(headers=None):
+        with SessionLocal() as db:
+            return products.get_store_products(request(headers), store_id, db)
+
+    def cold():
+        catalog_cache.clear()
+        call()
+
+    etag = call().headers["etag"]
+    results = {
+        "cold": timed(cold, repeat),
+        "warm": timed(call, repeat),
+        "304": timed(lambda: call({"If-None-Match": etag}), repeat),
+    }
+    body_bytes = len(call().body)
+
+    print(f"GET /products/store/{{id}}, {n_products} products, {body_bytes:,} byte body")
+    print(f"{'mode':>6} {'req/s':>10} {'p50 us':>8} {'p99 us':>8}")
+    for name, (ops, latencies) in results.items():
+        print(f"{name:>6} {ops:>10,.0f} {percentile(latencies, 50) * 1000:>8.0f} {percentile(latencies, 99) * 1000:>8.0f}")
+
+    with SessionLocal() as db:
+        db.get(models.Product, product_id).price = 12345
+        db.commit()
+    catalog_cache.invalidate_store(store_id)
+    response = call({"If-None-Match": etag})
+    assert response.status_code == 200 and b"12345" in response.body, "stale menu after invalidation"
+    print(f"after an update: 200 with a new ETag; {catalog_cache.stats()}")
+
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:3]]
+    main(*args)
@@ -0,0 +1,55 @@
+"""Hot list endpoints with and without fast JSON responses.
+
+    python -m benchmarks.bench_fast_json [n_products] [n_orders] [repeat]
+
+Serves GET /products/store/{id}, GET /orders/my and GET /delivery/jobs through
+the FastAPI app, first with fastjson.FAST_JSON_RESPONSES off (ORM objects
+validated and dumped through the pydantic response model) and then on (Core
+rows straight to orjson). The data comes from testbed.fast_json, on which
+tests/test_fast_json.py checks that both modes send byte-identical pages. The
+store menu is timed with the catalog cache cleared before each request.
+"""
+import sys
+
+from fastapi.testclient import TestClient
+
+from .common import make_session_factory, percentile, timed
+from testbed.fast_json import seed
+from app import database, fastjson
+from app.catalog_cache import catalog_cache
+from app.main import app
+
+
+def main(n_products=500, n_orders=500, repeat=300):
+    SessionLocal = make_session_factory()
+    store_id, tokens = seed(SessionLocal, n_products, n_orders)
+
+    def get_db():
+        with SessionLocal() as db:
+            yield db
+
+    app.dependency_overrides[database.get_db] = get_db
+    client = TestClient(app)
+    requester = {"Authorization": f"Bearer {tokens['requester']}"}
+    deliverer = {"Authorization": f"Bearer {tokens['deliverer']}"}
+    endpoints = [
+        ("store menu", f"/products/store/{store_id}", {}, {}),
+        ("my orders", "/orders/my", requester, {"limit": 50}),
+        ("job board", "/delivery/jobs", deliverer, {"limit": 100}),
+    ]
+
+    print(f"{'endpoint':>12} {'mode':>6} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8}")
+    for name, path, headers, params in endpoints:
+        def request():
+            catalog_cache.clear()
+            client.get(path, headers=headers, params=params)
+
+        for mode, fast in [("pydantic", False), ("fast", True)]:
+            fastjson.FAST_JSON_RESPONSES = fast
+            ops, latencies = timed(request, repeat)
+            print(f"{name:>12} {mode:>6} {ops:>8,.0f} {percentile(latencies, 50):>8.2f} {percentile(latencies, 99):>8.2f}")
+
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:4]]
+    main(*args)
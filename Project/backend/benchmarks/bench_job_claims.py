@@ -0,0 +1,51 @@
+"""Concurrent deliverers claiming jobs: no job may be assigned twice.
+
+    python -m benchmarks.bench_job_claims [claimers] [jobs] [threads]
+
+Two rounds, each with every claimer a different deliverer calling the route
+handler in its own session from a pool of threads:
+
+- one job: all claimers POST /delivery/jobs/{id}/accept for the same job;
+  exactly one must win and the rest get 409.
+- next job: all claimers POST /delivery/jobs/next over `jobs` open jobs;
+  every job must be taken exactly once and the rest get 404.
+
+Afterwards each claimed order must have exactly one delivery row, owned by
+the deliverer the order is assigned to. Throughput and the latency of
+winners and losers are reported. On SQLite writers are serialized (see
+testbed.make_threaded_session_factory); BENCH_DATABASE_URL runs it on Postgres.
+"""
+import sys
+
+from .common import make_threaded_session_factory, percentile
+from testbed.job_claims import check_assignments, claim_all, seed
+from app.routers import delivery
+
+
+def main(claimers=200, jobs=100, threads=32):
+    SessionLocal = make_threaded_session_factory(threads)
+    deliverers, order_ids = seed(SessionLocal, claimers, jobs)
+    hot_job, board = order_ids[0], order_ids[1:]
+
+    rounds = [
+        ("one job", [hot_job], 1,
+         lambda db, user, deliverer_id: delivery.accept_job(hot_job, user, deliverer_id, db)),
+        ("next job", board, min(jobs, claimers),
+         lambda db, user, deliverer_id: delivery.accept_next_job(None, None, 5.0, user, deliverer_id, db)),
+    ]
+    print(f"{claimers} claimers, {threads} at a time")
+    print(f"{'round':>9} {'won':>5} {'lost':>5} {'claims/s':>9} {'won p50':>8} {'lost p50':>9} {'lost p99':>9}")
+    for name, round_order_ids, expected, claim in rounds:
+        results, elapsed = claim_all(SessionLocal, deliverers, threads, claim)
+        won = sorted(ms for ok, ms in results if ok)
+        lost = sorted(ms for ok, ms in results if not ok)
+        assert len(won) == expected, f"{name}: {len(won)} claims won, expected {expected}"
+        assert check_assignments(SessionLocal, round_order_ids) == expected
+        print(f"{name:>9} {len(won):>5} {len(lost):>5} {claimers / elapsed:>9,.0f} {percentile(won, 50):>8.1f} "
+              f"{percentile(lost, 50):>9.1f} {percentile(lost, 99):>9.1f}")
+    print("no double assignment: one delivery per claimed job, owned by its deliverer")
+
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:4]]
+    main(*args)
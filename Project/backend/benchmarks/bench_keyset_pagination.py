@@ -0,0 +1,74 @@
+"""Page latency of /notifications/ with OFFSET versus a keyset cursor, at several depths.
+
+    python -m benchmarks.bench_keyset_pagination [n_notifications] [repeat]
+
+Seeds one user with n_notifications rows (default 20000), then fetches the
+page of 50 that starts 0, 1000 and 10000 rows in, both ways. OFFSET has to
+walk and discard `depth` index entries per request, so it slows down as the
+depth grows; the cursor seeks straight to (created_at, id) on
+idx_notifications_user_created and should cost the same at every depth.
+"""
+import sys
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert
+
+from .common import make_session_factory, seed_requester, timed, percentile
+from app import models
+from app.pagination import encode_cursor
+from app.routers.notifications import my_notifications_select
+
+PAGE_SIZE = 50
+DEPTHS = (0, 1000, 10000)
+
+
+def main(n_notifications=20000, repeat=200):
+    SessionLocal = make_session_factory()
+    with SessionLocal() as db:
+        user_id = seed_requester(db).user_id
+        start = datetime(2024, 1, 1)
+        db.execute(insert(models.Notification), [
+            {
+                "user_id": user_id,
+                "title": f"Notification {i}",
+                "message": "bench",
+                "type": "system",
+                # Several rows per second, so the id tie-breaker is exercised
+                "created_at": start + timedelta(seconds=i // 4),
+            }
+            for i in range(n_notifications)
+        ])
+        db.commit()
+
+        # Cursor of the row just before each page, as the previous page would return it
+        cursors = {0: None}
+        for depth in DEPTHS:
+            if depth:
+                before = db.execute(my_notifications_select(user_id, depth - 1, 1, None)).scalars().first()
+                cursors[depth] = encode_cursor(before.created_at, before.id)
+
+    def fetch(skip, cursor):
+        with SessionLocal() as db:
+            return db.execute(my_notifications_select(user_id, skip, PAGE_SIZE, cursor)).scalars().all()
+
+    print(f"{n_notifications} notifications, pages of {PAGE_SIZE}")
+    print(f"{'depth':>6} {'mode':>8} {'req/s':>10} {'p50 ms':>8} {'p99 ms':>8}")
+    p50 = {}
+    for depth in DEPTHS:
+        offset_ids = [n.id for n in fetch(depth, None)][:PAGE_SIZE]
+        keyset_ids = [n.id for n in fetch(0, cursors[depth])][:PAGE_SIZE]
+        assert offset_ids == keyset_ids, f"offset and keyset pages differ at depth {depth}"
+        for label, skip, page_cursor in [("offset", depth, None), ("keyset", 0, cursors[depth])]:
+            ops, latencies = timed(lambda: fetch(skip, page_cursor), repeat)
+            p50[label, depth] = percentile(latencies, 50)
+            print(f"{depth:>6} {label:>8} {ops:>10.0f} {p50[label, depth]:>8.2f} {percentile(latencies, 99):>8.2f}")
+
+    deepest = DEPTHS[-1]
+    print(f"p50 at depth {deepest} relative to depth 0: "
+          f"offset {p50['offset', deepest] / p50['offset', 0]:.1f}x, "
+          f"keyset {p50['keyset', deepest] / p50['keyset', 0]:.1f}x")
+
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:3]]
+    main(*args)
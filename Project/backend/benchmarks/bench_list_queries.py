@@ -0,0 +1,29 @@
+"""Query budget of every list endpoint, independent of the number of rows.
+
+    python -m benchmarks.bench_list_queries [n_orders]
+
+Counts the statements each list handler in routers/ sends to the database
+while its result is serialized (see testbed.list_queries for the endpoints and
+their budgets). Exits non-zero when any endpoint exceeds its budget;
+tests/test_query_budgets.py asserts the same budgets.
+"""
+import sys
+
+from .common import make_session_factory
+from testbed.list_queries import query_counts
+
+
+def main(n_orders=50):
+    failed = False
+    print(f"{n_orders} orders")
+    print(f"{'endpoint':<42} {'rows':>5} {'queries':>8} {'budget':>7}")
+    for name, rows, queries, budget in query_counts(make_session_factory(), n_orders):
+        over = queries > budget
+        failed = failed or over
+        print(f"{name:<42} {rows:>5} {queries:>8} {budget:>7}{'  OVER' if over else ''}")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 50)
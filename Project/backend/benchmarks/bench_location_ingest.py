@@ -0,0 +1,86 @@
+"""GPS pings/sec: one commit per ping versus the buffered LocationBuffer.
+
+    python -m benchmarks.bench_location_ingest [n_deliveries] [pings]
+
+"per-ping" is what PUT /delivery/{id}/location used to do: load the
+Delivery, update its position, insert one history row and commit. "buffered"
+appends to tracking.LocationBuffer and flushes every 500 pings, i.e. what the
+background flusher does for ~500 pings per LOCATION_FLUSH_MS; the flush cost
+is included in the timing.
+"""
+import random
+import sys
+import time
+
+from .common import make_session_factory, seed_requester, seed_store
+from app import models
+from app.tracking import LocationBuffer
+
+FLUSH_EVERY = 500
+
+
+def seed_deliveries(SessionLocal, n_deliveries):
+    with SessionLocal() as db:
+        store, _ = seed_store(db, n_products=1)
+        requester = seed_requester(db)
+        user = models.User(email="bench-deliverer@test.com", hashed_password="x", role="deliverer")
+        db.add(user)
+        db.flush()
+        deliverer = models.DelivererProfile(user_id=user.id, name="Bench Deliverer")
+        db.add(deliverer)
+        db.flush()
+        ids = []
+        for _ in range(n_deliveries):
+            order = models.Order(requester_id=requester.id, store_id=store.id, subtotal=0, total_price=0,
+                                 delivery_address="Bench", deliverer_id=deliverer.id, status="picked_up")
+            db.add(order)
+            db.flush()
+            delivery = models.Delivery(order_id=order.id, deliverer_id=deliverer.id)
+            db.add(delivery)
+            db.flush()
+            ids.append(delivery.id)
+        db.commit()
+        return ids
+
+
+def per_ping(SessionLocal, pings):
+    for delivery_id, lat, lng in pings:
+        with SessionLocal() as db:
+            delivery = db.query(models.Delivery).filter(models.Delivery.id == delivery_id).first()
+            delivery.current_latitude = lat
+            delivery.current_longitude = lng
+            db.add(models.DeliveryLocationHistory(delivery_id=delivery_id, latitude=lat, longitude=lng))
+            db.commit()
+
+
+def buffered(SessionLocal, pings):
+    # No background flusher: flush inline so the timing includes it
+    buffer = LocationBuffer(flush_ms=0, session_factory=SessionLocal)
+    for i, (delivery_id, lat, lng) in enumerate(pings, 1):
+        with SessionLocal() as db:
+            buffer.delivery_owner(db, delivery_id)
+        buffer.append(delivery_id, [(lat, lng, None)])
+        if i % FLUSH_EVERY == 0:
+            buffer.flush()
+    buffer.flush()
+
+
+def main(n_deliveries=2000, n_pings=10000):
+    rng = random.Random(0)
+    print(f"{n_deliveries} deliveries, {n_pings} pings")
+    print(f"{'mode':>10} {'pings/s':>10} {'history rows':>13}")
+    for label, ingest in [("per-ping", per_ping), ("buffered", buffered)]:
+        SessionLocal = make_session_factory()
+        ids = seed_deliveries(SessionLocal, n_deliveries)
+        pings = [(rng.choice(ids), 33.6 + rng.random() / 100, 133.7 + rng.random() / 100) for _ in range(n_pings)]
+        start = time.perf_counter()
+        ingest(SessionLocal, pings)
+        elapsed = time.perf_counter() - start
+        with SessionLocal() as db:
+            rows = db.query(models.DeliveryLocationHistory).count()
+        print(f"{label:>10} {n_pings / elapsed:>10.0f} {rows:>13}")
+
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:3]]
+    main(*args)
@@ -0,0 +1,69 @@
+"""/orders/my latency while /auth/login is flooded.
+
+Start the API, then run this once per hashing setup and compare:
+
+    HASH_WORKERS=0 uvicorn app.main:app --port 8000   # bcrypt inline in the request thread
+    HASH_WORKERS=2 uvicorn app.main:app --port 8000   # bcrypt worker pool + 429s
+    python -m benchmarks.bench_login_flood --base-url http://localhost:8000
+
+Uses the seeded test accounts from docker/db/init.sql. Requires httpx.
+"""
+import argparse
+import asyncio
+import time
+from collections import Counter
+
+import httpx
+
+from .common import percentile
+from .load_test import ACCOUNTS, PASSWORD, login
+
+
+async def probe_orders(client, headers, deadline, latencies):
+    while time.perf_counter() < deadline:
+        t0 = time.perf_counter()
+        await client.get("/orders/my", headers=headers)
+        latencies.append((time.perf_counter() - t0) * 1000)
+
+
+async def flood_logins(client, deadline, statuses):
+    form = {"username": ACCOUNTS["requester"], "password": PASSWORD}
+    while time.perf_counter() < deadline:
+        try:
+            response = await client.post("/auth/login", data=form)
+            statuses[response.status_code] += 1
+        except httpx.HTTPError as exc:
+            statuses[type(exc).__name__] += 1
+
+
+async def phase(client, headers, duration, order_clients, login_clients):
+    latencies, statuses = [], Counter()
+    deadline = time.perf_counter() + duration
+    await asyncio.gather(
+        *[probe_orders(client, headers, deadline, latencies) for _ in range(order_clients)],
+        *[flood_logins(client, deadline, statuses) for _ in range(login_clients)],
+    )
+    latencies.sort()
+    return latencies, statuses
+
+
+async def main(base_url, duration, order_clients, login_clients):
+    limits = httpx.Limits(max_connections=order_clients + login_clients + 4)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        headers = await login(client, ACCOUNTS["requester"])
+        for label, flooders in [("baseline", 0), ("login flood", login_clients)]:
+            latencies, statuses = await phase(client, headers, duration, order_clients, flooders)
+            print(f"{label}:")
+            print(f"  /orders/my  n={len(latencies)} p50={percentile(latencies, 50):.1f}ms p99={percentile(latencies, 99):.1f}ms")
+            if flooders:
+                print(f"  /auth/login {dict(statuses)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--duration", type=float, default=15.0)
+    parser.add_argument("--order-clients", type=int, default=8)
+    parser.add_argument("--login-clients", type=int, default=64)
+    args = parser.parse_args()
+    asyncio.run(main(args.base_url, args.duration, args.order_clients, args.login_clients))
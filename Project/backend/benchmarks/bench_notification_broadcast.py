@@ -0,0 +1,98 @@
+"""Fan-out of one notification to every requester: per-user commits versus chunked broadcast.
+
+    python -m benchmarks.bench_notification_broadcast [n_recipients] [chunk_size]
+
+The per-user path does what POST /notifications/ does for each recipient
+(counter upsert, insert, counter bump, commit) and is timed on a sample
+then extrapolated. The broadcast path runs broadcasts.BroadcastRunner over
+all recipients, stops it halfway once to show it resumes from the
+checkpoint without duplicates, and reports the longest chunk transaction,
+i.e. the longest a foreground writer can wait on a recipient's counter.
+"""
+import sys
+import time
+
+from sqlalchemy import func, insert, select
+
+from .common import make_session_factory, percentile
+from app import broadcasts, models, notification_counts
+
+SAMPLE = 2000
+
+
+class TimedRunner(broadcasts.BroadcastRunner):
+    def __init__(self, *args, stop_after=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.chunk_ms = []
+        self.stop_after = stop_after
+
+    def _send_chunk(self, db, broadcast):
+        if self.stop_after is not None and len(self.chunk_ms) >= self.stop_after:
+            self.stop()
+        start = time.perf_counter()
+        sent = super()._send_chunk(db, broadcast)
+        self.chunk_ms.append((time.perf_counter() - start) * 1000)
+        return sent
+
+
+def main(n_recipients=200_000, chunk_size=broadcasts.BROADCAST_CHUNK_SIZE):
+    SessionLocal = make_session_factory()
+    with SessionLocal() as db:
+        for start in range(0, n_recipients, 50_000):
+            db.execute(insert(models.User), [
+                {"email": f"bench-{i}@test.com", "hashed_password": "x", "role": "requester"}
+                for i in range(start, min(start + 50_000, n_recipients))
+            ])
+        db.commit()
+        user_ids = db.execute(select(models.User.id).order_by(models.User.id)).scalars().all()
+
+        start = time.perf_counter()
+        for user_id in user_ids[:SAMPLE]:
+            notification_counts.ensure_counters(db, [user_id])
+            db.add(models.Notification(user_id=user_id, title="Per-user", message="m", type="promotion"))
+            notification_counts.add_unread(db, {user_id: 1})
+            db.commit()
+        per_user_rate = SAMPLE / (time.perf_counter() - start)
+
+        broadcast = models.NotificationBroadcast(title="Sale", message="m", type="promotion",
+                                                 audience="role", audience_role="requester")
+        broadcast.total_count = broadcasts.audience_size(db, broadcast)
+        db.add(broadcast)
+        db.commit()
+        broadcast_id = broadcast.id
+
+    n_chunks = -(-n_recipients // chunk_size)
+    first = TimedRunner(chunk_size=chunk_size, chunk_pause_ms=0, session_factory=SessionLocal,
+                        stop_after=n_chunks // 2)
+    second = TimedRunner(chunk_size=chunk_size, chunk_pause_ms=0, session_factory=SessionLocal)
+    start = time.perf_counter()
+    first.run_next()
+    with SessionLocal() as db:
+        halfway = db.get(models.NotificationBroadcast, broadcast_id)
+        halfway_status, halfway_sent = halfway.status, halfway.sent_count
+    second.run_next()
+    elapsed = time.perf_counter() - start
+
+    with SessionLocal() as db:
+        broadcast = db.get(models.NotificationBroadcast, broadcast_id)
+        assert broadcast.status == "completed" and broadcast.sent_count == n_recipients, broadcast.status
+        sent, recipients = db.execute(
+            select(func.count(models.Notification.id), func.count(models.Notification.user_id.distinct()))
+            .where(models.Notification.title == "Sale")
+        ).one()
+        assert sent == recipients == n_recipients, f"{sent} notifications for {recipients} recipients"
+        for user_id in (user_ids[0], user_ids[-1]):
+            assert notification_counts.unread_count(db, user_id) == notification_counts.count_unread(db, user_id)
+
+    chunk_ms = sorted(first.chunk_ms + second.chunk_ms)
+    print(f"{n_recipients:,} recipients, chunks of {chunk_size}")
+    print(f"per-user commits: {per_user_rate:,.0f} recipients/s "
+          f"(~{n_recipients / per_user_rate:,.0f} s for all, extrapolated from {SAMPLE})")
+    print(f"broadcast:        {n_recipients / elapsed:,.0f} recipients/s ({elapsed:.1f} s), "
+          f"chunk transaction p50 {percentile(chunk_ms, 50):.0f} ms, max {chunk_ms[-1]:.0f} ms")
+    print(f"stopped at {halfway_sent:,} sent ({halfway_status}), resumed by a second runner, no duplicates")
+
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:3]]
+    main(*args)
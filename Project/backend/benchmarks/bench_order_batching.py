@@ -0,0 +1,130 @@
+"""Couriers saved per hour by stacking pickups from one store onto one courier.
+
+    python -m benchmarks.bench_order_batching [hours] [orders_per_hour] [stores]
+
+Offline simulation of a dinner peak: orders go ready_for_pickup at stores
+of very uneven popularity, with drop-offs scattered around each store. Every
+minute the open jobs are planned with batching.plan_batches; a job is taken
+BOARD_WAIT_SECONDS after it went ready, together with the rest of its
+batch. Each trip costs the courier the ride to the store, the pickup, the
+route through the drops and a hand-over per drop. The same order stream is
+run with one drop per trip (today's board) and with batching, and the
+courier-hours are turned into couriers needed per hour.
+
+tests/test_order_batching.py checks the database path: the board lists the
+batch and accepting it creates all its deliveries in one transaction, or none.
+"""
+import random
+import sys
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from .common import percentile
+from app import batching
+from app.geo import haversine_km
+
+CITY = (33.56, 133.53)
+STORE_SPREAD_DEG = 0.04
+DROP_SPREAD_DEG = 0.02
+TICK_SECONDS = 60
+BOARD_WAIT_SECONDS = 180
+# Courier model
+APPROACH_KM = 1.5
+SPEED_KMH = 18
+PICKUP_MINUTES = 4
+HANDOVER_MINUTES = 2
+
+Job = namedtuple("Job", "id store_id ready_at store_latitude store_longitude delivery_latitude delivery_longitude")
+
+
+def order_stream(hours, orders_per_hour, n_stores, rng):
+    """Jobs in ready order; a few stores get most of the orders"""
+    stores = [(rng.gauss(CITY[0], STORE_SPREAD_DEG), rng.gauss(CITY[1], STORE_SPREAD_DEG)) for _ in range(n_stores)]
+    weights = [rng.paretovariate(1.2) for _ in range(n_stores)]
+    start = datetime(2024, 1, 1, 18)
+    jobs = []
+    for i in range(int(hours * orders_per_hour)):
+        store_id = rng.choices(range(n_stores), weights)[0]
+        lat, lng = stores[store_id]
+        ready_at = start + timedelta(seconds=rng.uniform(0, hours * 3600))
+        jobs.append(Job(i + 1, store_id, ready_at, lat, lng,
+                        rng.gauss(lat, DROP_SPREAD_DEG), rng.gauss(lng, DROP_SPREAD_DEG)))
+    jobs.sort(key=lambda job: job.ready_at)
+    return start, jobs
+
+
+def simulate(start, jobs, hours, max_drops):
+    """Run the board minute by minute; returns (trips as lists of jobs, their route km, tick plan times in ms)"""
+    trips, route_km, plan_ms = [], [], []
+    by_id = {job.id: job for job in jobs}
+    open_jobs, upcoming = {}, iter(jobs)
+    pending = next(upcoming, None)
+    now = start
+    end = start + timedelta(hours=hours) + timedelta(seconds=BOARD_WAIT_SECONDS + TICK_SECONDS)
+    while now <= end:
+        while pending is not None and pending.ready_at <= now:
+            open_jobs[pending.id] = pending
+            pending = next(upcoming, None)
+        t0 = time.perf_counter()
+        batches = batching.plan_batches(open_jobs.values(), max_drops)
+        plan_ms.append((time.perf_counter() - t0) * 1000)
+        for batch in batches:
+            members = [by_id[order_id] for order_id in batch.order_ids]
+            if min(job.ready_at for job in members) + timedelta(seconds=BOARD_WAIT_SECONDS) <= now:
+                trips.append(members)
+                route_km.append(batch.route_km)
+                for job in members:
+                    del open_jobs[job.id]
+        now += timedelta(seconds=TICK_SECONDS)
+    assert not open_jobs and pending is None, "jobs left on the board"
+    return trips, route_km, sorted(plan_ms)
+
+
+def courier_hours(trips, route_km):
+    return sum(
+        (APPROACH_KM + km) / SPEED_KMH + (PICKUP_MINUTES + HANDOVER_MINUTES * len(trip)) / 60
+        for trip, km in zip(trips, route_km)
+    )
+
+
+def detour_km(trips):
+    """Extra distance ridden before each drop compared with going straight there, over all drops"""
+    extra = []
+    for trip in trips:
+        store_lat, store_lng = trip[0].store_latitude, trip[0].store_longitude
+        order, arrival = batching.plan_route(store_lat, store_lng, [job.delivery_latitude for job in trip],
+                                             [job.delivery_longitude for job in trip])
+        direct = haversine_km(store_lat, store_lng, [trip[i].delivery_latitude for i in order],
+                              [trip[i].delivery_longitude for i in order])
+        extra.extend((arrival - direct).tolist())
+    return sorted(extra)
+
+
+def main(hours=4, orders_per_hour=1500, n_stores=80):
+    start, jobs = order_stream(hours, orders_per_hour, n_stores, random.Random(25))
+    print(f"{len(jobs):,} orders over {hours} h at {n_stores} stores, up to {batching.BATCH_MAX_DROPS} drops, "
+          f"{batching.BATCH_READY_WINDOW_SECONDS:g} s ready window, {batching.BATCH_MAX_BEARING_DEG:g} deg bearing, "
+          f"{batching.BATCH_MAX_DETOUR_KM:g} km max detour")
+    print(f"{'scheme':>8} {'trips':>7} {'drops/trip':>10} {'route km':>9} {'couriers/h':>10} "
+          f"{'p95 detour':>10} {'plan p95':>9}")
+
+    results = {}
+    for scheme, max_drops in (("single", 1), ("batched", batching.BATCH_MAX_DROPS)):
+        trips, route_km, plan_ms = simulate(start, jobs, hours, max_drops)
+        assert sum(len(trip) for trip in trips) == len(jobs)
+        couriers = courier_hours(trips, route_km) / hours
+        detour = detour_km(trips)
+        print(f"{scheme:>8} {len(trips):>7,} {len(jobs) / len(trips):>10.2f} {sum(route_km):>9,.0f} "
+              f"{couriers:>10.1f} {percentile(detour, 95):>8.2f}km {percentile(plan_ms, 95):>7.1f}ms")
+        results[scheme] = couriers
+
+    saved = results["single"] - results["batched"]
+    print(f"couriers saved per hour: {saved:.1f} ({saved / results['single'] * 100:.0f}%)")
+    if saved <= 0:
+        sys.exit("batching did not save couriers")
+
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:4]]
+    main(*args)
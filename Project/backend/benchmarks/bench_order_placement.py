@@ -0,0 +1,38 @@
+"""Orders/sec of ordering.place_order against cart size.
+
+    python -m benchmarks.bench_order_placement [repeat]
+"""
+import sys
+
+from .common import make_session_factory, seed_store, seed_requester, timed, percentile
+from app import schemas, ordering
+
+CART_SIZES = [1, 5, 10, 20, 50]
+
+
+def main(repeat=200):
+    SessionLocal = make_session_factory()
+    with SessionLocal() as db:
+        store, products = seed_store(db, n_products=max(CART_SIZES), stock_quantity=1_000_000)
+        requester = seed_requester(db)
+        store_id, requester_id = store.id, requester.id
+        product_ids = [p.id for p in products]
+
+    print(f"{'cart size':>10} {'orders/s':>10} {'p50 ms':>8} {'p99 ms':>8}")
+    for size in CART_SIZES:
+        order = schemas.OrderCreate(
+            store_id=store_id,
+            delivery_address="Bench",
+            details=[schemas.OrderDetailCreate(product_id=pid, quantity=1) for pid in product_ids[:size]],
+        )
+
+        def run():
+            with SessionLocal() as db:
+                ordering.place_order(db, requester_id, order)
+
+        ops, latencies = timed(run, repeat)
+        print(f"{size:>10} {ops:>10.1f} {percentile(latencies, 50):>8.2f} {percentile(latencies, 99):>8.2f}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
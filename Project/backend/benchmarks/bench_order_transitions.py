@@ -0,0 +1,35 @@
+"""Requester and deliverer racing on the same orders: every order must end in one consistent state.
+
+    python -m benchmarks.bench_order_transitions [orders] [threads]
+
+Seeds `orders` claimed orders (picked_up, delivery assigned). For each one
+the requester cancels the order while its deliverer completes the delivery, both
+through the route handlers in their own sessions on a pool of threads.
+Exactly one of the two may win per order, and afterwards each order must be
+either cancelled with its delivery cancelled and its stock returned, or
+delivered with its delivery completed and counted in the sales rollups.
+Deliverers must end online. Throughput and latency are reported.
+"""
+import sys
+
+from .common import make_threaded_session_factory, percentile
+from testbed.order_transitions import check_outcomes, race, seed
+
+
+def main(n_orders=300, threads=16):
+    SessionLocal = make_threaded_session_factory(threads)
+    requester, product_id, jobs = seed(SessionLocal, n_orders)
+    results, elapsed = race(SessionLocal, requester, jobs, threads)
+    cancelled = check_outcomes(SessionLocal, results, product_id, n_orders)
+
+    latencies = sorted(ms for *_, ms in results)
+    print(f"{n_orders} orders, requester and deliverer racing on each, {threads} threads")
+    print(f"cancelled {cancelled}, delivered {n_orders - cancelled}; "
+          f"{len(results) / elapsed:,.0f} transitions/s, p50 {percentile(latencies, 50):.1f} ms, "
+          f"p99 {percentile(latencies, 99):.1f} ms")
+    print("no lost updates: one winner per order, order, delivery, deliverer, stock and rollups agree")
+
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:3]]
+    main(*args)
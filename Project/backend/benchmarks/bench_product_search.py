@@ -0,0 +1,161 @@
+"""Product search latency over a large catalog, plus the ranking contract check.
+
+    python -m benchmarks.bench_product_search [n_products] [n_queries]
+
+Seeds n_products products with Japanese and English names and descriptions
+over 200 stores, then runs a mix of one- and two-term queries, with and
+without store/category/price filters, through search.search_product_ids.
+On SQLite that is the in-memory index (built once, timed separately); with
+BENCH_DATABASE_URL pointing at Postgres it is the pg_trgm query. On SQLite
+every result is first compared with a full-scan LIKE query applying the
+same ranking, and the scan is timed as the baseline. Finally, on SQLite,
+concurrent searches hit a stale index: exactly one of them may reload it,
+while the others keep answering from the old one.
+"""
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import and_, case, func, insert, select
+
+from .common import BENCH_DATABASE_URL, make_session_factory, percentile, timed
+from app import models, search
+
+WORDS = ["ラーメン", "醤油", "味噌", "塩", "カレー", "チキン", "ビーフ", "唐揚げ", "餃子", "炒飯",
+         "pizza", "burger", "salad", "cheese", "tomato", "spicy", "special", "set", "lunch", "combo",
+         "寿司", "サーモン", "まぐろ", "うどん", "そば", "天ぷら", "弁当", "おにぎり", "コーヒー", "ケーキ"]
+N_STORES = 200
+
+
+def seed(SessionLocal, n_products):
+    rng = random.Random(7)
+    with SessionLocal() as db:
+        db.execute(insert(models.User), [
+            {"email": f"bench-store-{i}@test.com", "hashed_password": "x", "role": "store"} for i in range(N_STORES)
+        ])
+        user_ids = db.execute(select(models.User.id)).scalars().all()
+        db.execute(insert(models.StoreProfile), [
+            {"user_id": user_id, "store_name": f"Store {user_id}", "address": "Bench"} for user_id in user_ids
+        ])
+        store_ids = db.execute(select(models.StoreProfile.id)).scalars().all()
+        db.execute(insert(models.ProductCategory), [
+            {"store_id": store_id, "name": f"Category {k}"} for store_id in store_ids for k in range(3)
+        ])
+        category_ids = db.execute(select(models.ProductCategory.id)).scalars().all()
+        for start in range(0, n_products, 50_000):
+            rows = []
+            for i in range(start, min(start + 50_000, n_products)):
+                store_index = rng.randrange(N_STORES)
+                rows.append({
+                    "store_id": store_ids[store_index],
+                    "category_id": category_ids[store_index * 3 + rng.randrange(3)],
+                    "name": " ".join(rng.sample(WORDS, rng.randint(1, 3))) + f" {i}",
+                    "description": None if i % 4 == 0 else "、".join(rng.sample(WORDS, 4)),
+                    "price": rng.randrange(100, 3000, 10),
+                    "is_available": i % 10 != 0,
+                    "stock_quantity": 10,
+                })
+            db.execute(insert(models.Product), rows)
+        db.commit()
+    return store_ids, category_ids
+
+
+def make_queries(n_queries, store_ids, category_ids):
+    rng = random.Random(11)
+    queries = []
+    for _ in range(n_queries):
+        terms = rng.sample(WORDS, rng.choice([1, 1, 2]))
+        kind = rng.randrange(4)
+        store_index = rng.randrange(N_STORES)
+        queries.append({
+            # Part of a word half the time, e.g. "ラー" or "chee"
+            "q": " ".join(term if rng.random() < 0.5 else term[:max(2, len(term) - 2)] for term in terms),
+            "store_id": store_ids[store_index] if kind in (1, 3) else None,
+            "category_id": category_ids[store_index * 3] if kind == 3 else None,
+            "max_price": rng.randrange(500, 2000, 100) if kind in (2, 3) else None,
+        })
+    return queries
+
+
+def scan_select(q, store_id, category_id, max_price, limit=20):
+    """The ranking of search.ProductSearchIndex as one LIKE query over every row"""
+    terms = search.parse_terms(q)
+    name, description = models.Product.name, models.Product.description
+    text = name + "\n" + func.coalesce(description, "")
+    stmt = select(models.Product.id).where(
+        models.Product.is_available == True, *[text.contains(term) for term in terms]
+    )
+    if store_id is not None:
+        stmt = stmt.where(models.Product.store_id == store_id)
+    if category_id is not None:
+        stmt = stmt.where(models.Product.category_id == category_id)
+    if max_price is not None:
+        stmt = stmt.where(models.Product.price <= max_price)
+    rank = case(
+        (name.startswith(terms[0]), 0),
+        (and_(*[name.contains(term) for term in terms]), 1),
+        else_=2
+    )
+    return stmt.order_by(rank, func.length(name), models.Product.id).limit(limit)
+
+
+def check_concurrent_reload(SessionLocal, queries, threads=16):
+    """Searches finding the index stale at once: one reloads it, the rest search the old index meanwhile"""
+    index = search.product_search
+    index._synced_at -= search.SEARCH_INDEX_RESYNC_SECONDS
+    reloads = index.reloads
+    barrier = threading.Barrier(threads)
+
+    def run(query):
+        barrier.wait()
+        with SessionLocal() as db:
+            start = time.perf_counter()
+            search.search_product_ids(db, **query)
+            return (time.perf_counter() - start) * 1000
+
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        latencies = sorted(pool.map(run, queries[:threads]))
+    assert index.reloads == reloads + 1, f"{index.reloads - reloads} reloads for one stale index"
+    print(f"{threads} concurrent searches on a stale index: 1 reload; "
+          f"p50 {percentile(latencies, 50):.2f} ms, slowest {latencies[-1]:.0f} ms (the reload)")
+
+
+def main(n_products=200_000, n_queries=300):
+    SessionLocal = make_session_factory()
+    start = time.perf_counter()
+    store_ids, category_ids = seed(SessionLocal, n_products)
+    print(f"{n_products:,} products seeded in {time.perf_counter() - start:.1f} s")
+    queries = make_queries(n_queries, store_ids, category_ids)
+    sqlite = BENCH_DATABASE_URL.startswith("sqlite")
+
+    with SessionLocal() as db:
+        if sqlite:
+            start = time.perf_counter()
+            search.product_search.sync(db, force=True)
+            print(f"in-memory index: {len(search.product_search):,} products indexed in "
+                  f"{time.perf_counter() - start:.1f} s")
+            for query in queries:
+                expected = db.execute(scan_select(**query)).scalars().all()
+                actual = search.search_product_ids(db, **query)
+                assert actual == expected, f"{query}: index {actual} != scan {expected}"
+            print(f"{n_queries} queries: index results identical to the full scan")
+
+        modes = [("index" if sqlite else "pg_trgm", lambda query: search.search_product_ids(db, **query))]
+        if sqlite:
+            modes.append(("scan", lambda query: db.execute(scan_select(**query)).scalars().all()))
+        print(f"{'mode':>8} {'q/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+        for mode, run in modes:
+            pending = iter(queries)
+            ops, latencies = timed(lambda: run(next(pending)), n_queries)
+            print(f"{mode:>8} {ops:>8,.0f} {percentile(latencies, 50):>8.2f} "
+                  f"{percentile(latencies, 95):>8.2f} {percentile(latencies, 99):>8.2f}")
+
+    if sqlite:
+        check_concurrent_reload(SessionLocal, queries)
+
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:3]]
+    main(*args)
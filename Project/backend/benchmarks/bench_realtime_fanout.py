@@ -0,0 +1,108 @@
+"""Fan-out of realtime.Hub to 10k concurrent subscribers.
+
+    python -m benchmarks.bench_realtime_fanout [subscribers] [events]
+
+Each subscriber is an asyncio task draining its Subscription the way the
+WebSocket/SSE endpoints do. Two scenarios:
+
+- broadcast: every subscriber follows "jobs" and each event goes to all of
+  them; reports delivered messages/sec and publish-to-last-receive latency.
+- targeted: each subscriber follows its own user:{i} topic and events go to
+  one random user each, like notifications; reports events/sec.
+
+A last run stalls 10% of the subscribers to show backpressure: the stalled
+queues collapse to a resync message and the rest keep up.
+"""
+import asyncio
+import random
+import sys
+import time
+
+from .common import percentile
+from app.realtime import RESYNC_MESSAGE, Hub
+
+
+async def drain(subscription, received, stalled=False):
+    while True:
+        message = await subscription.get()
+        received[0] += 1
+        if stalled:
+            await asyncio.sleep(3600)
+
+
+async def broadcast(n_subscribers, n_events):
+    hub = Hub()
+    subscriptions = [hub.subscribe(["jobs"]) for _ in range(n_subscribers)]
+    received = [0]
+    tasks = [asyncio.create_task(drain(s, received)) for s in subscriptions]
+    await asyncio.sleep(0)
+
+    latencies = []
+    start = time.perf_counter()
+    for i in range(n_events):
+        t0 = time.perf_counter()
+        target = received[0] + n_subscribers
+        hub.publish(["jobs"], {"type": "order_status", "order_id": i, "status": "ready_for_pickup"})
+        while received[0] < target:
+            await asyncio.sleep(0)
+        latencies.append((time.perf_counter() - t0) * 1000)
+    elapsed = time.perf_counter() - start
+    for task in tasks:
+        task.cancel()
+    latencies.sort()
+    print(f"broadcast  {n_subscribers} subscribers x {n_events} events: "
+          f"{received[0] / elapsed:,.0f} msg/s, p50 {percentile(latencies, 50):.1f} ms, "
+          f"p99 {percentile(latencies, 99):.1f} ms to reach every subscriber")
+
+
+async def targeted(n_subscribers, n_events):
+    hub = Hub()
+    subscriptions = [hub.subscribe([f"user:{i}"]) for i in range(n_subscribers)]
+    received = [0]
+    tasks = [asyncio.create_task(drain(s, received)) for s in subscriptions]
+    await asyncio.sleep(0)
+
+    rng = random.Random(0)
+    start = time.perf_counter()
+    for i in range(n_events):
+        hub.publish([f"user:{rng.randrange(n_subscribers)}"], {"type": "notification", "id": i})
+        if i % 1000 == 0:
+            await asyncio.sleep(0)
+    while received[0] < n_events:
+        await asyncio.sleep(0)
+    elapsed = time.perf_counter() - start
+    for task in tasks:
+        task.cancel()
+    print(f"targeted   {n_subscribers} subscribers x {n_events} events: {n_events / elapsed:,.0f} events/s")
+
+
+async def slow_consumers(n_subscribers, n_events):
+    hub = Hub()
+    subscriptions = [hub.subscribe(["jobs"]) for _ in range(n_subscribers)]
+    n_stalled = n_subscribers // 10
+    received = [0]
+    tasks = [asyncio.create_task(drain(s, received, stalled=i < n_stalled)) for i, s in enumerate(subscriptions)]
+    await asyncio.sleep(0)
+    for i in range(n_events):
+        hub.publish(["jobs"], {"type": "order_status", "order_id": i, "status": "ready_for_pickup"})
+        await asyncio.sleep(0)
+    for _ in range(10):
+        await asyncio.sleep(0)
+    stalled = subscriptions[:n_stalled]
+    backlog = max(s.queue.qsize() for s in stalled)
+    resynced = sum(1 for s in stalled if RESYNC_MESSAGE in s.queue._queue)
+    for task in tasks:
+        task.cancel()
+    print(f"stalled    {n_stalled} of {n_subscribers} subscribers: max backlog {backlog} messages "
+          f"(limit {hub.queue_size}), {resynced} told to resync, {hub.stats()['dropped']:,} messages dropped")
+
+
+def main(n_subscribers=10000, n_events=200):
+    asyncio.run(broadcast(n_subscribers, n_events))
+    asyncio.run(targeted(n_subscribers, n_events * 100))
+    asyncio.run(slow_consumers(n_subscribers, 3 * Hub().queue_size))
+
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:3]]
+    main(*args)
@@ -0,0 +1,95 @@
+"""Sales rollups: backfill, incremental updates and period close-out.
+
+    python -m benchmarks.bench_sales_rollups [orders] [stores] [days] [workers]
+
+Seeds `orders` orders over `stores` stores and `days` days, most of them
+delivered, then:
+
+- backfill: rebuilds the day rows from history in parallel chunks; they
+  must equal a GROUP BY over a full scan of the orders.
+- incremental: cancels a sample of delivered orders and delivers a sample of
+  open ones through rollups.sync_order; the day rows must still match a scan.
+- close-out: closes a month from the day rows, timed against totalling the
+  month from the orders themselves; both must give the same rows.
+"""
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, select, update
+
+from .common import make_threaded_session_factory
+from testbed.sales_rollups import START, day_rows, period_totals, scan, seed
+from app import models, rollups
+
+
+def main(n_orders=200_000, n_stores=200, days=180, workers=4):
+    SessionLocal = make_threaded_session_factory(workers)
+    t0 = time.perf_counter()
+    seed(SessionLocal, n_orders, n_stores, n_stores, days)
+    print(f"seeded {n_orders:,} orders, {n_stores} stores, {days} days in {time.perf_counter() - t0:.1f}s")
+
+    t0 = time.perf_counter()
+    counted = rollups.backfill(SessionLocal, workers=workers)
+    elapsed = time.perf_counter() - t0
+    with SessionLocal() as db:
+        expected = scan(db)
+        assert day_rows(db) == expected, "backfilled day rows differ from a scan"
+        day_count = len(expected[0])
+    print(f"backfill: {counted:,} orders into {day_count:,} store-days in {elapsed:.2f}s ({workers} workers)")
+
+    rng = random.Random(7)
+    with SessionLocal() as db:
+        delivered = db.execute(select(models.Order.id).where(models.Order.status == "delivered")).scalars().all()
+        open_orders = db.execute(select(models.Order.id).where(models.Order.status == "preparing")).scalars().all()
+    changes = [(order_id, "cancelled") for order_id in rng.sample(delivered, 500)]
+    changes += [(order_id, "delivered") for order_id in rng.sample(open_orders, 500)]
+    t0 = time.perf_counter()
+    for order_id, status in changes:
+        with SessionLocal() as db:
+            values = {"status": status}
+            if status == "delivered":
+                values["completed_at"] = datetime.combine(START, datetime.min.time()) + timedelta(days=rng.randrange(days))
+            db.execute(update(models.Order).where(models.Order.id == order_id).values(**values))
+            rollups.sync_order(db, order_id)
+            rollups.sync_order(db, order_id)  # a retry must not count it twice
+            db.commit()
+    elapsed = time.perf_counter() - t0
+    with SessionLocal() as db:
+        expected = scan(db)
+        assert day_rows(db) == expected, "incremental day rows differ from a scan"
+    print(f"incremental: {len(changes)} status changes in {elapsed * 1000 / len(changes):.2f} ms each, day rows match")
+
+    period_start = START + timedelta(days=30)
+    period_end = period_start + timedelta(days=30)
+    with SessionLocal() as db:
+        t0 = time.perf_counter()
+        stores, deliverers = scan(db, period_start, period_end)
+        from_scan = period_totals(stores, period_start, period_end), period_totals(deliverers, period_start, period_end)
+        scan_ms = (time.perf_counter() - t0) * 1000
+
+        t0 = time.perf_counter()
+        rollups.close_period(db, period_start, period_end)
+        close_ms = (time.perf_counter() - t0) * 1000
+        closed_stores = {
+            row.store_id: [row.total_orders, row.total_amount, row.commission_amount, row.net_amount]
+            for row in db.execute(select(models.StoreSales).where(models.StoreSales.period_start == period_start))
+            .scalars()
+        }
+        closed_deliverers = {
+            row.deliverer_id: [row.total_deliveries, row.total_amount]
+            for row in db.execute(select(models.DelivererPayout).where(models.DelivererPayout.period_start == period_start))
+            .scalars()
+        }
+        assert (closed_stores, closed_deliverers) == from_scan, "closed period differs from a scan"
+        # Closing again rewrites the pending rows instead of adding more
+        rollups.close_period(db, period_start, period_end)
+        assert db.execute(select(func.count(models.StoreSales.id))).scalar() == len(closed_stores)
+    print(f"close-out of {period_start}..{period_end}: {close_ms:.1f} ms from day rows, "
+          f"{scan_ms:.1f} ms scanning orders ({scan_ms / close_ms:.0f}x); totals match")
+
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:5]]
+    main(*args)
@@ -0,0 +1,56 @@
+"""Flash sale: many parallel buyers of one item, with its stock in one row and in shards.
+
+    python -m benchmarks.bench_stock_reservation [buyers] [stock] [threads] [shards]
+
+Each buyer places an order for one unit through ordering.place_order in its
+own session, from a pool of threads. Every mode must sell exactly the stock,
+turn the other buyers away with 409, leave the stock at zero and have one
+order line per unit sold; then throughput and latency are reported.
+
+The shards only pay off where row locks are the bottleneck: run it against
+Postgres (BENCH_DATABASE_URL) to compare. SQLite has one writer at a time
+(buyers take the write lock at BEGIN here), so there both modes queue alike.
+"""
+import sys
+
+from sqlalchemy import func, select, update
+
+from .common import make_threaded_session_factory, percentile, seed_requester, seed_store
+from testbed.stock_reservation import flash_sale
+from app import inventory, models
+
+
+def main(buyers=500, stock=200, threads=32, shards=8):
+    SessionLocal = make_threaded_session_factory(threads)
+    with SessionLocal() as db:
+        store, products = seed_store(db, n_products=1)
+        requester = seed_requester(db)
+        store_id, requester_id, product_id = store.id, requester.id, products[0].id
+
+    print(f"{buyers} buyers, {threads} at a time, for {stock} units")
+    print(f"{'stock in':>10} {'sold':>6} {'409':>6} {'orders/s':>9} {'p50 ms':>8} {'p99 ms':>8}")
+    for mode, n_shards in [("1 row", 0), (f"{shards} shards", shards)]:
+        with SessionLocal() as db:
+            db.execute(update(models.Product).where(models.Product.id == product_id).values(stock_quantity=stock))
+            db.commit()
+            inventory.set_shards(db, product_id, n_shards)
+            lines_before = db.execute(select(func.count(models.OrderDetail.id))).scalar()
+
+        results, elapsed = flash_sale(SessionLocal, store_id, requester_id, product_id, buyers, threads)
+
+        sold = sum(1 for ok, _ in results if ok)
+        with SessionLocal() as db:
+            left = inventory.set_shards(db, product_id, 0)
+            lines = db.execute(select(func.count(models.OrderDetail.id))).scalar() - lines_before
+        assert sold == min(buyers, stock), f"{mode}: sold {sold} of {stock}"
+        assert left == stock - sold, f"{mode}: {left} left after selling {sold} of {stock}"
+        assert lines == sold, f"{mode}: {lines} order lines for {sold} units"
+        latencies = sorted(ms for _, ms in results)
+        print(f"{mode:>10} {sold:>6} {buyers - sold:>6} {buyers / elapsed:>9,.0f} "
+              f"{percentile(latencies, 50):>8.1f} {percentile(latencies, 99):>8.1f}")
+    print("no oversell: every unit sold once, stock ends at zero")
+
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:5]]
+    main(*args)
@@ -0,0 +1,167 @@
+"""Store analytics dashboard: bucket reads against GROUP BYs over the orders.
+
+    python -m benchmarks.bench_store_analytics [orders] [stores] [days]
+
+Seeds `orders` orders with one to three lines over `days` days of history
+for `stores` stores, rebuilds the analytics buckets from them (timed), then
+for each store calls GET /stores/my/analytics (90 days) and compares it with
+the same dashboard computed at request time from orders and order_details.
+Both must agree; the bucket handler's p95 must stay under 50 ms. The
+request-time version uses SQLite date functions, so this one runs on SQLite.
+"""
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, insert, select
+
+from .common import make_session_factory, percentile, seed_requester
+from app import analytics, models
+from app.routers import stores
+
+DASHBOARD_DAYS = 90
+BUDGET_MS = 50
+
+
+def seed(SessionLocal, n_orders, n_stores, days, n_products=30):
+    rng = random.Random(22)
+    now = datetime.utcnow()
+    with SessionLocal() as db:
+        requester = seed_requester(db)
+        db.execute(insert(models.User), [
+            {"email": f"bench-store-{i}@test.com", "hashed_password": "x", "role": "store"} for i in range(n_stores)
+        ])
+        user_ids = db.execute(select(models.User.id).where(models.User.role == "store")).scalars().all()
+        db.execute(insert(models.StoreProfile), [
+            {"user_id": user_id, "store_name": f"Store {user_id}", "address": "Bench"} for user_id in user_ids
+        ])
+        store_ids = db.execute(select(models.StoreProfile.id)).scalars().all()
+        db.execute(insert(models.Product), [
+            {"store_id": store_id, "name": f"Product {store_id}-{i}", "price": 100 + 10 * i, "is_available": True}
+            for store_id in store_ids for i in range(n_products)
+        ])
+        menu = {}
+        for product_id, store_id, price in db.execute(
+            select(models.Product.id, models.Product.store_id, models.Product.price)
+        ):
+            menu.setdefault(store_id, []).append((product_id, price))
+
+        order_id = 0
+        orders, details = [], []
+        for _ in range(n_orders):
+            order_id += 1
+            store_id = rng.choice(store_ids)
+            lines = rng.sample(menu[store_id], rng.randint(1, 3))
+            quantities = [rng.randint(1, 4) for _ in lines]
+            subtotal = sum(price * quantity for (_, price), quantity in zip(lines, quantities))
+            ordered_at = now - timedelta(seconds=rng.randrange(days * 86400))
+            status = rng.choices(["delivered", "cancelled", "preparing"], [85, 10, 5])[0]
+            accepted_at = ordered_at + timedelta(seconds=rng.randrange(30, 600)) if status != "cancelled" else None
+            orders.append({
+                "id": order_id, "requester_id": requester.id, "store_id": store_id, "status": status,
+                "subtotal": subtotal, "delivery_fee": 300, "total_price": subtotal + 300,
+                "delivery_address": "Bench", "ordered_at": ordered_at, "accepted_at": accepted_at,
+                "completed_at": accepted_at + timedelta(seconds=rng.randrange(600, 3600)) if status == "delivered" else None,
+                "cancelled_at": ordered_at + timedelta(seconds=120) if status == "cancelled" else None,
+            })
+            details += [
+                {"order_id": order_id, "product_id": product_id, "product_name": "x", "quantity": quantity,
+                 "unit_price": price, "subtotal": price * quantity}
+                for (product_id, price), quantity in zip(lines, quantities)
+            ]
+            if len(orders) == 10_000:
+                db.execute(insert(models.Order), orders)
+                db.execute(insert(models.OrderDetail), details)
+                orders, details = [], []
+        if orders:
+            db.execute(insert(models.Order), orders)
+            db.execute(insert(models.OrderDetail), details)
+        db.commit()
+        return store_ids
+
+
+def dashboard_from_orders(db, store_id, days, top):
+    """The dashboard's numbers straight from orders and order_details"""
+    start, end = analytics.day_range(days)
+    low, high = datetime.combine(start, datetime.min.time()), datetime.combine(end, datetime.min.time())
+    order = models.Order
+    in_range = lambda column: (column >= low, column < high)  # noqa: E731
+    placed = db.execute(
+        select(func.count(), func.strftime("%H", order.ordered_at))
+        .where(order.store_id == store_id, *in_range(order.ordered_at))
+        .group_by(func.strftime("%H", order.ordered_at))
+    ).all()
+    by_hour = [0] * 24
+    for count, hour in placed:
+        by_hour[int(hour)] = count
+    accepted, accept_seconds = db.execute(
+        select(func.count(), func.sum(func.julianday(order.accepted_at) - func.julianday(order.ordered_at)))
+        .where(order.store_id == store_id, *in_range(order.accepted_at))
+    ).one()
+    completed, revenue = db.execute(
+        select(func.count(), func.coalesce(func.sum(order.subtotal), 0))
+        .where(order.store_id == store_id, order.status == "delivered", *in_range(order.completed_at))
+    ).one()
+    cancelled = db.execute(
+        select(func.count()).where(order.store_id == store_id, order.status == "cancelled", *in_range(order.cancelled_at))
+    ).scalar()
+    line_revenue = func.sum(models.OrderDetail.subtotal)
+    top_products = db.execute(
+        select(models.OrderDetail.product_id, func.sum(models.OrderDetail.quantity), line_revenue)
+        .join(order, order.id == models.OrderDetail.order_id)
+        .where(order.store_id == store_id, order.status == "delivered", *in_range(order.completed_at))
+        .group_by(models.OrderDetail.product_id)
+        .order_by(line_revenue.desc(), models.OrderDetail.product_id).limit(top)
+    ).all()
+    return {
+        "orders_placed": sum(by_hour), "orders_accepted": accepted, "orders_completed": completed,
+        "orders_cancelled": cancelled, "revenue": revenue, "orders_by_hour": by_hour,
+        "avg_accept_minutes": round((accept_seconds or 0) * 1440 / accepted, 1) if accepted else None,
+        "top_products": [(product_id, quantity, total) for product_id, quantity, total in top_products],
+    }
+
+
+def main(n_orders=500_000, n_stores=20, days=730):
+    SessionLocal = make_session_factory()
+    t0 = time.perf_counter()
+    store_ids = seed(SessionLocal, n_orders, n_stores, days)
+    print(f"seeded {n_orders:,} orders for {n_stores} stores over {days} days in {time.perf_counter() - t0:.1f}s")
+
+    with SessionLocal() as db:
+        t0 = time.perf_counter()
+        analytics.rebuild(db)
+        elapsed = time.perf_counter() - t0
+        buckets = db.execute(select(func.count()).select_from(models.StoreStatsBucket)).scalar()
+    print(f"rebuild: {buckets:,} order buckets in {elapsed:.2f}s")
+
+    bucket_ms, scan_ms = [], []
+    with SessionLocal() as db:
+        for store_id in store_ids:
+            t0 = time.perf_counter()
+            dashboard = stores.get_my_store_analytics(days=DASHBOARD_DAYS, top=10, store_id=store_id, db=db)
+            bucket_ms.append((time.perf_counter() - t0) * 1000)
+
+            t0 = time.perf_counter()
+            expected = dashboard_from_orders(db, store_id, DASHBOARD_DAYS, 10)
+            scan_ms.append((time.perf_counter() - t0) * 1000)
+
+            for field in ("orders_placed", "orders_accepted", "orders_completed", "orders_cancelled",
+                          "revenue", "orders_by_hour"):
+                assert dashboard[field] == expected[field], f"store {store_id} {field}: {dashboard[field]} != {expected[field]}"
+            assert abs((dashboard["avg_accept_minutes"] or 0) - (expected["avg_accept_minutes"] or 0)) <= 0.1
+            got = [(p["product_id"], p["quantity"], p["revenue"]) for p in dashboard["top_products"]]
+            assert got == expected["top_products"], f"store {store_id} top products differ"
+    bucket_ms.sort()
+    scan_ms.sort()
+    print(f"{DASHBOARD_DAYS}-day dashboard over {len(store_ids)} stores, results identical")
+    print(f"{'source':>18} {'p50 ms':>8} {'p95 ms':>8}")
+    print(f"{'buckets':>18} {percentile(bucket_ms, 50):>8.1f} {percentile(bucket_ms, 95):>8.1f}")
+    print(f"{'orders GROUP BY':>18} {percentile(scan_ms, 50):>8.1f} {percentile(scan_ms, 95):>8.1f}")
+    if percentile(bucket_ms, 95) > BUDGET_MS:
+        sys.exit(f"dashboard p95 over {BUDGET_MS} ms")
+
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:4]]
+    main(*args)
@@ -0,0 +1,121 @@
+"""Size and replay time of a delivery route: raw history rows versus a packed track.
+
+    python -m benchmarks.bench_track_storage [n_points]
+
+Simulates one courier pinging every 3 s along a wandering route (default
+3600 points, i.e. three hours), stores it as delivery_location_history rows,
+then compacts it with tracks.compact_delivery. Reports the bytes per point,
+the time to read the route back both ways, the worst round-trip error, and
+how many points the simplified display polyline keeps. Finally adds a few
+late raw rows and checks that the streamed track matches tracks.load_track.
+"""
+import json
+import math
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert
+
+from .common import make_session_factory, seed_requester, seed_store
+from app import models, tracks
+
+# Rough on-disk size of one history row in Postgres: tuple header, id,
+# two numerics, timestamp, foreign key, plus its index entries
+HISTORY_ROW_BYTES = 24 + 4 + 2 * 12 + 8 + 4 + 2 * 16
+
+
+def simulate_route(n_points, rng):
+    lat, lng, heading = 33.6, 133.7, 0.0
+    start = datetime(2024, 1, 1, 12)
+    points = []
+    for i in range(n_points):
+        heading += rng.gauss(0, 0.2)
+        step = 8 * 3 / 111_320  # ~8 m/s for 3 s, in degrees
+        lat += step * math.cos(heading) + rng.gauss(0, 2e-6)
+        lng += step * math.sin(heading) + rng.gauss(0, 2e-6)
+        points.append((round(lat, 8), round(lng, 8), start + timedelta(seconds=3 * i)))
+    return points
+
+
+def main(n_points=3600):
+    SessionLocal = make_session_factory()
+    with SessionLocal() as db:
+        store, _ = seed_store(db, n_products=1)
+        requester = seed_requester(db)
+        user = models.User(email="bench-deliverer@test.com", hashed_password="x", role="deliverer")
+        db.add(user)
+        db.flush()
+        deliverer = models.DelivererProfile(user_id=user.id, name="Bench Deliverer")
+        db.add(deliverer)
+        db.flush()
+        order = models.Order(requester_id=requester.id, store_id=store.id, subtotal=0, total_price=0,
+                             delivery_address="Bench", deliverer_id=deliverer.id, status="delivered")
+        db.add(order)
+        db.flush()
+        delivery = models.Delivery(order_id=order.id, deliverer_id=deliverer.id, status="completed")
+        db.add(delivery)
+        db.commit()
+        delivery_id = delivery.id
+
+        route = simulate_route(n_points, random.Random(0))
+        db.execute(insert(models.DeliveryLocationHistory), [
+            {"delivery_id": delivery_id, "latitude": lat, "longitude": lng, "recorded_at": at}
+            for lat, lng, at in route
+        ])
+        db.commit()
+
+    with SessionLocal() as db:
+        start = time.perf_counter()
+        rows = db.query(models.DeliveryLocationHistory).filter(
+            models.DeliveryLocationHistory.delivery_id == delivery_id
+        ).order_by(models.DeliveryLocationHistory.recorded_at).all()
+        raw_ms = (time.perf_counter() - start) * 1000
+        assert len(rows) == n_points
+
+    with SessionLocal() as db:
+        tracks.compact_delivery(db, delivery_id)
+        track = db.query(models.DeliveryTrack).filter(models.DeliveryTrack.delivery_id == delivery_id).one()
+        packed_bytes, polyline_bytes = len(track.packed), len(track.polyline)
+
+    with SessionLocal() as db:
+        start = time.perf_counter()
+        lats, lngs, times = tracks.load_track(db, delivery_id)
+        packed_ms = (time.perf_counter() - start) * 1000
+
+    max_error = max(
+        max(abs(lat - r_lat), abs(lng - r_lng))
+        for lat, lng, (r_lat, r_lng, _) in zip(lats, lngs, route)
+    )
+    assert times == [at for _, _, at in route], "timestamps changed in the round trip"
+    kept = len(tracks.douglas_peucker(lats, lngs))
+
+    # Late fixes land as raw rows next to the packed track; the stream merges them in time order
+    with SessionLocal() as db:
+        last_lat, last_lng, last_at = route[-1]
+        late = route[::max(1, n_points // 10)] + [(last_lat, last_lng, last_at + timedelta(seconds=3))]
+        db.execute(insert(models.DeliveryLocationHistory), [
+            {"delivery_id": delivery_id, "latitude": lat + 1e-4, "longitude": lng, "recorded_at": at}
+            for lat, lng, at in late
+        ])
+        db.commit()
+        expected = tracks.load_track(db, delivery_id)
+    streamed = json.loads("".join(tracks.stream_track_json(SessionLocal, delivery_id)))
+    assert streamed["point_count"] == len(streamed["points"]) == len(expected[2])
+    assert [(p["latitude"], p["longitude"], p["recorded_at"]) for p in streamed["points"]] == [
+        (lat, lng, at.isoformat()) for lat, lng, at in zip(*expected)
+    ], "streamed track differs from load_track"
+
+    print(f"{n_points} points")
+    print(f"{'storage':>14} {'bytes/point':>12} {'read ms':>8}")
+    print(f"{'history rows':>14} {HISTORY_ROW_BYTES:>12.1f} {raw_ms:>8.2f}")
+    print(f"{'packed track':>14} {packed_bytes / n_points:>12.1f} {packed_ms:>8.2f}")
+    print(f"max round-trip error {max_error:.1e} deg; "
+          f"polyline keeps {kept}/{n_points} points in {polyline_bytes} bytes "
+          f"at {tracks.TRACK_SIMPLIFY_TOLERANCE_M} m tolerance")
+    print(f"streamed {len(streamed['points'])} points with late raw rows merged, same as load_track")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 3600)
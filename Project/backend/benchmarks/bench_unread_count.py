@@ -0,0 +1,55 @@
+"""Badge refresh cost: COUNT(*) over notifications versus the counter row.
+
+    python -m benchmarks.bench_unread_count [n_users] [per_user]
+
+Seeds n_users users with per_user notifications each (a third of them
+unread), then times the unread badge both ways for random users, checks the
+counters agree with COUNT(*), and times a full reconciliation pass.
+"""
+import random
+import sys
+import time
+
+from sqlalchemy import insert
+
+from .common import make_session_factory, percentile, timed
+from app import models, notification_counts
+
+
+def main(n_users=200, per_user=500):
+    SessionLocal = make_session_factory()
+    with SessionLocal() as db:
+        db.execute(insert(models.User), [
+            {"email": f"bench-{i}@test.com", "hashed_password": "x", "role": "requester"}
+            for i in range(n_users)
+        ])
+        user_ids = [user.id for user in db.query(models.User.id)]
+        rng = random.Random(0)
+        db.execute(insert(models.Notification), [
+            {"user_id": user_id, "title": "t", "message": "m", "type": "system", "is_read": rng.random() > 1 / 3}
+            for user_id in user_ids for _ in range(per_user)
+        ])
+        db.commit()
+        start = time.perf_counter()
+        notification_counts.reconcile(db)
+        reconcile_ms = (time.perf_counter() - start) * 1000
+
+    rng = random.Random(1)
+    with SessionLocal() as db:
+        for user_id in rng.sample(user_ids, min(20, n_users)):
+            assert notification_counts.unread_count(db, user_id) == notification_counts.count_unread(db, user_id)
+        results = {
+            "COUNT(*)": timed(lambda: notification_counts.count_unread(db, rng.choice(user_ids)), 2000),
+            "counter": timed(lambda: notification_counts.unread_count(db, rng.choice(user_ids)), 2000),
+        }
+
+    print(f"{n_users} users x {per_user} notifications")
+    print(f"{'badge':>10} {'req/s':>10} {'p50 ms':>8} {'p99 ms':>8}")
+    for name, (ops, latencies) in results.items():
+        print(f"{name:>10} {ops:>10,.0f} {percentile(latencies, 50):>8.3f} {percentile(latencies, 99):>8.3f}")
+    print(f"reconcile {n_users} users: {reconcile_ms:.0f} ms")
+
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:3]]
+    main(*args)
@@ -0,0 +1,37 @@
+"""Shared setup for the backend benchmarks.
+
+Run from the backend directory, e.g. ``python -m benchmarks.bench_order_placement``.
+BENCH_DATABASE_URL selects the database (default: in-memory SQLite). The
+database setup and seed data live in the testbed package, shared with tests/.
+"""
+import time
+
+from testbed import (  # noqa: F401
+    BENCH_DATABASE_URL,
+    count_queries,
+    make_session_factory,
+    make_threaded_session_factory,
+    seed_deliverer,
+    seed_requester,
+    seed_store,
+)
+
+
+def timed(fn, repeat):
+    """Run fn repeat times and return (ops/sec, sorted latencies in ms)"""
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        latencies.append((time.perf_counter() - t0) * 1000)
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return repeat / elapsed, latencies
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(p / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
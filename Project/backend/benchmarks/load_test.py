@@ -0,0 +1,82 @@
+"""HTTP load test for A/B-ing DB_MODE=sync against DB_MODE=async.
+
+Start the API in each mode and point this script at it:
+
+    DB_MODE=sync  uvicorn app.main:app --port 8000 --workers 1
+    python -m benchmarks.load_test --base-url http://localhost:8000 --concurrency 64 --duration 20
+
+It logs in with the seeded test accounts from docker/db/init.sql and hammers
+the hot read endpoints. Requires httpx (pip install httpx).
+"""
+import argparse
+import asyncio
+import random
+import time
+
+import httpx
+
+from .common import percentile
+
+ACCOUNTS = {
+    "requester": "user1@test.com",
+    "store": "store1@test.com",
+    "deliverer": "deliverer1@test.com",
+}
+PASSWORD = "password"
+
+# (role whose token is used, path); None means unauthenticated
+SCENARIO = [
+    (None, "/products/"),
+    (None, "/products/store/1"),
+    ("requester", "/orders/my"),
+    ("requester", "/notifications/unread/count"),
+    ("store", "/orders/store/pending"),
+    ("deliverer", "/delivery/jobs"),
+]
+
+
+async def login(client, email):
+    response = await client.post("/auth/login", data={"username": email, "password": PASSWORD})
+    response.raise_for_status()
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+async def worker(client, headers, deadline, latencies, errors):
+    while time.perf_counter() < deadline:
+        role, path = random.choice(SCENARIO)
+        t0 = time.perf_counter()
+        try:
+            response = await client.get(path, headers=headers.get(role, {}))
+            if response.status_code >= 400:
+                errors.append(response.status_code)
+        except httpx.HTTPError as exc:
+            errors.append(type(exc).__name__)
+        latencies.append((time.perf_counter() - t0) * 1000)
+
+
+async def main(base_url, concurrency, duration):
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30) as client:
+        headers = {role: await login(client, email) for role, email in ACCOUNTS.items()}
+        latencies, errors = [], []
+        start = time.perf_counter()
+        deadline = start + duration
+        await asyncio.gather(*[
+            worker(client, headers, deadline, latencies, errors) for _ in range(concurrency)
+        ])
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    print(f"requests:    {len(latencies)} ({len(errors)} errors)")
+    print(f"throughput:  {len(latencies) / elapsed:.1f} req/s")
+    print(f"latency p50: {percentile(latencies, 50):.1f} ms")
+    print(f"latency p99: {percentile(latencies, 99):.1f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--duration", type=float, default=20.0)
+    args = parser.parse_args()
+    asyncio.run(main(args.base_url, args.concurrency, args.duration))
@@ -0,0 +1,113 @@
+"""Database setup and seed data shared by tests/ and benchmarks/.
+
+BENCH_DATABASE_URL selects the database (default: in-memory SQLite). Import
+this package before app: app.database builds its engine at import time.
+"""
+import os
+import tempfile
+from contextlib import contextmanager
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+BENCH_DATABASE_URL = os.getenv("BENCH_DATABASE_URL", "sqlite://")
+# app.database builds its engine at import time; keep it off the real database
+os.environ.setdefault("DATABASE_URL", BENCH_DATABASE_URL)
+
+from app import models  # noqa: E402
+from app.database import Base  # noqa: E402
+
+
+def make_session_factory():
+    """Create a fresh schema and return a session factory bound to it"""
+    if BENCH_DATABASE_URL.startswith("sqlite"):
+        engine = create_engine(
+            BENCH_DATABASE_URL,
+            connect_args={"check_same_thread": False},
+            poolclass=StaticPool,
+        )
+    else:
+        engine = create_engine(BENCH_DATABASE_URL)
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+def make_threaded_session_factory(threads):
+    """Like make_session_factory, but with a connection per thread for concurrency checks
+
+    In-memory SQLite is replaced by a temporary file. SQLite has a single
+    writer; transactions take the write lock at BEGIN, so concurrent writers
+    queue instead of failing to upgrade a read lock.
+    """
+    if BENCH_DATABASE_URL.startswith("sqlite"):
+        path = os.path.join(tempfile.mkdtemp(), "bench.db")
+        engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False, "timeout": 60},
+                               pool_size=threads)
+
+        @event.listens_for(engine, "connect")
+        def autocommit_driver(dbapi_connection, connection_record):
+            dbapi_connection.isolation_level = None
+
+        @event.listens_for(engine, "begin")
+        def begin_immediate(connection):
+            connection.exec_driver_sql("BEGIN IMMEDIATE")
+    else:
+        engine = create_engine(BENCH_DATABASE_URL, pool_size=threads, max_overflow=0)
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+@contextmanager
+def count_queries(engine):
+    """Count the statements engine executes inside the block; yields a list of SQL strings"""
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+
+
+def seed_store(db, n_products=50, stock_quantity=0, email="bench-store@test.com"):
+    """Create a store user, profile and products; returns (store, products)"""
+    user = models.User(email=email, hashed_password="x", role="store")
+    db.add(user)
+    db.flush()
+    store = models.StoreProfile(user_id=user.id, store_name="Bench Store", address="Bench",
+                                latitude=33.6, longitude=133.7)
+    db.add(store)
+    db.flush()
+    products = [
+        models.Product(store_id=store.id, name=f"Product {i}", price=100 + i,
+                       is_available=True, stock_quantity=stock_quantity, display_order=i)
+        for i in range(n_products)
+    ]
+    db.add_all(products)
+    db.commit()
+    return store, products
+
+
+def seed_requester(db, email="bench-requester@test.com"):
+    user = models.User(email=email, hashed_password="x", role="requester")
+    db.add(user)
+    db.flush()
+    requester = models.RequesterProfile(user_id=user.id, name="Bench Requester")
+    db.add(requester)
+    db.commit()
+    return requester
+
+
+def seed_deliverer(db, email="bench-deliverer@test.com"):
+    user = models.User(email=email, hashed_password="x", role="deliverer")
+    db.add(user)
+    db.flush()
+    deliverer = models.DelivererProfile(user_id=user.id, name="Bench Deliverer")
+    db.add(deliverer)
+    db.commit()
+    return deliverer
@@ -0,0 +1,48 @@
+"""Store menu, order history and job board for the fast JSON checks.
+
+The data includes NULLs, non-ASCII text and timestamps with and without
+microseconds, which is where the fast path and the response models could
+disagree. Used by tests/test_fast_json.py and benchmarks.bench_fast_json.
+"""
+from datetime import datetime, timedelta
+
+from . import seed_deliverer, seed_requester, seed_store
+from app import models
+from app.routers import auth
+
+
+def seed(SessionLocal, n_products, n_orders):
+    with SessionLocal() as db:
+        store, products = seed_store(db, n_products=n_products, stock_quantity=7)
+        for i, product in enumerate(products):
+            product.name = f"商品 {i} \"special\"" if i % 3 == 0 else product.name
+            product.description = None if i % 2 else f"Line one\nline two é {i}"
+            product.image_url = None if i % 5 else f"https://img.example/{i}.png"
+        requester = seed_requester(db)
+        deliverer = seed_deliverer(db)
+        start = datetime(2024, 1, 1, 12)
+        for i in range(n_orders):
+            order = models.Order(
+                requester_id=requester.id, store_id=store.id, subtotal=300, delivery_fee=300 + i % 7,
+                total_price=600, delivery_address=f"東京都 {i}", notes=None if i % 2 else "置き配",
+                status="ready_for_pickup" if i % 4 == 0 else "delivered",
+                ordered_at=start + timedelta(minutes=i, microseconds=0 if i % 3 else 123456),
+                completed_at=None if i % 4 == 0 else start + timedelta(minutes=i + 30),
+            )
+            db.add(order)
+            db.flush()
+            db.add_all([
+                models.OrderDetail(order_id=order.id, product_id=products[(i + k) % n_products].id,
+                                   product_name=products[(i + k) % n_products].name, quantity=k + 1,
+                                   unit_price=100, subtotal=100 * (k + 1), notes=None if k else "no onions")
+                for k in range(3)
+            ])
+        db.commit()
+        tokens = {
+            role: auth.create_access_token({"sub": email, "role": role, "user_id": user_id})
+            for role, email, user_id in [
+                ("requester", "bench-requester@test.com", requester.user_id),
+                ("deliverer", "bench-deliverer@test.com", deliverer.user_id),
+            ]
+        }
+        return store.id, tokens
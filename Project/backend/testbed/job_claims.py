@@ -0,0 +1,76 @@
+"""Many deliverers claiming the same jobs at once.
+
+Used by tests/test_job_claims.py and benchmarks.bench_job_claims.
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi import HTTPException
+from sqlalchemy import func, insert, select
+
+from . import seed_requester, seed_store
+from app import models
+
+
+def seed(SessionLocal, claimers, jobs):
+    with SessionLocal() as db:
+        store, _ = seed_store(db, n_products=1)
+        requester = seed_requester(db)
+        db.execute(insert(models.User), [
+            {"email": f"bench-deliverer-{i}@test.com", "hashed_password": "x", "role": "deliverer"}
+            for i in range(claimers)
+        ])
+        user_ids = db.execute(
+            select(models.User.id).where(models.User.role == "deliverer").order_by(models.User.id)
+        ).scalars().all()
+        db.execute(insert(models.DelivererProfile), [
+            {"user_id": user_id, "name": f"Deliverer {user_id}"} for user_id in user_ids
+        ])
+        deliverers = db.execute(
+            select(models.DelivererProfile.user_id, models.DelivererProfile.id).order_by(models.DelivererProfile.id)
+        ).all()
+        db.execute(insert(models.Order), [
+            {"requester_id": requester.id, "store_id": store.id, "status": "ready_for_pickup", "subtotal": 500,
+             "delivery_fee": 300, "total_price": 800, "delivery_address": f"Bench {i}"}
+            for i in range(jobs + 1)
+        ])
+        db.commit()
+        order_ids = db.execute(select(models.Order.id).order_by(models.Order.id)).scalars().all()
+        return [tuple(row) for row in deliverers], order_ids
+
+
+def claim_all(SessionLocal, deliverers, threads, claim):
+    """Run claim(db, user, deliverer_id) once per deliverer; returns [(won, ms)]"""
+    def run(deliverer):
+        user_id, deliverer_id = deliverer
+        start = time.perf_counter()
+        with SessionLocal() as db:
+            user = db.get(models.User, user_id)
+            try:
+                claim(db, user, deliverer_id)
+                won = True
+            except HTTPException as e:
+                assert e.status_code in (404, 409), e.detail
+                won = False
+        return won, (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        results = list(pool.map(run, deliverers))
+    return results, time.perf_counter() - start
+
+
+def check_assignments(SessionLocal, order_ids):
+    """Number of claimed orders; asserts one delivery each, by the assigned deliverer"""
+    with SessionLocal() as db:
+        rows = db.execute(
+            select(models.Order.id, models.Order.deliverer_id,
+                   func.count(models.Delivery.id), func.min(models.Delivery.deliverer_id))
+            .outerjoin(models.Delivery, models.Delivery.order_id == models.Order.id)
+            .where(models.Order.id.in_(order_ids), models.Order.deliverer_id != None)
+            .group_by(models.Order.id, models.Order.deliverer_id)
+        ).all()
+    for order_id, deliverer_id, deliveries, delivery_deliverer_id in rows:
+        assert deliveries == 1, f"order {order_id} has {deliveries} deliveries"
+        assert delivery_deliverer_id == deliverer_id, f"order {order_id} assigned twice"
+    return len(rows)
@@ -0,0 +1,150 @@
+"""Every list endpoint in routers/, with its query budget.
+
+Each handler is called directly and its result serialized with its
+response_model, the way FastAPI does, while counting the statements sent to
+the database. Lazy relationship loads during serialization count too, so a
+regression to one query per row shows up as a budget overrun. Handlers that
+return the JSON themselves (catalog cache, fast JSON) are parsed instead; the
+catalog cache is cleared before each call. Used by tests/test_query_budgets.py
+and benchmarks.bench_list_queries.
+"""
+import json
+from datetime import datetime, timedelta
+from typing import List
+
+from fastapi import Request, Response
+from pydantic import TypeAdapter
+from sqlalchemy import select, update
+
+from . import count_queries, seed_deliverer, seed_requester, seed_store
+from app import analytics, models, ordering, schemas
+from app.catalog_cache import catalog_cache
+from app.geo import job_index
+from app.search import product_search
+from app.routers import delivery, notifications, orders, products, profile, stores
+
+
+def seed(SessionLocal, n_orders):
+    with SessionLocal() as db:
+        # As many products as orders, so product lists and search results grow with them too
+        store, store_products = seed_store(db, n_products=n_orders + 5, stock_quantity=1_000_000)
+        requester = seed_requester(db)
+        deliverer = seed_deliverer(db)
+        db.add(models.RequesterAddress(requester_id=requester.id, label="Home", address_line1="Bench"))
+        db.add(models.ProductCategory(store_id=store.id, name="Main"))
+        db.commit()
+        for i in range(n_orders):
+            ordering.place_order(db, requester.id, schemas.OrderCreate(
+                store_id=store.id,
+                delivery_address="Bench",
+                # Drop-offs spread around the store, so the batched board forms several batches
+                delivery_latitude=float(store.latitude) + 0.01 * (i % 4 - 1.5),
+                delivery_longitude=float(store.longitude) + 0.01 * (i % 3 - 1),
+                details=[schemas.OrderDetailCreate(product_id=store_products[(i + k) % len(store_products)].id,
+                                                   quantity=1) for k in range(3)],
+            ))
+            db.add(models.Notification(user_id=requester.user_id, title="t", message="m", type="system"))
+        db.commit()
+        now = datetime.utcnow()
+        # Every other order is waiting for a deliverer, for the job board, and offered to the deliverer
+        db.execute(update(models.Order).where(models.Order.id % 2 == 0).values(
+            status="ready_for_pickup", ready_at=now
+        ))
+        db.add_all([
+            models.JobOffer(order_id=order_id, deliverer_id=deliverer.id, offered_at=now,
+                            expires_at=now + timedelta(hours=1))
+            for order_id in db.execute(select(models.Order.id).where(models.Order.id % 2 == 0)).scalars()
+        ])
+        # Every fourth was delivered, hours apart, for the store analytics
+        delivered = db.execute(select(models.Order.id).where(models.Order.id % 4 == 1)).scalars().all()
+        for i, order_id in enumerate(delivered):
+            completed_at = now - timedelta(hours=5 * i)
+            db.execute(update(models.Order).where(models.Order.id == order_id).values(
+                status="delivered", accepted_at=completed_at - timedelta(minutes=30), completed_at=completed_at
+            ))
+        db.commit()
+        analytics.rebuild(db)
+        return {
+            "store_id": store.id,
+            "store_user_id": store.user_id,
+            "requester_id": requester.id,
+            "requester_user_id": requester.user_id,
+            "deliverer_id": deliverer.id,
+            "deliverer_user_id": deliverer.user_id,
+        }
+
+
+REQUEST = Request({"type": "http", "method": "GET", "headers": []})
+
+# (name, user, response model, handler call, budget)
+ENDPOINTS = [
+    ("GET /orders/my (requester)", "requester_user_id", schemas.Order,
+     lambda db, u, ids: orders.get_my_orders(Response(), 50, None, u, ids["requester_id"], db), 2),
+    ("GET /orders/my (store)", "store_user_id", schemas.Order,
+     lambda db, u, ids: orders.get_my_orders(Response(), 50, None, u, ids["store_id"], db), 2),
+    ("GET /orders/store/pending", "store_user_id", schemas.Order,
+     lambda db, u, ids: orders.get_store_pending_orders(u, ids["store_id"], db), 2),
+    ("GET /notifications/", "requester_user_id", schemas.Notification,
+     lambda db, u, ids: notifications.get_my_notifications(Response(), 0, 50, None, u, db), 1),
+    ("GET /products/", "requester_user_id", schemas.Product,
+     lambda db, u, ids: products.get_products(REQUEST, 0, 100, None, db), 1),
+    ("GET /products/search", "requester_user_id", schemas.Product,
+     lambda db, u, ids: products.get_search_products(REQUEST, "product", None, None, None, 100, db), 1),
+    ("GET /products/store/{id}", "requester_user_id", schemas.Product,
+     lambda db, u, ids: products.get_store_products(REQUEST, ids["store_id"], db), 1),
+    ("GET /products/store/{id}/categories", "requester_user_id", schemas.ProductCategory,
+     lambda db, u, ids: products.get_store_categories(REQUEST, ids["store_id"], db), 1),
+    ("GET /stores/", "requester_user_id", schemas.StoreProfile,
+     lambda db, u, ids: stores.get_stores(REQUEST, 0, 100, db), 1),
+    ("GET /stores/my/analytics/volume (hour)", "store_user_id", schemas.AnalyticsBucket,
+     lambda db, u, ids: stores.get_my_store_order_volume("hour", 30, ids["store_id"], db), 1),
+    ("GET /stores/my/analytics/volume (day)", "store_user_id", schemas.AnalyticsBucket,
+     lambda db, u, ids: stores.get_my_store_order_volume("day", 30, ids["store_id"], db), 1),
+    ("GET /stores/my/analytics/volume (month)", "store_user_id", schemas.AnalyticsBucket,
+     lambda db, u, ids: stores.get_my_store_order_volume("month", 30, ids["store_id"], db), 1),
+    ("GET /stores/my/analytics/top-products", "store_user_id", schemas.ProductRevenue,
+     lambda db, u, ids: stores.get_my_store_top_products(30, 100, ids["store_id"], db), 1),
+    ("GET /delivery/my", "deliverer_user_id", schemas.Delivery,
+     lambda db, u, ids: delivery.get_my_deliveries(u, ids["deliverer_id"], db), 1),
+    ("GET /delivery/jobs", "deliverer_user_id", schemas.DeliveryJob,
+     lambda db, u, ids: delivery.get_delivery_jobs(Response(), None, None, 5.0, 100, None, False, u, db), 1),
+    # The rows, plus one query whenever the job index is due for a resync
+    ("GET /delivery/jobs (nearest)", "deliverer_user_id", schemas.DeliveryJob,
+     lambda db, u, ids: delivery.get_delivery_jobs(Response(), 33.6, 133.7, 5.0, 100, None, False, u, db), 2),
+    # Seeds, their stores, the stores' open jobs to plan, the batched rows
+    ("GET /delivery/jobs (batched)", "deliverer_user_id", schemas.DeliveryJob,
+     lambda db, u, ids: delivery.get_delivery_jobs(Response(), None, None, 5.0, 100, None, True, u, db), 4),
+    ("GET /delivery/offers", "deliverer_user_id", schemas.JobOffer,
+     lambda db, u, ids: delivery.get_my_job_offers(u, ids["deliverer_id"], db), 1),
+    ("GET /profile/requester/addresses", "requester_user_id", schemas.RequesterAddress,
+     lambda db, u, ids: profile.get_requester_addresses(u, ids["requester_id"], db), 1),
+]
+
+
+def rows_of(result):
+    """The handler's rows; handlers answering with a Response have serialized them already"""
+    return json.loads(result.body) if isinstance(result, Response) else result
+
+
+def query_counts(SessionLocal, n_orders):
+    """(endpoint, rows returned, statements executed, budget) for every list endpoint
+
+    SessionLocal must be bound to an empty schema; it is seeded with n_orders.
+    """
+    engine = SessionLocal.kw["bind"]
+    ids = seed(SessionLocal, n_orders)
+    # The job and search indexes are process-wide; point them at this database
+    with SessionLocal() as db:
+        job_index.sync(db, force=True)
+        product_search.sync(db, force=True)
+
+    counts = []
+    for name, user_key, model, call, budget in ENDPOINTS:
+        with SessionLocal() as db:
+            current_user = db.get(models.User, ids[user_key])
+            catalog_cache.clear()
+            with count_queries(engine) as statements:
+                rows = rows_of(call(db, current_user, ids))
+                TypeAdapter(List[model]).validate_python(rows, from_attributes=True)
+        counts.append((name, len(rows), len(statements), budget))
+    return counts
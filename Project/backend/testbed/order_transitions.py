@@ -0,0 +1,122 @@
+"""Requester and deliverer racing to cancel and to complete the same orders.
+
+Used by tests/test_order_transitions.py and benchmarks.bench_order_transitions.
+"""
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi import BackgroundTasks, HTTPException
+from sqlalchemy import func, insert, select
+
+from . import seed_requester, seed_store
+# analytics, inventory and rollups subscribe to the order transitions on import
+from app import analytics, inventory, models, rollups, schemas  # noqa: F401
+from app.routers import delivery, orders
+
+
+def seed(SessionLocal, n_orders):
+    with SessionLocal() as db:
+        store, products = seed_store(db, n_products=1, stock_quantity=0)
+        requester = seed_requester(db)
+        db.execute(insert(models.User), [
+            {"email": f"bench-deliverer-{i}@test.com", "hashed_password": "x", "role": "deliverer"}
+            for i in range(n_orders)
+        ])
+        user_ids = db.execute(
+            select(models.User.id).where(models.User.role == "deliverer").order_by(models.User.id)
+        ).scalars().all()
+        db.execute(insert(models.DelivererProfile), [
+            {"user_id": user_id, "name": f"Deliverer {user_id}", "work_status": "busy"} for user_id in user_ids
+        ])
+        deliverers = db.execute(
+            select(models.DelivererProfile.id, models.DelivererProfile.user_id).order_by(models.DelivererProfile.id)
+        ).all()
+        db.execute(insert(models.Order), [
+            {"requester_id": requester.id, "store_id": store.id, "deliverer_id": deliverer_id, "status": "picked_up",
+             "subtotal": 100, "delivery_fee": 300, "total_price": 400, "delivery_address": f"Bench {i}"}
+            for i, (deliverer_id, _) in enumerate(deliverers)
+        ])
+        order_ids = db.execute(select(models.Order.id).order_by(models.Order.id)).scalars().all()
+        db.execute(insert(models.OrderDetail), [
+            {"order_id": order_id, "product_id": products[0].id, "product_name": "x", "quantity": 1,
+             "unit_price": 100, "subtotal": 100}
+            for order_id in order_ids
+        ])
+        db.execute(insert(models.Delivery), [
+            {"order_id": order_id, "deliverer_id": deliverer_id, "status": "assigned", "delivery_fee": 300}
+            for order_id, (deliverer_id, _) in zip(order_ids, deliverers)
+        ])
+        db.commit()
+        delivery_ids = db.execute(select(models.Delivery.id).order_by(models.Delivery.order_id)).scalars().all()
+        jobs = [
+            (order_id, delivery_id, deliverer_id, user_id)
+            for order_id, delivery_id, (deliverer_id, user_id) in zip(order_ids, delivery_ids, deliverers)
+        ]
+        return (requester.user_id, requester.id), products[0].id, jobs
+
+
+def race(SessionLocal, requester, jobs, threads):
+    requester_user_id, requester_id = requester
+
+    def cancel(job):
+        order_id, _, _, _ = job
+        with SessionLocal() as db:
+            user = db.get(models.User, requester_user_id)
+            return orders.update_order_status(
+                order_id, schemas.OrderUpdate(status="cancelled"), user, requester_id, db
+            )
+
+    def complete(job):
+        _, delivery_id, deliverer_id, user_id = job
+        with SessionLocal() as db:
+            user = db.get(models.User, user_id)
+            return delivery.update_delivery_status(
+                delivery_id, schemas.DeliveryStatusUpdate(status="completed"), BackgroundTasks(), user, deliverer_id, db
+            )
+
+    calls = [(cancel, job) for job in jobs] + [(complete, job) for job in jobs]
+    random.Random(23).shuffle(calls)
+
+    def run(call):
+        action, job = call
+        start = time.perf_counter()
+        try:
+            action(job)
+            won = True
+        except HTTPException as e:
+            assert e.status_code == 409, e.detail
+            won = False
+        return action.__name__, job[0], won, (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        results = list(pool.map(run, calls))
+    return results, time.perf_counter() - start
+
+
+def check_outcomes(SessionLocal, results, product_id, n_orders):
+    """Number of orders cancelled; asserts one winner per order and a consistent end state"""
+    winners = {}
+    for action, order_id, won, _ in results:
+        if won:
+            assert order_id not in winners, f"order {order_id}: both the requester and the deliverer won"
+            winners[order_id] = action
+    assert len(winners) == n_orders, f"{n_orders - len(winners)} orders moved by neither side"
+
+    with SessionLocal() as db:
+        rows = db.execute(
+            select(models.Order.id, models.Order.status, models.Delivery.status, models.DelivererProfile.work_status)
+            .join(models.Delivery, models.Delivery.order_id == models.Order.id)
+            .join(models.DelivererProfile, models.DelivererProfile.id == models.Order.deliverer_id)
+        ).all()
+        for order_id, order_status, delivery_status, work_status in rows:
+            expected = ("cancelled", "cancelled") if winners[order_id] == "cancel" else ("delivered", "completed")
+            assert (order_status, delivery_status) == expected, f"order {order_id}: {order_status}/{delivery_status}"
+            assert work_status == "online", f"order {order_id}: deliverer left {work_status}"
+        cancelled = sum(1 for action in winners.values() if action == "cancel")
+        stock = db.execute(select(models.Product.stock_quantity).where(models.Product.id == product_id)).scalar()
+        assert stock == cancelled, f"{stock} units back in stock for {cancelled} cancellations"
+        counted = db.execute(select(func.coalesce(func.sum(models.StoreSalesDaily.order_count), 0))).scalar()
+        assert counted == n_orders - cancelled, f"{counted} orders in the rollups, {n_orders - cancelled} delivered"
+    return cancelled
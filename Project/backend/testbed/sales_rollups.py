@@ -0,0 +1,107 @@
+"""Order history for the sales rollups, and the day totals recomputed from it.
+
+Used by tests/test_sales_rollups.py and benchmarks.bench_sales_rollups.
+"""
+import random
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+from sqlalchemy import func, insert, select
+
+from . import seed_requester
+from app import models, rollups
+
+START = date(2026, 1, 1)
+
+
+def seed(SessionLocal, n_orders, n_stores, n_deliverers, days):
+    rng = random.Random(21)
+    with SessionLocal() as db:
+        requester = seed_requester(db)
+        db.execute(insert(models.User), [
+            {"email": f"bench-{role}-{i}@test.com", "hashed_password": "x", "role": role}
+            for role, n in (("store", n_stores), ("deliverer", n_deliverers)) for i in range(n)
+        ])
+        users = db.execute(select(models.User.id, models.User.role).order_by(models.User.id)).all()
+        # Stores on different commission rates
+        db.execute(insert(models.StoreProfile), [
+            {"user_id": user_id, "store_name": f"Store {user_id}", "address": "Bench",
+             "commission_rate": Decimal(8 + user_id % 5) + Decimal("0.5") * (user_id % 2)}
+            for user_id, role in users if role == "store"
+        ])
+        db.execute(insert(models.DelivererProfile), [
+            {"user_id": user_id, "name": f"Deliverer {user_id}"} for user_id, role in users if role == "deliverer"
+        ])
+        store_ids = db.execute(select(models.StoreProfile.id)).scalars().all()
+        deliverer_ids = db.execute(select(models.DelivererProfile.id)).scalars().all()
+        rows = []
+        for i in range(n_orders):
+            ordered_at = datetime.combine(START, datetime.min.time()) + timedelta(minutes=rng.randrange(days * 1440))
+            status = rng.choices(["delivered", "completed", "cancelled", "preparing"], [80, 10, 6, 4])[0]
+            subtotal = rng.randrange(500, 5000)
+            delivered = status in rollups.COUNTED_STATUSES
+            rows.append({
+                "requester_id": requester.id, "store_id": rng.choice(store_ids),
+                "deliverer_id": rng.choice(deliverer_ids) if delivered or rng.random() < 0.5 else None,
+                "status": status, "subtotal": subtotal, "delivery_fee": 300, "total_price": subtotal + 300,
+                "delivery_address": "Bench", "ordered_at": ordered_at,
+                "completed_at": ordered_at + timedelta(minutes=40) if delivered else None,
+            })
+            if len(rows) == 10_000:
+                db.execute(insert(models.Order), rows)
+                rows = []
+        if rows:
+            db.execute(insert(models.Order), rows)
+        db.commit()
+
+
+def scan(db, period_start=None, period_end=None):
+    """Store and deliverer day totals computed from the orders themselves
+
+    Orders are priced at the commission rate they were counted at, and
+    those never counted at their store's current rate.
+    """
+    stores, deliverers = {}, {}
+    orders = db.execute(
+        select(models.Order.store_id, models.Order.deliverer_id, models.Order.subtotal,
+               models.Order.delivery_fee, models.Order.completed_at,
+               func.coalesce(models.Order.commission_rate, models.StoreProfile.commission_rate))
+        .join(models.StoreProfile, models.StoreProfile.id == models.Order.store_id)
+        .where(models.Order.status.in_(rollups.COUNTED_STATUSES))
+    )
+    for store_id, deliverer_id, subtotal, delivery_fee, completed_at, rate in orders:
+        day = completed_at.date()
+        if period_start and not period_start <= day <= period_end:
+            continue
+        fee = rollups.commission(subtotal, rate)
+        totals = stores.setdefault((store_id, day), [0, 0, 0, 0])
+        for i, amount in enumerate((1, subtotal, fee, subtotal - fee)):
+            totals[i] += amount
+        if deliverer_id is not None:
+            totals = deliverers.setdefault((deliverer_id, day), [0, 0])
+            totals[0] += 1
+            totals[1] += delivery_fee
+    return stores, deliverers
+
+
+def day_rows(db):
+    sales, earnings = models.StoreSalesDaily, models.DelivererEarningsDaily
+    stores = {
+        (row.store_id, row.day): [row.order_count, row.gross_amount, row.commission_amount, row.net_amount]
+        for row in db.execute(select(sales)).scalars() if row.order_count
+    }
+    deliverers = {
+        (row.deliverer_id, row.day): [row.delivery_count, row.total_amount]
+        for row in db.execute(select(earnings)).scalars() if row.delivery_count
+    }
+    return stores, deliverers
+
+
+def period_totals(day_totals, period_start, period_end):
+    totals = {}
+    for (owner, day), values in day_totals.items():
+        if period_start <= day <= period_end:
+            summed = totals.setdefault(owner, [0] * len(values))
+            for i, value in enumerate(values):
+                summed[i] += value
+    return totals
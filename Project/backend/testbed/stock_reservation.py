@@ -0,0 +1,31 @@
+"""Parallel buyers of one item, each ordering one unit.
+
+Used by tests/test_stock_reservation.py and benchmarks.bench_stock_reservation.
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi import HTTPException
+
+from app import ordering, schemas
+
+
+def flash_sale(SessionLocal, store_id, requester_id, product_id, buyers, threads):
+    order = schemas.OrderCreate(store_id=store_id, delivery_address="Bench",
+                                details=[schemas.OrderDetailCreate(product_id=product_id, quantity=1)])
+
+    def buy(_):
+        start = time.perf_counter()
+        with SessionLocal() as db:
+            try:
+                ordering.place_order(db, requester_id, order)
+                sold = True
+            except HTTPException as e:
+                assert e.status_code == 409, e.detail
+                sold = False
+        return sold, (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        results = list(pool.map(buy, range(buyers)))
+    return results, time.perf_counter() - start
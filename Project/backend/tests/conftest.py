@@ -0,0 +1,56 @@
+"""Shared fixtures: a fresh database per test, the app served on it, seed data.
+
+The setup and seeds come from the testbed package, which the benchmarks use
+too; importing it first keeps app.database off the real database.
+"""
+import pytest
+from fastapi.testclient import TestClient
+
+from testbed import count_queries, make_session_factory, make_threaded_session_factory
+from testbed import fast_json
+from app import database
+from app.main import app
+
+# Worker threads of the concurrency tests, each with its own connection
+THREADS = 16
+
+
+@pytest.fixture
+def session_factory():
+    """A session factory bound to a fresh, empty schema"""
+    return make_session_factory()
+
+
+@pytest.fixture
+def threaded_session_factory():
+    """(session factory, threads): a fresh schema with a connection for each of threads concurrent writers"""
+    return make_threaded_session_factory(THREADS), THREADS
+
+
+@pytest.fixture
+def query_counter():
+    """count_queries(engine): a block counting the statements engine executes"""
+    return count_queries
+
+
+@pytest.fixture(scope="module")
+def serve():
+    """serve(SessionLocal) routes the app's get_db to SessionLocal and returns a TestClient"""
+    def serve(SessionLocal):
+        def get_db():
+            with SessionLocal() as db:
+                yield db
+
+        app.dependency_overrides[database.get_db] = get_db
+        return TestClient(app)
+
+    yield serve
+    app.dependency_overrides.pop(database.get_db, None)
+
+
+@pytest.fixture(scope="module")
+def board(serve):
+    """The fast JSON data (testbed.fast_json) behind the app: (client, store_id, tokens by role)"""
+    SessionLocal = make_session_factory()
+    store_id, tokens = fast_json.seed(SessionLocal, 60, 120)
+    return serve(SessionLocal), store_id, tokens
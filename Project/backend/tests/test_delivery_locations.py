@@ -0,0 +1,94 @@
+"""Only a delivery's own deliverer may send its fixes, and only while it is in progress.
+
+Fixes for a delivery that does not exist get 404, for someone else's 403.
+Once the delivery is completed or cancelled its cached owner is dropped and
+further fixes get 409.
+"""
+from datetime import datetime
+
+import pytest
+from fastapi import BackgroundTasks, HTTPException
+
+from testbed import seed_deliverer, seed_requester, seed_store
+from app import lifecycle, models, schemas, tracking
+from app.routers import delivery
+
+FIX = schemas.DeliveryLocationUpdate(latitude=33.61, longitude=133.71)
+
+
+@pytest.fixture
+def buffer(monkeypatch, session_factory):
+    """A fresh location buffer behind the routes, flushed by hand"""
+    buffer = tracking.LocationBuffer(flush_ms=0, session_factory=session_factory)
+    monkeypatch.setattr(tracking, "location_buffer", buffer)
+    monkeypatch.setattr(delivery, "location_buffer", buffer)
+    return buffer
+
+
+@pytest.fixture
+def trip(session_factory):
+    """(delivery id, order id, [(user id, deliverer id)] of its deliverer and another one)"""
+    with session_factory() as db:
+        store, _ = seed_store(db, n_products=1)
+        requester = seed_requester(db)
+        deliverers = [seed_deliverer(db, email=f"test-deliverer-{i}@test.com") for i in range(2)]
+        order = models.Order(requester_id=requester.id, store_id=store.id, deliverer_id=deliverers[0].id,
+                             status="picked_up", subtotal=1000, delivery_fee=300, total_price=1300,
+                             delivery_address="Test", ready_at=datetime.utcnow())
+        db.add(order)
+        db.flush()
+        trip = models.Delivery(order_id=order.id, deliverer_id=deliverers[0].id, status="picked_up")
+        db.add(trip)
+        db.commit()
+        return trip.id, order.id, [(deliverer.user_id, deliverer.id) for deliverer in deliverers]
+
+
+def send_fix(SessionLocal, delivery_id, deliverer):
+    user_id, deliverer_id = deliverer
+    with SessionLocal() as db:
+        return delivery.update_delivery_location(delivery_id, FIX, db.get(models.User, user_id), deliverer_id, db)
+
+
+def test_own_delivery_only(session_factory, buffer, trip):
+    delivery_id, _, (owner, other) = trip
+    send_fix(session_factory, delivery_id, owner)
+    assert buffer.latest(delivery_id)[:2] == (FIX.latitude, FIX.longitude)
+
+    with pytest.raises(HTTPException) as exc:
+        send_fix(session_factory, delivery_id, other)
+    assert exc.value.status_code == 403
+    with pytest.raises(HTTPException) as exc:
+        send_fix(session_factory, delivery_id + 1, owner)
+    assert exc.value.status_code == 404
+
+    user_id, deliverer_id = other
+    batch = schemas.DeliveryLocationBatch(fixes=[FIX, FIX])
+    with session_factory() as db, pytest.raises(HTTPException) as exc:
+        delivery.upload_delivery_locations(delivery_id, batch, db.get(models.User, user_id), deliverer_id, db)
+    assert exc.value.status_code == 403
+    assert buffer.flush() == 1
+
+
+def test_no_fixes_after_completion(session_factory, buffer, trip):
+    delivery_id, _, (owner, _) = trip
+    send_fix(session_factory, delivery_id, owner)
+    user_id, deliverer_id = owner
+    with session_factory() as db:
+        delivery.update_delivery_status(delivery_id, schemas.DeliveryStatusUpdate(status="completed"),
+                                        BackgroundTasks(), db.get(models.User, user_id), deliverer_id, db)
+
+    with pytest.raises(HTTPException) as exc:
+        send_fix(session_factory, delivery_id, owner)
+    assert exc.value.status_code == 409
+
+
+def test_no_fixes_after_cancellation(session_factory, buffer, trip):
+    delivery_id, order_id, (owner, _) = trip
+    send_fix(session_factory, delivery_id, owner)
+    with session_factory() as db:
+        assert lifecycle.transition(db, order_id, "cancelled") is not None
+        db.commit()
+
+    with pytest.raises(HTTPException) as exc:
+        send_fix(session_factory, delivery_id, owner)
+    assert exc.value.status_code == 409
@@ -0,0 +1,47 @@
+"""The fast JSON path must send the same bytes as the response_model path.
+
+Every page of each list endpoint is fetched through the FastAPI app with
+fastjson.FAST_JSON_RESPONSES off and on, following X-Next-Cursor; bodies and
+cursors must match exactly. The data comes from testbed.fast_json (the board
+fixture) and includes NULLs, non-ASCII text and timestamps with and without
+microseconds.
+"""
+import pytest
+
+from app import fastjson
+from app.catalog_cache import catalog_cache
+
+
+def fetch_all(client, path, headers, params):
+    """Every page of a list endpoint as (body, next cursor) pairs"""
+    pages = []
+    params = dict(params)
+    while True:
+        catalog_cache.clear()
+        response = client.get(path, headers=headers, params=params)
+        assert response.status_code == 200, response.text
+        pages.append((response.content, response.headers.get("x-next-cursor")))
+        if not pages[-1][1]:
+            return pages
+        params["cursor"] = pages[-1][1]
+
+
+@pytest.mark.parametrize("path, role, params", [
+    ("/products/store/{store_id}", None, {}),
+    ("/orders/my", "requester", {}),
+    ("/orders/my", "requester", {"limit": 50}),
+    ("/delivery/jobs", "deliverer", {"limit": 10}),
+    ("/delivery/jobs", "deliverer", {"limit": 10, "batched": "true"}),
+])
+def test_fast_json_is_byte_identical(board, monkeypatch, path, role, params):
+    client, store_id, tokens = board
+    path = path.format(store_id=store_id)
+    headers = {"Authorization": f"Bearer {tokens[role]}"} if role else {}
+
+    monkeypatch.setattr(fastjson, "FAST_JSON_RESPONSES", False)
+    expected = fetch_all(client, path, headers, params)
+    monkeypatch.setattr(fastjson, "FAST_JSON_RESPONSES", True)
+    actual = fetch_all(client, path, headers, params)
+
+    assert len(expected) > 1 or not params.get("limit"), "seed too small to page"
+    assert actual == expected
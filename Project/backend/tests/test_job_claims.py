@@ -0,0 +1,36 @@
+"""Concurrent deliverers claiming jobs: no job is ever assigned twice.
+
+Every claimer is a different deliverer calling the route handler in its own
+session (testbed.job_claims). Losers get 409 (the job is taken) or 404 (no
+job left), and each claimed order ends with exactly one delivery, owned by
+the deliverer the order is assigned to.
+"""
+from testbed.job_claims import check_assignments, claim_all, seed
+from app.routers import delivery
+
+CLAIMERS = 200
+
+
+def test_one_job_has_one_winner(threaded_session_factory):
+    SessionLocal, threads = threaded_session_factory
+    deliverers, order_ids = seed(SessionLocal, CLAIMERS, 0)
+    hot_job = order_ids[0]
+
+    results, _ = claim_all(SessionLocal, deliverers, threads,
+                           lambda db, user, deliverer_id: delivery.accept_job(hot_job, user, deliverer_id, db))
+
+    assert sum(won for won, _ in results) == 1
+    assert check_assignments(SessionLocal, [hot_job]) == 1
+
+
+def test_next_job_takes_each_job_once(threaded_session_factory):
+    SessionLocal, threads = threaded_session_factory
+    deliverers, order_ids = seed(SessionLocal, CLAIMERS, 49)
+
+    def claim_next(db, user, deliverer_id):
+        return delivery.accept_next_job(None, None, 5.0, user, deliverer_id, db)
+
+    results, _ = claim_all(SessionLocal, deliverers, threads, claim_next)
+
+    assert sum(won for won, _ in results) == len(order_ids)
+    assert check_assignments(SessionLocal, order_ids) == len(order_ids)
@@ -0,0 +1,118 @@
+"""Accepting a batch of jobs is all or nothing.
+
+The board lists three drop-offs north of the store as one batch and the one
+south alone. Accepting the batch creates all its deliveries in one
+transaction; orders the board does not plan together, a batch with a job
+taken meanwhile, and the loser of two deliverers racing for the same batch
+get 409 and no delivery at all.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import func, select
+
+from testbed import seed_requester, seed_store
+from app import models, schemas
+from app.routers import delivery
+
+# Three drop-offs north of the store, one south
+DROPS = [(0.010, 0.001), (0.015, 0.002), (0.020, -0.001), (-0.015, 0.0)]
+
+
+def seed(SessionLocal):
+    """Returns (north order ids, south order id, [(user id, deliverer id)] of two deliverers)"""
+    now = datetime.utcnow()
+    with SessionLocal() as db:
+        store, _ = seed_store(db, n_products=1)
+        requester = seed_requester(db)
+        store_lat, store_lng = float(store.latitude), float(store.longitude)
+        orders = [
+            models.Order(requester_id=requester.id, store_id=store.id, status="ready_for_pickup", ready_at=now,
+                         subtotal=1000, delivery_fee=300, total_price=1300, delivery_address=f"Test {i}",
+                         delivery_latitude=store_lat + dlat, delivery_longitude=store_lng + dlng)
+            for i, (dlat, dlng) in enumerate(DROPS)
+        ]
+        db.add_all(orders)
+        deliverers = []
+        for i in range(2):
+            user = models.User(email=f"test-deliverer-{i}@test.com", hashed_password="x", role="deliverer")
+            db.add(user)
+            db.flush()
+            deliverers.append(models.DelivererProfile(user_id=user.id, name="Test", work_status="online"))
+            db.add(deliverers[-1])
+        db.commit()
+        return ([order.id for order in orders[:3]], orders[3].id,
+                [(deliverer.user_id, deliverer.id) for deliverer in deliverers])
+
+
+def accept_batch(SessionLocal, deliverer, order_ids):
+    user_id, deliverer_id = deliverer
+    with SessionLocal() as db:
+        return delivery.accept_job_batch(schemas.JobBatchAccept(order_ids=order_ids),
+                                         db.get(models.User, user_id), deliverer_id, db)
+
+
+def deliveries(SessionLocal, deliverer_id=None):
+    with SessionLocal() as db:
+        stmt = select(func.count(models.Delivery.id))
+        if deliverer_id is not None:
+            stmt = stmt.where(models.Delivery.deliverer_id == deliverer_id)
+        return db.execute(stmt).scalar()
+
+
+def test_board_lists_the_batch(session_factory):
+    north, south, _ = seed(session_factory)
+    with session_factory() as db:
+        jobs, _ = delivery.list_batched_jobs(db, None, None, 5.0, 100, None)
+
+    assert sorted(sorted(job["order_ids"]) for job in jobs) == [north, [south]]
+    assert next(job for job in jobs if len(job["order_ids"]) == 3)["reward"] == 900
+
+
+def test_unplanned_orders_are_refused(session_factory):
+    north, south, (deliverer, _) = seed(session_factory)
+
+    with pytest.raises(HTTPException) as refused:
+        accept_batch(session_factory, deliverer, [north[0], south])
+
+    assert refused.value.status_code == 409
+    assert deliveries(session_factory) == 0
+
+
+def test_batch_with_a_taken_job_is_refused_whole(session_factory):
+    north, _, (deliverer, (other_user_id, other_id)) = seed(session_factory)
+    with session_factory() as db:
+        delivery.accept_job(north[1], db.get(models.User, other_user_id), other_id, db)
+
+    with pytest.raises(HTTPException) as refused:
+        accept_batch(session_factory, deliverer, north)
+
+    assert refused.value.status_code == 409
+    assert deliveries(session_factory) == 1
+    # Re-planned without the taken job, the other two still go together
+    rest = [order_id for order_id in north if order_id != north[1]]
+    accepted = accept_batch(session_factory, deliverer, rest[::-1])
+    assert sorted(accepted["order_ids"]) == rest
+    assert deliveries(session_factory, deliverer[1]) == 2
+
+
+def test_racing_deliverers_get_all_or_nothing(threaded_session_factory):
+    SessionLocal, _ = threaded_session_factory
+    north, _, deliverers = seed(SessionLocal)
+
+    def attempt(deliverer):
+        try:
+            return accept_batch(SessionLocal, deliverer, north)
+        except HTTPException as e:
+            assert e.status_code == 409, e.detail
+            return None
+
+    with ThreadPoolExecutor(max_workers=len(deliverers)) as pool:
+        results = list(pool.map(attempt, deliverers))
+
+    winners = [deliverer for deliverer, result in zip(deliverers, results) if result is not None]
+    assert len(winners) == 1
+    assert deliveries(SessionLocal, winners[0][1]) == 3
+    assert deliveries(SessionLocal) == 3
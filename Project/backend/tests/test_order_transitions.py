@@ -0,0 +1,91 @@
+"""Order transitions: illegal moves are refused, racing moves happen once.
+
+The race comes from testbed.order_transitions: the requester cancels each
+order while its deliverer completes it, and exactly one of them may win with
+order, delivery, deliverer, stock and sales rollups agreeing afterwards.
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import func, select
+
+from testbed import seed_requester, seed_store
+from testbed.order_transitions import check_outcomes, race, seed
+from app import models, ordering, schemas
+from app.routers import orders
+
+
+def place(SessionLocal):
+    """A pending order; returns (order id, {role: (user id, profile id)})"""
+    with SessionLocal() as db:
+        store, products = seed_store(db, n_products=1, stock_quantity=10)
+        requester = seed_requester(db)
+        order = ordering.place_order(db, requester.id, schemas.OrderCreate(
+            store_id=store.id, delivery_address="Test",
+            details=[schemas.OrderDetailCreate(product_id=products[0].id, quantity=1)],
+        ))
+        db.commit()
+        return order.id, {"store": (store.user_id, store.id), "requester": (requester.user_id, requester.id)}
+
+
+def set_status(SessionLocal, order_id, party, status):
+    user_id, profile_id = party
+    with SessionLocal() as db:
+        user = db.get(models.User, user_id)
+        return orders.update_order_status(order_id, schemas.OrderUpdate(status=status), user, profile_id, db)
+
+
+def test_cancel_and_complete_race(threaded_session_factory):
+    SessionLocal, threads = threaded_session_factory
+    requester, product_id, jobs = seed(SessionLocal, 60)
+
+    results, _ = race(SessionLocal, requester, jobs, threads)
+
+    check_outcomes(SessionLocal, results, product_id, len(jobs))
+
+
+@pytest.mark.parametrize("role, status, status_code", [
+    ("store", "ready_for_pickup", 409),  # pending orders are accepted first
+    ("store", "delivered", 403),
+    ("requester", "accepted", 403),
+    ("store", "picked_up", 400),
+    ("store", "shipped", 400),
+])
+def test_illegal_transition_is_refused(session_factory, role, status, status_code):
+    order_id, parties = place(session_factory)
+
+    with pytest.raises(HTTPException) as refused:
+        set_status(session_factory, order_id, parties[role], status)
+
+    assert refused.value.status_code == status_code
+    with session_factory() as db:
+        assert db.get(models.Order, order_id).status == "pending"
+
+
+def test_duplicate_transition_happens_once(threaded_session_factory):
+    SessionLocal, threads = threaded_session_factory
+    order_id, parties = place(SessionLocal)
+
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        results = list(pool.map(lambda _: set_status(SessionLocal, order_id, parties["store"], "accepted"),
+                                range(threads)))
+
+    assert all(result["status"] == "accepted" for result in results)
+    with SessionLocal() as db:
+        accepted = db.execute(select(func.sum(models.StoreStatsBucket.orders_accepted))).scalar()
+    assert accepted == 1
+
+
+def test_ended_order_stays_ended(session_factory):
+    order_id, parties = place(session_factory)
+    set_status(session_factory, order_id, parties["requester"], "cancelled")
+    set_status(session_factory, order_id, parties["requester"], "cancelled")
+
+    with pytest.raises(HTTPException) as refused:
+        set_status(session_factory, order_id, parties["store"], "accepted")
+
+    assert refused.value.status_code == 409
+    with session_factory() as db:
+        assert db.execute(select(models.Product.stock_quantity)).scalar() == 10
+        assert db.execute(select(func.sum(models.StoreStatsBucket.orders_cancelled))).scalar() == 1
@@ -0,0 +1,52 @@
+"""Both search backends rank the same products in the same order.
+
+The Postgres statement (search_select) runs here on SQLite, where ILIKE is
+emulated with lower() LIKE lower(); it must return the same ids, in the
+same order, as the in-memory index for every query, filter and limit.
+"""
+import pytest
+
+from testbed import seed_store
+from app import models
+from app.search import ProductSearchIndex, parse_terms, search_select
+
+NAMES = [
+    "Tea", "Green Tea", "Tea Set", "Teapot", "Iced Tea", "Tea", "Matcha", "Black Tea Leaves",
+    "Herbal", "Steamed Bun", "Tempura", "Steak", "Green Salad",
+]
+DESCRIPTIONS = {"Matcha": "powdered green tea", "Herbal": "not a tea, strictly speaking"}
+
+
+@pytest.fixture
+def catalog(session_factory):
+    with session_factory() as db:
+        store_id = seed_store(db, n_products=0)[0].id
+        db.add_all([
+            models.Product(store_id=store_id, name=name, description=DESCRIPTIONS.get(name),
+                           price=100 * (i % 4 + 1), is_available=True, stock_quantity=0)
+            for i, name in enumerate(NAMES)
+        ])
+        db.commit()
+        index = ProductSearchIndex()
+        index.sync(db, force=True)
+    return session_factory, store_id, index
+
+
+@pytest.mark.parametrize("q, max_price, limit", [
+    ("tea", None, 20),
+    ("tea", None, 3),
+    ("tea", 200, 20),
+    ("te", None, 20),
+    ("t", None, 5),
+    ("green tea", None, 20),
+    ("tea green", None, 20),
+    ("ste", None, 20),
+    ("zzz", None, 20),
+])
+def test_backends_agree(catalog, q, max_price, limit):
+    SessionLocal, store_id, index = catalog
+    terms = parse_terms(q)
+    expected = index.search(terms, store_id, None, max_price, limit)
+    with SessionLocal() as db:
+        ids = db.execute(search_select(terms, store_id, None, max_price, limit)).scalars().all()
+    assert ids == expected
@@ -0,0 +1,37 @@
+"""Every list endpoint stays within its query budget, however many rows it returns.
+
+The endpoints, their handler calls and budgets are those of
+testbed.list_queries, which benchmarks.bench_list_queries prints.
+Each endpoint is measured with few and with many rows: the statement count
+must stay within budget and must not grow with the rows, which is what a
+regression to one query per row (or per job on the board) would do.
+"""
+import pytest
+
+from testbed import make_session_factory
+from testbed.list_queries import ENDPOINTS, query_counts
+
+
+@pytest.fixture(scope="module")
+def counts():
+    return {
+        n_orders: {name: entry for name, *entry in query_counts(make_session_factory(), n_orders)}
+        for n_orders in (10, 100)
+    }
+
+
+@pytest.mark.parametrize("endpoint", [name for name, *_ in ENDPOINTS])
+def test_query_budget(counts, endpoint):
+    few_rows, few_queries, budget = counts[10][endpoint]
+    many_rows, many_queries, _ = counts[100][endpoint]
+    assert many_queries <= budget, f"{many_queries} queries for {many_rows} rows, budget {budget}"
+    assert many_queries == few_queries, f"{few_queries} queries for {few_rows} rows, {many_queries} for {many_rows}"
+
+
+@pytest.mark.parametrize("prefix", [
+    "GET /delivery/jobs", "GET /delivery/offers", "GET /products/search",
+    "GET /stores/my/analytics/volume (hour)", "GET /stores/my/analytics/top-products",
+])
+def test_rows_are_measured(counts, prefix):
+    names = [name for name in counts[100] if name.startswith(prefix)]
+    assert names and all(counts[100][name][0] > counts[10][name][0] for name in names)
@@ -0,0 +1,90 @@
+"""The sales rollups always equal a recompute from the orders.
+
+Day rows are compared with testbed.sales_rollups.scan, a GROUP BY over a full
+scan of the orders: after a parallel backfill, after incremental status
+changes (each synced twice, as a retry would), and once a period is closed
+from them. Orders keep the commission rate they were counted at when their
+store's rate changes.
+"""
+import random
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from sqlalchemy import func, select, update
+
+from testbed.sales_rollups import START, day_rows, period_totals, scan, seed
+from app import models, rollups
+
+DAYS = 60
+
+
+def test_rollups_equal_recompute(threaded_session_factory):
+    SessionLocal, _ = threaded_session_factory
+    seed(SessionLocal, 3000, 8, 8, DAYS)
+
+    rollups.backfill(SessionLocal, workers=4, chunk_size=500)
+    with SessionLocal() as db:
+        assert day_rows(db) == scan(db)
+
+    rng = random.Random(21)
+    with SessionLocal() as db:
+        delivered = db.execute(select(models.Order.id).where(models.Order.status == "delivered")).scalars().all()
+        open_orders = db.execute(select(models.Order.id).where(models.Order.status == "preparing")).scalars().all()
+    changes = [(order_id, "cancelled") for order_id in rng.sample(delivered, 50)]
+    changes += [(order_id, "delivered") for order_id in rng.sample(open_orders, 50)]
+    for order_id, status in changes:
+        with SessionLocal() as db:
+            values = {"status": status}
+            if status == "delivered":
+                day = START + timedelta(days=rng.randrange(DAYS))
+                values["completed_at"] = datetime.combine(day, datetime.min.time())
+            db.execute(update(models.Order).where(models.Order.id == order_id).values(**values))
+            rollups.sync_order(db, order_id)
+            rollups.sync_order(db, order_id)
+            db.commit()
+    with SessionLocal() as db:
+        assert day_rows(db) == scan(db)
+
+    period_start = START + timedelta(days=10)
+    period_end = period_start + timedelta(days=30)
+    with SessionLocal() as db:
+        stores, deliverers = scan(db, period_start, period_end)
+        rollups.close_period(db, period_start, period_end)
+        rollups.close_period(db, period_start, period_end)
+        closed_stores = {
+            row.store_id: [row.total_orders, row.total_amount, row.commission_amount, row.net_amount]
+            for row in db.execute(select(models.StoreSales)).scalars()
+        }
+        closed_deliverers = {
+            row.deliverer_id: [row.total_deliveries, row.total_amount]
+            for row in db.execute(select(models.DelivererPayout)).scalars()
+        }
+        assert closed_stores == period_totals(stores, period_start, period_end)
+        assert closed_deliverers == period_totals(deliverers, period_start, period_end)
+        assert db.execute(select(func.count(models.StoreSales.id))).scalar() == len(closed_stores)
+
+
+def test_rate_change_keeps_history(threaded_session_factory):
+    SessionLocal, _ = threaded_session_factory
+    seed(SessionLocal, 500, 2, 2, DAYS)
+    rollups.backfill(SessionLocal, workers=2, chunk_size=100)
+    with SessionLocal() as db:
+        before = day_rows(db)
+        store_id, order_id = db.execute(
+            select(models.Order.store_id, models.Order.id).where(models.Order.status == "preparing")
+        ).first()
+        db.execute(update(models.StoreProfile).where(models.StoreProfile.id == store_id)
+                   .values(commission_rate=Decimal("25.00")))
+        db.commit()
+
+    rollups.backfill(SessionLocal, workers=2, chunk_size=100)
+    with SessionLocal() as db:
+        assert day_rows(db) == before
+        db.execute(update(models.Order).where(models.Order.id == order_id).values(
+            status="delivered", subtotal=1000, completed_at=datetime.combine(START, datetime.min.time())
+        ))
+        rollups.sync_order(db, order_id)
+        db.commit()
+        stores, _ = day_rows(db)
+    old = before[0].get((store_id, START), [0, 0, 0, 0])
+    assert stores[(store_id, START)][2] - old[2] == 250
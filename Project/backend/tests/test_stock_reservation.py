@@ -0,0 +1,38 @@
+"""Flash sale: parallel buyers of one item never oversell it.
+
+Each buyer orders one unit through ordering.place_order in its own session
+(testbed.stock_reservation), with the stock in the product row and in
+shards. Exactly the stock is sold, the other buyers get 409, the stock ends
+at zero and there is one order line per unit sold.
+"""
+import pytest
+from sqlalchemy import func, select, update
+
+from testbed import seed_requester, seed_store
+from testbed.stock_reservation import flash_sale
+from app import inventory, models
+
+BUYERS = 120
+STOCK = 50
+
+
+@pytest.mark.parametrize("shards", [0, 4])
+def test_no_oversell(threaded_session_factory, shards):
+    SessionLocal, threads = threaded_session_factory
+    with SessionLocal() as db:
+        store, products = seed_store(db, n_products=1)
+        requester = seed_requester(db)
+        store_id, requester_id, product_id = store.id, requester.id, products[0].id
+        db.execute(update(models.Product).where(models.Product.id == product_id).values(stock_quantity=STOCK))
+        db.commit()
+        inventory.set_shards(db, product_id, shards)
+
+    results, _ = flash_sale(SessionLocal, store_id, requester_id, product_id, BUYERS, threads)
+
+    sold = sum(ok for ok, _ in results)
+    with SessionLocal() as db:
+        left = inventory.set_shards(db, product_id, 0)
+        lines = db.execute(select(func.count(models.OrderDetail.id))).scalar()
+    assert sold == STOCK
+    assert left == 0
+    assert lines == sold
@@ -0,0 +1,51 @@
+"""Day and month series of the store analytics add up the hour buckets.
+
+Orders spread over three months are counted with analytics.rebuild; each
+series must equal the hour rows summed per day or month, with buckets at
+the start of their day or month.
+"""
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+
+import pytest
+from sqlalchemy import insert, select
+
+from testbed import seed_requester, seed_store
+from app import analytics, models
+
+START = datetime(2026, 1, 1)
+
+
+@pytest.fixture
+def hours(session_factory):
+    """(store id, hour rows) of orders every 7 hours over 90 days"""
+    with session_factory() as db:
+        store, _ = seed_store(db, n_products=1)
+        requester = seed_requester(db)
+        db.execute(insert(models.Order), [
+            {"requester_id": requester.id, "store_id": store.id, "status": "delivered" if i % 3 else "cancelled",
+             "subtotal": 100 + i, "delivery_fee": 300, "total_price": 400 + i, "delivery_address": "Test",
+             "ordered_at": START + timedelta(hours=7 * i),
+             "completed_at": START + timedelta(hours=7 * i, minutes=40) if i % 3 else None,
+             "cancelled_at": None if i % 3 else START + timedelta(hours=7 * i, minutes=5)}
+            for i in range(90 * 24 // 7)
+        ])
+        db.commit()
+        analytics.rebuild(db)
+        return store.id, db.execute(select(models.StoreStatsBucket)).scalars().all()
+
+
+@pytest.mark.parametrize("granularity", ["hour", "day", "month"])
+def test_series_sums_the_hours(session_factory, hours, granularity):
+    store_id, hour_rows = hours
+    expected = defaultdict(lambda: dict.fromkeys(analytics.STAT_FIELDS, 0))
+    for row in hour_rows:
+        totals = expected[analytics.truncate(row.bucket, granularity)]
+        for field in analytics.STAT_FIELDS:
+            totals[field] += getattr(row, field)
+
+    with session_factory() as db:
+        rows = analytics.series(db, store_id, granularity, date(2026, 1, 1), date(2026, 4, 1))
+
+    assert [row.bucket for row in rows] == sorted(expected)
+    assert {row.bucket: {field: getattr(row, field) for field in analytics.STAT_FIELDS} for row in rows} == expected
@@ -0,0 +1,57 @@
+"""Packed delivery tracks round-trip, including across the antimeridian.
+
+A step from 179.99 to -179.99 degrees is 0.02 degrees the short way round
+but 359.98 the long way, which would not fit the int32 delta columns; it
+must pack, compact and stream back as the same points.
+"""
+import json
+from datetime import datetime, timedelta
+
+import numpy as np
+from sqlalchemy import insert
+
+from testbed import seed_deliverer, seed_requester, seed_store
+from app import models, tracks
+
+START = datetime(2026, 1, 1, 12)
+# Fiji: eastward across 180 degrees and back
+LATS = [-17.8, -17.8001, -17.8002, -17.8003, -17.8004]
+LNGS = [179.9995, 179.9999, -179.9997, -179.9993, 179.9998]
+TIMES = [START + timedelta(seconds=5 * i) for i in range(len(LATS))]
+
+
+def test_pack_crosses_antimeridian():
+    started_at, packed = tracks.pack_track(LATS, LNGS, TIMES)
+    lats, lngs, times = tracks.unpack_track(started_at, packed)
+
+    assert np.allclose(lats, LATS, atol=1e-7)
+    assert np.allclose(lngs, LNGS, atol=1e-7)
+    assert times == TIMES
+
+
+def test_compacted_track_streams_back(session_factory):
+    with session_factory() as db:
+        store, _ = seed_store(db, n_products=1)
+        requester = seed_requester(db)
+        deliverer = seed_deliverer(db)
+        order = models.Order(requester_id=requester.id, store_id=store.id, deliverer_id=deliverer.id,
+                             status="delivered", subtotal=100, total_price=400, delivery_address="Test")
+        db.add(order)
+        db.flush()
+        delivery = models.Delivery(order_id=order.id, deliverer_id=deliverer.id, status="completed")
+        db.add(delivery)
+        db.flush()
+        db.execute(insert(models.DeliveryLocationHistory), [
+            {"delivery_id": delivery.id, "latitude": lat, "longitude": lng, "recorded_at": at}
+            for lat, lng, at in zip(LATS, LNGS, TIMES)
+        ])
+        db.commit()
+        delivery_id = delivery.id
+
+        assert tracks.compact_delivery(db, delivery_id) == len(LATS)
+
+    document = json.loads("".join(tracks.stream_track_json(session_factory, delivery_id)))
+    points = document["points"]
+    assert document["point_count"] == len(points) == len(LATS)
+    assert np.allclose([point["longitude"] for point in points], LNGS, atol=1e-7)
+    assert [point["recorded_at"] for point in points] == [at.isoformat() for at in TIMES]
@@ -45,6 +45,9 @@ CREATE TABLE IF NOT EXISTS deliverer_profiles (
     phone_number VARCHAR(20),
     resume TEXT,
     work_status VARCHAR(20) DEFAULT 'offline' CHECK (work_status IN ('online', 'offline', 'busy')),
+    latitude DECIMAL(10, 8),  -- 待機中の位置 (自動配車に使用)
+    longitude DECIMAL(11, 8),
+    location_updated_at TIMESTAMP,
     bank_name VARCHAR(100),
     bank_branch VARCHAR(100),
     bank_account_type VARCHAR(20),
@@ -77,6 +80,7 @@ CREATE TABLE IF NOT EXISTS store_profiles (
     bank_account_holder VARCHAR(100),
     store_image_url VARCHAR(500),
     is_open BOOLEAN DEFAULT TRUE,
+    commission_rate DECIMAL(5, 2) NOT NULL DEFAULT 10.00,  -- 商品売上に対する手数料率 (%)
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
@@ -104,12 +108,21 @@ CREATE TABLE IF NOT EXISTS products (
     price INTEGER NOT NULL CHECK (price >= 0),
     image_url VARCHAR(500),
     is_available BOOLEAN DEFAULT TRUE,
-    stock_quantity INTEGER DEFAULT 0,
+    stock_quantity INTEGER DEFAULT 0 CHECK (stock_quantity >= 0),
+    stock_shards INTEGER DEFAULT 0,         -- 0 以外: 在庫は product_stock_shards に分割
     display_order INTEGER DEFAULT 0,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
+-- 人気商品の在庫シャード (同時購入で同じ行のロック待ちにならないよう分割)
+CREATE TABLE IF NOT EXISTS product_stock_shards (
+    product_id INTEGER NOT NULL REFERENCES products(id) ON DELETE CASCADE,
+    shard INTEGER NOT NULL,
+    quantity INTEGER NOT NULL DEFAULT 0 CHECK (quantity >= 0),
+    PRIMARY KEY (product_id, shard)
+);
+
 -- ==========================================
 -- 注文管理テーブル
 -- ==========================================
@@ -128,6 +141,7 @@ CREATE TABLE IF NOT EXISTS orders (
         'picked_up',         -- 配達員が受け取り
         'delivering',        -- 配達中
         'delivered',         -- 配達完了
+        'completed',         -- 取引完了
         'cancelled'          -- キャンセル
     )),
     subtotal INTEGER NOT NULL,
@@ -140,9 +154,12 @@ CREATE TABLE IF NOT EXISTS orders (
     estimated_delivery_time TIMESTAMP,
     ordered_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     accepted_at TIMESTAMP,
+    ready_at TIMESTAMP,                 -- 受け取り準備完了の時刻 (まとめ配達に使用)
     completed_at TIMESTAMP,
     cancelled_at TIMESTAMP,
-    cancel_reason TEXT
+    cancel_reason TEXT,
+    rollup_day DATE,                    -- 売上集計に計上した日 (未計上は NULL)
+    commission_rate DECIMAL(5, 2)       -- 初回計上時の店舗の手数料率 (再計上でも変えない)
 );
 
 -- 注文明細
@@ -173,7 +190,8 @@ CREATE TABLE IF NOT EXISTS deliveries (
         'picked_up',      -- 商品を受け取った
         'delivering',     -- 配達中
         'arrived',        -- 配達先に到着
-        'completed'       -- 完了
+        'completed',      -- 完了
+        'cancelled'       -- 注文キャンセル
     )),
     pickup_time TIMESTAMP,
     delivery_time TIMESTAMP,
@@ -185,6 +203,20 @@ CREATE TABLE IF NOT EXISTS deliveries (
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
+-- 自動配車のジョブオファー (配達員ごとに期限付きで提示)
+CREATE TABLE IF NOT EXISTS job_offers (
+    id SERIAL PRIMARY KEY,
+    order_id INTEGER NOT NULL REFERENCES orders(id) ON DELETE CASCADE,
+    deliverer_id INTEGER NOT NULL REFERENCES deliverer_profiles(id) ON DELETE CASCADE,
+    status VARCHAR(20) NOT NULL DEFAULT 'offered' CHECK (status IN (
+        'offered', 'accepted', 'declined', 'expired', 'withdrawn'
+    )),
+    distance_km DECIMAL(6, 2),
+    offered_at TIMESTAMP NOT NULL,
+    expires_at TIMESTAMP NOT NULL,
+    responded_at TIMESTAMP
+);
+
 -- 配達員の位置履歴
 CREATE TABLE IF NOT EXISTS delivery_location_history (
     id SERIAL PRIMARY KEY,
@@ -194,6 +226,17 @@ CREATE TABLE IF NOT EXISTS delivery_location_history (
     recorded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
+-- 完了した配達の位置履歴 (圧縮済み)
+CREATE TABLE IF NOT EXISTS delivery_tracks (
+    id SERIAL PRIMARY KEY,
+    delivery_id INTEGER UNIQUE NOT NULL REFERENCES deliveries(id) ON DELETE CASCADE,
+    point_count INTEGER NOT NULL,
+    started_at TIMESTAMP NOT NULL,
+    packed BYTEA NOT NULL,
+    polyline TEXT NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
 -- ==========================================
 -- 通知テーブル
 -- ==========================================
@@ -215,6 +258,35 @@ CREATE TABLE IF NOT EXISTS notifications (
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
+-- 未読通知数 (notifications と同じトランザクションで更新)
+CREATE TABLE IF NOT EXISTS notification_counters (
+    user_id INTEGER PRIMARY KEY REFERENCES users(id) ON DELETE CASCADE,
+    unread_count INTEGER NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- 一斉通知 (チャンク単位で送信、last_user_id から再開可能)
+CREATE TABLE IF NOT EXISTS notification_broadcasts (
+    id SERIAL PRIMARY KEY,
+    created_by INTEGER REFERENCES users(id) ON DELETE SET NULL,
+    title VARCHAR(200) NOT NULL,
+    message TEXT NOT NULL,
+    type VARCHAR(50) NOT NULL,
+    audience VARCHAR(20) NOT NULL,
+    audience_role VARCHAR(20),
+    audience_store_id INTEGER REFERENCES store_profiles(id) ON DELETE CASCADE,
+    audience_user_ids TEXT,
+    status VARCHAR(20) DEFAULT 'pending',
+    total_count INTEGER NOT NULL DEFAULT 0,
+    sent_count INTEGER NOT NULL DEFAULT 0,
+    last_user_id INTEGER NOT NULL DEFAULT 0,
+    heartbeat_at TIMESTAMP,
+    error TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    started_at TIMESTAMP,
+    finished_at TIMESTAMP
+);
+
 -- ==========================================
 -- 支払い・売上テーブル
 -- ==========================================
@@ -264,6 +336,53 @@ CREATE TABLE IF NOT EXISTS store_sales (
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
+-- 店舗の日次売上 (注文の配達完了・キャンセル時に差分更新)
+CREATE TABLE IF NOT EXISTS store_sales_daily (
+    store_id INTEGER NOT NULL REFERENCES store_profiles(id) ON DELETE CASCADE,
+    day DATE NOT NULL,
+    order_count INTEGER NOT NULL DEFAULT 0,
+    gross_amount INTEGER NOT NULL DEFAULT 0,
+    commission_amount INTEGER NOT NULL DEFAULT 0,
+    net_amount INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (store_id, day)
+);
+
+-- 配達員の日次報酬
+CREATE TABLE IF NOT EXISTS deliverer_earnings_daily (
+    deliverer_id INTEGER NOT NULL REFERENCES deliverer_profiles(id) ON DELETE CASCADE,
+    day DATE NOT NULL,
+    delivery_count INTEGER NOT NULL DEFAULT 0,
+    total_amount INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (deliverer_id, day)
+);
+
+-- 店舗の注文統計 (時間単位、注文の状態遷移時に差分更新。日・月は読み出し時に集計)
+CREATE TABLE IF NOT EXISTS store_stats_buckets (
+    store_id INTEGER NOT NULL REFERENCES store_profiles(id) ON DELETE CASCADE,
+    granularity VARCHAR(5) NOT NULL CHECK (granularity = 'hour'),
+    bucket TIMESTAMP NOT NULL,
+    orders_placed INTEGER NOT NULL DEFAULT 0,
+    orders_accepted INTEGER NOT NULL DEFAULT 0,
+    accept_seconds BIGINT NOT NULL DEFAULT 0,
+    orders_completed INTEGER NOT NULL DEFAULT 0,
+    revenue BIGINT NOT NULL DEFAULT 0,
+    prep_count INTEGER NOT NULL DEFAULT 0,
+    prep_seconds BIGINT NOT NULL DEFAULT 0,
+    orders_cancelled INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (store_id, granularity, bucket)
+);
+
+-- 店舗の商品別売上 (日単位)
+CREATE TABLE IF NOT EXISTS store_product_buckets (
+    store_id INTEGER NOT NULL REFERENCES store_profiles(id) ON DELETE CASCADE,
+    granularity VARCHAR(5) NOT NULL CHECK (granularity = 'day'),
+    bucket TIMESTAMP NOT NULL,
+    product_id INTEGER NOT NULL REFERENCES products(id) ON DELETE CASCADE,
+    quantity INTEGER NOT NULL DEFAULT 0,
+    revenue BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (store_id, granularity, bucket, product_id)
+);
+
 -- ==========================================
 -- インデックス
 -- ==========================================
@@ -277,6 +396,22 @@ CREATE INDEX IF NOT EXISTS idx_orders_status ON orders(status);
 CREATE INDEX IF NOT EXISTS idx_products_store ON products(store_id);
 CREATE INDEX IF NOT EXISTS idx_notifications_user ON notifications(user_id);
 CREATE INDEX IF NOT EXISTS idx_deliveries_deliverer ON deliveries(deliverer_id);
+CREATE INDEX IF NOT EXISTS idx_location_history_delivery ON delivery_location_history(delivery_id, recorded_at);
+CREATE INDEX IF NOT EXISTS idx_job_offers_order ON job_offers(order_id);
+CREATE INDEX IF NOT EXISTS idx_job_offers_status_expires ON job_offers(status, expires_at);
+CREATE INDEX IF NOT EXISTS idx_job_offers_deliverer_status ON job_offers(deliverer_id, status);
+-- キーセットページング用 (ordered_at / created_at の降順 + id)
+CREATE INDEX IF NOT EXISTS idx_orders_requester_ordered ON orders(requester_id, ordered_at, id);
+CREATE INDEX IF NOT EXISTS idx_orders_store_ordered ON orders(store_id, ordered_at, id);
+CREATE INDEX IF NOT EXISTS idx_orders_deliverer_ordered ON orders(deliverer_id, ordered_at, id);
+CREATE INDEX IF NOT EXISTS idx_notifications_user_created ON notifications(user_id, created_at, id);
+-- 期間締め (日次集計から作成、同じ期間は 1 行)
+CREATE UNIQUE INDEX IF NOT EXISTS idx_store_sales_period ON store_sales(store_id, period_start, period_end);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_deliverer_payouts_period ON deliverer_payouts(deliverer_id, period_start, period_end);
+-- 商品検索用 (部分一致 ILIKE '%語%' をトライグラムで索引)
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE INDEX IF NOT EXISTS idx_products_name_trgm ON products USING gin (name gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_products_description_trgm ON products USING gin (description gin_trgm_ops);
 
 -- ==========================================
 -- テストデータ
@@ -305,11 +440,11 @@ INSERT INTO deliverer_profiles (user_id, name, phone_number, vehicle_type) VALUE
 (4, '佐藤一郎', '090-8765-4321', 'バイク');
 
 -- テスト商品
-INSERT INTO products (store_id, name, description, price, is_available) VALUES 
-(1, 'カツ丼', '揚げたてサクサクのカツ丼', 850, true),
-(1, '親子丼', 'ふわとろ卵の親子丼', 750, true),
-(1, 'うどん', '讃岐風うどん', 500, true),
-(1, 'カレーライス', '特製スパイスカレー', 800, true);
+INSERT INTO products (store_id, name, description, price, is_available, stock_quantity) VALUES 
+(1, 'カツ丼', '揚げたてサクサクのカツ丼', 850, true, 100),
+(1, '親子丼', 'ふわとろ卵の親子丼', 750, true, 100),
+(1, 'うどん', '讃岐風うどん', 500, true, 100),
+(1, 'カレーライス', '特製スパイスカレー', 800, true, 100);
 
 -- スーパーユーザーの初期データ
 INSERT INTO users (email, password, role, is_active)